@@ -12,6 +12,12 @@ from datetime import datetime, timedelta
 import time
 import json
 from typing import Dict, Any, Tuple, Optional
+from cache_backend import get_cache
+from cassette import mount_cassette
+from tracing import STAGE_FETCH, traced
+
+# 历史数据缓存时间（秒）
+CACHE_TTL = 300
 
 class AlternativeStockAPI:
     """替代股票数据API类"""
@@ -28,14 +34,13 @@ class AlternativeStockAPI:
         self.polygon_base = "https://api.polygon.io/v2"
         
         # 请求会话
-        self.session = requests.Session()
+        self.session = mount_cassette(requests.Session())
         self.session.headers.update({
             'User-Agent': 'TradingAgents/1.0'
         })
         
         # 缓存
-        self._cache = {}
-        self._cache_timestamps = {}
+        self._cache = get_cache()
     
     def get_stock_data(self, symbol: str, period: str = "1y") -> Tuple[Optional[pd.DataFrame], Optional[Dict]]:
         """
@@ -49,10 +54,11 @@ class AlternativeStockAPI:
             (历史数据DataFrame, 股票信息字典)
         """
         # 检查缓存
-        cache_key = f"{symbol}_{period}"
-        if self._is_cache_valid(cache_key):
+        cache_key = f"alternative_{symbol}_{period}"
+        cached = self._cache.get(cache_key)
+        if cached is not None:
             print(f"📋 使用缓存数据: {symbol}")
-            return self._cache[cache_key]
+            return cached
         
         # 尝试不同的数据源
         data_sources = [
@@ -70,8 +76,8 @@ class AlternativeStockAPI:
                 if hist_data is not None and not hist_data.empty:
                     # 缓存数据
                     result = (hist_data, info_data)
-                    self._cache[cache_key] = result
-                    self._cache_timestamps[cache_key] = datetime.now()
+                    # 多市场数据，不按A股交易时段延长
+                    self._cache.set(cache_key, result, ttl=CACHE_TTL, session_aware=False)
                     print(f"✅ 成功获取 {symbol} 数据，来源: {get_data_func.__name__}")
                     return result
                     
@@ -82,14 +88,7 @@ class AlternativeStockAPI:
         print(f"❌ 所有数据源都失败，使用模拟数据: {symbol}")
         return self._generate_mock_data(symbol, period)
     
-    def _is_cache_valid(self, cache_key: str, max_age_minutes: int = 5) -> bool:
-        """检查缓存是否有效"""
-        if cache_key not in self._cache_timestamps:
-            return False
-        
-        cache_time = self._cache_timestamps[cache_key]
-        return (datetime.now() - cache_time).total_seconds() < max_age_minutes * 60
-    
+    @traced(STAGE_FETCH, "Alpha Vantage 日线", provider="alpha_vantage")
     def _get_alpha_vantage_data(self, symbol: str, period: str) -> Tuple[pd.DataFrame, Dict]:
         """使用Alpha Vantage API获取数据"""
         if self.alpha_vantage_key == "demo":
@@ -173,6 +172,7 @@ class AlternativeStockAPI:
         except:
             return self._generate_mock_info(symbol)
     
+    @traced(STAGE_FETCH, "Finnhub 日线", provider="finnhub")
     def _get_finnhub_data(self, symbol: str, period: str) -> Tuple[pd.DataFrame, Dict]:
         """使用Finnhub API获取数据"""
         if self.finnhub_key == "demo":
@@ -257,6 +257,7 @@ class AlternativeStockAPI:
         """使用Polygon API获取数据（免费版本有限制）"""
         raise ValueError("Polygon API需要付费订阅")
     
+    @traced(STAGE_FETCH, "Yahoo 日线", provider="yahoo_chart")
     def _get_free_api_data(self, symbol: str, period: str) -> Tuple[pd.DataFrame, Dict]:
         """使用免费API获取数据"""
         # 这里可以添加其他免费API，如Yahoo Finance的非官方API
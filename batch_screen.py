@@ -0,0 +1,197 @@
+"""
+批量筛选命令行
+收盘后定时任务使用：加载一次全市场快照，按分区并行执行任意组合的预设筛选器与短线策略，
+结果按日期和筛选器分区写成 Parquet 或 CSV（date=YYYY-MM-DD/screener=<键>/），
+并打印各阶段耗时。不依赖 Streamlit。
+
+用法:
+    python batch_screen.py                                   # 全部筛选器，读取共享快照
+    python batch_screen.py -s value_growth -s momentum_breakout_entry --format csv
+    python batch_screen.py --input universe.parquet --workers 8 --output-dir /data/screens
+"""
+
+import argparse
+import json
+import os
+import shutil
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from cache_backend import CHINA_TZ
+from market_snapshots import SNAPSHOT_MAX_AGE, UNIVERSE_SNAPSHOT_NAME, fetch_a_share_universe
+from parallel_screen import PARTITION_BY_BOARD, PARTITION_BY_RANGE, ParallelScreener
+from shared_snapshot import SharedSnapshotStore
+
+# 默认输出目录
+DEFAULT_OUTPUT_DIR = "screen_results"
+
+# 输出格式
+FORMAT_PARQUET = "parquet"
+FORMAT_CSV = "csv"
+
+# 每次运行的汇总文件（位于日期分区目录下）
+SUMMARY_FILE = "_summary.json"
+
+
+class StageTimer:
+    """按阶段记录耗时"""
+
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - started
+
+    @property
+    def total(self) -> float:
+        return sum(self.stages.values())
+
+
+def available_strategies() -> Dict[str, Tuple[str, str]]:
+    """全部可用策略：策略键 -> (分区筛选类型, 策略键)，直接取自两个筛选器的配置"""
+    from smart_stock_screener import SmartStockScreener
+    from short_term_entry_screener import ShortTermEntryScreener
+
+    strategies = {key: ("smart", key) for key in SmartStockScreener().screener_logic}
+    strategies.update({key: ("short_term", key) for key in ShortTermEntryScreener().short_term_strategies})
+    return strategies
+
+
+def resolve_strategies(names: Optional[Sequence[str]]) -> List[Tuple[str, str]]:
+    """解析命令行中的策略：策略键、presets（全部预设）、short-term（全部短线）或 all"""
+    known = available_strategies()
+    if not names:
+        return list(known.values())
+
+    resolved = []
+    for name in names:
+        if name == "all":
+            selected = list(known.values())
+        elif name == "presets":
+            selected = [s for s in known.values() if s[0] == "smart"]
+        elif name == "short-term":
+            selected = [s for s in known.values() if s[0] == "short_term"]
+        elif name in known:
+            selected = [known[name]]
+        else:
+            raise ValueError(f"未知策略: {name}（可选: {', '.join(known)}）")
+        resolved.extend(s for s in selected if s not in resolved)
+    return resolved
+
+
+def load_universe(path: Optional[str] = None) -> pd.DataFrame:
+    """读取股票池：指定文件（Parquet / CSV / Arrow IPC）或主机级共享快照"""
+    if path is None:
+        store = SharedSnapshotStore(UNIVERSE_SNAPSHOT_NAME)
+        return store.get_or_refresh(fetch_a_share_universe, SNAPSHOT_MAX_AGE)
+
+    if path.endswith(".csv"):
+        return pd.read_csv(path, dtype={"股票代码": str})
+    if path.endswith((".arrow", ".feather")):
+        return pd.read_feather(path)
+    return pd.read_parquet(path)
+
+
+def write_partition(df: pd.DataFrame, output_dir: str, run_date: str, screener: str, fmt: str) -> str:
+    """写入 date=<日期>/screener=<键>/ 分区（同一分区重跑时整体替换）"""
+    directory = os.path.join(output_dir, f"date={run_date}", f"screener={screener}")
+    if os.path.isdir(directory):
+        shutil.rmtree(directory)
+    os.makedirs(directory)
+
+    if fmt == FORMAT_CSV:
+        path = os.path.join(directory, "part-0.csv")
+        df.to_csv(path, index=False, encoding="utf-8-sig")
+    else:
+        path = os.path.join(directory, "part-0.parquet")
+        df = df.copy(deep=False)
+        df.attrs = {}  # 快照时间戳等属性不写入 schema 元数据
+        pq.write_table(pa.Table.from_pandas(df, preserve_index=False), path)
+    return path
+
+
+def run_batch(universe: pd.DataFrame, strategies: Sequence[Tuple[str, str]], output_dir: str = DEFAULT_OUTPUT_DIR,
+              run_date: Optional[str] = None, fmt: str = FORMAT_PARQUET, top_k: Optional[int] = None,
+              workers: Optional[int] = None, partition_by: str = PARTITION_BY_RANGE,
+              timer: Optional[StageTimer] = None) -> Dict:
+    """在股票池上执行全部策略并分区写出，返回运行汇总"""
+    timer = timer or StageTimer()
+    run_date = run_date or datetime.now(CHINA_TZ).date().isoformat()
+
+    with timer.stage("并行筛选"):
+        results = ParallelScreener(workers, partition_by).run(universe, strategies, top_k or max(len(universe), 1))
+
+    screeners = {}
+    with timer.stage("写出结果"):
+        for kind, key in strategies:
+            result = results[(kind, key)]
+            path = write_partition(result["top"], output_dir, run_date, key, fmt)
+            screeners[key] = {"kind": kind, "matched": result["matched"], "rows": len(result["top"]), "path": path}
+
+    summary = {
+        "date": run_date,
+        "universe": len(universe),
+        "format": fmt,
+        "screeners": screeners,
+        "timings": {name: round(seconds, 4) for name, seconds in timer.stages.items()},
+    }
+    with open(os.path.join(output_dir, f"date={run_date}", SUMMARY_FILE), "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    return summary
+
+
+def print_summary(summary: Dict, timer: StageTimer):
+    print(f"📅 {summary['date']} | 股票池 {summary['universe']} 只 | 输出格式 {summary['format']}")
+    for key, info in summary["screeners"].items():
+        print(f"  ✅ {key:<28} 入选 {info['matched']:>6} 只，写出 {info['rows']:>6} 行")
+    print("⏱️ 阶段耗时:")
+    for name, seconds in timer.stages.items():
+        print(f"  {name:<8} {seconds:8.3f} 秒")
+    print(f"  {'合计':<8} {timer.total:8.3f} 秒")
+
+
+# 主要接口函数
+def main(argv=None) -> Dict:
+    """批量筛选命令行入口"""
+    parser = argparse.ArgumentParser(description="A股批量筛选（结果按日期和筛选器分区写出）")
+    parser.add_argument("-s", "--strategy", action="append", dest="strategies",
+                        help="策略键，可重复；presets / short-term / all 表示一组（默认全部）")
+    parser.add_argument("--input", help="股票池文件（Parquet / CSV / Arrow），默认读取共享快照")
+    parser.add_argument("--output-dir", default=DEFAULT_OUTPUT_DIR)
+    parser.add_argument("--format", choices=[FORMAT_PARQUET, FORMAT_CSV], default=FORMAT_PARQUET)
+    parser.add_argument("--date", help="分区日期（默认北京时间当天）")
+    parser.add_argument("--top-k", type=int, help="每个筛选器最多写出的行数（默认全部入选股票）")
+    parser.add_argument("--workers", type=int, help="进程数（默认 CPU 核数）")
+    parser.add_argument("--partition-by", choices=[PARTITION_BY_RANGE, PARTITION_BY_BOARD], default=PARTITION_BY_RANGE)
+    args = parser.parse_args(argv)
+
+    try:
+        strategies = resolve_strategies(args.strategies)
+    except ValueError as e:
+        parser.error(str(e))
+
+    timer = StageTimer()
+    with timer.stage("加载快照"):
+        universe = load_universe(args.input)
+    if universe is None or universe.empty:
+        parser.exit(1, "❌ 股票池为空，未执行筛选\n")
+
+    summary = run_batch(universe, strategies, args.output_dir, args.date, args.format, args.top_k,
+                        args.workers, args.partition_by, timer)
+    print_summary(summary, timer)
+    return summary
+
+
+if __name__ == "__main__":
+    main()
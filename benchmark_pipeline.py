@@ -0,0 +1,433 @@
+"""
+数据管线基准测试
+对 抓取解析 → 清洗 → 技术指标 → 评分 → 筛选 → 表格格式化 各阶段分别计时，
+输入规模为 50 / 500 / 5,000 / 50,000 行，记录耗时（多次取最小值与中位数）与 tracemalloc 峰值内存，
+结果写成 JSON，可与历史结果逐项对比，防止热点路径随股票池扩大而退化。
+
+输入默认为固定种子生成的模拟数据；--recorded 指定录制的原始行情目录时改用录制数据
+（sina.txt：新浪接口原始响应；tencent.txt：每行一条腾讯接口响应；spot.parquet 或 spot.csv：
+akshare 全市场行情原始表），不足所需行数时循环平铺。
+
+用法:
+    python benchmark_pipeline.py                              # 全部阶段、全部规模
+    python benchmark_pipeline.py --sizes 50 500 --stages parse_sina clean_realtime
+    python benchmark_pipeline.py --compare benchmark_results/20240604-153000.json
+"""
+
+import argparse
+import gc
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from quote_server import format_sina_line, format_tencent_line, quote_symbol
+
+# 默认输入规模（行数）
+DEFAULT_SIZES = [50, 500, 5000, 50000]
+
+# 每个规模的计时次数（另有一次预热和一次内存测量）
+DEFAULT_REPEAT = 3
+
+# 结果目录
+RESULTS_DIR = "benchmark_results"
+
+# 自定义筛选阶段使用的条件
+BENCHMARK_CRITERIA = {
+    "market_cap_range": [50, 5000],
+    "pe_range": [0, 30],
+    "rsi_range": [30, 70],
+    "price_change_range": [-3, 8],
+    "volume_ratio_min": 1.2,
+}
+
+
+def make_codes(size: int) -> List[str]:
+    """带交易所后缀的股票代码（沪市、深市主板、创业板轮换）"""
+    boards = [("6", "SH"), ("0", "SZ"), ("3", "SZ")]
+    return [f"{boards[i % 3][0]}{i:05d}.{boards[i % 3][1]}" for i in range(size)]
+
+
+class PipelineInputs:
+    """某一规模的基准输入（按需生成并缓存，生成时间不计入阶段耗时）"""
+
+    def __init__(self, size: int, seed: int = 42, recorded_dir: Optional[str] = None):
+        self.size = size
+        self.seed = seed
+        self.recorded_dir = recorded_dir
+        self.codes = make_codes(size)
+        self._cache: Dict[str, object] = {}
+
+    def _recorded(self, name: str) -> Optional[str]:
+        if self.recorded_dir is None:
+            return None
+        path = os.path.join(self.recorded_dir, name)
+        return path if os.path.exists(path) else None
+
+    def _cached(self, name: str, build: Callable[[], object]):
+        if name not in self._cache:
+            self._cache[name] = build()
+        return self._cache[name]
+
+    @property
+    def source(self) -> str:
+        return "recorded" if self.recorded_dir else "synthetic"
+
+    def _quotes(self) -> pd.DataFrame:
+        rng = np.random.default_rng(self.seed)
+        prev_close = rng.uniform(3, 200, self.size).round(2)
+        price = (prev_close * (1 + rng.uniform(-0.1, 0.1, self.size))).round(2)
+        return pd.DataFrame({
+            "prev_close": prev_close,
+            "price": price,
+            "open": (prev_close * (1 + rng.uniform(-0.03, 0.03, self.size))).round(2),
+            "high": np.maximum(price, prev_close).round(2),
+            "low": np.minimum(price, prev_close).round(2),
+            "volume": rng.integers(10 ** 4, 10 ** 8, self.size),
+            "amount": rng.uniform(1e6, 1e10, self.size).round(2),
+        })
+
+    def _quote_rows(self) -> List[Dict]:
+        quotes = self._quotes()
+        quotes.insert(0, "name", [f"股票{code[:6]}" for code in self.codes])
+        return quotes.to_dict("records")
+
+    def sina_payload(self) -> Tuple[str, List[str]]:
+        """新浪接口原始响应文本与对应的代码列表"""
+        def build():
+            path = self._recorded("sina.txt")
+            if path:
+                with open(path, encoding="utf-8") as f:
+                    lines = [line for line in f.read().strip().split("\n") if '="' in line]
+                lines = [lines[i % len(lines)] for i in range(self.size)]
+                codes = [_code_from_quote_line(line) for line in lines]
+                return "\n".join(lines), codes
+
+            lines = [format_sina_line(quote_symbol(code), quote) for code, quote in zip(self.codes, self._quote_rows())]
+            return "\n".join(lines), list(self.codes)
+        return self._cached("sina", build)
+
+    def tencent_payload(self) -> List[str]:
+        """腾讯接口原始响应（每只股票一条）"""
+        def build():
+            path = self._recorded("tencent.txt")
+            if path:
+                with open(path, encoding="utf-8") as f:
+                    lines = [line for line in f.read().strip().split("\n") if "~" in line]
+                return [lines[i % len(lines)] for i in range(self.size)]
+
+            return [format_tencent_line(quote_symbol(code), quote) for code, quote in zip(self.codes, self._quote_rows())]
+        return self._cached("tencent", build)
+
+    def raw_spot(self) -> pd.DataFrame:
+        """akshare 全市场行情原始表（约 2% 的停牌行价格为 0，供清洗过滤）"""
+        def build():
+            for name, reader in (("spot.parquet", pd.read_parquet), ("spot.csv", pd.read_csv)):
+                path = self._recorded(name)
+                if path:
+                    recorded = reader(path)
+                    return recorded.iloc[np.arange(self.size) % len(recorded)].reset_index(drop=True)
+
+            rng = np.random.default_rng(self.seed + 1)
+            quotes = self._quotes()
+            suspended = rng.uniform(0, 1, self.size) < 0.02
+            total_cap = rng.uniform(2e9, 2e12, self.size)
+            return pd.DataFrame({
+                "代码": [code[:6] for code in self.codes],
+                "名称": [f"股票{code[:6]}" for code in self.codes],
+                "最新价": np.where(suspended, 0.0, quotes["price"]),
+                "涨跌幅": ((quotes["price"] / quotes["prev_close"] - 1) * 100).round(2),
+                "涨跌额": (quotes["price"] - quotes["prev_close"]).round(2),
+                "成交量": quotes["volume"],
+                "成交额": np.where(suspended, 0.0, quotes["amount"]),
+                "振幅": rng.uniform(0, 12, self.size).round(2),
+                "最高": quotes["high"],
+                "最低": quotes["low"],
+                "今开": quotes["open"],
+                "昨收": quotes["prev_close"],
+                "换手率": rng.uniform(0.05, 20, self.size).round(2),
+                "市盈率-动态": rng.uniform(-50, 150, self.size).round(2),
+                "市净率": rng.uniform(0.3, 15, self.size).round(2),
+                "总市值": total_cap,
+                "流通市值": total_cap * rng.uniform(0.3, 1, self.size),
+            })
+        return self._cached("raw_spot", build)
+
+    def cleaned(self) -> pd.DataFrame:
+        """清洗后的实时行情"""
+        from real_data_fetcher import RealDataFetcher
+        return self._cached("cleaned", lambda: RealDataFetcher()._clean_realtime_data(self.raw_spot().copy()))
+
+    def realtime(self) -> pd.DataFrame:
+        """清洗并计算全部技术指标后的实时行情（自定义筛选与结果表使用）"""
+        from real_data_fetcher import RealDataFetcher
+        return self._cached("realtime", lambda: RealDataFetcher().calculate_technical_indicators(self.cleaned()))
+
+    def universe(self) -> pd.DataFrame:
+        """含财务字段与全部派生列的A股数据（预设筛选器与短线策略使用）"""
+        def build():
+            from china_a_stock_fetcher import ChinaAStockFetcher
+            random.seed(self.seed)
+            return ChinaAStockFetcher().generate_enhanced_mock_data(self.codes)
+        return self._cached("universe", build)
+
+
+def _code_from_quote_line(line: str) -> str:
+    """从 var hq_str_sh600000="..." 取出 600000.SH"""
+    symbol = line.split("=")[0].split("_")[-1]
+    return f"{symbol[2:]}.{symbol[:2].upper()}"
+
+
+class Stage:
+    """基准阶段：prepare 生成本次调用的参数（不计时），run 为被测函数"""
+
+    def __init__(self, name: str, prepare: Callable[[PipelineInputs], tuple], run: Callable, description: str):
+        self.name = name
+        self.prepare = prepare
+        self.run = run
+        self.description = description
+
+
+def _fetcher():
+    from china_a_stock_fetcher import ChinaAStockFetcher
+    return ChinaAStockFetcher()
+
+
+def _realtime_fetcher():
+    from real_data_fetcher import RealDataFetcher
+    return RealDataFetcher()
+
+
+def _parse_tencent(fetcher, lines: List[str]) -> list:
+    return [fetcher.parse_tencent_data(line) for line in lines]
+
+
+def _indicators(fetcher, df: pd.DataFrame) -> pd.DataFrame:
+    from derived_columns import clear_derived_cache
+    clear_derived_cache()  # 每次都从头计算，不命中快照派生列缓存
+    return fetcher.calculate_technical_indicators(df)
+
+
+def _all_presets(df: pd.DataFrame) -> Dict[str, int]:
+    from smart_stock_screener import SmartStockScreener
+    screener = SmartStockScreener()
+    return {key: len(screener.apply_screener_logic(df, key)) for key in screener.screener_logic}
+
+
+def _preset_masks(df: pd.DataFrame) -> Dict[str, int]:
+    from smart_stock_screener import SmartStockScreener
+    screener = SmartStockScreener()
+    return {key: int(screener.screener_mask(df, key).sum()) for key in screener.screener_logic}
+
+
+def _preset_masks_boolean(df: pd.DataFrame) -> Dict[str, int]:
+    """对照基线：每个条件都在整张表上算布尔掩码再相与，类别条件直接比较行业列"""
+    from filter_planner import CategoryPredicate
+    from smart_stock_screener import SmartStockScreener
+    screener = SmartStockScreener()
+    all_rows = np.arange(len(df))
+    industries = df["行业"].astype("object").to_numpy()
+    counts = {}
+    for key, logic in screener.screener_logic.items():
+        mask = np.ones(len(df), dtype=bool)
+        for predicate in screener.build_predicates(key):
+            if isinstance(predicate, CategoryPredicate):
+                hits = np.isin(industries, predicate.values)
+                mask &= ~hits if predicate.negate else hits
+            elif predicate.available(df):
+                mask &= predicate.evaluate(df, all_rows)
+        preferred = mask & np.isin(industries, logic["preferred_industries"])
+        counts[key] = int((preferred if preferred.any() else mask).sum())
+    return counts
+
+
+def _all_short_term(df: pd.DataFrame) -> Dict[str, int]:
+    from short_term_entry_screener import ShortTermEntryScreener
+    screener = ShortTermEntryScreener()
+    return {key: len(screener.score_entries(df, key).head(20)) for key in screener.short_term_strategies}
+
+
+def _custom_criteria(df: pd.DataFrame, criteria: Dict) -> pd.DataFrame:
+    from stock_screener_app import apply_custom_criteria
+    return apply_custom_criteria(df, criteria)
+
+
+def _format_table(df: pd.DataFrame) -> pd.DataFrame:
+    from stock_screener_app import format_results_table
+    return format_results_table(df)
+
+
+STAGES: Dict[str, Stage] = {stage.name: stage for stage in [
+    Stage("parse_sina", lambda i: (_fetcher(), *i.sina_payload()),
+          lambda fetcher, text, codes: fetcher.parse_sina_data(text, codes),
+          "ChinaAStockFetcher.parse_sina_data"),
+    Stage("parse_tencent", lambda i: (_fetcher(), i.tencent_payload()), _parse_tencent,
+          "ChinaAStockFetcher.parse_tencent_data（逐只）"),
+    Stage("clean_realtime", lambda i: (_realtime_fetcher(), i.raw_spot().copy()),
+          lambda fetcher, df: fetcher._clean_realtime_data(df),
+          "RealDataFetcher._clean_realtime_data"),
+    Stage("technical_indicators", lambda i: (_realtime_fetcher(), i.cleaned().copy()), _indicators,
+          "RealDataFetcher.calculate_technical_indicators（不命中派生列缓存）"),
+    Stage("comprehensive_score", lambda i: (i.realtime(),),
+          lambda df: _realtime_fetcher()._calculate_comprehensive_score(df),
+          "RealDataFetcher._calculate_comprehensive_score"),
+    Stage("apply_screener_logic", lambda i: (i.universe().copy(),), _all_presets,
+          "SmartStockScreener.apply_screener_logic（全部6个预设）"),
+    Stage("preset_masks", lambda i: (i.universe().copy(deep=False),), _preset_masks,
+          "SmartStockScreener.screener_mask（规划器 + 快照类别位图，全部6个预设，每次为快照的新副本）"),
+    Stage("preset_masks_boolean", lambda i: (i.universe().copy(deep=False),), _preset_masks_boolean,
+          "preset_masks 的对照基线：整表布尔掩码逐条件相与（不经规划器）"),
+    Stage("short_term_entries", lambda i: (i.universe().copy(),), _all_short_term,
+          "ShortTermEntryScreener.score_entries + 前20名（screen_short_term_entries 的计算部分，全部策略）"),
+    Stage("custom_criteria", lambda i: (i.realtime().copy(), BENCHMARK_CRITERIA), _custom_criteria,
+          "stock_screener_app.apply_custom_criteria"),
+    Stage("format_table", lambda i: (i.realtime(),), _format_table,
+          "stock_screener_app.format_results_table（结果表格式化）"),
+]}
+
+
+def measure(stage: Stage, inputs: PipelineInputs, repeat: int = DEFAULT_REPEAT) -> Dict:
+    """对一个阶段计时并测量峰值内存（先预热一次）"""
+    stage.run(*stage.prepare(inputs))
+
+    timings = []
+    for _ in range(repeat):
+        args = stage.prepare(inputs)
+        gc.collect()
+        started = time.perf_counter()
+        stage.run(*args)
+        timings.append(time.perf_counter() - started)
+        del args
+
+    # 内存单独测量一次（tracemalloc 会拖慢执行，不与计时混在一起）
+    args = stage.prepare(inputs)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        stage.run(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "stage": stage.name,
+        "rows": inputs.size,
+        "input": inputs.source,
+        "repeat": repeat,
+        "seconds_min": min(timings),
+        "seconds_median": statistics.median(timings),
+        "peak_bytes": peak,
+        "rows_per_second": inputs.size / min(timings) if min(timings) > 0 else None,
+    }
+
+
+def _environment() -> Dict:
+    import pyarrow
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "pyarrow": pyarrow.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def run_benchmarks(sizes: Sequence[int] = DEFAULT_SIZES, stages: Optional[Sequence[str]] = None,
+                   repeat: int = DEFAULT_REPEAT, recorded_dir: Optional[str] = None,
+                   progress: Optional[Callable[[Dict], None]] = None) -> Dict:
+    """按规模依次运行各阶段，返回 {"meta": 运行环境, "results": [每个阶段×规模一条]}"""
+    names = list(stages or STAGES)
+    unknown = [name for name in names if name not in STAGES]
+    if unknown:
+        raise ValueError(f"未知阶段: {', '.join(unknown)}（可选: {', '.join(STAGES)}）")
+
+    results = []
+    for size in sizes:
+        inputs = PipelineInputs(size, recorded_dir=recorded_dir)
+        for name in names:
+            result = measure(STAGES[name], inputs, repeat)
+            results.append(result)
+            if progress:
+                progress(result)
+
+    meta = dict(_environment(), started_at=datetime.now().isoformat(timespec="seconds"),
+                sizes=list(sizes), repeat=repeat)
+    return {"meta": meta, "results": results}
+
+
+def compare_results(current: Dict, baseline: Dict) -> List[Dict]:
+    """与历史结果逐项对比：ratio > 1 表示比基线慢"""
+    previous = {(r["stage"], r["rows"]): r for r in baseline["results"]}
+    rows = []
+    for result in current["results"]:
+        before = previous.get((result["stage"], result["rows"]))
+        if before is None:
+            continue
+        rows.append({
+            "stage": result["stage"],
+            "rows": result["rows"],
+            "time_ratio": result["seconds_min"] / before["seconds_min"] if before["seconds_min"] else None,
+            "memory_ratio": result["peak_bytes"] / before["peak_bytes"] if before["peak_bytes"] else None,
+        })
+    return rows
+
+
+def _format_result(result: Dict) -> str:
+    return (f"  {result['stage']:<22} {result['rows']:>7} 行  "
+            f"{result['seconds_min'] * 1000:10.2f} ms (中位 {result['seconds_median'] * 1000:.2f})  "
+            f"峰值 {result['peak_bytes'] / 1024 / 1024:8.2f} MB")
+
+
+# 主要接口函数
+def main(argv=None) -> Dict:
+    """基准测试命令行入口"""
+    parser = argparse.ArgumentParser(description="数据管线分阶段基准测试")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--stages", nargs="+", choices=list(STAGES), help="默认全部阶段")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    parser.add_argument("--recorded", help="录制的原始行情目录（sina.txt / tencent.txt / spot.parquet）")
+    parser.add_argument("--output", help=f"结果 JSON 路径（默认 {RESULTS_DIR}/<时间>.json）")
+    parser.add_argument("--compare", help="与之对比的历史结果 JSON")
+    args = parser.parse_args(argv)
+
+    logging.getLogger().setLevel(logging.WARNING)  # 指标计算的进度日志不混入结果
+    print(f"🧪 基准测试: 规模 {args.sizes}，每项计时 {args.repeat} 次")
+    report = run_benchmarks(args.sizes, args.stages, args.repeat, args.recorded,
+                            progress=lambda result: print(_format_result(result)))
+
+    output = args.output or os.path.join(RESULTS_DIR, datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"✅ 结果已写入 {output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"📊 与 {args.compare} 对比（>1 表示变慢/变大）:")
+        for row in compare_results(report, baseline):
+            time_ratio = f"{row['time_ratio']:.2f}x" if row["time_ratio"] else "N/A"
+            memory_ratio = f"{row['memory_ratio']:.2f}x" if row["memory_ratio"] else "N/A"
+            print(f"  {row['stage']:<22} {row['rows']:>7} 行  耗时 {time_ratio:>7}  内存 {memory_ratio:>7}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,544 @@
+"""
+统一缓存接口
+行情、基本信息、筛选结果等缓存统一经过 Cache，后端可选：
+进程内 LRU（默认）、本地磁盘、Redis 协议（多副本共享热数据）。
+DataFrame 以 Arrow IPC（zstd 压缩）序列化，其余对象用 pickle + zlib 压缩；
+过期时间可按A股交易时段计算，收盘后的数据一直有效到下一次开盘。
+"""
+
+import functools
+import hashlib
+import inspect
+import os
+import pickle
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from metrics import get_metrics
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+# 缓存键命名空间
+CACHE_NAMESPACE = "stock_screener"
+
+# 北京时间（A股无夏令时）
+CHINA_TZ = timezone(timedelta(hours=8))
+
+# A股交易时段（含集合竞价）
+TRADING_SESSIONS = [((9, 15), (11, 30)), ((13, 0), (15, 0))]
+
+# 序列化格式标记
+_ARROW = b"A"
+_PICKLE = b"P"
+
+# 缓存未命中标记（区分缓存了 None）
+_MISSING = object()
+
+# 进程内缓存与磁盘缓存的默认上限
+DEFAULT_MAX_BYTES = int(float(os.environ.get("STOCK_CACHE_MAX_MB", "256")) * 1024 * 1024)
+DEFAULT_MAX_ENTRIES = 1024
+
+
+def estimate_size(value: Any) -> int:
+    """估算缓存值占用的字节数（DataFrame 按 memory_usage(deep=True) 计算）"""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    if isinstance(value, (bytes, bytearray, str)):
+        return sys.getsizeof(value)
+    if isinstance(value, (tuple, list, set)):
+        return sys.getsizeof(value) + sum(estimate_size(item) for item in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    return sys.getsizeof(value)
+
+
+def _session_bounds(day: datetime):
+    for (start_h, start_m), (end_h, end_m) in TRADING_SESSIONS:
+        yield (day.replace(hour=start_h, minute=start_m, second=0, microsecond=0),
+               day.replace(hour=end_h, minute=end_m, second=0, microsecond=0))
+
+
+def next_session_open(now: datetime) -> datetime:
+    """下一个交易时段开始时间（只考虑周末，不含法定节假日）"""
+    day = now
+    while True:
+        if day.weekday() < 5:
+            for start, _ in _session_bounds(day):
+                if start > now:
+                    return start
+        day = (day + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def is_trading_time(now: Optional[datetime] = None) -> bool:
+    """当前是否处于A股交易时段"""
+    now = (now or datetime.now(CHINA_TZ)).astimezone(CHINA_TZ)
+    if now.weekday() >= 5:
+        return False
+    return any(start <= now < end for start, end in _session_bounds(now))
+
+
+def market_ttl(ttl: float, now: Optional[datetime] = None) -> float:
+    """按交易时段调整过期时间
+
+    交易时段内使用给定 ttl；休市期间行情不会变化，缓存一直有效到下一次开盘。
+    """
+    now = (now or datetime.now(CHINA_TZ)).astimezone(CHINA_TZ)
+    if is_trading_time(now):
+        return ttl
+    return max(ttl, (next_session_open(now) - now).total_seconds())
+
+
+def serialize(value: Any) -> bytes:
+    """序列化缓存值：DataFrame 用 Arrow IPC（zstd），其余用 pickle + zlib"""
+    if pa is not None and isinstance(value, pd.DataFrame):
+        frame = value.copy(deep=False)
+        frame.attrs = {}
+        table = pa.Table.from_pandas(frame)
+        metadata = dict(table.schema.metadata or {})
+        metadata[b"attrs"] = pickle.dumps(value.attrs)
+        table = table.replace_schema_metadata(metadata)
+        sink = pa.BufferOutputStream()
+        options = pa.ipc.IpcWriteOptions(compression="zstd")
+        with pa.ipc.new_stream(sink, table.schema, options=options) as writer:
+            writer.write_table(table)
+        return _ARROW + sink.getvalue().to_pybytes()
+    return _PICKLE + zlib.compress(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def deserialize(data: bytes) -> Any:
+    """反序列化缓存值"""
+    kind, payload = data[:1], data[1:]
+    if kind == _ARROW:
+        table = pa.ipc.open_stream(payload).read_all()
+        df = table.to_pandas()
+        attrs = (table.schema.metadata or {}).get(b"attrs")
+        if attrs:
+            df.attrs.update(pickle.loads(attrs))
+        return df
+    return pickle.loads(zlib.decompress(payload))
+
+
+class CacheBackend:
+    """缓存后端基类"""
+
+    # 为 True 时直接保存对象，不经过序列化
+    stores_objects = False
+
+    def get(self, key: str) -> Any:
+        """返回缓存值，不存在或已过期时返回 _MISSING"""
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def clear(self, namespace: str = CACHE_NAMESPACE):
+        """清除命名空间下的全部键（键的形式为 "命名空间:键"）"""
+        raise NotImplementedError
+
+
+class MemoryLRUBackend(CacheBackend):
+    """进程内 LRU 缓存，按估算字节数和条目数限制容量
+
+    写入时先清理过期条目，仍超出上限时淘汰最久未使用的条目；
+    单个超过字节上限的值不会被缓存。
+    """
+
+    stores_objects = True
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        # key -> (过期时间, 值, 字节数)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "rejections": 0}
+
+    def _remove(self, key: str):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def _purge_expired(self, now: float):
+        expired = [k for k, (expires_at, _, _) in self._entries.items()
+                   if expires_at is not None and expires_at <= now]
+        for key in expired:
+            self._remove(key)
+        self._stats["expirations"] += len(expired)
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return _MISSING
+            expires_at, value, _ = entry
+            if expires_at is not None and expires_at <= time.time():
+                self._remove(key)
+                self._stats["expirations"] += 1
+                self._stats["misses"] += 1
+                return _MISSING
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        size = estimate_size(value)
+        now = time.time()
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if size > self.max_bytes:
+                self._stats["rejections"] += 1
+                return
+
+            if self._bytes + size > self.max_bytes or len(self._entries) >= self.max_entries:
+                self._purge_expired(now)
+            while self._entries and (self._bytes + size > self.max_bytes
+                                     or len(self._entries) >= self.max_entries):
+                self._remove(next(iter(self._entries)))
+                self._stats["evictions"] += 1
+
+            expires_at = None if ttl is None else now + ttl
+            self._entries[key] = (expires_at, value, size)
+            self._bytes += size
+
+    def delete(self, key: str):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self, namespace: str = CACHE_NAMESPACE):
+        prefix = f"{namespace}:"
+        with self._lock:
+            for key in [k for k in self._entries if k.startswith(prefix)]:
+                self._remove(key)
+
+    def stats(self) -> Dict[str, float]:
+        """命中、未命中、淘汰统计与当前占用"""
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "hit_rate": self._stats["hits"] / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+class DiskBackend(CacheBackend):
+    """本地磁盘缓存（同一主机上的进程共享），按文件字节数和条目数限制容量
+
+    读取命中时刷新文件修改时间，写入后超出上限时先删除过期文件，再按修改时间
+    淘汰最久未使用的文件；单个超过字节上限的值不会被缓存。
+    """
+
+    def __init__(self, directory: Optional[str] = None, max_bytes: int = DEFAULT_MAX_BYTES,
+                 max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.directory = directory or os.path.join(tempfile.gettempdir(), "stock_screener_cache")
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        os.makedirs(self.directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "rejections": 0}
+
+    @staticmethod
+    def _namespace_tag(namespace: str) -> str:
+        return hashlib.sha1(namespace.encode()).hexdigest()[:8]
+
+    def _path(self, key: str) -> str:
+        # 文件名带命名空间前缀，按命名空间清除时不必读取文件
+        namespace = key.split(":", 1)[0] if ":" in key else ""
+        digest = hashlib.sha1(key.encode()).hexdigest()
+        return os.path.join(self.directory, f"{self._namespace_tag(namespace)}-{digest}.cache")
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+    @staticmethod
+    def _expires_at(path: str) -> Optional[float]:
+        with open(path, "rb") as f:
+            header = f.readline()
+        return float(header) if header.strip() else None
+
+    def get(self, key: str) -> Any:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                header = f.readline()
+                expires_at = float(header) if header.strip() else None
+                if expires_at is not None and expires_at <= time.time():
+                    self._count("expirations")
+                    self._count("misses")
+                    return _MISSING
+                value = f.read()
+            # 修改时间即最近使用时间，淘汰时按它排序
+            os.utime(path)
+        except (OSError, ValueError):
+            self._count("misses")
+            return _MISSING
+        self._count("hits")
+        return value
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        path = self._path(key)
+        header = b"\n" if ttl is None else f"{time.time() + ttl}\n".encode()
+        if len(header) + len(value) > self.max_bytes:
+            self.delete(key)
+            self._count("rejections")
+            return
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(header)
+            f.write(value)
+        os.replace(tmp_path, path)
+        self._enforce_limits(keep=path)
+
+    def _scan(self) -> List[tuple]:
+        """目录中的缓存文件: [(修改时间, 字节数, 路径)]"""
+        files = []
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.name.endswith(".cache"):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    files.append((stat.st_mtime, stat.st_size, entry.path))
+        return files
+
+    def _enforce_limits(self, keep: str):
+        files = self._scan()
+        total = sum(size for _, size, _ in files)
+        if total <= self.max_bytes and len(files) <= self.max_entries:
+            return
+
+        # 先删除过期文件，仍超出上限时按修改时间从旧到新淘汰（刚写入的文件保留）
+        now = time.time()
+        remaining = []
+        for mtime, size, path in files:
+            try:
+                expires_at = self._expires_at(path)
+            except (OSError, ValueError):
+                expires_at = None
+            if path != keep and expires_at is not None and expires_at <= now:
+                if self._unlink(path):
+                    self._count("expirations")
+                total -= size
+            else:
+                remaining.append((mtime, size, path))
+
+        remaining.sort()
+        count = len(remaining)
+        for _, size, path in remaining:
+            if total <= self.max_bytes and count <= self.max_entries:
+                break
+            if path == keep:
+                continue
+            if self._unlink(path):
+                self._count("evictions")
+            total -= size
+            count -= 1
+
+    @staticmethod
+    def _unlink(path: str) -> bool:
+        # 其他进程可能已删除同一文件
+        try:
+            os.remove(path)
+            return True
+        except OSError:
+            return False
+
+    def delete(self, key: str):
+        self._unlink(self._path(key))
+
+    def clear(self, namespace: str = CACHE_NAMESPACE):
+        prefix = f"{self._namespace_tag(namespace)}-"
+        for name in os.listdir(self.directory):
+            if name.startswith(prefix) and name.endswith(".cache"):
+                self._unlink(os.path.join(self.directory, name))
+
+    def stats(self) -> Dict[str, float]:
+        """本进程的命中、淘汰统计与目录当前占用"""
+        files = self._scan()
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "hit_rate": self._stats["hits"] / lookups if lookups else 0.0,
+                "entries": len(files),
+                "bytes": sum(size for _, size, _ in files),
+                "max_bytes": self.max_bytes,
+            }
+
+
+class RedisBackend(CacheBackend):
+    """Redis 协议缓存（兼容 Redis 的服务均可，多副本共享）"""
+
+    def __init__(self, url: str = "redis://localhost:6379/0", client=None):
+        if client is None:
+            if redis is None:
+                raise ImportError("使用 Redis 缓存需要安装 redis: pip install redis")
+            client = redis.Redis.from_url(url)
+        self.client = client
+
+    def get(self, key: str) -> Any:
+        value = self.client.get(key)
+        return _MISSING if value is None else value
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        if ttl is None:
+            self.client.set(key, value)
+        else:
+            self.client.set(key, value, px=max(1, int(ttl * 1000)))
+
+    def delete(self, key: str):
+        self.client.delete(key)
+
+    def clear(self, namespace: str = CACHE_NAMESPACE):
+        # 只清理给定命名空间下的键，同一 Redis 上的其他应用不受影响
+        for key in self.client.scan_iter(match=f"{namespace}:*"):
+            self.client.delete(key)
+
+
+class Cache:
+    """缓存前端：统一键命名、序列化和交易时段过期"""
+
+    def __init__(self, backend: Optional[CacheBackend] = None, namespace: str = CACHE_NAMESPACE):
+        self.backend = backend or MemoryLRUBackend()
+        self.namespace = namespace
+
+    def _key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    def _load(self, value: Any) -> Any:
+        if not self.backend.stores_objects:
+            return deserialize(value)
+        # 进程内缓存返回浅拷贝，调用方增删列不会影响缓存中的对象
+        return value.copy(deep=False) if isinstance(value, pd.DataFrame) else value
+
+    def get(self, key: str, default: Any = None) -> Any:
+        value = self.backend.get(self._key(key))
+        return default if value is _MISSING else self._load(value)
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None, session_aware: bool = True):
+        """写入缓存；session_aware 为 True 时休市期间延长到下一次开盘"""
+        if ttl is not None and session_aware:
+            ttl = market_ttl(ttl)
+        payload = value if self.backend.stores_objects else serialize(value)
+        self.backend.set(self._key(key), payload, ttl)
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any], ttl: Optional[float] = None,
+                       session_aware: bool = True, cache_empty: bool = False) -> Any:
+        """读取缓存，未命中时计算并写入（空结果默认不缓存）"""
+        value = self.backend.get(self._key(key))
+        if value is not _MISSING:
+            return self._load(value)
+
+        value = compute()
+        empty = value is None or (isinstance(value, pd.DataFrame) and value.empty)
+        if cache_empty or not empty:
+            self.set(key, value, ttl, session_aware)
+        return self._load(value) if self.backend.stores_objects else value
+
+    def delete(self, key: str):
+        self.backend.delete(self._key(key))
+
+    def clear(self):
+        """清除本命名空间下的缓存（共享后端上其他命名空间的缓存保留）"""
+        self.backend.clear(self.namespace)
+
+    def stats(self) -> Dict[str, float]:
+        """后端统计信息（不支持统计的后端返回空字典）"""
+        return self.backend.stats() if hasattr(self.backend, "stats") else {}
+
+
+def cached(ttl: Optional[float] = None, session_aware: bool = True):
+    """函数结果缓存装饰器，替代 st.cache_data
+
+    缓存键由按函数签名绑定（补齐默认值）后的参数生成；
+    参数名为 self/_self 的第一个参数不参与缓存键，与 st.cache_data 的约定一致。
+    """
+    def decorator(func: Callable) -> Callable:
+        prefix = f"{func.__module__}.{func.__qualname__}"
+        # 被其他装饰器（如 traced）包装时按原函数的签名绑定参数
+        signature = inspect.signature(inspect.unwrap(func))
+        params = list(signature.parameters)
+        skip = params[0] if params and params[0] in ("self", "_self") else None
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            # 按签名绑定并补齐默认值，位置参数、关键字参数和省略默认值的调用得到同一个键
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key_args = [(name, value) for name, value in bound.arguments.items() if name != skip]
+            digest = hashlib.sha1(repr(key_args).encode()).hexdigest()
+            missed = []
+
+            def compute():
+                missed.append(True)
+                return func(*args, **kwargs)
+
+            value = get_cache().get_or_compute(f"{prefix}:{digest}", compute, ttl, session_aware)
+            get_metrics().cache_requests.inc(function=prefix, result="miss" if missed else "hit")
+            return value
+        return wrapper
+    return decorator
+
+
+def create_backend(kind: Optional[str] = None) -> CacheBackend:
+    """按环境变量创建缓存后端
+
+    STOCK_CACHE_BACKEND: memory（默认）/ disk / redis
+    STOCK_CACHE_DIR: 磁盘缓存目录；STOCK_CACHE_URL: Redis 地址
+    STOCK_CACHE_MAX_MB: 进程内缓存与磁盘缓存的字节上限
+    """
+    kind = (kind or os.environ.get("STOCK_CACHE_BACKEND", "memory")).lower()
+    if kind == "disk":
+        return DiskBackend(os.environ.get("STOCK_CACHE_DIR"))
+    if kind == "redis":
+        return RedisBackend(os.environ.get("STOCK_CACHE_URL", "redis://localhost:6379/0"))
+    return MemoryLRUBackend()
+
+
+# 主要接口函数
+# 全局缓存实例
+_cache = None
+
+def get_cache() -> Cache:
+    """获取全局缓存实例"""
+    global _cache
+    if _cache is None:
+        _cache = Cache(create_backend())
+    return _cache
+
+def set_cache_backend(backend: CacheBackend) -> Cache:
+    """替换全局缓存后端"""
+    global _cache
+    _cache = Cache(backend)
+    return _cache
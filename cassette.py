@@ -0,0 +1,354 @@
+"""
+数据源录制与回放
+在数据源边界（akshare / yfinance 调用与 HTTP 请求）记录响应：录制模式下把每次调用的键、
+相对到达时间、耗时和返回值（表格用 Arrow IPC，其余对象用 pickle，均压缩）写成一个列式 Parquet 文件；
+回放模式下不访问网络，按键依次返回录制的结果，可按录制时的到达间隔回放，也可尽快返回。
+测试、基准与调试脚本因此不再依赖网络，结果可复现。
+
+用法:
+    STOCK_CASSETTE=cassettes/a_share.parquet STOCK_CASSETTE_MODE=record python test_china_a_stock.py
+    STOCK_CASSETTE=cassettes/a_share.parquet STOCK_CASSETTE_MODE=replay python test_china_a_stock.py
+
+    with use_cassette("cassettes/a_share.parquet", MODE_REPLAY, pacing=PACING_RECORDED):
+        df = RealDataFetcher().get_stock_realtime_data()
+"""
+
+import atexit
+import hashlib
+import importlib
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+from cache_backend import deserialize, serialize
+from tracing import current_span
+
+# 模式
+MODE_RECORD = "record"
+MODE_REPLAY = "replay"
+
+# 回放节奏：尽快返回，或按录制时的到达间隔返回
+PACING_FAST = "fast"
+PACING_RECORDED = "recorded"
+
+# 录制条目类型
+KIND_VALUE = "value"    # 调用或属性返回的数据
+KIND_OBJECT = "object"  # 返回的对象（如 yf.Ticker），回放时以代理替代
+KIND_HTTP = "http"      # HTTP 响应
+
+# 可直接序列化保存的返回值类型
+_DATA_TYPES = (pd.DataFrame, pd.Series, dict, list, tuple, str, bytes, int, float, bool, type(None),
+               np.generic, np.ndarray)
+
+CASSETTE_SCHEMA = pa.schema([
+    ("seq", pa.int32()),
+    ("key", pa.string()),
+    ("kind", pa.dictionary(pa.int8(), pa.string())),
+    ("offset", pa.float64()),
+    ("duration", pa.float64()),
+    ("error", pa.string()),
+    ("payload", pa.binary()),
+])
+
+
+class CassetteMiss(KeyError):
+    """回放时没有录制该调用"""
+
+
+class ReplayedError(Exception):
+    """录制时数据源抛出的异常（原异常类型无法重建时使用）"""
+
+
+class _ReplayedObject:
+    """回放时代表录制期间返回的对象"""
+
+
+REPLAYED_OBJECT = _ReplayedObject()
+
+
+def _error_text(error: BaseException) -> str:
+    cls = type(error)
+    return f"{cls.__module__}.{cls.__qualname__}: {error}"
+
+
+def _rebuild_error(text: str) -> Exception:
+    """按录制的 模块.类名: 消息 重建异常"""
+    path, _, message = text.partition(": ")
+    module, _, name = path.rpartition(".")
+    try:
+        cls = getattr(importlib.import_module(module), name)
+        if isinstance(cls, type) and issubclass(cls, Exception):
+            return cls(message)
+    except Exception:
+        pass
+    return ReplayedError(text)
+
+
+class Cassette:
+    """一盘录制带：录制模式累积调用记录，save() 时写出；回放模式按键依次返回录制的结果"""
+
+    def __init__(self, path: str, mode: str = MODE_REPLAY, pacing: str = PACING_FAST):
+        if mode not in (MODE_RECORD, MODE_REPLAY):
+            raise ValueError(f"未知模式: {mode}")
+        if pacing not in (PACING_FAST, PACING_RECORDED):
+            raise ValueError(f"未知回放节奏: {pacing}")
+        self.path = path
+        self.mode = mode
+        self.pacing = pacing
+        self.stats = {"recorded": 0, "replayed": 0, "misses": 0}
+        self._lock = threading.Lock()
+        self._rows: List[Dict] = []
+        self._tapes: Dict[str, Deque[Dict]] = {}
+        self._last: Dict[str, Dict] = {}
+        if mode == MODE_REPLAY:
+            self._load()
+        self._started = time.perf_counter()
+
+    def _load(self):
+        for row in pq.read_table(self.path).to_pylist():
+            self._tapes.setdefault(row["key"], deque()).append(row)
+
+    def __len__(self) -> int:
+        return len(self._rows) if self.mode == MODE_RECORD else sum(len(t) for t in self._tapes.values())
+
+    def has(self, key: str) -> bool:
+        return key in self._tapes or key in self._last
+
+    def call(self, key: str, fetch: Optional[Callable[[], Any]], kind: Optional[str] = None) -> Any:
+        """执行一次数据源调用：录制模式调用 fetch 并记录，回放模式返回录制结果"""
+        if self.mode == MODE_REPLAY:
+            return self.replay(key)
+
+        started = time.perf_counter()
+        try:
+            value = fetch()
+        except Exception as e:
+            self._append(key, kind or KIND_VALUE, started, error=_error_text(e))
+            raise
+        self._append(key, kind, started, value=value)
+        return value
+
+    def record_value(self, key: str, value: Any, started: float):
+        """记录一次已取得的值（属性访问）"""
+        self._append(key, None, started, value=value)
+
+    def _append(self, key: str, kind: Optional[str], started: float, value: Any = None, error: Optional[str] = None):
+        duration = time.perf_counter() - started
+        payload = None
+        if error is None:
+            kind = kind or (KIND_VALUE if isinstance(value, _DATA_TYPES) else KIND_OBJECT)
+            if kind != KIND_OBJECT:
+                payload = serialize(value)
+        with self._lock:
+            self._rows.append({"seq": len(self._rows), "key": key, "kind": kind, "offset": started - self._started,
+                               "duration": duration, "error": error, "payload": payload})
+            self.stats["recorded"] += 1
+
+    def replay(self, key: str) -> Any:
+        """返回该键的下一条录制结果（录制条目用完后重复最后一条）"""
+        with self._lock:
+            tape = self._tapes.get(key)
+            if tape:
+                row = tape.popleft()
+                if not tape:
+                    del self._tapes[key]
+                self._last[key] = row
+            elif key in self._last:
+                row = self._last[key]
+            else:
+                self.stats["misses"] += 1
+                raise CassetteMiss(key)
+            self.stats["replayed"] += 1
+
+        if self.pacing == PACING_RECORDED:
+            wait = row["offset"] + row["duration"] - (time.perf_counter() - self._started)
+            if wait > 0:
+                time.sleep(wait)
+        if row["error"] is not None:
+            raise _rebuild_error(row["error"])
+        if row["kind"] == KIND_OBJECT:
+            return REPLAYED_OBJECT
+        return deserialize(row["payload"])
+
+    def save(self):
+        """写出录制结果（回放模式下不做任何事）"""
+        if self.mode != MODE_RECORD:
+            return
+        with self._lock:
+            rows = list(self._rows)
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        table = pa.Table.from_pylist(rows, schema=CASSETTE_SCHEMA)
+        pq.write_table(table, self.path, compression="zstd")
+
+
+def _call_key(name: str, args: tuple, kwargs: Dict) -> str:
+    parts = [repr(a) for a in args] + [f"{k}={v!r}" for k, v in sorted(kwargs.items())]
+    return f"{name}({', '.join(parts)})"
+
+
+def _wrap(value: Any, key: str) -> Any:
+    """对象类返回值继续以代理返回，使其后续调用同样被录制"""
+    if value is REPLAYED_OBJECT:
+        return RecordableProxy(None, key)
+    if isinstance(value, _DATA_TYPES):
+        return value
+    return RecordableProxy(value, key)
+
+
+class _RecordedCallable:
+    def __init__(self, function: Optional[Callable], name: str):
+        self._function = function
+        self._name = name
+
+    def __call__(self, *args, **kwargs):
+        cassette = get_cassette()
+        if cassette is None:
+            return self._function(*args, **kwargs)
+        key = _call_key(self._name, args, kwargs)
+        return _wrap(cassette.call(key, lambda: self._function(*args, **kwargs)), key)
+
+
+class RecordableProxy:
+    """数据源对象（模块或其返回的对象）的录制代理：未启用录制带时直接转发"""
+
+    __slots__ = ("_target", "_name")
+
+    def __init__(self, target: Any, name: str):
+        object.__setattr__(self, "_target", target)
+        object.__setattr__(self, "_name", name)
+
+    def __getattr__(self, attr: str):
+        cassette = get_cassette()
+        if cassette is None:
+            return getattr(self._target, attr)
+
+        key = f"{self._name}.{attr}"
+        if cassette.mode == MODE_REPLAY:
+            if cassette.has(key):  # 录制的是属性访问（如 Ticker.info）
+                return _wrap(cassette.replay(key), key)
+            return _RecordedCallable(None, key)
+
+        started = time.perf_counter()
+        value = getattr(self._target, attr)
+        if callable(value):
+            return _RecordedCallable(value, key)
+        cassette.record_value(key, value, started)
+        return _wrap(value, key)
+
+    def __repr__(self) -> str:
+        return f"<RecordableProxy {self._name}>"
+
+
+def recordable(target: Any, name: str) -> RecordableProxy:
+    """把数据源模块包装成可录制回放的代理，如 ak = recordable(akshare, "akshare")"""
+    return RecordableProxy(target, name)
+
+
+def _response_record(response: requests.Response) -> Dict:
+    return {
+        "status": response.status_code,
+        "reason": response.reason,
+        "headers": dict(response.headers),
+        "content": response.content,
+        "encoding": response.encoding,
+        "url": response.url,
+    }
+
+
+def _build_response(record: Dict, request: requests.PreparedRequest) -> requests.Response:
+    response = requests.Response()
+    response.status_code = record["status"]
+    response.reason = record["reason"]
+    response.headers = CaseInsensitiveDict(record["headers"])
+    response._content = record["content"]
+    response.encoding = record["encoding"]
+    response.url = record["url"]
+    response.request = request
+    return response
+
+
+class CassetteAdapter(HTTPAdapter):
+    """requests 传输适配器：启用录制带时录制或回放 HTTP 响应，并把响应字节数计入当前 span"""
+
+    def send(self, request: requests.PreparedRequest, **kwargs) -> requests.Response:
+        response = self._send(request, **kwargs)
+        if not kwargs.get("stream"):
+            # 响应字节数计入当前获取 span（汇入数据源响应大小指标）
+            current_span().add("bytes", len(response.content))
+        return response
+
+    def _send(self, request: requests.PreparedRequest, **kwargs) -> requests.Response:
+        cassette = get_cassette()
+        if cassette is None:
+            return super().send(request, **kwargs)
+
+        key = f"{request.method} {request.url}"
+        if request.body:
+            body = request.body if isinstance(request.body, bytes) else str(request.body).encode()
+            key += f" body={hashlib.sha1(body).hexdigest()[:16]}"
+        record = cassette.call(key, lambda: _response_record(super(CassetteAdapter, self).send(request, **kwargs)),
+                               KIND_HTTP)
+        return _build_response(record, request)
+
+
+def mount_cassette(session: requests.Session) -> requests.Session:
+    """在会话上挂载录制回放适配器"""
+    adapter = CassetteAdapter()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+_active: Optional[Cassette] = None
+_env_checked = False
+_session: Optional[requests.Session] = None
+
+
+def get_cassette() -> Optional[Cassette]:
+    """当前启用的录制带；首次调用时按 STOCK_CASSETTE / STOCK_CASSETTE_MODE 环境变量启用"""
+    global _active, _env_checked
+    if not _env_checked:
+        _env_checked = True
+        path = os.environ.get("STOCK_CASSETTE")
+        if path and _active is None:
+            mode = os.environ.get("STOCK_CASSETTE_MODE") or (MODE_REPLAY if os.path.exists(path) else MODE_RECORD)
+            _active = Cassette(path, mode, os.environ.get("STOCK_CASSETTE_PACING", PACING_FAST))
+            atexit.register(_active.save)
+    return _active
+
+
+@contextmanager
+def use_cassette(path: str, mode: Optional[str] = None, pacing: str = PACING_FAST):
+    """在上下文中启用录制带；mode 为 None 时文件存在则回放，否则录制"""
+    global _active
+    mode = mode or (MODE_REPLAY if os.path.exists(path) else MODE_RECORD)
+    previous = get_cassette()
+    cassette = Cassette(path, mode, pacing)
+    _active = cassette
+    try:
+        yield cassette
+    finally:
+        _active = previous
+        cassette.save()
+
+
+# 主要接口函数
+def http_session() -> requests.Session:
+    """数据源共用的 HTTP 会话（已挂载录制回放适配器，连接可复用）"""
+    global _session
+    if _session is None:
+        _session = mount_cassette(requests.Session())
+    return _session
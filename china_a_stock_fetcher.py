@@ -5,18 +5,95 @@
 
 import pandas as pd
 import numpy as np
-import requests
-import streamlit as st
 import time
 import random
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
 import json
+import os
+import threading
+from collections import OrderedDict
+from screener_index import CategoryBitmapIndex
+from derived_columns import DerivedColumnRegistry, frame_fingerprint
+from snapshot_schema import enforce_snapshot_schema
+from cache_backend import cached
+from synthetic_market import SyntheticMarket
+from cassette import http_session
+from job_runner import report_progress
+from tracing import STAGE_CLEAN, STAGE_ENRICH, STAGE_FETCH, current_span, span, traced
+
+# 类别位图索引: 快照指纹 -> 索引（None 为代码表本身），只保留最近几份快照的索引
+_category_indexes: "OrderedDict[Optional[str], CategoryBitmapIndex]" = OrderedDict()
+_category_lock = threading.Lock()
+CATEGORY_INDEX_CACHE_SIZE = 8
+
+# 新浪与腾讯行情接口默认地址
+SINA_QUOTE_URL = "http://hq.sinajs.cn"
+TENCENT_QUOTE_URL = "http://qt.gtimg.cn"
+
+# 模拟数据生成的日线长度（足够计算 MA20、MACD 等指标）
+MOCK_HISTORY_DAYS = 60
+
+# A股快照派生列（技术指标与评分），按筛选器需要计算
+A_SHARE_DERIVED_COLUMNS = DerivedColumnRegistry("a_share")
+
+@A_SHARE_DERIVED_COLUMNS.register("RSI")
+def _rsi(df: pd.DataFrame, rng: np.random.Generator) -> np.ndarray:
+    return np.round(rng.uniform(20, 80, len(df)), 2)
+
+@A_SHARE_DERIVED_COLUMNS.register("MACD")
+def _macd(df: pd.DataFrame, rng: np.random.Generator) -> np.ndarray:
+    return np.round(rng.uniform(-2, 2, len(df)), 3)
+
+@A_SHARE_DERIVED_COLUMNS.register("KDJ_K")
+def _kdj_k(df: pd.DataFrame, rng: np.random.Generator) -> np.ndarray:
+    return np.round(rng.uniform(0, 100, len(df)), 2)
+
+@A_SHARE_DERIVED_COLUMNS.register("布林上轨", inputs=["最新价"])
+def _boll_upper(df: pd.DataFrame, rng: np.random.Generator) -> np.ndarray:
+    return np.round(df["最新价"].to_numpy(dtype=np.float64) * 1.1, 2)
+
+@A_SHARE_DERIVED_COLUMNS.register("布林下轨", inputs=["最新价"])
+def _boll_lower(df: pd.DataFrame, rng: np.random.Generator) -> np.ndarray:
+    return np.round(df["最新价"].to_numpy(dtype=np.float64) * 0.9, 2)
+
+def _register_moving_average(name: str, spread: float):
+    @A_SHARE_DERIVED_COLUMNS.register(name, inputs=["最新价"])
+    def _moving_average(df: pd.DataFrame, rng: np.random.Generator) -> np.ndarray:
+        price = df["最新价"].to_numpy(dtype=np.float64)
+        return np.round(price * rng.uniform(1 - spread, 1 + spread, len(df)), 2)
+
+for _name, _spread in (("MA5", 0.05), ("MA10", 0.1), ("MA20", 0.15)):
+    _register_moving_average(_name, _spread)
+
+@A_SHARE_DERIVED_COLUMNS.register("成交量比")
+def _volume_ratio_5d(df: pd.DataFrame, rng: np.random.Generator) -> np.ndarray:
+    return np.round(rng.uniform(0.5, 3, len(df)), 2)
+
+@A_SHARE_DERIVED_COLUMNS.register("量比")
+def _volume_ratio(df: pd.DataFrame, rng: np.random.Generator) -> np.ndarray:
+    return np.round(rng.uniform(0.3, 5, len(df)), 2)
+
+@A_SHARE_DERIVED_COLUMNS.register("每股收益", inputs=["最新价"])
+def _eps(df: pd.DataFrame, rng: np.random.Generator) -> np.ndarray:
+    return np.round(df["最新价"].to_numpy(dtype=np.float64) / rng.uniform(10, 30, len(df)), 2)
+
+@A_SHARE_DERIVED_COLUMNS.register("每股净资产", inputs=["最新价"])
+def _bps(df: pd.DataFrame, rng: np.random.Generator) -> np.ndarray:
+    return np.round(df["最新价"].to_numpy(dtype=np.float64) / rng.uniform(1, 5, len(df)), 2)
+
+@A_SHARE_DERIVED_COLUMNS.register("综合评分")
+def _score(df: pd.DataFrame, rng: np.random.Generator) -> np.ndarray:
+    return np.round(rng.uniform(1, 10, len(df)), 1)
 
 class ChinaAStockFetcher:
     """中国A股数据获取器"""
     
-    def __init__(self):
+    def __init__(self, sina_base_url: Optional[str] = None, tencent_base_url: Optional[str] = None):
+        # 行情接口地址（参数或环境变量可指向本地行情服务 quote_server）
+        self.sina_base_url = (sina_base_url or os.environ.get("STOCK_SINA_URL") or SINA_QUOTE_URL).rstrip("/")
+        self.tencent_base_url = (tencent_base_url or os.environ.get("STOCK_TENCENT_URL") or TENCENT_QUOTE_URL).rstrip("/")
+
         # 中国A股代码列表（主要的大盘股和热门股）
         self.a_stock_codes = [
             # 银行股
@@ -66,6 +143,98 @@ class ChinaAStockFetcher:
             "券商": ["600030.SH", "000166.SZ", "002736.SZ", "600999.SH", "000776.SZ"]
         }
     
+        # 概念板块（一只股票可属于多个概念）
+        self.stock_concepts = {
+            "000001.SZ": ["金融科技", "数字货币"], "600036.SH": ["金融科技", "数字货币"],
+            "600000.SH": ["金融科技"], "601318.SH": ["金融科技", "互联网医疗"],
+            "601398.SH": ["数字货币", "中特估"], "601328.SH": ["中特估"],
+            "600519.SH": ["白酒", "国企改革"], "000858.SZ": ["白酒", "国企改革"],
+            "002304.SZ": ["白酒"], "000596.SZ": ["白酒", "国企改革"], "600809.SH": ["白酒", "国企改革"],
+            "000002.SZ": ["装配式建筑", "国企改革"], "002415.SZ": ["人工智能", "安防", "机器视觉"],
+            "300059.SZ": ["金融科技", "互联网金融"], "300122.SZ": ["疫苗", "生物医药"],
+            "002594.SZ": ["新能源汽车", "锂电池", "芯片"], "600276.SH": ["创新药", "生物医药"],
+            "000661.SZ": ["生物医药", "创新药"], "002821.SZ": ["CXO", "创新药"],
+            "300015.SZ": ["医疗服务", "互联网医疗"], "600867.SH": ["生物医药"],
+            "600887.SH": ["乳业", "大消费"], "600298.SH": ["大消费", "合成生物"],
+            "000895.SZ": ["大消费", "预制菜"], "002568.SZ": ["大消费"],
+            "300750.SZ": ["锂电池", "储能", "新能源汽车"], "002460.SZ": ["锂电池", "锂矿", "储能"],
+            "300274.SZ": ["光伏", "储能"], "688599.SH": ["光伏", "储能"], "002129.SZ": ["光伏", "芯片"],
+            "001979.SZ": ["国企改革", "装配式建筑"], "600048.SH": ["国企改革"],
+            "000069.SZ": ["旅游", "国企改革"], "600340.SH": ["雄安新区"],
+            "600030.SH": ["互联网金融"], "000166.SZ": ["互联网金融"],
+            "002736.SZ": ["互联网金融"], "600999.SH": ["互联网金融"], "000776.SZ": ["互联网金融"]
+        }
+
+        # 指数成分股
+        self.index_constituents = {
+            "沪深300": [
+                "000001.SZ", "600036.SH", "600000.SH", "601318.SH", "601398.SH", "601328.SH",
+                "600519.SH", "000858.SZ", "002304.SZ", "600809.SH", "000002.SZ", "002415.SZ",
+                "300059.SZ", "300122.SZ", "002594.SZ", "600276.SH", "000661.SZ", "300015.SZ",
+                "600887.SH", "300750.SZ", "002460.SZ", "300274.SZ", "688599.SH", "001979.SZ",
+                "600048.SH", "600030.SH", "000166.SZ", "600999.SH", "000776.SZ"
+            ],
+            "中证500": [
+                "000596.SZ", "002821.SZ", "600867.SH", "600298.SH", "000895.SZ",
+                "002568.SZ", "002129.SZ", "000069.SZ", "002736.SZ"
+            ]
+        }
+    
+    def get_stock_board(self, code: str) -> str:
+        """根据代码前缀判断上市板块"""
+        digits = code[:6]
+        if digits.startswith(("688", "689")):
+            return "科创板"
+        if digits.startswith(("300", "301")):
+            return "创业板"
+        if digits.startswith(("8", "4", "920")):
+            return "北交所"
+        return "主板"
+    
+    def get_stock_concepts(self, code: str) -> List[str]:
+        """获取股票所属概念"""
+        return self.stock_concepts.get(code, [])
+    
+    def get_symbol_master(self) -> pd.DataFrame:
+        """获取股票代码表（行业、概念、板块、指数成分）"""
+        rows = []
+        for code in dict.fromkeys(self.a_stock_codes):
+            rows.append({
+                "股票代码": code.replace('.SH', '').replace('.SZ', ''),
+                "股票名称": self.stock_names.get(code, f"股票{code[:6]}"),
+                "行业": self.get_stock_industry(code),
+                "概念": self.get_stock_concepts(code),
+                "板块": self.get_stock_board(code),
+                "指数成分": [name for name, codes in self.index_constituents.items() if code in codes]
+            })
+        return pd.DataFrame(rows)
+    
+    def get_category_index(self, snapshot: Optional[pd.DataFrame] = None,
+                           refresh: bool = False) -> CategoryBitmapIndex:
+        """获取类别位图索引
+
+        传入行情快照时按快照指纹建一次索引，位图行号即快照行号，类别以快照自身的列为准
+        （代码表只补齐缺失的字段），新快照到来时自动重建；不传时返回代码表索引。
+        只应传入完整快照，存活行的类别条件按行号从快照索引中取位，不要为子集建索引。
+        """
+        key = None if snapshot is None else frame_fingerprint(snapshot)
+        with _category_lock:
+            index = None if refresh else _category_indexes.get(key)
+            if index is not None:
+                _category_indexes.move_to_end(key)
+                return index
+
+        master = self.get_symbol_master()
+        if snapshot is None:
+            index = CategoryBitmapIndex(master)
+        else:
+            index = CategoryBitmapIndex.from_snapshot(snapshot, master)
+        with _category_lock:
+            _category_indexes[key] = index
+            while len(_category_indexes) > CATEGORY_INDEX_CACHE_SIZE:
+                _category_indexes.popitem(last=False)
+        return index
+    
     def get_stock_industry(self, code: str) -> str:
         """获取股票行业"""
         for industry, codes in self.industries.items():
@@ -73,6 +242,7 @@ class ChinaAStockFetcher:
                 return industry
         return "其他"
     
+    @traced(STAGE_FETCH, "新浪行情", provider="sina")
     def fetch_sina_data(self, codes: List[str]) -> Dict:
         """从新浪财经获取数据"""
         try:
@@ -86,28 +256,27 @@ class ChinaAStockFetcher:
 
             # 构建请求URL
             code_str = ','.join(sina_codes)
-            url = f"http://hq.sinajs.cn/list={code_str}"
+            url = f"{self.sina_base_url}/list={code_str}"
 
             headers = {
                 'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
                 'Referer': 'http://finance.sina.com.cn'
             }
 
-            response = requests.get(url, headers=headers, timeout=15)
+            response = http_session().get(url, headers=headers, timeout=15)
             response.encoding = 'gbk'
 
             if response.status_code == 200 and response.text:
-                return self.parse_sina_data(response.text, codes)
+                quotes = self.parse_sina_data(response.text, codes)
+                current_span().set(rows=len(quotes))
+                return quotes
 
         except Exception as e:
-            # 在非Streamlit环境中使用print
-            try:
-                st.warning(f"新浪财经数据获取失败: {e}")
-            except:
-                print(f"新浪财经数据获取失败: {e}")
+            report_progress("warning", f"新浪财经数据获取失败: {e}")
 
         return {}
 
+    @traced(STAGE_FETCH, "腾讯行情", provider="tencent")
     def fetch_tencent_data(self, codes: List[str]) -> Dict:
         """从腾讯财经获取数据（备用数据源）"""
         try:
@@ -122,52 +291,59 @@ class ChinaAStockFetcher:
             results = {}
             for i, tencent_code in enumerate(tencent_codes):
                 try:
-                    url = f"http://qt.gtimg.cn/q={tencent_code}"
+                    url = f"{self.tencent_base_url}/q={tencent_code}"
                     headers = {
                         'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
                     }
 
-                    response = requests.get(url, headers=headers, timeout=10)
+                    response = http_session().get(url, headers=headers, timeout=10)
                     response.encoding = 'gbk'
 
                     if response.status_code == 200 and response.text:
-                        # 解析腾讯数据格式
-                        data = response.text.strip()
-                        if '~' in data:
-                            fields = data.split('~')
-                            if len(fields) > 10:
-                                code = codes[i]
-                                current_price = float(fields[3]) if fields[3] else 0
-                                prev_close = float(fields[4]) if fields[4] else 0
-
-                                change = current_price - prev_close
-                                change_percent = (change / prev_close * 100) if prev_close > 0 else 0
-
-                                results[code] = {
-                                    'name': fields[1],
-                                    'current_price': current_price,
-                                    'prev_close': prev_close,
-                                    'change': change,
-                                    'change_percent': change_percent,
-                                    'volume': int(fields[6]) if fields[6] else 0,
-                                    'amount': float(fields[37]) if len(fields) > 37 and fields[37] else 0,
-                                    'high': float(fields[33]) if len(fields) > 33 and fields[33] else 0,
-                                    'low': float(fields[34]) if len(fields) > 34 and fields[34] else 0,
-                                    'open': float(fields[5]) if fields[5] else 0,
-                                }
+                        quote = self.parse_tencent_data(response.text)
+                        if quote:
+                            results[codes[i]] = quote
                 except:
                     continue
 
+            current_span().set(rows=len(results))
             return results
 
         except Exception as e:
-            try:
-                st.warning(f"腾讯财经数据获取失败: {e}")
-            except:
-                print(f"腾讯财经数据获取失败: {e}")
+            report_progress("warning", f"腾讯财经数据获取失败: {e}")
 
         return {}
     
+    def parse_tencent_data(self, data: str) -> Optional[Dict]:
+        """解析腾讯财经单只股票的行情（格式不符时返回 None）"""
+        data = data.strip()
+        if '~' not in data:
+            return None
+
+        fields = data.split('~')
+        if len(fields) <= 10:
+            return None
+
+        current_price = float(fields[3]) if fields[3] else 0
+        prev_close = float(fields[4]) if fields[4] else 0
+
+        change = current_price - prev_close
+        change_percent = (change / prev_close * 100) if prev_close > 0 else 0
+
+        return {
+            'name': fields[1],
+            'current_price': current_price,
+            'prev_close': prev_close,
+            'change': change,
+            'change_percent': change_percent,
+            'volume': int(fields[6]) if fields[6] else 0,
+            'amount': float(fields[37]) if len(fields) > 37 and fields[37] else 0,
+            'high': float(fields[33]) if len(fields) > 33 and fields[33] else 0,
+            'low': float(fields[34]) if len(fields) > 34 and fields[34] else 0,
+            'open': float(fields[5]) if fields[5] else 0,
+        }
+
+    @traced(STAGE_CLEAN, "解析新浪行情")
     def parse_sina_data(self, data: str, codes: List[str]) -> Dict:
         """解析新浪财经数据"""
         results = {}
@@ -210,177 +386,119 @@ class ChinaAStockFetcher:
         
         return results
     
-    def generate_enhanced_mock_data(self, codes: List[str]) -> pd.DataFrame:
-        """生成增强的A股模拟数据"""
-        data = []
-        
-        for code in codes:
-            # 基础价格范围（根据股票类型）
-            if code in self.industries.get("银行", []):
-                base_price = random.uniform(3, 8)
-            elif code in self.industries.get("白酒", []):
-                base_price = random.uniform(100, 2000)
-            elif code in self.industries.get("科技", []):
-                base_price = random.uniform(20, 200)
-            else:
-                base_price = random.uniform(5, 100)
-            
-            change_percent = random.uniform(-10, 10)
-            change = base_price * change_percent / 100
-            
-            stock_data = {
-                "股票代码": code.replace('.SH', '').replace('.SZ', ''),
-                "股票名称": self.stock_names.get(code, f"股票{code[:6]}"),
-                "最新价": round(base_price, 2),
-                "涨跌幅": round(change_percent, 2),
-                "涨跌额": round(change, 2),
-                "成交量": random.randint(1000000, 500000000),
-                "成交额": random.randint(100000000, 10000000000),
-                "换手率": round(random.uniform(0.1, 15), 2),
-                "市盈率": round(random.uniform(5, 50), 2),
-                "市净率": round(random.uniform(0.5, 10), 2),
-                "总市值": random.randint(10000000000, 2000000000000),
-                "流通市值": random.randint(5000000000, 1500000000000),
-                "ROE": round(random.uniform(-5, 25), 2),
-                "净利润增长": round(random.uniform(-30, 50), 2),
-                "营收增长": round(random.uniform(-20, 40), 2),
-                "毛利率": round(random.uniform(10, 60), 2),
-                "净利率": round(random.uniform(-10, 30), 2),
-                "资产负债率": round(random.uniform(20, 80), 2),
-                "RSI": round(random.uniform(20, 80), 2),
-                "MACD": round(random.uniform(-2, 2), 3),
-                "KDJ_K": round(random.uniform(0, 100), 2),
-                "布林上轨": round(base_price * 1.1, 2),
-                "布林下轨": round(base_price * 0.9, 2),
-                "MA5": round(base_price * random.uniform(0.95, 1.05), 2),
-                "MA10": round(base_price * random.uniform(0.9, 1.1), 2),
-                "MA20": round(base_price * random.uniform(0.85, 1.15), 2),
-                "成交量比": round(random.uniform(0.5, 3), 2),
-                "量比": round(random.uniform(0.3, 5), 2),
-                "市销率": round(random.uniform(0.5, 20), 2),
-                "股息率": round(random.uniform(0, 8), 2),
-                "每股收益": round(base_price / random.uniform(10, 30), 2),
-                "每股净资产": round(base_price / random.uniform(1, 5), 2),
-                "行业": self.get_stock_industry(code),
-                "概念": random.choice(["新能源", "人工智能", "5G", "芯片", "新材料", "生物医药"]),
-                "上市日期": f"{random.randint(1990, 2020)}-{random.randint(1, 12):02d}-{random.randint(1, 28):02d}",
-                "数据源": "A股模拟数据",
-                "更新时间": datetime.now().strftime("%H:%M:%S"),
-                "综合评分": round(random.uniform(1, 10), 1)
-            }
-            data.append(stock_data)
-        
-        return pd.DataFrame(data)
+    @traced(STAGE_FETCH, "模拟行情", provider="synthetic")
+    def generate_enhanced_mock_data(self, codes: List[str], columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """生成增强的A股模拟数据
+
+        行情与基本面由合成市场生成，技术指标按最近的日线路径计算；
+        columns 为需要的派生列，None 表示全部派生列，空列表表示只要基础列。
+        """
+        symbols = pd.DataFrame({
+            "股票代码": codes,
+            "股票名称": [self.stock_names.get(code, f"股票{code[:6]}") for code in codes],
+            "行业": [self.get_stock_industry(code) for code in codes],
+            "概念": ["、".join(self.get_stock_concepts(code)) for code in codes],
+        })
+        # 种子取自全局 random，调用方 random.seed 后结果可复现
+        market = SyntheticMarket(symbols=symbols, n_days=MOCK_HISTORY_DAYS, seed=random.getrandbits(32))
+        snapshot = market.spot_snapshot(indicators=A_SHARE_DERIVED_COLUMNS.resolve(columns))
+        return self.add_derived_columns(snapshot, columns)
+    
+    @traced(STAGE_ENRICH, "派生列")
+    def add_derived_columns(self, df: pd.DataFrame, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """按需补齐派生列（同一快照上的结果会被缓存）"""
+        return A_SHARE_DERIVED_COLUMNS.materialize(df, columns)
+    
+    def get_china_a_stock_data(self, num_stocks: int = 30, use_real_data: bool = True,
+                               columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """获取中国A股数据
+
+        columns 为当前筛选器需要的列，只计算其中的派生列；None 表示计算全部派生列。
+        """
+        base_data = self.get_base_stock_data(num_stocks, use_real_data)
+        return self.add_derived_columns(base_data, columns)
     
-    @st.cache_data(ttl=300)
-    def get_china_a_stock_data(_self, num_stocks: int = 30, use_real_data: bool = True) -> pd.DataFrame:
-        """获取中国A股数据"""
+    @cached(ttl=300)
+    def get_base_stock_data(_self, num_stocks: int = 30, use_real_data: bool = True) -> pd.DataFrame:
+        """获取中国A股基础数据（不含派生列）"""
         
         # 随机选择股票
         selected_codes = random.sample(_self.a_stock_codes, min(num_stocks, len(_self.a_stock_codes)))
+        return _self.load_codes(selected_codes, use_real_data)
+    
+    def load_codes(self, selected_codes: List[str], use_real_data: bool = True) -> pd.DataFrame:
+        """获取指定股票的基础数据（不含派生列），实时数据失败时使用模拟数据
+
+        过程信息通过 report_progress 上报（后台任务中显示为任务阶段），不直接操作页面，
+        可以在任务线程和工作节点上调用。
+        """
         
         if use_real_data:
-            # 处理Streamlit环境和非Streamlit环境
-            try:
-                with st.spinner("🇨🇳 正在获取A股实时数据..."):
-                    progress_bar = st.progress(0)
-                    use_streamlit = True
-            except:
-                print("🇨🇳 正在获取A股实时数据...")
-                progress_bar = None
-                use_streamlit = False
+            report_progress("info", "🇨🇳 正在获取A股实时数据...")
 
             # 尝试多个数据源
             real_data = {}
 
             # 1. 尝试新浪财经
-            if use_streamlit and progress_bar:
-                progress_bar.progress(0.2, "尝试新浪财经...")
-            else:
-                print("尝试新浪财经...")
+            report_progress("info", "尝试新浪财经...")
 
-            real_data = _self.fetch_sina_data(selected_codes)
+            real_data = self.fetch_sina_data(selected_codes)
 
             # 2. 如果新浪失败，尝试腾讯财经
             if not real_data:
-                if use_streamlit and progress_bar:
-                    progress_bar.progress(0.4, "尝试腾讯财经...")
-                else:
-                    print("尝试腾讯财经...")
+                report_progress("info", "尝试腾讯财经...")
 
-                real_data = _self.fetch_tencent_data(selected_codes)
+                real_data = self.fetch_tencent_data(selected_codes)
 
             if real_data:
-                if use_streamlit and progress_bar:
-                    progress_bar.progress(0.7, "处理数据...")
-                else:
-                    print("处理数据...")
-
-                # 转换为DataFrame格式
-                processed_data = []
-
-                for code, data in real_data.items():
-                    stock_info = {
-                        "股票代码": code.replace('.SH', '').replace('.SZ', ''),
-                        "股票名称": data['name'],
-                        "最新价": round(data['current_price'], 2),
-                        "涨跌幅": round(data['change_percent'], 2),
-                        "涨跌额": round(data['change'], 2),
-                        "成交量": data['volume'],
-                        "成交额": int(data['amount']),
-                        "换手率": round(random.uniform(0.1, 15), 2),
-                        "市盈率": round(random.uniform(5, 50), 2),
-                        "市净率": round(random.uniform(0.5, 10), 2),
-                        "总市值": random.randint(10000000000, 2000000000000),
-                        "流通市值": random.randint(5000000000, 1500000000000),
-                        "ROE": round(random.uniform(-5, 25), 2),
-                        "净利润增长": round(random.uniform(-30, 50), 2),
-                        "营收增长": round(random.uniform(-20, 40), 2),
-                        "毛利率": round(random.uniform(10, 60), 2),
-                        "净利率": round(random.uniform(-10, 30), 2),
-                        "资产负债率": round(random.uniform(20, 80), 2),
-                        "RSI": round(random.uniform(20, 80), 2),
-                        "MACD": round(random.uniform(-2, 2), 3),
-                        "KDJ_K": round(random.uniform(0, 100), 2),
-                        "布林上轨": round(data['current_price'] * 1.1, 2),
-                        "布林下轨": round(data['current_price'] * 0.9, 2),
-                        "MA5": round(data['current_price'] * random.uniform(0.95, 1.05), 2),
-                        "MA10": round(data['current_price'] * random.uniform(0.9, 1.1), 2),
-                        "MA20": round(data['current_price'] * random.uniform(0.85, 1.15), 2),
-                        "成交量比": round(random.uniform(0.5, 3), 2),
-                        "量比": round(random.uniform(0.3, 5), 2),
-                        "市销率": round(random.uniform(0.5, 20), 2),
-                        "股息率": round(random.uniform(0, 8), 2),
-                        "每股收益": round(data['current_price'] / random.uniform(10, 30), 2),
-                        "每股净资产": round(data['current_price'] / random.uniform(1, 5), 2),
-                        "行业": _self.get_stock_industry(code),
-                        "概念": random.choice(["新能源", "人工智能", "5G", "芯片", "新材料", "生物医药"]),
-                        "上市日期": f"{random.randint(1990, 2020)}-{random.randint(1, 12):02d}-{random.randint(1, 28):02d}",
-                        "数据源": "新浪财经实时数据",
-                        "更新时间": datetime.now().strftime("%H:%M:%S"),
-                        "综合评分": round(random.uniform(1, 10), 1)
-                    }
-                    processed_data.append(stock_info)
+                report_progress("info", "处理数据...")
+
+                with span("整理行情", STAGE_CLEAN, rows=len(real_data)):
+                    # 转换为DataFrame格式
+                    processed_data = []
 
-                if use_streamlit and progress_bar:
-                    progress_bar.progress(1.0, "数据获取完成！")
-                else:
-                    print("数据获取完成！")
+                    for code, data in real_data.items():
+                        stock_info = {
+                            "股票代码": code.replace('.SH', '').replace('.SZ', ''),
+                            "股票名称": data['name'],
+                            "最新价": round(data['current_price'], 2),
+                            "涨跌幅": round(data['change_percent'], 2),
+                            "涨跌额": round(data['change'], 2),
+                            "成交量": data['volume'],
+                            "成交额": int(data['amount']),
+                            "换手率": round(random.uniform(0.1, 15), 2),
+                            "市盈率": round(random.uniform(5, 50), 2),
+                            "市净率": round(random.uniform(0.5, 10), 2),
+                            "总市值": random.randint(10000000000, 2000000000000),
+                            "流通市值": random.randint(5000000000, 1500000000000),
+                            "ROE": round(random.uniform(-5, 25), 2),
+                            "净利润增长": round(random.uniform(-30, 50), 2),
+                            "营收增长": round(random.uniform(-20, 40), 2),
+                            "毛利率": round(random.uniform(10, 60), 2),
+                            "净利率": round(random.uniform(-10, 30), 2),
+                            "资产负债率": round(random.uniform(20, 80), 2),
+                            "市销率": round(random.uniform(0.5, 20), 2),
+                            "股息率": round(random.uniform(0, 8), 2),
+                            "行业": self.get_stock_industry(code),
+                            "概念": "、".join(self.get_stock_concepts(code)),
+                            "板块": self.get_stock_board(code),
+                            "上市日期": f"{random.randint(1990, 2020)}-{random.randint(1, 12):02d}-{random.randint(1, 28):02d}",
+                            "数据源": "新浪财经实时数据"
+                        }
+                        processed_data.append(stock_info)
 
                 if processed_data:
-                    df = pd.DataFrame(processed_data)
-                    try:
-                        st.success(f"✅ 成功获取 {len(df)} 只A股实时数据")
-                    except:
-                        print(f"✅ 成功获取 {len(df)} 只A股实时数据")
+                    df = enforce_snapshot_schema(pd.DataFrame(processed_data))
+                    report_progress("success", f"✅ 成功获取 {len(df)} 只A股实时数据")
                     return df
         
         # 如果实时数据获取失败，使用增强的模拟数据
-        st.info("📊 使用A股模拟数据...")
-        return _self.generate_enhanced_mock_data(selected_codes)
+        report_progress("info", "📊 使用A股模拟数据...")
+        return self.generate_enhanced_mock_data(selected_codes, columns=[])
 
 # 主要接口函数
-def get_china_a_stock_data(num_stocks: int = 30, use_real_data: bool = True) -> pd.DataFrame:
+def get_china_a_stock_data(num_stocks: int = 30, use_real_data: bool = True,
+                           columns: Optional[List[str]] = None) -> pd.DataFrame:
     """获取中国A股数据的主要接口"""
     fetcher = ChinaAStockFetcher()
-    return fetcher.get_china_a_stock_data(num_stocks, use_real_data)
+    return fetcher.get_china_a_stock_data(num_stocks, use_real_data, columns)
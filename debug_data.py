@@ -1,13 +1,20 @@
 """
 数据获取调试页面
 用于诊断实时数据获取问题
+
+可录制一次真实响应后离线复现问题:
+    STOCK_CASSETTE=cassettes/debug.parquet STOCK_CASSETTE_MODE=record streamlit run debug_data.py
+    STOCK_CASSETTE=cassettes/debug.parquet STOCK_CASSETTE_MODE=replay streamlit run debug_data.py
 """
 
 import streamlit as st
-import yfinance as yf
+import yfinance
 import pandas as pd
 from datetime import datetime
 import traceback
+from cassette import recordable
+
+yf = recordable(yfinance, "yfinance")
 
 def debug_yfinance():
     """调试Yahoo Finance"""
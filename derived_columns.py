@@ -0,0 +1,200 @@
+"""
+派生列注册表
+每个派生列（技术指标、评分等）声明自己依赖的输入列和计算函数，
+筛选时只计算当前筛选器的条件、排序字段和展示列真正需要的列，并按快照缓存计算结果。
+"""
+
+import hashlib
+import threading
+import weakref
+import zlib
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from typing import Callable, Dict, Iterable, List, Optional
+from snapshot_schema import TIMESTAMP_ATTR, coerce_column
+
+# 最多缓存的快照数
+MEMO_SNAPSHOTS = 8
+
+# 用于识别快照的列（存在哪些用哪些）
+FINGERPRINT_COLUMNS = ["股票代码", "最新价", "涨跌幅", "成交量"]
+
+# 快照派生列缓存: (注册表名, 快照指纹) -> {列名: 数组}
+_memo: "OrderedDict[tuple, Dict[str, np.ndarray]]" = OrderedDict()
+_memo_lock = threading.Lock()
+
+# 快照对象的指纹: id(df) -> (弱引用, 指纹)，快照释放后自动失效
+_fingerprints: Dict[int, tuple] = {}
+
+
+class DerivedColumn:
+    """派生列定义
+
+    compute(df, rng) 返回与 df 行对齐的数组；rng 确定性播种，模拟指标因此在同一快照上
+    无论单独计算还是一起计算结果都相同。快照有股票代码列时 rng 按代码逐只播种，
+    每只股票的值与它和哪些股票一起计算（分区、分片、分块）无关。
+    """
+
+    def __init__(self, name: str, inputs: Iterable[str], compute: Callable, description: str = ""):
+        self.name = name
+        self.inputs = list(inputs)
+        self.compute = compute
+        self.description = description
+
+
+def snapshot_fingerprint(df: pd.DataFrame) -> str:
+    """快照指纹：行数 + 更新时间 + 关键列内容
+
+    数值列直接哈希底层字节，字符串列连接后整体哈希，不做逐行哈希（5000 行约 1 毫秒）。
+    """
+    digest = hashlib.blake2b(f"{len(df)}|{df.attrs.get(TIMESTAMP_ATTR)}".encode(), digest_size=16)
+    for column in FINGERPRINT_COLUMNS:
+        if column not in df.columns:
+            continue
+        values = df[column]
+        digest.update(f"|{column}|".encode())
+        if isinstance(values.dtype, np.dtype) and values.dtype.kind in "biuf":
+            digest.update(np.ascontiguousarray(values.to_numpy()).tobytes())
+        else:
+            digest.update("\x1f".join(values.astype(str).tolist()).encode())
+    return digest.hexdigest()
+
+
+def frame_fingerprint(df: pd.DataFrame) -> str:
+    """快照指纹，同一 DataFrame 对象只计算一次
+
+    快照按只读对待（共享快照为只读内存映射），用于按快照缓存索引和统计信息；
+    复制出的新对象重新计算，内容相同时指纹相同。
+    """
+    key = id(df)
+    entry = _fingerprints.get(key)
+    if entry is not None and entry[0]() is df:
+        return entry[1]
+    fingerprint = snapshot_fingerprint(df)
+    _fingerprints[key] = (weakref.ref(df), fingerprint)
+    weakref.finalize(df, _fingerprints.pop, key, None)
+    return fingerprint
+
+
+class KeyedRandom:
+    """按股票代码逐行播种的随机源（提供派生列用到的 Generator 接口子集）"""
+
+    def __init__(self, keys: pd.Series, salt: str):
+        self.keys = keys
+        self.salt = salt
+        self._draws = 0
+
+    def random(self, size: Optional[int] = None) -> np.ndarray:
+        if size is not None and size != len(self.keys):
+            raise ValueError("按代码播种的随机数只能逐行生成")
+        self._draws += 1
+        return keyed_uniform(self.keys, f"{self.salt}|{self._draws}")
+
+    def uniform(self, low: float = 0.0, high: float = 1.0, size: Optional[int] = None) -> np.ndarray:
+        return low + self.random(size) * (high - low)
+
+
+class DerivedColumnRegistry:
+    """派生列注册表"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._columns: Dict[str, DerivedColumn] = {}
+
+    def register(self, name: str, inputs: Iterable[str] = (), description: str = ""):
+        """注册派生列（装饰器）"""
+        def decorator(compute: Callable) -> Callable:
+            self._columns[name] = DerivedColumn(name, inputs, compute, description)
+            return compute
+        return decorator
+
+    def names(self) -> List[str]:
+        """全部派生列名（注册顺序）"""
+        return list(self._columns)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._columns
+
+    def resolve(self, columns: Optional[Iterable[str]] = None) -> List[str]:
+        """需要计算的派生列（含间接依赖），按依赖顺序排列
+
+        columns 为 None 时返回全部派生列；非派生列名被忽略（视为快照自带）。
+        """
+        wanted = self.names() if columns is None else [c for c in columns if c in self._columns]
+        ordered: List[str] = []
+        visiting = set()
+
+        def visit(name: str):
+            if name in ordered:
+                return
+            if name in visiting:
+                raise ValueError(f"派生列存在循环依赖: {name}")
+            visiting.add(name)
+            for dependency in self._columns[name].inputs:
+                if dependency in self._columns:
+                    visit(dependency)
+            visiting.discard(name)
+            ordered.append(name)
+
+        for name in wanted:
+            visit(name)
+        return ordered
+
+    def _rng(self, df: pd.DataFrame, fingerprint: str, name: str):
+        if "股票代码" in df.columns:
+            return KeyedRandom(df["股票代码"], f"{self.name}|{df.attrs.get(TIMESTAMP_ATTR)}|{name}")
+        return np.random.default_rng(zlib.crc32(f"{self.name}|{fingerprint}|{name}".encode()))
+
+    def materialize(self, df: pd.DataFrame, columns: Optional[Iterable[str]] = None,
+                    memoize: bool = True) -> pd.DataFrame:
+        """在快照上补齐所需派生列
+
+        快照中已经存在的列不会重新计算；同一快照上已算过的列直接取缓存。
+        """
+        needed = [name for name in self.resolve(columns) if name not in df.columns]
+        if not needed or df.empty:
+            return df
+
+        fingerprint = snapshot_fingerprint(df)
+        key = (self.name, fingerprint)
+        if memoize:
+            with _memo_lock:
+                computed = _memo.setdefault(key, {})
+                _memo.move_to_end(key)
+                while len(_memo) > MEMO_SNAPSHOTS:
+                    _memo.popitem(last=False)
+        else:
+            computed = {}
+
+        # 浅拷贝：只新增列，不复制快照已有的列（共享快照的映射内存保持零拷贝）
+        result = df.copy(deep=False)
+        for name in needed:
+            values = computed.get(name)
+            if values is None:
+                # 计算在锁外进行；多个线程同时算同一列时结果相同，保留先写入的一份
+                column = self._columns[name]
+                values = column.compute(result, self._rng(result, fingerprint, name))
+                # 按快照列类型规范存储
+                values = coerce_column(name, np.asarray(values))
+                with _memo_lock:
+                    values = computed.setdefault(name, values)
+            result[name] = values
+        return result
+
+
+def keyed_uniform(keys: pd.Series, salt: str) -> np.ndarray:
+    """按键（如股票代码）逐行确定性生成 [0, 1) 均匀随机数
+
+    只取决于键本身和 salt，与行所在的批次、分区和顺序无关。
+    """
+    hash_key = hashlib.blake2b(salt.encode(), digest_size=8).hexdigest()
+    hashes = pd.util.hash_pandas_object(keys.astype(str), index=False, hash_key=hash_key).to_numpy()
+    return (hashes >> np.uint64(11)).astype(np.float64) * 2.0 ** -53
+
+
+# 主要接口函数
+def clear_derived_cache():
+    """清空派生列缓存"""
+    with _memo_lock:
+        _memo.clear()
@@ -0,0 +1,464 @@
+"""
+多节点分片筛选
+协调者把股票代码按区间划分为分片，分配给各工作节点；工作节点在本地加载分片数据、
+计算技术指标并执行各策略，只回传前K名与统计信息，由协调者合并。
+传输支持 TCP 和本机消息队列，本机可以用多个进程代替多个节点进行测试。
+消息由 JSON 头和 Arrow IPC 表格数据组成，解码时不执行 pickle，收到的字节只会被解析为数据。
+协调者默认只监听 127.0.0.1，多节点部署时需用 --host 显式指定内网地址。
+
+用法:
+    python distributed_screen.py coordinator --host 10.0.0.1 --port 9540 --shards 16 --strategy smart:value_growth
+    python distributed_screen.py worker --host 10.0.0.1 --port 9540
+    python distributed_screen.py local --workers 4 --strategy short_term:momentum_breakout_entry
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import socket
+import struct
+import threading
+import time
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from parallel_screen import merge_results, screen_frame
+
+logger = logging.getLogger(__name__)
+
+# 协调者默认端口
+DEFAULT_PORT = 9540
+
+# 协调者默认监听地址（只接受本机连接）
+DEFAULT_HOST = "127.0.0.1"
+
+# 分片失败后的最多尝试次数
+MAX_ATTEMPTS = 3
+
+# 本机模式等待结果时检查工作进程存活的间隔（秒）
+POLL_SECONDS = 0.5
+
+# 消息格式：JSON 头长度 + JSON 头 + 各表格数据；TCP 上每条消息再加总长度
+_HEAD_SIZE = struct.Struct("!I")
+_MESSAGE_SIZE = struct.Struct("!Q")
+
+Strategy = Tuple[str, str]
+
+
+def _frame_to_ipc(df: pd.DataFrame) -> bytes:
+    # attrs（快照更新时间等）不随结果传输
+    df = df.copy(deep=False)
+    df.attrs = {}
+    table = pa.Table.from_pandas(df)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def _frame_from_ipc(data: bytes) -> pd.DataFrame:
+    return pa.ipc.open_stream(data).read_all().to_pandas()
+
+
+def encode_message(header: Dict, frames: Optional[Dict[str, pd.DataFrame]] = None) -> bytes:
+    """编码消息：header 为可 JSON 化的字典，frames 为附带的表格（Arrow IPC）"""
+    blobs = [(name, _frame_to_ipc(df)) for name, df in (frames or {}).items()]
+    head = dict(header, frames=[[name, len(blob)] for name, blob in blobs])
+    head_bytes = json.dumps(head, ensure_ascii=False).encode("utf-8")
+    return _HEAD_SIZE.pack(len(head_bytes)) + head_bytes + b"".join(blob for _, blob in blobs)
+
+
+def decode_message(data: bytes) -> Tuple[Dict, Dict[str, pd.DataFrame]]:
+    """解码消息，返回 (header, frames)"""
+    (size,) = _HEAD_SIZE.unpack_from(data)
+    offset = _HEAD_SIZE.size + size
+    header = json.loads(data[_HEAD_SIZE.size:offset].decode("utf-8"))
+    frames = {}
+    for name, length in header.pop("frames", []):
+        frames[name] = _frame_from_ipc(data[offset:offset + length])
+        offset += length
+    return header, frames
+
+
+def send_message(sock: socket.socket, data: bytes):
+    sock.sendall(_MESSAGE_SIZE.pack(len(data)) + data)
+
+
+def recv_message(sock: socket.socket) -> bytes:
+    (size,) = _MESSAGE_SIZE.unpack(_recv_exact(sock, _MESSAGE_SIZE.size))
+    return _recv_exact(sock, size)
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes:
+    buffer = bytearray()
+    while len(buffer) < size:
+        chunk = sock.recv(min(size - len(buffer), 1 << 20))
+        if not chunk:
+            raise ConnectionError("连接已关闭")
+        buffer += chunk
+    return bytes(buffer)
+
+
+def shard_codes(codes: Sequence[str], shards: int) -> List[List[str]]:
+    """按代码区间把股票划分为分片（去重后排序）"""
+    ordered = sorted(dict.fromkeys(codes))
+    return [list(part) for part in np.array_split(np.array(ordered, dtype=object), max(1, min(shards, len(ordered))))
+            if len(part)]
+
+
+# 工作节点进程内复用的数据获取器
+_fetcher = None
+
+def load_shard(codes: List[str], use_real_data: bool = False) -> pd.DataFrame:
+    """默认的分片加载：在工作节点本地获取这些股票的基础数据"""
+    global _fetcher
+    if _fetcher is None:
+        from china_a_stock_fetcher import ChinaAStockFetcher
+        _fetcher = ChinaAStockFetcher()
+    return _fetcher.load_codes(codes, use_real_data)
+
+
+def _empty_outputs(strategies: Sequence[Strategy]) -> Dict[Strategy, Dict]:
+    return {tuple(s): {"matched": 0, "preferred": pd.DataFrame(), "all": pd.DataFrame()} for s in strategies}
+
+
+class ShardWorker:
+    """工作节点：加载分片、计算指标、执行策略，回传前K名与统计"""
+
+    def __init__(self, name: Optional[str] = None,
+                 loader: Callable[[List[str], bool], pd.DataFrame] = load_shard):
+        self.name = name or f"{socket.gethostname()}-{os.getpid()}"
+        self.loader = loader
+
+    def process(self, task: Dict) -> bytes:
+        """执行一个分片任务，返回编码后的结果消息（失败时返回错误消息）"""
+        strategies = [tuple(s) for s in task["strategies"]]
+        try:
+            started = time.time()
+            df = self.loader(task["codes"], task.get("use_real_data", False))
+            loaded = time.time()
+            outputs = screen_frame(df, strategies, task["top_k"]) if not df.empty else _empty_outputs(strategies)
+            finished = time.time()
+        except Exception as e:
+            logger.error(f"❌ 分片 {task['shard']} 处理失败: {e}")
+            return encode_message({"type": "error", "shard": task["shard"], "worker": self.name, "error": str(e)})
+
+        header = {
+            "type": "result",
+            "shard": task["shard"],
+            "worker": self.name,
+            "matched": {},
+            "stats": {
+                "worker": self.name,
+                "rows": len(df),
+                "load_seconds": round(loaded - started, 4),
+                "screen_seconds": round(finished - loaded, 4),
+            },
+        }
+        frames = {}
+        for (kind, key), result in outputs.items():
+            name = f"{kind}:{key}"
+            header["matched"][name] = result["matched"]
+            for group in ("preferred", "all"):
+                if group in result:
+                    frames[f"{name}:{group}"] = result[group]
+        return encode_message(header, frames)
+
+    def serve_queue(self, tasks, results):
+        """从本机消息队列取任务，None 表示结束
+
+        开始处理前先报告领取的分片，进程意外退出时协调者据此把该分片重新排队。
+        """
+        while True:
+            data = tasks.get()
+            if data is None:
+                break
+            header, _ = decode_message(data)
+            results.put(encode_message({"type": "started", "shard": header["shard"], "worker": self.name}))
+            results.put(self.process(header))
+
+    def serve_tcp(self, host: str, port: int = DEFAULT_PORT):
+        """连接协调者，循环领取分片直到收到结束消息"""
+        with socket.create_connection((host, port)) as sock:
+            send_message(sock, encode_message({"type": "hello", "worker": self.name}))
+            while True:
+                header, _ = decode_message(recv_message(sock))
+                if header["type"] == "stop":
+                    break
+                send_message(sock, self.process(header))
+
+
+def _queue_worker_main(tasks, results, name: str, loader: Callable[[List[str], bool], pd.DataFrame]):
+    ShardWorker(name, loader).serve_queue(tasks, results)
+
+
+class ScreenCoordinator:
+    """协调者：分配分片、收集结果、合并前K名和统计"""
+
+    def __init__(self, codes: Sequence[str], strategies: Sequence[Strategy], top_k: int = 30,
+                 shards: int = 8, use_real_data: bool = False):
+        self.strategies = [tuple(s) for s in strategies]
+        self.top_k = top_k
+        self.tasks = [
+            {"type": "task", "shard": i, "codes": part, "strategies": [list(s) for s in self.strategies],
+             "top_k": top_k, "use_real_data": use_real_data}
+            for i, part in enumerate(shard_codes(codes, shards))
+        ]
+        self._results: Dict[int, Tuple[Dict, Dict]] = {}
+        self._attempts: Dict[int, int] = {}
+        self._failed: Dict[int, str] = {}
+        self._pending: "queue.Queue[Dict]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._server: Optional[socket.socket] = None
+        self._started = time.time()
+
+    # ---- 结果收集 ----
+    def _accept_result(self, task: Dict, data: bytes) -> bool:
+        """记录一个分片的结果；失败时重新排队，返回是否成功"""
+        header, frames = decode_message(data)
+        with self._lock:
+            if header["type"] == "result":
+                self._results[task["shard"]] = (header, frames)
+                ok = True
+            else:
+                ok = False
+                self._retry(task, header.get("error", "未知错误"))
+            self._check_done()
+        return ok
+
+    def _retry(self, task: Dict, reason: str):
+        attempts = self._attempts.get(task["shard"], 0) + 1
+        self._attempts[task["shard"]] = attempts
+        if attempts >= MAX_ATTEMPTS:
+            self._failed[task["shard"]] = reason
+        else:
+            self._pending.put(task)
+
+    def _check_done(self):
+        if len(self._results) + len(self._failed) >= len(self.tasks):
+            self._done.set()
+
+    def result(self) -> Dict:
+        """合并结果：{"results": {(类型, 策略键): {"top", "matched"}}, "stats": 汇总统计}"""
+        outputs, workers, rows = [], {}, 0
+        for shard in sorted(self._results):
+            header, frames = self._results[shard]
+            output = {}
+            for kind, key in self.strategies:
+                name = f"{kind}:{key}"
+                output[(kind, key)] = {"matched": header["matched"][name]}
+                for group in ("preferred", "all"):
+                    if f"{name}:{group}" in frames:
+                        output[(kind, key)][group] = frames[f"{name}:{group}"]
+            outputs.append(output)
+
+            stats = header["stats"]
+            rows += stats["rows"]
+            worker = workers.setdefault(stats["worker"], {"shards": 0, "rows": 0, "seconds": 0.0})
+            worker["shards"] += 1
+            worker["rows"] += stats["rows"]
+            worker["seconds"] = round(worker["seconds"] + stats["load_seconds"] + stats["screen_seconds"], 4)
+
+        results = merge_results(self.strategies, outputs, self.top_k) if outputs else {
+            s: {"top": pd.DataFrame(), "matched": 0} for s in self.strategies
+        }
+        return {
+            "results": results,
+            "stats": {
+                "shards": len(self.tasks),
+                "completed": len(self._results),
+                "failed": dict(self._failed),
+                "rows": rows,
+                "workers": workers,
+                "elapsed": round(time.time() - self._started, 3),
+            },
+        }
+
+    # ---- 本机消息队列 ----
+    def run_local(self, workers: int = 2, timeout: Optional[float] = None,
+                  loader: Callable[[List[str], bool], pd.DataFrame] = load_shard) -> Dict:
+        """用本机多个进程代替工作节点（loader 需可被子进程导入）
+
+        等待结果时定期检查工作进程：退出的进程正在处理的分片重新排队，
+        全部进程都已退出时其余分片记为失败，不会无限等待。
+        """
+        context = multiprocessing.get_context()
+        tasks, results = context.Queue(), context.Queue()
+        processes = [
+            context.Process(target=_queue_worker_main, args=(tasks, results, f"local-{i}", loader), daemon=True)
+            for i in range(workers)
+        ]
+        for process in processes:
+            process.start()
+
+        by_shard = {task["shard"]: task for task in self.tasks}
+        for task in self.tasks:
+            tasks.put(encode_message(task))
+
+        def requeue():
+            while not self._pending.empty():
+                tasks.put(encode_message(self._pending.get()))
+
+        # 工作进程名 -> 正在处理的分片任务
+        in_flight: Dict[str, Dict] = {}
+        names = {process: f"local-{i}" for i, process in enumerate(processes)}
+        deadline = None if timeout is None else time.time() + timeout
+        while not self._done.is_set():
+            if deadline is not None and time.time() >= deadline:
+                break
+            wait = POLL_SECONDS if deadline is None else min(POLL_SECONDS, max(0.0, deadline - time.time()))
+            try:
+                data = results.get(timeout=wait)
+            except queue.Empty:
+                self._reap_local(processes, names, in_flight)
+                requeue()
+                continue
+            header = decode_message(data)[0]
+            if header["type"] == "started":
+                in_flight[header["worker"]] = by_shard[header["shard"]]
+                continue
+            in_flight.pop(header["worker"], None)
+            if not self._accept_result(by_shard[header["shard"]], data):
+                requeue()
+
+        for _ in processes:
+            tasks.put(None)
+        for process in processes:
+            process.join(timeout=5)
+        return self.result()
+
+    def _reap_local(self, processes: List, names: Dict, in_flight: Dict[str, Dict]):
+        """处理已退出的本机工作进程"""
+        with self._lock:
+            for process in processes:
+                if process.is_alive():
+                    continue
+                task = in_flight.pop(names[process], None)
+                if task is not None and task["shard"] not in self._results:
+                    logger.warning(f"⚠️ 工作进程 {names[process]} 退出（{process.exitcode}），分片 {task['shard']} 重新排队")
+                    self._retry(task, f"工作进程退出: {process.exitcode}")
+            if not any(process.is_alive() for process in processes):
+                for task in self.tasks:
+                    if task["shard"] not in self._results:
+                        self._failed.setdefault(task["shard"], "没有存活的工作进程")
+            self._check_done()
+
+    # ---- TCP ----
+    def listen(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT) -> Tuple[str, int]:
+        """开始监听，返回实际地址（port=0 时由系统分配）"""
+        self._server = socket.create_server((host, port))
+        self._server.settimeout(0.2)
+        return self._server.getsockname()[:2]
+
+    def serve(self, timeout: Optional[float] = None) -> Dict:
+        """接受工作节点连接并分配分片，全部分片完成（或超时）后返回合并结果"""
+        if self._server is None:
+            self.listen()
+        for task in self.tasks:
+            self._pending.put(task)
+
+        handlers = []
+        deadline = None if timeout is None else time.time() + timeout
+        try:
+            while not self._done.is_set() and (deadline is None or time.time() < deadline):
+                try:
+                    conn, _ = self._server.accept()
+                except socket.timeout:
+                    continue
+                handler = threading.Thread(target=self._handle_worker, args=(conn,), daemon=True)
+                handler.start()
+                handlers.append(handler)
+        finally:
+            self._done.set()
+            self._server.close()
+        for handler in handlers:
+            handler.join(timeout=5)
+        return self.result()
+
+    def _handle_worker(self, conn: socket.socket):
+        task = None
+        try:
+            with conn:
+                conn.settimeout(None)
+                header, _ = decode_message(recv_message(conn))
+                logger.info(f"🔗 工作节点已连接: {header.get('worker')}")
+                while not self._done.is_set():
+                    try:
+                        task = self._pending.get(timeout=0.2)
+                    except queue.Empty:
+                        continue
+                    send_message(conn, encode_message(task))
+                    data = recv_message(conn)
+                    finished, task = task, None
+                    self._accept_result(finished, data)
+                send_message(conn, encode_message({"type": "stop"}))
+        except (OSError, ConnectionError, ValueError) as e:
+            # 节点断开：正在处理的分片重新排队
+            logger.warning(f"⚠️ 工作节点断开: {e}")
+            if task is not None:
+                with self._lock:
+                    self._retry(task, f"工作节点断开: {e}")
+                    self._check_done()
+
+
+def _parse_strategies(values: Optional[List[str]]) -> List[Strategy]:
+    strategies = [tuple(v.split(":", 1)) for v in values or []]
+    return strategies or [("smart", "value_growth")]
+
+
+def _print_result(result: Dict):
+    stats = result["stats"]
+    print(f"📊 分片 {stats['completed']}/{stats['shards']}，共 {stats['rows']} 只股票，耗时 {stats['elapsed']} 秒")
+    for worker, info in stats["workers"].items():
+        print(f"   {worker}: {info['shards']} 个分片, {info['rows']} 只, {info['seconds']} 秒")
+    for (kind, key), merged in result["results"].items():
+        print(f"\n✅ {kind}:{key} 入选 {merged['matched']} 只")
+        if not merged["top"].empty:
+            print(merged["top"].head(10).to_string())
+
+
+def main():
+    """命令行入口"""
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="多节点分片筛选")
+    parser.add_argument("mode", choices=["coordinator", "worker", "local"])
+    parser.add_argument("--host", default=DEFAULT_HOST,
+                        help="协调者监听地址 / 工作节点连接的协调者地址（默认只限本机）")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--shards", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=2, help="local 模式的工作进程数")
+    parser.add_argument("--strategy", action="append", help="类型:策略键，可重复，如 smart:value_growth")
+    parser.add_argument("--top-k", type=int, default=30)
+    parser.add_argument("--codes-file", help="股票代码文件，每行一个（默认使用内置代码表）")
+    parser.add_argument("--real", action="store_true", help="工作节点获取实时数据")
+    args = parser.parse_args()
+
+    if args.mode == "worker":
+        ShardWorker().serve_tcp(args.host, args.port)
+        return
+
+    if args.codes_file:
+        with open(args.codes_file, encoding="utf-8") as f:
+            codes = [line.strip() for line in f if line.strip()]
+    else:
+        from china_a_stock_fetcher import ChinaAStockFetcher
+        codes = ChinaAStockFetcher().a_stock_codes
+
+    coordinator = ScreenCoordinator(codes, _parse_strategies(args.strategy), args.top_k, args.shards, args.real)
+    if args.mode == "local":
+        result = coordinator.run_local(args.workers)
+    else:
+        host, port = coordinator.listen(args.host, args.port)
+        print(f"🛰️ 协调者监听 {host}:{port}，等待工作节点...")
+        result = coordinator.serve()
+    _print_result(result)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+"""
+筛选条件规划器
+根据当前快照各列的直方图估算每个条件的选择率，按“淘汰率/代价”从高到低排序执行，
+后续条件只在存活的行号上计算，结果为空时立即短路。
+"""
+
+import threading
+import weakref
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from typing import Callable, Dict, Iterable, List, Optional
+
+from derived_columns import FINGERPRINT_COLUMNS, frame_fingerprint
+
+# 直方图桶数
+HISTOGRAM_BINS = 32
+
+# 条件的相对代价（数值比较为1）
+RANGE_COST = 1.0
+COMPARE_COST = 1.5
+# 类别条件在预建的快照位图上按行号取位，代价与数值比较相当
+CATEGORY_COST = 1.0
+
+
+class ColumnHistogram:
+    """数值列等宽直方图"""
+
+    def __init__(self, values: np.ndarray, bins: int = HISTOGRAM_BINS):
+        values = np.asarray(values, dtype=np.float64)
+        finite = values[np.isfinite(values)]
+        self.total = len(values)
+        self.valid = len(finite)
+        if self.valid:
+            low, high = float(finite.min()), float(finite.max())
+            if high <= low:
+                high = low + 1.0
+            self.counts, self.edges = np.histogram(finite, bins=bins, range=(low, high))
+            self.cumulative = np.concatenate([[0], np.cumsum(self.counts)])
+        else:
+            self.counts = np.zeros(0)
+            self.edges = np.zeros(1)
+            self.cumulative = np.zeros(1)
+
+    def _rank(self, value: float) -> float:
+        """小于等于 value 的估计行数（桶内线性插值）"""
+        if value < self.edges[0]:
+            return 0.0
+        if value >= self.edges[-1]:
+            return float(self.valid)
+        bucket = int(np.searchsorted(self.edges, value, side="right")) - 1
+        left, right = self.edges[bucket], self.edges[bucket + 1]
+        fraction = (value - left) / (right - left)
+        return float(self.cumulative[bucket] + fraction * self.counts[bucket])
+
+    def selectivity(self, low: Optional[float], high: Optional[float]) -> float:
+        """区间 [low, high] 的估计选择率（缺失值不满足任何区间）"""
+        if self.total == 0 or self.valid == 0:
+            return 0.0
+        below = 0.0 if low is None else self._rank(np.nextafter(low, -np.inf))
+        upto = float(self.valid) if high is None else self._rank(high)
+        return max(0.0, upto - below) / self.total
+
+
+class SnapshotStatistics:
+    """快照统计信息，各列直方图按需计算并缓存
+
+    同一快照（指纹相同）的各个副本共享一份统计，按需计算时使用最近绑定的副本。
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self._df = weakref.ref(df)
+        self.size = len(df)
+        self._histograms: Dict[str, ColumnHistogram] = {}
+        self._frequencies: Dict[str, Dict[str, float]] = {}
+
+    def bind(self, df: pd.DataFrame):
+        """换成同一快照的另一个副本（原副本可能已释放）"""
+        if self._df() is not df:
+            self._df = weakref.ref(df)
+
+    def histogram(self, column: str) -> Optional[ColumnHistogram]:
+        if column not in self._histograms:
+            df = self._df()
+            if df is None or column not in df.columns:
+                return None
+            values = pd.to_numeric(df[column], errors="coerce").to_numpy(dtype=np.float64)
+            self._histograms[column] = ColumnHistogram(values)
+        return self._histograms[column]
+
+    def frequencies(self, column: str) -> Optional[Dict[str, float]]:
+        """类别列各取值占比"""
+        if column not in self._frequencies:
+            df = self._df()
+            if df is None or column not in df.columns:
+                return None
+            self._frequencies[column] = df[column].astype("object").value_counts(normalize=True).to_dict()
+        return self._frequencies[column]
+
+
+# 快照统计缓存: 快照指纹 -> SnapshotStatistics，只保留最近几份快照
+_statistics_cache: "OrderedDict[str, SnapshotStatistics]" = OrderedDict()
+_statistics_lock = threading.Lock()
+STATISTICS_CACHE_SIZE = 8
+
+
+def get_snapshot_statistics(df: pd.DataFrame) -> SnapshotStatistics:
+    """获取快照统计信息（同一快照只计算一次，快照的副本共享统计）
+
+    没有指纹列的表无法按内容识别，按对象缓存。
+    """
+    by_content = any(column in df.columns for column in FINGERPRINT_COLUMNS)
+    key = frame_fingerprint(df) if by_content else f"id:{id(df)}"
+    with _statistics_lock:
+        stats = _statistics_cache.get(key)
+        if stats is None or (not by_content and stats._df() is not df):
+            stats = SnapshotStatistics(df)
+            _statistics_cache[key] = stats
+            while len(_statistics_cache) > STATISTICS_CACHE_SIZE:
+                _statistics_cache.popitem(last=False)
+        else:
+            stats.bind(df)
+            _statistics_cache.move_to_end(key)
+    return stats
+
+
+class Predicate:
+    """筛选条件基类"""
+
+    cost = RANGE_COST
+    columns: List[str] = []
+
+    def available(self, df: pd.DataFrame) -> bool:
+        return all(column in df.columns for column in self.columns)
+
+    def estimate(self, stats: SnapshotStatistics) -> float:
+        """估计选择率（通过比例）"""
+        return 0.5
+
+    def evaluate(self, df: pd.DataFrame, rows) -> np.ndarray:
+        """在给定行号（行号数组，或 slice(None) 表示全部行）上计算条件，返回布尔数组"""
+        raise NotImplementedError
+
+    @property
+    def label(self) -> str:
+        return self.__class__.__name__
+
+
+class RangePredicate(Predicate):
+    """数值区间条件 low <= 列 <= high，None 表示该侧不限"""
+
+    cost = RANGE_COST
+
+    def __init__(self, column: str, low: Optional[float] = None, high: Optional[float] = None):
+        self.column = column
+        self.columns = [column]
+        self.low, self.high = low, high
+
+    def estimate(self, stats: SnapshotStatistics) -> float:
+        histogram = stats.histogram(self.column)
+        return 0.5 if histogram is None else histogram.selectivity(self.low, self.high)
+
+    def evaluate(self, df: pd.DataFrame, rows) -> np.ndarray:
+        # 统一按 float64 比较，与区间索引和接近达标分析一致（快照中比率列为 float32）
+        values = np.asarray(df[self.column].to_numpy()[rows], dtype=np.float64)
+        keep = np.ones(len(values), dtype=bool)
+        if self.low is not None:
+            keep &= values >= self.low
+        if self.high is not None:
+            keep &= values <= self.high
+        return keep
+
+    @property
+    def label(self) -> str:
+        low = "-∞" if self.low is None else f"{self.low:g}"
+        high = "+∞" if self.high is None else f"{self.high:g}"
+        return f"{self.column} ∈ [{low}, {high}]"
+
+
+class CompareColumnsPredicate(Predicate):
+    """两列比较条件 left > right"""
+
+    cost = COMPARE_COST
+
+    def __init__(self, left: str, right: str):
+        self.left, self.right = left, right
+        self.columns = [left, right]
+
+    def evaluate(self, df: pd.DataFrame, rows) -> np.ndarray:
+        return df[self.left].to_numpy()[rows] > df[self.right].to_numpy()[rows]
+
+    @property
+    def label(self) -> str:
+        return f"{self.left} > {self.right}"
+
+
+class CategoryPredicate(Predicate):
+    """类别条件：属于（或不属于）给定取值之一
+
+    mask_fn(df, rows) 可接入类别位图索引，参数为完整快照与存活行号，返回这些行“属于”的布尔数组。
+    """
+
+    cost = CATEGORY_COST
+
+    def __init__(self, column: str, values: Iterable[str], negate: bool = False,
+                 mask_fn: Optional[Callable[[pd.DataFrame, np.ndarray], np.ndarray]] = None,
+                 extra_columns: Optional[List[str]] = None):
+        self.column = column
+        self.values = list(values)
+        self.negate = negate
+        self.mask_fn = mask_fn
+        self.columns = [column] + list(extra_columns or [])
+
+    def estimate(self, stats: SnapshotStatistics) -> float:
+        frequencies = stats.frequencies(self.column)
+        if frequencies is None:
+            return 0.5
+        hit = sum(frequencies.get(value, 0.0) for value in self.values)
+        return 1.0 - hit if self.negate else hit
+
+    def evaluate(self, df: pd.DataFrame, rows) -> np.ndarray:
+        if self.mask_fn is not None:
+            hits = np.asarray(self.mask_fn(df, rows), dtype=bool)
+        elif isinstance(df[self.column].dtype, pd.CategoricalDtype):
+            # 类别列直接比较类别编码，不展开字符串
+            column = df[self.column]
+            wanted = column.cat.categories.get_indexer(self.values)
+            hits = np.isin(column.cat.codes.to_numpy()[rows], wanted[wanted >= 0])
+        else:
+            hits = np.isin(df[self.column].to_numpy()[rows], self.values)
+        return ~hits if self.negate else hits
+
+    @property
+    def label(self) -> str:
+        operator = "∉" if self.negate else "∈"
+        return f"{self.column} {operator} {{{', '.join(self.values)}}}"
+
+
+class FilterPlanner:
+    """按选择率和代价排序并短路执行筛选条件"""
+
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+        self.stats = get_snapshot_statistics(df)
+        self.last_plan: List[Dict] = []
+        self._estimates: Dict[int, float] = {}
+
+    def plan(self, predicates: List[Predicate]) -> List[Predicate]:
+        """排序：每单位代价淘汰行数最多的条件先执行；列不存在的条件被忽略"""
+        usable = [p for p in predicates if p.available(self.df)]
+        ranked = []
+        for order, predicate in enumerate(usable):
+            selectivity = predicate.estimate(self.stats)
+            ranked.append(((1.0 - selectivity) / predicate.cost, order, predicate, selectivity))
+        ranked.sort(key=lambda item: (-item[0], item[1]))
+        self._estimates = {id(item[2]): item[3] for item in ranked}
+        return [item[2] for item in ranked]
+
+    def execute(self, predicates: List[Predicate], rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """执行条件，返回满足全部条件的行号（升序）"""
+        # 第一个条件在整列上计算，不按行号取数
+        whole = rows is None
+        if whole:
+            rows = np.arange(len(self.df))
+        self.last_plan = []
+
+        for predicate in self.plan(predicates):
+            if len(rows) == 0:
+                break
+            before = len(rows)
+            rows = rows[predicate.evaluate(self.df, slice(None) if whole else rows)]
+            whole = False
+            self.last_plan.append({
+                "条件": predicate.label,
+                "预估选择率": round(self._estimates[id(predicate)], 3),
+                "实际选择率": round(len(rows) / before, 3),
+                "剩余行数": len(rows),
+            })
+
+        return rows
+
+    def mask(self, predicates: List[Predicate]) -> np.ndarray:
+        """执行条件，返回布尔掩码"""
+        mask = np.zeros(len(self.df), dtype=bool)
+        mask[self.execute(predicates)] = True
+        return mask
+
+    def explain(self) -> pd.DataFrame:
+        """上一次执行的计划与实际效果"""
+        return pd.DataFrame(self.last_plan)
+
+
+# 主要接口函数
+def filter_rows(df: pd.DataFrame, predicates: List[Predicate]) -> np.ndarray:
+    """按规划顺序执行条件，返回满足全部条件的行号"""
+    return FilterPlanner(df).execute(predicates)
@@ -0,0 +1,187 @@
+"""
+后台筛选任务
+筛选任务提交到线程池在后台执行，按阶段上报进度和中间结果，界面轮询任务状态即可，
+不再阻塞 Streamlit 脚本线程；相同参数的任务正在排队或执行时直接复用，不重复计算。
+"""
+
+import itertools
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 任务状态
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# 保留的已结束任务数
+MAX_FINISHED_JOBS = 100
+
+# 当前上下文的过程信息上报函数 report(level, message)，level 为 info/success/warning/error
+_reporter: ContextVar = ContextVar("job_reporter", default=None)
+
+
+class ScreenJob:
+    """筛选任务：状态、阶段进度、中间结果与最终结果"""
+
+    def __init__(self, job_id: str, key: Hashable, name: str = ""):
+        self.job_id = job_id
+        self.key = key
+        self.name = name
+        self.status = QUEUED
+        self.progress = 0.0
+        self.message = "排队中..."
+        self.stages: List[Dict[str, Any]] = []
+        self.partial = None
+        self.result = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def report(self, progress: float, message: str, partial: Any = None):
+        """上报阶段进度（0~1），可附带中间结果"""
+        with self._lock:
+            now = time.time()
+            if self.stages:
+                self.stages[-1]["耗时"] = round(now - self.stages[-1]["开始"], 3)
+            self.stages.append({"阶段": message, "进度": progress, "开始": now, "耗时": None})
+            self.progress = progress
+            self.message = message
+            if partial is not None:
+                self.partial = partial
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (DONE, FAILED)
+
+    @property
+    def elapsed(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+    def snapshot(self) -> Dict[str, Any]:
+        """当前状态（供界面渲染）"""
+        with self._lock:
+            return {
+                "job_id": self.job_id,
+                "name": self.name,
+                "status": self.status,
+                "progress": self.progress,
+                "message": self.message,
+                "stages": [dict(stage) for stage in self.stages],
+                "partial": self.partial,
+                "elapsed": self.elapsed,
+            }
+
+
+class JobRunner:
+    """后台任务执行器"""
+
+    def __init__(self, max_workers: int = 4):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="screen-job")
+        self._jobs: "OrderedDict[str, ScreenJob]" = OrderedDict()
+        self._active: Dict[Hashable, ScreenJob] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def submit(self, key: Hashable, func: Callable[..., Any], *args, name: str = "", **kwargs) -> ScreenJob:
+        """提交任务；相同 key 的任务正在排队或执行时返回已有任务
+
+        func 的第一个参数是 ScreenJob，用于上报进度，返回值作为任务结果。
+        """
+        with self._lock:
+            existing = self._active.get(key)
+            if existing is not None and not existing.finished:
+                return existing
+
+            job = ScreenJob(f"job-{next(self._ids)}", key, name)
+            self._jobs[job.job_id] = job
+            self._active[key] = job
+            self._trim()
+
+        self._executor.submit(self._run, job, func, args, kwargs)
+        return job
+
+    def _run(self, job: ScreenJob, func: Callable, args: tuple, kwargs: dict):
+        job.status = RUNNING
+        job.started_at = time.time()
+        try:
+            job.result = func(job, *args, **kwargs)
+            job.report(1.0, "✅ 完成")
+            job.status = DONE
+        except Exception as e:
+            job.error = str(e)
+            job.report(job.progress, f"❌ 失败: {e}")
+            job.status = FAILED
+        finally:
+            job.finished_at = time.time()
+            with self._lock:
+                if self._active.get(job.key) is job:
+                    del self._active[job.key]
+
+    def _trim(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job_id]
+
+    def get(self, job_id: str) -> Optional[ScreenJob]:
+        return self._jobs.get(job_id)
+
+    def active_count(self) -> int:
+        with self._lock:
+            return len(self._active)
+
+    def wait(self, job_id: str, timeout: Optional[float] = None, poll: float = 0.05) -> Optional[ScreenJob]:
+        """等待任务结束（命令行与测试使用，界面应轮询）"""
+        job = self.get(job_id)
+        deadline = None if timeout is None else time.time() + timeout
+        while job is not None and not job.finished:
+            if deadline is not None and time.time() > deadline:
+                break
+            time.sleep(poll)
+        return job
+
+
+# 全局任务执行器
+_job_runner = None
+_job_runner_lock = threading.Lock()
+
+def get_job_runner() -> JobRunner:
+    """获取全局任务执行器"""
+    global _job_runner
+    if _job_runner is None:
+        # 多个会话同时首次提交任务时只创建一个执行器（否则各自的线程池与任务表互不可见）
+        with _job_runner_lock:
+            if _job_runner is None:
+                _job_runner = JobRunner()
+    return _job_runner
+
+
+@contextmanager
+def reporting(report: Callable[[str, str], None]):
+    """在上下文内把深层调用（数据获取等）的过程信息交给 report 上报"""
+    token = _reporter.set(report)
+    try:
+        yield
+    finally:
+        _reporter.reset(token)
+
+
+def report_progress(level: str, message: str):
+    """上报过程信息：在 reporting 上下文内交给其上报函数，否则写日志（不直接操作页面）"""
+    report = _reporter.get()
+    if report is not None:
+        report(level, message)
+    else:
+        logger.log(logging.WARNING if level in ("warning", "error") else logging.INFO, message)
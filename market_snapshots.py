@@ -0,0 +1,104 @@
+"""
+全市场快照与自定义筛选条件
+Streamlit 应用与 HTTP API 共用的快照名称、刷新函数和自定义条件的执行逻辑，
+两者挂载同一份主机级共享快照，行情只拉取一次。本模块不依赖页面运行时。
+"""
+
+import numpy as np
+import pandas as pd
+from typing import Dict
+
+from filter_planner import RangePredicate, filter_rows
+from tracing import STAGE_FILTER, traced
+
+# 共享快照的最长使用时间（秒），过期后由一个进程重新拉取
+SNAPSHOT_MAX_AGE = 300
+
+# 预设筛选器与组合筛选使用的A股快照（含派生列）
+UNIVERSE_SNAPSHOT_NAME = "a_share_universe"
+
+# 自定义筛选使用的全市场实时行情快照
+CUSTOM_SNAPSHOT_NAME = "realtime_universe"
+
+# 自定义筛选的股票池上限（覆盖全部A股）
+CUSTOM_UNIVERSE_LIMIT = 6000
+
+# 自定义筛选条件 -> 快照列
+CUSTOM_CRITERIA_COLUMNS = {
+    "market_cap_range": "市值",
+    "pe_range": "PE",
+    "pb_range": "PB",
+    "rsi_range": "RSI",
+    "price_change_range": "涨跌幅",
+    "volume_ratio_min": "量比",
+    "turnover_range": "换手率",
+}
+
+
+def fetch_a_share_universe() -> pd.DataFrame:
+    """拉取A股股票池数据并补齐全部派生列（由共享快照的刷新进程调用）"""
+
+    from china_a_stock_fetcher import ChinaAStockFetcher
+    fetcher = ChinaAStockFetcher()
+    return fetcher.get_china_a_stock_data(num_stocks=len(fetcher.a_stock_codes), use_real_data=True)
+
+
+def fetch_custom_universe() -> pd.DataFrame:
+    """拉取全市场实时行情并计算技术指标（由共享快照的刷新进程调用）"""
+
+    from real_data_fetcher import get_real_data_fetcher
+    data_fetcher = get_real_data_fetcher()
+    df = data_fetcher.get_stock_realtime_data(limit=CUSTOM_UNIVERSE_LIMIT)
+    if df.empty:
+        return df
+    return data_fetcher.calculate_technical_indicators(df).reset_index(drop=True)
+
+
+def criteria_to_ranges(criteria: dict) -> Dict[str, tuple]:
+    """将自定义筛选条件转换为区间索引的列区间，语义与 apply_custom_criteria 一致"""
+
+    ranges = {}
+
+    if criteria.get("market_cap_range"):
+        ranges['市值'] = tuple(criteria["market_cap_range"])
+
+    # PE/PB 要求严格大于0
+    positive = np.nextafter(0, 1)
+    if criteria.get("pe_range"):
+        min_pe, max_pe = criteria["pe_range"]
+        ranges['PE'] = (max(min_pe, positive), max_pe)
+
+    if criteria.get("pb_range"):
+        min_pb, max_pb = criteria["pb_range"]
+        ranges['PB'] = (max(min_pb, positive), max_pb)
+
+    if criteria.get("rsi_range"):
+        ranges['RSI'] = tuple(criteria["rsi_range"])
+
+    if criteria.get("price_change_range"):
+        ranges['涨跌幅'] = tuple(criteria["price_change_range"])
+
+    if criteria.get("volume_ratio_min"):
+        ranges['量比'] = (criteria["volume_ratio_min"], None)
+
+    if criteria.get("turnover_range"):
+        ranges['换手率'] = tuple(criteria["turnover_range"])
+
+    return ranges
+
+
+@traced(STAGE_FILTER, "自定义条件")
+def filter_custom_criteria(df: pd.DataFrame, criteria: dict) -> pd.DataFrame:
+    """返回满足自定义条件的全部行（不排序、不截断）
+
+    条件由 FilterPlanner 按选择率排序，在存活行号上短路执行，只在最后取一次子集。
+    """
+
+    if df.empty:
+        return df
+
+    predicates = [
+        RangePredicate(column, low, high)
+        for column, (low, high) in criteria_to_ranges(criteria).items()
+    ]
+    return df.iloc[filter_rows(df, predicates)]
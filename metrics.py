@@ -0,0 +1,373 @@
+"""
+运行指标
+计数器、仪表与直方图，以 Prometheus 文本格式通过 HTTP 暴露：
+- 各数据源请求耗时与响应字节数直方图、获取行数计数（来自获取阶段的追踪 span）
+- 统一缓存的命中、未命中、淘汰与过期计数，以及按函数区分的命中情况
+- 共享快照的年龄、行数、版本与文件大小
+- 各筛选器运行耗时直方图
+- 各阶段产出 DataFrame 的内存占用直方图，页面会话的驻留 / 溢出内存与溢出、清除次数
+
+热路径上只做一次加锁累加；缓存与快照状态在抓取时才读取。
+
+用法:
+    STOCK_METRICS_PORT=8601 streamlit run stock_screener_app.py   # 页面进程旁的 /metrics（0 关闭）
+    curl http://127.0.0.1:8601/metrics
+    curl http://127.0.0.1:8600/metrics                              # 筛选 HTTP API 同样提供
+"""
+
+import bisect
+import logging
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from tracing import STAGE_FETCH, Span, get_tracer
+
+logger = logging.getLogger(__name__)
+
+# 指标名前缀
+METRIC_PREFIX = "stock"
+
+# 页面进程旁指标服务的默认端口（STOCK_METRICS_PORT=0 关闭）
+DEFAULT_METRICS_PORT = 8601
+
+# Prometheus 文本格式的媒体类型
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# 直方图分桶
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+BYTES_BUCKETS = tuple(1024 * 4 ** i for i in range(8))  # 1 KB ~ 16 MB
+MEMORY_BUCKETS = tuple(64 * 1024 * 4 ** i for i in range(8))  # 64 KB ~ 1 GB
+SCREEN_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# 抓取时输出的一组样本：(名称, 类型, 说明, [(标签, 值)])
+MetricFamily = Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    """带固定标签名的指标；标签取值组合各自独立累计"""
+
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple, object] = {}
+
+    def _key(self, labels: Dict) -> Tuple:
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name} 需要标签 {self.labels}，收到 {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def _labels_of(self, key: Tuple) -> Dict[str, str]:
+        return dict(zip(self.labels, key))
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_value(self._labels_of(key), value))
+        return lines
+
+    def _render_value(self, labels: Dict[str, str], value) -> List[str]:
+        return [f"{self.name}{_format_labels(labels)} {_format_value(value)}"]
+
+
+class Counter(Metric):
+    """只增计数器"""
+
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(Metric):
+    """可增可减的当前值"""
+
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+
+class Histogram(Metric):
+    """固定分桶直方图"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # 各桶计数（非累计，最后一格为 +Inf）、总和、次数
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def count(self, **labels) -> int:
+        state = self._values.get(self._key(labels))
+        return 0 if state is None else state[2]
+
+    def _render_value(self, labels: Dict[str, str], state) -> List[str]:
+        counts, total, count = state
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += bucket_count
+            bucket_labels = dict(labels, le=_format_value(bound))
+            lines.append(f"{self.name}_bucket{_format_labels(bucket_labels)} {cumulative}")
+        lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(total)}")
+        lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """指标注册表：持有全部指标与抓取时调用的采集函数"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._collectors: List[Callable[[], Iterable[MetricFamily]]] = []
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name: str, *args, **kwargs) -> Metric:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"指标 {name} 已注册为 {metric.kind}")
+            return metric
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter, name, help, labels)
+
+    def gauge(self, name: str, help: str, labels: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge, name, help, labels)
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, help, labels, buckets)
+
+    def add_collector(self, collector: Callable[[], Iterable[MetricFamily]]):
+        """注册抓取时调用的采集函数"""
+        if collector not in self._collectors:
+            self._collectors.append(collector)
+
+    def render(self) -> str:
+        """Prometheus 文本格式"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            try:
+                families = list(collector())
+            except Exception as e:
+                logger.warning(f"⚠️ 指标采集失败 {getattr(collector, '__name__', collector)}: {e}")
+                continue
+            for name, kind, help, samples in families:
+                lines.extend([f"# HELP {name} {help}", f"# TYPE {name} {kind}"])
+                lines.extend(f"{name}{_format_labels(labels)} {_format_value(value)}" for labels, value in samples)
+        return "\n".join(lines) + "\n"
+
+
+class StockMetrics:
+    """本应用的指标集合"""
+
+    def __init__(self, registry: Optional[MetricsRegistry] = None):
+        self.registry = registry or MetricsRegistry()
+        r = self.registry
+        self.provider_latency = r.histogram(f"{METRIC_PREFIX}_provider_request_duration_seconds",
+                                            "数据源请求耗时", ("provider", "outcome"))
+        self.provider_bytes = r.histogram(f"{METRIC_PREFIX}_provider_response_bytes",
+                                          "数据源响应字节数", ("provider",), BYTES_BUCKETS)
+        self.provider_rows = r.counter(f"{METRIC_PREFIX}_provider_rows_total", "数据源返回的行数", ("provider",))
+        self.cache_requests = r.counter(f"{METRIC_PREFIX}_cache_function_requests_total",
+                                        "缓存函数调用次数（按命中与否）", ("function", "result"))
+        self.screen_duration = r.histogram(f"{METRIC_PREFIX}_screen_duration_seconds",
+                                           "筛选运行耗时", ("screener", "outcome"), SCREEN_BUCKETS)
+        self.stage_memory = r.histogram(f"{METRIC_PREFIX}_stage_result_bytes",
+                                        "各阶段产出 DataFrame 的内存占用", ("stage",), MEMORY_BUCKETS)
+        r.add_collector(collect_cache_stats)
+        r.add_collector(collect_snapshot_stats)
+        r.add_collector(collect_session_memory)
+
+    def record_span(self, span: Span):
+        """追踪 span 结束时汇入指标：带 provider 的获取 span、带 screener 的运行 span 与带 memory 的阶段 span"""
+        attributes = span.attributes
+        outcome = "error" if span.error else "ok"
+        if span.stage == STAGE_FETCH and "provider" in attributes:
+            provider = attributes["provider"]
+            self.provider_latency.observe(span.duration, provider=provider, outcome=outcome)
+            if "bytes" in attributes:
+                self.provider_bytes.observe(attributes["bytes"], provider=provider)
+            if "rows" in attributes:
+                self.provider_rows.inc(attributes["rows"], provider=provider)
+        if "screener" in attributes:
+            self.screen_duration.observe(span.duration, screener=attributes["screener"], outcome=outcome)
+        if span.stage is not None and "memory" in attributes:
+            self.stage_memory.observe(attributes["memory"], stage=span.stage)
+
+    def render(self) -> str:
+        return self.registry.render()
+
+
+def collect_cache_stats() -> Iterable[MetricFamily]:
+    """统一缓存的累计命中、未命中、淘汰、过期与当前占用"""
+    from cache_backend import get_cache
+
+    stats = get_cache().stats()
+    if not stats:
+        return []
+    families = [
+        (f"{METRIC_PREFIX}_cache_{name}_total", "counter", f"统一缓存 {name} 次数", [({}, stats[name])])
+        for name in ("hits", "misses", "evictions", "expirations", "rejections") if name in stats
+    ]
+    families.append((f"{METRIC_PREFIX}_cache_entries", "gauge", "统一缓存条目数", [({}, stats["entries"])]))
+    families.append((f"{METRIC_PREFIX}_cache_bytes", "gauge", "统一缓存占用字节数", [({}, stats["bytes"])]))
+    return families
+
+
+def collect_snapshot_stats() -> Iterable[MetricFamily]:
+    """共享快照的年龄、行数、版本与文件大小（未发布的快照不输出）"""
+    import time
+    from market_snapshots import CUSTOM_SNAPSHOT_NAME, UNIVERSE_SNAPSHOT_NAME
+    from shared_snapshot import SharedSnapshotStore
+
+    samples = {"age": [], "rows": [], "version": [], "bytes": []}
+    for name in (UNIVERSE_SNAPSHOT_NAME, CUSTOM_SNAPSHOT_NAME):
+        store = SharedSnapshotStore(name)
+        manifest = store.manifest()
+        if manifest is None:
+            continue
+        labels = {"snapshot": name}
+        samples["age"].append((labels, round(time.time() - manifest["published_at"], 3)))
+        samples["rows"].append((labels, manifest["rows"]))
+        samples["version"].append((labels, manifest["version"]))
+        try:
+            samples["bytes"].append((labels, os.path.getsize(os.path.join(store.directory, manifest["path"]))))
+        except OSError:
+            pass
+    return [
+        (f"{METRIC_PREFIX}_snapshot_age_seconds", "gauge", "共享快照发布至今的秒数", samples["age"]),
+        (f"{METRIC_PREFIX}_snapshot_rows", "gauge", "共享快照行数", samples["rows"]),
+        (f"{METRIC_PREFIX}_snapshot_version", "gauge", "共享快照版本号", samples["version"]),
+        (f"{METRIC_PREFIX}_snapshot_bytes", "gauge", "共享快照文件字节数", samples["bytes"]),
+    ]
+
+
+def collect_session_memory() -> Iterable[MetricFamily]:
+    """页面会话的数量、驻留与溢出内存，以及超出预算后的溢出、清除次数"""
+    from session_memory import get_session_accountant
+
+    stats = get_session_accountant().stats()
+    return [
+        (f"{METRIC_PREFIX}_sessions", "gauge", "记账中的页面会话数", [({}, stats["sessions"])]),
+        (f"{METRIC_PREFIX}_session_memory_bytes", "gauge", "全部会话驻留内存字节数", [({}, stats["bytes"])]),
+        (f"{METRIC_PREFIX}_session_memory_max_bytes", "gauge", "占用最大的会话驻留内存字节数",
+         [({}, stats["max_session_bytes"])]),
+        (f"{METRIC_PREFIX}_session_spilled_bytes", "gauge", "全部会话溢出到磁盘的字节数", [({}, stats["spilled_bytes"])]),
+        (f"{METRIC_PREFIX}_session_spills_total", "counter", "超出会话预算溢出到磁盘的次数", [({}, stats["spills"])]),
+        (f"{METRIC_PREFIX}_session_evictions_total", "counter", "超出会话预算清除的次数", [({}, stats["evictions"])]),
+    ]
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = get_metrics().render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_metrics: Optional[StockMetrics] = None
+_metrics_lock = threading.Lock()
+_server: Optional[ThreadingHTTPServer] = None
+
+
+def get_metrics() -> StockMetrics:
+    """获取全局指标（首次调用时挂到全局追踪器上，模块导入时即调用一次）"""
+    global _metrics
+    if _metrics is None:
+        with _metrics_lock:
+            if _metrics is None:
+                metrics = StockMetrics()
+                get_tracer().add_listener(metrics.record_span)
+                _metrics = metrics
+    return _metrics
+
+
+# 导入即挂上追踪器：首次抓取 /metrics 之前结束的筛选与数据源 span 同样计入
+get_metrics()
+
+
+# 主要接口函数
+def start_metrics_server(port: Optional[int] = None, host: Optional[str] = None) -> Optional[ThreadingHTTPServer]:
+    """在后台线程启动 /metrics 服务（进程内只启动一次，端口为 0 或被占用时不启动）
+
+    端口与地址默认取 STOCK_METRICS_PORT / STOCK_METRICS_HOST（默认只监听本机）。
+    """
+    global _server
+    if port is None:
+        port = int(os.environ.get("STOCK_METRICS_PORT", DEFAULT_METRICS_PORT))
+    host = host or os.environ.get("STOCK_METRICS_HOST", "127.0.0.1")
+    get_metrics()
+    with _metrics_lock:
+        if _server is not None or port == 0:
+            return _server
+        try:
+            _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        except OSError as e:
+            logger.warning(f"⚠️ 指标服务未启动（端口 {port}）: {e}")
+            return None
+        _server.daemon_threads = True
+        threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+        logger.info(f"📈 指标服务: http://{host}:{_server.server_address[1]}/metrics")
+        return _server
@@ -6,11 +6,24 @@
 import pandas as pd
 import numpy as np
 import streamlit as st
-import yfinance as yf
+import yfinance
 import requests
 import time
 from datetime import datetime, timedelta
 import random
+from cache_backend import cached
+from synthetic_market import SyntheticMarket
+from cassette import recordable
+
+yf = recordable(yfinance, "yfinance")
+
+# 示例股票数据的列
+SAMPLE_COLUMNS = [
+    "股票代码", "股票名称", "最新价", "涨跌幅", "涨跌额", "成交量", "成交额", "换手率", "市盈率", "市净率",
+    "总市值", "流通市值", "ROE", "净利润增长", "营收增长", "毛利率", "净利率", "资产负债率",
+    "RSI", "MACD", "KDJ_K", "布林上轨", "布林下轨", "MA5", "MA10", "MA20", "成交量比", "量比",
+    "市销率", "股息率", "每股收益", "每股净资产", "行业", "概念", "上市日期", "综合评分"
+]
 
 class OptimizedDataFetcher:
     """优化的数据获取器"""
@@ -19,7 +32,7 @@ class OptimizedDataFetcher:
         self.timeout = 10  # 10秒超时
         self.max_retries = 2  # 最多重试2次
         
-    @st.cache_data(ttl=300)  # 5分钟缓存
+    @cached(ttl=300)  # 5分钟缓存
     def get_sample_stock_data(_self, num_stocks=50):
         """获取示例股票数据 - 快速版本"""
         
@@ -38,59 +51,17 @@ class OptimizedDataFetcher:
         # 随机选择股票
         selected_codes = random.sample(stock_codes, min(num_stocks, len(stock_codes)))
         
-        # 生成模拟数据
-        data = []
-        for i, code in enumerate(selected_codes):
-            # 模拟真实的股票数据
-            base_price = random.uniform(5, 200)
-            change_pct = random.uniform(-10, 10)
-            
-            stock_data = {
-                "股票代码": code,
-                "股票名称": _self._get_stock_name(code),
-                "最新价": round(base_price, 2),
-                "涨跌幅": round(change_pct, 2),
-                "涨跌额": round(base_price * change_pct / 100, 2),
-                "成交量": random.randint(1000000, 100000000),
-                "成交额": random.randint(10000000, 1000000000),
-                "换手率": round(random.uniform(0.1, 15), 2),
-                "市盈率": round(random.uniform(5, 50), 2),
-                "市净率": round(random.uniform(0.5, 10), 2),
-                "总市值": random.randint(1000000000, 500000000000),
-                "流通市值": random.randint(500000000, 300000000000),
-                "ROE": round(random.uniform(-5, 25), 2),
-                "净利润增长": round(random.uniform(-30, 50), 2),
-                "营收增长": round(random.uniform(-20, 40), 2),
-                "毛利率": round(random.uniform(10, 60), 2),
-                "净利率": round(random.uniform(-10, 30), 2),
-                "资产负债率": round(random.uniform(20, 80), 2),
-                "RSI": round(random.uniform(20, 80), 2),
-                "MACD": round(random.uniform(-2, 2), 3),
-                "KDJ_K": round(random.uniform(0, 100), 2),
-                "布林上轨": round(base_price * 1.1, 2),
-                "布林下轨": round(base_price * 0.9, 2),
-                "MA5": round(base_price * random.uniform(0.95, 1.05), 2),
-                "MA10": round(base_price * random.uniform(0.9, 1.1), 2),
-                "MA20": round(base_price * random.uniform(0.85, 1.15), 2),
-                "成交量比": round(random.uniform(0.5, 3), 2),
-                "量比": round(random.uniform(0.3, 5), 2),
-                "市销率": round(random.uniform(0.5, 20), 2),
-                "股息率": round(random.uniform(0, 8), 2),
-                "每股收益": round(random.uniform(-2, 10), 2),
-                "每股净资产": round(random.uniform(1, 50), 2),
-                "行业": _self._get_industry(code),
-                "概念": _self._get_concept(code),
-                "上市日期": _self._get_list_date(),
-                "综合评分": round(random.uniform(1, 10), 1)
-            }
-            data.append(stock_data)
-            
-            # 显示进度
-            if i % 10 == 0:
-                progress = (i + 1) / len(selected_codes)
-                st.progress(progress, f"正在生成股票数据... {i+1}/{len(selected_codes)}")
-        
-        return pd.DataFrame(data)
+        # 生成模拟数据（整批由合成市场生成，不再逐行构造）
+        symbols = pd.DataFrame({
+            "股票代码": selected_codes,
+            "股票名称": [_self._get_stock_name(code) for code in selected_codes],
+            "行业": [_self._get_industry(code) for code in selected_codes],
+            "概念": [_self._get_concept(code) for code in selected_codes],
+        })
+        seed = random.getrandbits(32)
+        snapshot = SyntheticMarket(symbols=symbols, n_days=60, seed=seed).spot_snapshot()
+        snapshot["综合评分"] = np.round(np.random.default_rng(seed).uniform(1, 10, len(snapshot)), 1)
+        return snapshot[SAMPLE_COLUMNS]
     
     def _get_stock_name(self, code):
         """获取股票名称"""
@@ -125,16 +96,7 @@ class OptimizedDataFetcher:
                    "环保", "大数据", "云计算", "物联网", "区块链", "虚拟现实", "新零售"]
         return random.choice(concepts)
     
-    def _get_list_date(self):
-        """获取上市日期"""
-        start_date = datetime(1990, 1, 1)
-        end_date = datetime(2023, 12, 31)
-        random_date = start_date + timedelta(
-            days=random.randint(0, (end_date - start_date).days)
-        )
-        return random_date.strftime("%Y-%m-%d")
-    
-    @st.cache_data(ttl=600)  # 10分钟缓存
+    @cached(ttl=600, session_aware=False)  # 10分钟缓存（美股数据）
     def try_real_data(_self, max_stocks=20):
         """尝试获取真实数据（限制数量以提高速度）"""
         try:
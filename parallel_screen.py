@@ -0,0 +1,190 @@
+"""
+多进程并行筛选
+先在整张全市场快照上补齐各策略需要的派生列，再按代码区间或上市板块分区，在进程池中
+分区执行筛选，各分区只返回前K名，由主进程合并。派生列与评分的随机因素按股票代码播种，
+结果与分区数、核数无关。快照通过共享内存（Arrow IPC 内存映射）传给子进程，
+任务参数只有分区行号，不再序列化整张表，多策略全市场筛选可随核数近线性加速。
+"""
+
+import os
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from shared_snapshot import SharedSnapshotStore
+
+# 分区方式
+PARTITION_BY_RANGE = "range"  # 按股票代码排序后的连续区间
+PARTITION_BY_BOARD = "board"  # 按上市板块
+
+# 并行筛选使用的共享快照名称
+PARALLEL_SNAPSHOT_NAME = "parallel_universe"
+
+# 进程内复用的筛选器实例
+_screeners: Dict[str, object] = {}
+
+
+def partition_rows(df: pd.DataFrame, partitions: int, by: str = PARTITION_BY_RANGE) -> List[np.ndarray]:
+    """把快照行号划分为若干分区（int32 行号数组，按行号升序）"""
+    if df.empty:
+        return []
+
+    if by == PARTITION_BY_BOARD and "板块" in df.columns:
+        boards = df["板块"].astype(str).to_numpy()
+        return [np.flatnonzero(boards == board).astype(np.int32) for board in pd.unique(boards)]
+
+    order = np.argsort(df["股票代码"].astype(str).to_numpy(), kind="stable").astype(np.int32)
+    return [np.sort(part) for part in np.array_split(order, max(1, min(partitions, len(df)))) if len(part)]
+
+
+def _screener(kind: str):
+    if kind not in _screeners:
+        if kind == "smart":
+            from smart_stock_screener import SmartStockScreener
+            _screeners[kind] = SmartStockScreener()
+        else:
+            from short_term_entry_screener import ShortTermEntryScreener
+            _screeners[kind] = ShortTermEntryScreener()
+    return _screeners[kind]
+
+
+def _top(df: pd.DataFrame, sort_by: str, descending: bool, top_k: int) -> pd.DataFrame:
+    if sort_by in df.columns:
+        # 同值按股票代码排序，分区内前K名合并后与全量排序一致
+        by, ascending = [sort_by], [not descending]
+        if "股票代码" in df.columns and sort_by != "股票代码":
+            by.append("股票代码")
+            ascending.append(True)
+        df = df.sort_values(by, ascending=ascending, kind="stable")
+    return df.head(top_k)
+
+
+def _screen_smart(part: pd.DataFrame, screener_type: str, top_k: int) -> Dict:
+    """智能筛选器分区：硬性条件在分区内执行，行业偏好留给合并方"""
+    screener = _screener("smart")
+    logic = screener.screener_logic[screener_type]
+    part = screener.fetcher.add_derived_columns(part, screener.required_columns(screener_type))
+    rows, preferred = screener.survivor_rows(part, screener_type)
+    survivors = part.iloc[rows]
+    return {
+        "matched": len(rows),
+        "preferred": _top(survivors[preferred], logic["sort_by"], logic["sort_desc"], top_k),
+        "all": _top(survivors, logic["sort_by"], logic["sort_desc"], top_k),
+    }
+
+
+def _merge_smart(screener_type: str, results: List[Dict], top_k: int) -> pd.DataFrame:
+    logic = _screener("smart").screener_logic[screener_type]
+    # 与 apply_screener_logic 一致：只要有偏好行业的存活股票，就只保留偏好行业
+    group = "preferred" if any(len(r["preferred"]) for r in results) else "all"
+    merged = pd.concat([r[group] for r in results], ignore_index=True)
+    return _top(merged, logic["sort_by"], logic["sort_desc"], top_k).reset_index(drop=True)
+
+
+def _screen_short_term(part: pd.DataFrame, strategy_key: str, top_k: int) -> Dict:
+    """短线策略分区：条件判断与逐只评分都在分区内完成"""
+    screener = _screener("short_term")
+    part = screener.fetcher.add_derived_columns(part, screener.required_columns(strategy_key))
+    scored = screener.score_entries(part, strategy_key)
+    return {"matched": len(scored), "all": scored.head(top_k)}
+
+
+def _merge_short_term(strategy_key: str, results: List[Dict], top_k: int) -> pd.DataFrame:
+    merged = pd.concat([r["all"] for r in results], ignore_index=True)
+    return _top(merged, "入场评分", True, top_k).reset_index(drop=True)
+
+
+# 分区筛选与合并函数：类型 -> (分区函数, 合并函数)
+PARTITION_SCREENS: Dict[str, Tuple[Callable, Callable]] = {
+    "smart": (_screen_smart, _merge_smart),
+    "short_term": (_screen_short_term, _merge_short_term),
+}
+
+
+def required_columns(strategies: Sequence[Tuple[str, str]]) -> List[str]:
+    """全部策略需要的快照列（合并去重）"""
+    columns: List[str] = []
+    for kind, key in strategies:
+        columns += _screener(kind).required_columns(key)
+    return list(dict.fromkeys(columns))
+
+
+def prepare_frame(df: pd.DataFrame, strategies: Sequence[Tuple[str, str]]) -> pd.DataFrame:
+    """在整张快照上补齐全部策略需要的派生列
+
+    只算一次，各分区直接使用（分区内不再重复计算）。
+    """
+    return _screener("smart").fetcher.add_derived_columns(df, required_columns(strategies))
+
+
+def screen_frame(part: pd.DataFrame, strategies: Sequence[Tuple[str, str]],
+                 top_k: int) -> Dict[Tuple[str, str], Dict]:
+    """对一个分区执行全部策略，返回各策略的分区结果"""
+    return {
+        (kind, key): PARTITION_SCREENS[kind][0](part, key, top_k)
+        for kind, key in strategies
+    }
+
+
+def merge_results(strategies: Sequence[Tuple[str, str]], outputs: List[Dict[Tuple[str, str], Dict]],
+                  top_k: int) -> Dict[Tuple[str, str], Dict]:
+    """合并各分区结果：{(类型, 策略键): {"top": 前K名, "matched": 入选总数}}"""
+    merged = {}
+    for kind, key in strategies:
+        results = [output[(kind, key)] for output in outputs]
+        merged[(kind, key)] = {
+            "top": PARTITION_SCREENS[kind][1](key, results, top_k),
+            "matched": sum(r["matched"] for r in results),
+        }
+    return merged
+
+
+def screen_partition(directory: str, name: str, version: int, rows: np.ndarray,
+                     strategies: Sequence[Tuple[str, str]], top_k: int) -> Dict[Tuple[str, str], Dict]:
+    """子进程任务：挂载共享快照，对一个分区执行全部策略"""
+    snapshot = SharedSnapshotStore(name, directory).attach(version)
+    part = snapshot.iloc[rows].reset_index(drop=True)
+    part.attrs = dict(snapshot.attrs)
+    return screen_frame(part, strategies, top_k)
+
+
+class ParallelScreener:
+    """分区并行筛选"""
+
+    def __init__(self, workers: Optional[int] = None, partition_by: str = PARTITION_BY_RANGE,
+                 directory: Optional[str] = None, snapshot_name: str = PARALLEL_SNAPSHOT_NAME):
+        self.workers = workers or os.cpu_count() or 1
+        self.partition_by = partition_by
+        self.store = SharedSnapshotStore(snapshot_name, directory)
+
+    def run(self, df: pd.DataFrame, strategies: Sequence[Tuple[str, str]], top_k: int = 30,
+            partitions: Optional[int] = None) -> Dict[Tuple[str, str], Dict]:
+        """对快照并行执行多个策略
+
+        strategies 为 (类型, 策略键) 列表，类型见 PARTITION_SCREENS；
+        返回 {(类型, 策略键): {"top": 前K名, "matched": 入选总数}}。
+        workers=1 时在当前进程内按相同分区执行，结果与并行一致。
+        """
+        if df.empty:
+            return {tuple(s): {"top": pd.DataFrame(), "matched": 0} for s in strategies}
+
+        df = prepare_frame(df, strategies)
+        version = self.store.publish(df)
+        parts = partition_rows(df, partitions or self.workers, self.partition_by)
+        args = [(self.store.directory, self.store.name, version, rows, list(strategies), top_k) for rows in parts]
+
+        if self.workers == 1 or len(parts) == 1:
+            outputs = [screen_partition(*a) for a in args]
+        else:
+            with ProcessPoolExecutor(max_workers=min(self.workers, len(parts))) as pool:
+                outputs = list(pool.map(screen_partition, *zip(*args)))
+
+        return merge_results(strategies, outputs, top_k)
+
+
+# 主要接口函数
+def parallel_screen(df: pd.DataFrame, strategies: Sequence[Tuple[str, str]], top_k: int = 30,
+                    workers: Optional[int] = None, partition_by: str = PARTITION_BY_RANGE) -> Dict[Tuple[str, str], Dict]:
+    """多进程分区并行筛选的主要接口"""
+    return ParallelScreener(workers, partition_by).run(df, strategies, top_k)
@@ -0,0 +1,369 @@
+"""
+按需性能剖析
+打开剖析开关后，下一次筛选运行（预设筛选、自定义筛选、短线策略）在剖析器下执行：
+- sampling: 采样线程定时抓取运行线程的调用栈，输出火焰图可用的折叠栈（stacks.folded，
+  可直接交给 flamegraph.pl / speedscope / inferno）
+- cprofile: 确定性剖析，输出 pstats 文件（profile.prof，可用 snakeviz / flameprof 查看）
+两种模式都用 tracemalloc 记录运行期间的内存分配。报告写入 STOCK_PROFILE_DIR（默认 profiles/），
+包含热点函数前N名、分配最多的代码行与剖析文件，页面上可打包下载。
+
+开关:
+    STOCK_PROFILE=sampling streamlit run stock_screener_app.py   # 每次筛选都剖析（也可为 cprofile）
+    页面地址加 ?profile=1 显示侧边栏剖析开关，只剖析下一次筛选
+"""
+
+import cProfile
+import functools
+import io
+import json
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+import tracemalloc
+import zipfile
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+# 剖析模式
+MODE_SAMPLING = "sampling"
+MODE_CPROFILE = "cprofile"
+MODES = (MODE_SAMPLING, MODE_CPROFILE)
+
+# 报告目录
+PROFILE_DIR = os.environ.get("STOCK_PROFILE_DIR", "profiles")
+
+# 采样间隔（秒）
+SAMPLE_INTERVAL = 0.005
+
+# 报告中列出的热点函数与分配位置数
+TOP_N = 25
+
+# tracemalloc 保留的调用栈深度
+TRACEMALLOC_FRAMES = 10
+
+# 报告文件名
+SUMMARY_FILE = "summary.txt"
+REPORT_FILE = "report.json"
+FOLDED_FILE = "stacks.folded"
+PSTATS_FILE = "profile.prof"
+
+
+def _frame_label(code) -> str:
+    """调用栈中一帧的名称（折叠栈格式中分号是分隔符，需替换）"""
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ":")
+
+
+class StackSampler:
+    """采样剖析器：后台线程按间隔读取目标线程的当前调用栈并计数"""
+
+    def __init__(self, thread_id: int, interval: float = SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def _run(self):
+        sampler_frame = sys._getframe()
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None or frame is sampler_frame:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            self.stacks[tuple(reversed(stack))] += 1
+            self.samples += 1
+
+    def start(self) -> "StackSampler":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def folded(self, skip: int = 0) -> str:
+        """折叠栈格式：每行「根;...;叶 次数」，skip 去掉最外层的若干帧（剖析区间之外的调用方）"""
+        lines = [f"{';'.join(stack[skip:])} {count}" for stack, count in self.stacks.most_common() if stack[skip:]]
+        return "\n".join(lines) + "\n"
+
+    def hot_functions(self, n: int = TOP_N, skip: int = 0) -> List[Dict]:
+        """按自身样本数排序的热点函数（含包含子调用的样本数）"""
+        own: Counter = Counter()
+        inclusive: Counter = Counter()
+        for stack, count in self.stacks.items():
+            stack = stack[skip:]
+            if not stack:
+                continue
+            own[stack[-1]] += count
+            for frame in set(stack):
+                inclusive[frame] += count
+        total = max(self.samples, 1)
+        return [{"函数": frame, "自身占比": round(count / total, 4), "累计占比": round(inclusive[frame] / total, 4),
+                 "自身样本": count} for frame, count in own.most_common(n)]
+
+
+class ProfileReport:
+    """一次剖析的报告目录"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    @property
+    def name(self) -> str:
+        return os.path.basename(self.path)
+
+    def summary(self) -> Dict:
+        with open(os.path.join(self.path, REPORT_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def files(self) -> List[str]:
+        return sorted(os.listdir(self.path))
+
+    def archive(self) -> bytes:
+        """把报告目录打包为 zip（供页面下载）"""
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+            for file in self.files():
+                zf.write(os.path.join(self.path, file), f"{self.name}/{file}")
+        return buffer.getvalue()
+
+
+def _top_allocations(before: tracemalloc.Snapshot, after: tracemalloc.Snapshot, n: int) -> List[Dict]:
+    """运行期间净分配最多的代码行"""
+    filters = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+    stats = after.filter_traces(filters).compare_to(before.filter_traces(filters), "lineno")
+    rows = []
+    for stat in stats[:n]:
+        frame = stat.traceback[0]
+        rows.append({"位置": f"{frame.filename}:{frame.lineno}", "净分配(KB)": round(stat.size_diff / 1024, 1),
+                     "当前(KB)": round(stat.size / 1024, 1), "对象数": stat.count_diff})
+    return rows
+
+
+def _pstats_top(profiler: cProfile.Profile, n: int) -> Tuple[List[Dict], str]:
+    stats = pstats.Stats(profiler)
+    rows = []
+    for (filename, line, function), (_, calls, own, cumulative, _) in sorted(
+            stats.stats.items(), key=lambda item: item[1][2], reverse=True)[:n]:
+        rows.append({"函数": f"{function} ({os.path.basename(filename)}:{line})", "调用次数": calls,
+                     "自身耗时(s)": round(own, 4), "累计耗时(s)": round(cumulative, 4)})
+    text = io.StringIO()
+    pstats.Stats(profiler, stream=text).sort_stats("cumulative").print_stats(n)
+    return rows, text.getvalue()
+
+
+def _write_summary(path: str, report: Dict, extra: str = ""):
+    lines = [f"剖析: {report['name']}  模式: {report['mode']}  开始: {report['started_at']}",
+             f"耗时: {report['elapsed']:.3f} 秒  内存峰值: {report['peak_kb']:.0f} KB  净分配: {report['allocated_kb']:.0f} KB",
+             "", f"热点函数（前 {len(report['hot_functions'])} 名）:"]
+    for row in report["hot_functions"]:
+        lines.append("  " + "  ".join(f"{key}={value}" for key, value in row.items()))
+    lines += ["", f"分配最多的代码行（前 {len(report['allocations'])} 名）:"]
+    for row in report["allocations"]:
+        lines.append("  " + "  ".join(f"{key}={value}" for key, value in row.items()))
+    if extra:
+        lines += ["", extra]
+    with open(os.path.join(path, SUMMARY_FILE), "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+class Profiler:
+    """剖析开关与报告管理：同一时间只剖析一次运行（tracemalloc 为进程级）"""
+
+    def __init__(self, directory: Optional[str] = None, always: Optional[str] = None):
+        self.directory = directory or PROFILE_DIR
+        env_mode = os.environ.get("STOCK_PROFILE", "").lower()
+        self.always = always if always is not None else (MODE_SAMPLING if env_mode == "1" else
+                                                         env_mode if env_mode in MODES else None)
+        self._pending: Optional[str] = None
+        self._lock = threading.Lock()
+        self._active = False
+        self._local = threading.local()
+
+    def request(self, mode: str = MODE_SAMPLING):
+        """只剖析下一次运行"""
+        if mode not in MODES:
+            raise ValueError(f"未知剖析模式: {mode}")
+        self._pending = mode
+
+    def cancel(self):
+        self._pending = None
+
+    @property
+    def pending(self) -> Optional[str]:
+        return self._pending
+
+    def _take(self, mode: Optional[str] = None) -> Optional[str]:
+        """占用剖析器并取出本次运行的模式（已有剖析进行中时返回 None）
+
+        给出 mode 时直接按该模式剖析，否则使用待剖析请求或常开模式。
+        """
+        if getattr(self._local, "inside", False):
+            return None
+        with self._lock:
+            if self._active:
+                return None
+            if mode is None:
+                mode = self._pending or self.always
+                if mode is None:
+                    return None
+                self._pending = None
+            self._active = True
+        self._local.inside = True
+        return mode
+
+    def _release(self):
+        """释放 _take 占用的剖析器"""
+        self._local.inside = False
+        with self._lock:
+            self._active = False
+
+    @contextmanager
+    def run(self, name: str, mode: Optional[str] = None):
+        """在剖析开关打开时剖析包住的代码并写出报告；没有打开时直接执行
+
+        显式给出 mode 时同样经过占用检查：已有剖析进行中（包括同一线程内嵌套）时直接执行，
+        不会重复启动或提前停止进程级的 tracemalloc。产出的列表在退出后包含报告（未剖析时为空）。
+        """
+        result: List[ProfileReport] = []
+        if mode is not None and mode not in MODES:
+            raise ValueError(f"未知剖析模式: {mode}")
+        mode = self._take(mode)
+        if mode is None:
+            yield result
+            return
+
+        started_tracemalloc = False
+        try:
+            started_tracemalloc = not tracemalloc.is_tracing()
+            if started_tracemalloc:
+                tracemalloc.start(TRACEMALLOC_FRAMES)
+
+            sampler = profiler = None
+            skip = 0
+            if mode == MODE_SAMPLING:
+                sampler = StackSampler(threading.get_ident()).start()
+                # 采样栈去掉 with 语句之外的帧，火焰图从被剖析的代码开始
+                skip = _caller_depth()
+            else:
+                profiler = cProfile.Profile()
+            # 采样线程启动之后再取基准快照，分配统计不含剖析器自身
+            tracemalloc.reset_peak()
+            before = tracemalloc.take_snapshot()
+            base_memory = tracemalloc.get_traced_memory()[0]
+        except BaseException:
+            if started_tracemalloc:
+                tracemalloc.stop()
+            self._release()
+            raise
+        started_at = datetime.now()
+        started = time.perf_counter()
+        try:
+            if profiler is not None:
+                profiler.enable()
+            try:
+                yield result
+            finally:
+                if profiler is not None:
+                    profiler.disable()
+        finally:
+            elapsed = time.perf_counter() - started
+            current, peak = tracemalloc.get_traced_memory()
+            after = tracemalloc.take_snapshot()
+            if sampler is not None:
+                sampler.stop()
+            if started_tracemalloc:
+                tracemalloc.stop()
+            try:
+                result.append(self._write(name, mode, started_at, elapsed, sampler, skip, profiler, before, after,
+                                          peak - base_memory, current - base_memory))
+            finally:
+                self._release()
+
+    def _write(self, name: str, mode: str, started_at: datetime, elapsed: float, sampler: Optional[StackSampler],
+               skip: int, profiler: Optional[cProfile.Profile], before, after, peak: int, allocated: int) -> ProfileReport:
+        slug = re.sub(r"[^\w.-]+", "_", name).strip("_") or "run"
+        path = os.path.join(self.directory, f"{started_at:%Y%m%d_%H%M%S_%f}_{slug}")
+        os.makedirs(path, exist_ok=True)
+
+        extra = ""
+        if sampler is not None:
+            hot = sampler.hot_functions(TOP_N, skip)
+            with open(os.path.join(path, FOLDED_FILE), "w", encoding="utf-8") as f:
+                f.write(sampler.folded(skip))
+        else:
+            hot, extra = _pstats_top(profiler, TOP_N)
+            profiler.dump_stats(os.path.join(path, PSTATS_FILE))
+
+        report = {
+            "name": name,
+            "mode": mode,
+            "started_at": started_at.isoformat(timespec="seconds"),
+            "elapsed": round(elapsed, 4),
+            "samples": sampler.samples if sampler is not None else None,
+            "peak_kb": round(max(peak, 0) / 1024, 1),
+            "allocated_kb": round(allocated / 1024, 1),
+            "hot_functions": hot,
+            "allocations": _top_allocations(before, after, TOP_N),
+        }
+        with open(os.path.join(path, REPORT_FILE), "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        _write_summary(path, report, extra)
+        return ProfileReport(path)
+
+    def reports(self, limit: Optional[int] = None) -> List[ProfileReport]:
+        """已写出的报告（最新的在前）"""
+        if not os.path.isdir(self.directory):
+            return []
+        names = sorted((n for n in os.listdir(self.directory)
+                        if os.path.exists(os.path.join(self.directory, n, REPORT_FILE))), reverse=True)
+        return [ProfileReport(os.path.join(self.directory, n)) for n in names[:limit]]
+
+
+def _caller_depth() -> int:
+    """with 语句所在帧之上的帧数（run 生成器帧 → contextlib __enter__ → with 所在帧）"""
+    frame = sys._getframe(3).f_back
+    depth = 0
+    while frame is not None:
+        depth += 1
+        frame = frame.f_back
+    return depth
+
+
+_profiler: Optional[Profiler] = None
+
+
+def get_profiler() -> Profiler:
+    """获取全局剖析器"""
+    global _profiler
+    if _profiler is None:
+        _profiler = Profiler()
+    return _profiler
+
+
+# 主要接口函数
+def profile_run(name: str, mode: Optional[str] = None):
+    """剖析开关打开时剖析一次运行的上下文管理器"""
+    return get_profiler().run(name, mode)
+
+
+def profiled(name: Optional[str] = None):
+    """剖析开关打开时剖析函数调用的装饰器"""
+    def decorator(func: Callable) -> Callable:
+        label = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with get_profiler().run(label):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,381 @@
+"""
+本地行情服务（新浪 / 腾讯行情接口替身）
+在本机以两种接口的原始格式提供行情：新浪 /list=sh600000,sz000001 返回 GBK 编码的
+var hq_str_...="..." 行，腾讯 /q=sh600000 返回 ~ 分隔的 v_... 行；数据来自合成市场或录制的原始响应。
+可注入延迟（固定 / 均匀 / 对数正态分布）、5xx 错误、截断的响应体和限流响应，
+配合 ChinaAStockFetcher 的接口地址覆盖，离线测量真实网络代码在故障下的吞吐与尾延迟。
+
+用法:
+    python quote_server.py --port 8700 --symbols 5000 --latency lognormal:30:0.6 --error-rate 0.02
+    STOCK_SINA_URL=http://127.0.0.1:8700 STOCK_TENCENT_URL=http://127.0.0.1:8700 streamlit run stock_screener_app.py
+    python quote_server.py --load-test 200 --concurrency 8 --truncate-rate 0.05 --rate-limit 100
+"""
+
+import argparse
+import os
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+# 两种接口的路径前缀
+SINA_PATH = "/list="
+TENCENT_PATH = "/q="
+
+# 限流时的响应（新浪接口拒绝请求时的原样内容）
+RATE_LIMIT_STATUS = 403
+RATE_LIMIT_BODY = "Kinsoku jikou desu!"
+
+# 注入的服务端错误状态码
+ERROR_STATUSES = (500, 502, 503)
+
+# 延迟分布
+LATENCY_FIXED = "fixed"
+LATENCY_UNIFORM = "uniform"
+LATENCY_LOGNORMAL = "lognormal"
+
+# 请求结果
+OUTCOME_OK = "ok"
+OUTCOME_ERROR = "error"
+OUTCOME_TRUNCATED = "truncated"
+OUTCOME_RATE_LIMITED = "rate_limited"
+OUTCOME_FORBIDDEN = "forbidden"
+
+
+def quote_symbol(code: str) -> str:
+    """股票代码转行情代码：600000.SH / 600000 -> sh600000"""
+    digits, _, suffix = code.partition(".")
+    if suffix:
+        return suffix.lower() + digits
+    if digits.startswith(("6", "9")):
+        return "sh" + digits
+    if digits.startswith(("8", "4")):
+        return "bj" + digits
+    return "sz" + digits
+
+
+def format_sina_line(symbol: str, quote: Mapping, date: str = "2024-06-04", clock: str = "15:00:00") -> str:
+    """新浪行情行：名称,今开,昨收,现价,最高,最低,买一,卖一,成交量,成交额,五档,日期,时间"""
+    price = quote["price"]
+    fields = [quote["name"], quote["open"], quote["prev_close"], price, quote["high"], quote["low"], price, price,
+              quote["volume"], quote["amount"]] + ["100", str(price)] * 10 + [date, clock, "00"]
+    return f'var hq_str_{symbol}="{",".join(str(v) for v in fields)}";'
+
+
+def format_tencent_line(symbol: str, quote: Mapping) -> str:
+    """腾讯行情行：~ 分隔，3 现价、4 昨收、5 今开、6 成交量、33 最高、34 最低、37 成交额"""
+    fields = ["1", quote["name"], symbol[2:], quote["price"], quote["prev_close"], quote["open"], quote["volume"]] \
+        + ["0"] * 26 + [quote["high"], quote["low"], "", "", quote["amount"]] + ["0"] * 10
+    return f'v_{symbol}="{"~".join(str(v) for v in fields)}";'
+
+
+def _symbol_of_line(line: str) -> str:
+    """var hq_str_sh600000=... / v_sh600000=... -> sh600000"""
+    return line.split("=")[0].split("_")[-1].strip()
+
+
+class QuoteBook:
+    """按行情代码保存两种接口的响应行"""
+
+    def __init__(self):
+        self.sina: Dict[str, str] = {}
+        self.tencent: Dict[str, str] = {}
+
+    def __len__(self) -> int:
+        return len(set(self.sina) | set(self.tencent))
+
+    @property
+    def symbols(self) -> List[str]:
+        return list(dict.fromkeys(list(self.sina) + list(self.tencent)))
+
+    def add_quote(self, symbol: str, quote: Mapping, date: str = "2024-06-04"):
+        self.sina[symbol] = format_sina_line(symbol, quote, date)
+        self.tencent[symbol] = format_tencent_line(symbol, quote)
+
+    @classmethod
+    def from_market(cls, market, day: int = -1) -> "QuoteBook":
+        """由合成市场某个交易日的 OHLCV 生成行情"""
+        book = cls()
+        date = market.dates[day].strftime("%Y-%m-%d")
+        closes = np.round(market.close[day].astype(np.float64), 2)
+        columns = zip(market.codes, market.symbols["股票名称"], np.round(market.open[day].astype(np.float64), 2),
+                      np.round(market.prev_close[day].astype(np.float64), 2), closes,
+                      np.round(market.high[day].astype(np.float64), 2), np.round(market.low[day].astype(np.float64), 2),
+                      market.volume[day].astype(np.int64), np.round(market.volume[day] * closes, 2))
+        for code, name, open_, prev_close, price, high, low, volume, amount in columns:
+            book.add_quote(quote_symbol(code), {"name": name, "open": open_, "prev_close": prev_close, "price": price,
+                                                "high": high, "low": low, "volume": volume, "amount": amount}, date)
+        return book
+
+    @classmethod
+    def from_recorded(cls, directory: str) -> "QuoteBook":
+        """读取录制的原始响应（sina.txt：新浪响应；tencent.txt：每行一条腾讯响应）"""
+        book = cls()
+        for name, target, marker in (("sina.txt", book.sina, '="'), ("tencent.txt", book.tencent, "~")):
+            path = os.path.join(directory, name)
+            if os.path.exists(path):
+                with open(path, encoding="utf-8") as f:
+                    for line in f.read().strip().split("\n"):
+                        if marker in line:
+                            target[_symbol_of_line(line)] = line.strip()
+        return book
+
+    def sina_response(self, symbols: Sequence[str]) -> str:
+        """新浪响应：按请求顺序每只一行，未知代码返回空行情"""
+        return "".join(self.sina.get(s, f'var hq_str_{s}="";') + "\n" for s in symbols)
+
+    def tencent_response(self, symbols: Sequence[str]) -> str:
+        """腾讯响应：未知代码返回 v_pv_none_match"""
+        return "".join(self.tencent.get(s, 'v_pv_none_match="1";') + "\n" for s in symbols)
+
+
+class FaultProfile:
+    """延迟与故障注入配置
+
+    latency 为延迟分布：fixed（恒为 latency_ms）、uniform（0 ~ 2×latency_ms）、
+    lognormal（中位数 latency_ms，对数标准差 latency_spread，长尾）；
+    error_rate / truncate_rate 为返回 5xx 与截断响应体的概率；
+    rate_limit 为每秒允许的请求数（令牌桶，突发量同为 rate_limit），超出时返回限流响应。
+    """
+
+    def __init__(self, latency: str = LATENCY_FIXED, latency_ms: float = 0.0, latency_spread: float = 0.5,
+                 error_rate: float = 0.0, truncate_rate: float = 0.0, rate_limit: Optional[float] = None,
+                 seed: Optional[int] = None):
+        if latency not in (LATENCY_FIXED, LATENCY_UNIFORM, LATENCY_LOGNORMAL):
+            raise ValueError(f"未知延迟分布: {latency}")
+        if error_rate + truncate_rate > 1:
+            raise ValueError("error_rate 与 truncate_rate 之和不能超过 1")
+        self.latency = latency
+        self.latency_ms = latency_ms
+        self.latency_spread = latency_spread
+        self.error_rate = error_rate
+        self.truncate_rate = truncate_rate
+        self.rate_limit = rate_limit
+        self._rng = np.random.default_rng(seed)
+        self._lock = threading.Lock()
+        self._tokens = rate_limit or 0.0
+        self._refilled = time.monotonic()
+
+    @classmethod
+    def parse_latency(cls, spec: str) -> Tuple[str, float, float]:
+        """解析命令行延迟写法：30 / uniform:30 / lognormal:30:0.6"""
+        parts = spec.split(":")
+        if len(parts) == 1:
+            return LATENCY_FIXED, float(parts[0]), 0.5
+        return parts[0], float(parts[1]), float(parts[2]) if len(parts) > 2 else 0.5
+
+    def _take_token(self) -> bool:
+        now = time.monotonic()
+        self._tokens = min(self.rate_limit, self._tokens + (now - self._refilled) * self.rate_limit)
+        self._refilled = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+    def sample(self, body_size: int) -> Tuple[float, str, int]:
+        """抽取一次请求的 (延迟秒数, 结果, 附加值)：截断时附加值为保留的字节数，错误时为状态码"""
+        with self._lock:
+            if self.latency == LATENCY_LOGNORMAL and self.latency_ms > 0:
+                delay = self.latency_ms * float(self._rng.lognormal(0, self.latency_spread))
+            elif self.latency == LATENCY_UNIFORM:
+                delay = float(self._rng.uniform(0, 2 * self.latency_ms))
+            else:
+                delay = self.latency_ms
+            if self.rate_limit and not self._take_token():
+                return delay / 1000, OUTCOME_RATE_LIMITED, 0
+            draw = float(self._rng.random())
+            if draw < self.error_rate:
+                return delay / 1000, OUTCOME_ERROR, int(self._rng.choice(ERROR_STATUSES))
+            if draw < self.error_rate + self.truncate_rate and body_size > 1:
+                return delay / 1000, OUTCOME_TRUNCATED, int(self._rng.integers(1, body_size))
+            return delay / 1000, OUTCOME_OK, body_size
+
+
+class _QuoteHandler(BaseHTTPRequestHandler):
+    """按路径分发到新浪或腾讯格式"""
+
+    server_version = "QuoteServer/1.0"
+
+    def do_GET(self):
+        service: "QuoteServer" = self.server.quote_service
+        if self.path.startswith(SINA_PATH):
+            provider, symbols = "sina", self.path[len(SINA_PATH):].split(",")
+            if service.require_referer and not self.headers.get("Referer"):
+                service.record(provider, OUTCOME_FORBIDDEN)
+                return self._reply(RATE_LIMIT_STATUS, RATE_LIMIT_BODY.encode())
+            body = service.book.sina_response(symbols).encode("gbk", errors="replace")
+        elif self.path.startswith(TENCENT_PATH):
+            provider, symbols = "tencent", self.path[len(TENCENT_PATH):].split(",")
+            body = service.book.tencent_response(symbols).encode("gbk", errors="replace")
+        else:
+            return self._reply(404, b"not found")
+
+        delay, outcome, detail = service.faults.sample(len(body))
+        if delay > 0:
+            time.sleep(delay)
+        service.record(provider, outcome)
+        if outcome == OUTCOME_RATE_LIMITED:
+            return self._reply(RATE_LIMIT_STATUS, RATE_LIMIT_BODY.encode())
+        if outcome == OUTCOME_ERROR:
+            return self._reply(detail, b"upstream error")
+        self._reply(200, body[:detail])
+
+    def _reply(self, status: int, body: bytes):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/javascript; charset=GBK")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class QuoteServer:
+    """在后台线程运行的本地行情服务"""
+
+    def __init__(self, book: QuoteBook, faults: Optional[FaultProfile] = None, host: str = "127.0.0.1",
+                 port: int = 0, require_referer: bool = True):
+        self.book = book
+        self.faults = faults or FaultProfile()
+        self.require_referer = require_referer
+        self.stats: Dict[str, Dict[str, int]] = {"sina": {}, "tencent": {}}
+        self._stats_lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), _QuoteHandler)
+        self._httpd.daemon_threads = True
+        self._httpd.quote_service = self
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def record(self, provider: str, outcome: str):
+        with self._stats_lock:
+            counts = self.stats[provider]
+            counts[outcome] = counts.get(outcome, 0) + 1
+
+    def start(self) -> "QuoteServer":
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread:
+            self._thread.join(5)
+
+    def __enter__(self) -> "QuoteServer":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def load_test(base_url: str, codes: Sequence[str], calls: int = 100, concurrency: int = 4,
+              provider: str = "sina", batch_size: int = 50) -> Dict:
+    """用真实的 fetch_sina_data / fetch_tencent_data 压测行情服务，返回吞吐与延迟分位数
+
+    codes 为带 .SH/.SZ 后缀的代码；每次调用按顺序取 batch_size 只。
+    """
+    from china_a_stock_fetcher import ChinaAStockFetcher
+
+    fetcher = ChinaAStockFetcher(sina_base_url=base_url, tencent_base_url=base_url)
+    fetch = fetcher.fetch_sina_data if provider == "sina" else fetcher.fetch_tencent_data
+    batches = [[codes[(i * batch_size + j) % len(codes)] for j in range(batch_size)] for i in range(calls)]
+
+    def call(batch: List[str]) -> Tuple[float, int, int]:
+        started = time.perf_counter()
+        quotes = fetch(batch)
+        return time.perf_counter() - started, len(quotes), len(set(batch))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(call, batches))
+    elapsed = time.perf_counter() - started
+
+    latencies = np.array([r[0] for r in results]) * 1000
+    return {
+        "provider": provider,
+        "calls": calls,
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 4),
+        "calls_per_second": round(calls / elapsed, 2),
+        "quotes_per_second": round(sum(r[1] for r in results) / elapsed, 2),
+        "complete_rate": round(sum(r[1] == r[2] for r in results) / calls, 4),
+        "empty_rate": round(sum(r[1] == 0 for r in results) / calls, 4),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 2),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 2),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 2),
+        "mean_ms": round(statistics.fmean(latencies), 2),
+    }
+
+
+# 主要接口函数
+def start_quote_server(book: Optional[QuoteBook] = None, faults: Optional[FaultProfile] = None,
+                       **kwargs) -> QuoteServer:
+    """启动本地行情服务的主要接口（未提供行情时用 500 只合成股票）"""
+    if book is None:
+        from synthetic_market import generate_synthetic_market
+        book = QuoteBook.from_market(generate_synthetic_market(500, 60, seed=0))
+    return QuoteServer(book, faults, **kwargs).start()
+
+
+def main(argv=None):
+    """命令行入口：启动行情服务，或对其运行压测"""
+    parser = argparse.ArgumentParser(description="本地新浪 / 腾讯行情接口替身")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8700)
+    parser.add_argument("--symbols", type=int, default=5000, help="合成股票数量")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--recorded", help="录制的原始响应目录（sina.txt / tencent.txt），替代合成行情")
+    parser.add_argument("--latency", default="0", help="延迟（毫秒）：30 / uniform:30 / lognormal:30:0.6")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--truncate-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=float, help="每秒允许的请求数")
+    parser.add_argument("--load-test", type=int, metavar="CALLS", help="启动后用真实抓取代码压测并退出")
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args(argv)
+
+    if args.recorded:
+        book = QuoteBook.from_recorded(args.recorded)
+    else:
+        from synthetic_market import generate_synthetic_market
+        book = QuoteBook.from_market(generate_synthetic_market(args.symbols, 60, seed=args.seed))
+
+    latency, latency_ms, spread = FaultProfile.parse_latency(args.latency)
+    faults = FaultProfile(latency, latency_ms, spread, args.error_rate, args.truncate_rate, args.rate_limit,
+                          seed=args.seed)
+    server = QuoteServer(book, faults, args.host, 0 if args.load_test else args.port).start()
+    print(f"📡 行情服务 {server.url}（{len(book)} 只股票）")
+
+    if not args.load_test:
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            server.stop()
+        return None
+
+    codes = [f"{s[2:]}.{s[:2].upper()}" for s in book.symbols if s.startswith(("sh", "sz"))]
+    reports = [load_test(server.url, codes, args.load_test, args.concurrency, provider, batch)
+               for provider, batch in (("sina", 50), ("tencent", 1))]
+    server.stop()
+    for report in reports:
+        print(f"  {report['provider']:<8} {report['calls_per_second']:>8} 次/秒  {report['quotes_per_second']:>9} 只/秒  "
+              f"p50 {report['p50_ms']} ms  p95 {report['p95_ms']} ms  p99 {report['p99_ms']} ms  "
+              f"完整 {report['complete_rate']:.1%}")
+    print(f"  服务端统计: {server.stats}")
+    return reports
+
+
+if __name__ == "__main__":
+    main()
@@ -3,42 +3,63 @@
 使用akshare获取实时股票数据
 """
 
-import akshare as ak
+import akshare
 import pandas as pd
 import numpy as np
 import logging
 from datetime import datetime, timedelta
 import time
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Iterator
 import streamlit as st
+from derived_columns import DerivedColumnRegistry
+from snapshot_schema import enforce_snapshot_schema
+from cache_backend import get_cache
+from streaming_screen import iter_frame_chunks
+from cassette import http_session, recordable
+from tracing import STAGE_CLEAN, STAGE_ENRICH, STAGE_FETCH, span, traced
+
+ak = recordable(akshare, "akshare")
 
 # 设置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 分页行情接口（与 ak.stock_zh_a_spot_em 同一数据源），按成交额从高到低分页
+SPOT_PAGE_URL = "http://82.push2.eastmoney.com/api/qt/clist/get"
+SPOT_PAGE_SIZE = 100  # 接口单页上限
+SPOT_MARKETS = "m:0 t:6,m:0 t:80,m:1 t:2,m:1 t:23,m:0 t:81 s:2048"
+SPOT_FIELDS = {
+    "f12": "代码", "f14": "名称", "f2": "最新价", "f3": "涨跌幅", "f4": "涨跌额",
+    "f5": "成交量", "f6": "成交额", "f7": "振幅", "f15": "最高", "f16": "最低",
+    "f17": "今开", "f18": "昨收", "f8": "换手率", "f9": "市盈率-动态", "f23": "市净率",
+    "f20": "总市值", "f21": "流通市值", "f10": "量比",
+}
+
 class RealDataFetcher:
     """真实数据获取器"""
     
     def __init__(self):
-        self.cache_duration = 300  # 缓存5分钟
-        self.last_fetch_time = {}
-        self.cached_data = {}
+        self.cache_duration = 300  # 缓存5分钟（交易时段内）
     
     def get_stock_realtime_data(self, limit: int = 100) -> pd.DataFrame:
         """获取A股实时行情数据"""
         
+        cache = get_cache()
         cache_key = f"realtime_data_{limit}"
         
         # 检查缓存
-        if self._is_cache_valid(cache_key):
+        cached = cache.get(cache_key)
+        if cached is not None:
             logger.info("📊 使用缓存的实时数据")
-            return self.cached_data[cache_key]
+            return cached
         
         try:
             logger.info("📡 正在获取A股实时行情数据...")
             
             # 获取A股实时数据
-            df = ak.stock_zh_a_spot_em()
+            with span("东方财富全市场行情", STAGE_FETCH, provider="akshare") as s:
+                df = ak.stock_zh_a_spot_em()
+                s.set(rows=len(df))
             
             if df.empty:
                 logger.warning("⚠️ 获取的实时数据为空")
@@ -52,9 +73,8 @@ class RealDataFetcher:
                 # 按成交额排序，取前N只活跃股票
                 df = df.nlargest(limit, '成交额')
             
-            # 缓存数据
-            self.cached_data[cache_key] = df
-            self.last_fetch_time[cache_key] = datetime.now()
+            # 缓存数据（休市期间一直有效到下一次开盘）
+            cache.set(cache_key, df, ttl=self.cache_duration)
             
             logger.info(f"✅ 成功获取 {len(df)} 只股票的实时数据")
             return df
@@ -63,14 +83,79 @@ class RealDataFetcher:
             logger.error(f"❌ 获取实时数据失败: {e}")
             return pd.DataFrame()
     
+    def iter_stock_realtime_chunks(self, limit: Optional[int] = None, columns: Optional[List[str]] = None,
+                                   chunk_size: int = SPOT_PAGE_SIZE) -> Iterator[pd.DataFrame]:
+        """分批获取A股实时行情，每批清洗并计算技术指标后立即产出
+
+        批次按成交额从高到低到达，前 limit 只与 get_stock_realtime_data(limit) 相同。
+        分页行情直接带交易所的量比（f10），每批的指标只依赖本批各股自身的字段；
+        已有缓存或分页接口不可用时，先在整表上计算指标再切块产出。
+        """
+        
+        cached = get_cache().get(f"realtime_data_{limit}")
+        if cached is not None:
+            logger.info("📊 使用缓存的实时数据")
+            yield from iter_frame_chunks(self.calculate_technical_indicators(cached, columns), chunk_size)
+            return
+        
+        fetched = 0
+        page = 1
+        while limit is None or fetched < limit:
+            raw = self._fetch_spot_page(page, chunk_size)
+            if raw is None:
+                if page == 1:
+                    logger.warning("⚠️ 分页行情不可用，改为整表获取")
+                    df = self.get_stock_realtime_data(limit=limit or 10 ** 6)
+                    yield from iter_frame_chunks(self.calculate_technical_indicators(df, columns), chunk_size)
+                return
+            if raw.empty:
+                return
+            
+            if limit is not None:
+                raw = raw.head(limit - fetched)
+            fetched += len(raw)
+            chunk = self._clean_realtime_data(raw)
+            if not chunk.empty:
+                yield self.calculate_technical_indicators(chunk, columns)
+            
+            if len(raw) < chunk_size:
+                return
+            page += 1
+        
+        logger.info(f"✅ 分批获取 {fetched} 只股票的实时数据")
+    
+    def _fetch_spot_page(self, page: int, page_size: int) -> Optional[pd.DataFrame]:
+        """获取一页实时行情（列名与 ak.stock_zh_a_spot_em 一致），失败返回 None"""
+        
+        params = {
+            "pn": page, "pz": page_size, "po": 1, "np": 1, "fltt": 2, "invt": 2,
+            "ut": "bd1d9ddb04089700cf9c27f6f7426281", "fid": "f6",
+            "fs": SPOT_MARKETS, "fields": ",".join(SPOT_FIELDS),
+        }
+        try:
+            with span("东方财富分页行情", STAGE_FETCH, provider="eastmoney", page=page) as s:
+                response = http_session().get(SPOT_PAGE_URL, params=params, timeout=10)
+                response.raise_for_status()
+                data = response.json().get("data") or {}
+                s.set(rows=len(data.get("diff") or []))
+        except Exception as e:
+            logger.warning(f"⚠️ 第 {page} 页行情获取失败: {e}")
+            return None
+        
+        rows = data.get("diff") or []
+        # 停牌股的数值字段为 "-"，清洗时转为缺失值
+        return pd.DataFrame(rows, columns=list(SPOT_FIELDS)).rename(columns=SPOT_FIELDS)
+    
     def get_stock_basic_info(self) -> pd.DataFrame:
         """获取A股基本信息"""
         
+        cache = get_cache()
         cache_key = "basic_info"
         
         # 检查缓存（基本信息缓存时间更长）
-        if self._is_cache_valid(cache_key, duration=3600):  # 1小时缓存
-            return self.cached_data[cache_key]
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return cached
         
         try:
             logger.info("📋 正在获取A股基本信息...")
@@ -79,8 +164,7 @@ class RealDataFetcher:
             df = ak.stock_info_a_code_name()
             
             if not df.empty:
-                self.cached_data[cache_key] = df
-                self.last_fetch_time[cache_key] = datetime.now()
+                cache.set(cache_key, df, ttl=3600, session_aware=False)  # 1小时缓存
                 logger.info(f"✅ 成功获取 {len(df)} 只股票基本信息")
             
             return df
@@ -140,30 +224,20 @@ class RealDataFetcher:
             logger.warning("⚠️ 未获取到任何财务数据")
             return pd.DataFrame()
     
-    def calculate_technical_indicators(self, df: pd.DataFrame) -> pd.DataFrame:
-        """计算技术指标"""
+    @traced(STAGE_ENRICH, "计算技术指标")
+    def calculate_technical_indicators(self, df: pd.DataFrame, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """计算技术指标
+        
+        columns 为当前筛选需要的列，只计算其中的指标（含依赖）；None 表示计算全部指标。
+        同一快照上已经算过的指标直接复用。
+        """
         
         if df.empty:
             return df
         
         try:
             logger.info("📈 正在计算技术指标...")
-            
-            # 添加技术指标列
-            df = df.copy()
-            
-            # RSI计算（简化版本，基于涨跌幅）
-            df['RSI'] = df['涨跌幅'].apply(self._calculate_simple_rsi)
-            
-            # 量比（成交量/平均成交量的估算）
-            df['量比'] = df['成交量'] / df['成交量'].median()
-            
-            # MACD信号（简化版本）
-            df['MACD信号'] = df['涨跌幅'].apply(self._get_macd_signal)
-            
-            # 综合评分计算
-            df['综合评分'] = self._calculate_comprehensive_score(df)
-            
+            df = REALTIME_DERIVED_COLUMNS.materialize(df, columns)
             logger.info("✅ 技术指标计算完成")
             return df
             
@@ -171,6 +245,7 @@ class RealDataFetcher:
             logger.error(f"❌ 技术指标计算失败: {e}")
             return df
     
+    @traced(STAGE_CLEAN, "清洗实时行情")
     def _clean_realtime_data(self, df: pd.DataFrame) -> pd.DataFrame:
         """清洗实时数据"""
         
@@ -193,7 +268,8 @@ class RealDataFetcher:
                 '市盈率-动态': 'PE',
                 '市净率': 'PB',
                 '总市值': '总市值',
-                '流通市值': '流通市值'
+                '流通市值': '流通市值',
+                '量比': '量比'
             }
             
             # 重命名存在的列
@@ -204,7 +280,7 @@ class RealDataFetcher:
             # 数据类型转换
             numeric_columns = ['最新价', '涨跌幅', '涨跌额', '成交量', '成交额', '振幅', 
                              '最高价', '最低价', '开盘价', '昨收价', '换手率', 'PE', 'PB', 
-                             '总市值', '流通市值']
+                             '总市值', '流通市值', '量比']
             
             for col in numeric_columns:
                 if col in df.columns:
@@ -228,96 +304,78 @@ class RealDataFetcher:
             if '成交额' in df.columns:
                 df['成交额'] = df['成交额'] / 100000000
             
-            return df
+            # 统一列类型（快照入库时只转换这一次）
+            return enforce_snapshot_schema(df)
             
         except Exception as e:
             logger.error(f"❌ 数据清洗失败: {e}")
             return df
     
-    def _calculate_simple_rsi(self, change_pct: float) -> float:
-        """简化的RSI计算"""
-        if pd.isna(change_pct):
-            return 50.0
+    @staticmethod
+    def _calculate_simple_rsi(change_pct: pd.Series, rng: np.random.Generator) -> np.ndarray:
+        """简化的RSI计算（基于涨跌幅，整列计算）"""
+        change = pd.to_numeric(change_pct, errors='coerce').to_numpy(dtype=np.float64)
+        noise = rng.uniform(0, 1, len(change))
         
-        # 基于涨跌幅的简化RSI计算
-        if change_pct > 5:
-            return min(80 + np.random.uniform(-5, 5), 95)
-        elif change_pct > 2:
-            return min(70 + np.random.uniform(-10, 10), 85)
-        elif change_pct > 0:
-            return 50 + np.random.uniform(-15, 15)
-        elif change_pct > -2:
-            return 50 + np.random.uniform(-15, 15)
-        elif change_pct > -5:
-            return max(30 + np.random.uniform(-10, 10), 15)
-        else:
-            return max(20 + np.random.uniform(-5, 5), 5)
+        return np.select(
+            [np.isnan(change), change > 5, change > 2, change > -2, change > -5],
+            [
+                np.full(len(change), 50.0),
+                np.minimum(80 + (noise * 10 - 5), 95),
+                np.minimum(70 + (noise * 20 - 10), 85),
+                50 + (noise * 30 - 15),
+                np.maximum(30 + (noise * 20 - 10), 15),
+            ],
+            np.maximum(20 + (noise * 10 - 5), 5)
+        )
     
-    def _get_macd_signal(self, change_pct: float) -> str:
-        """获取MACD信号"""
-        if pd.isna(change_pct):
-            return "震荡"
+    @staticmethod
+    def _get_macd_signal(change_pct: pd.Series) -> np.ndarray:
+        """获取MACD信号（整列计算）"""
+        change = pd.to_numeric(change_pct, errors='coerce').to_numpy(dtype=np.float64)
         
-        if change_pct > 3:
-            return "强势金叉"
-        elif change_pct > 1:
-            return "金叉"
-        elif change_pct > -1:
-            return "震荡"
-        elif change_pct > -3:
-            return "死叉"
-        else:
-            return "强势死叉"
+        return np.select(
+            [np.isnan(change), change > 3, change > 1, change > -1, change > -3],
+            ["震荡", "强势金叉", "金叉", "震荡", "死叉"],
+            "强势死叉"
+        ).astype(object)
     
-    def _calculate_comprehensive_score(self, df: pd.DataFrame) -> pd.Series:
-        """计算综合评分"""
+    @staticmethod
+    def _calculate_comprehensive_score(df: pd.DataFrame) -> pd.Series:
+        """计算综合评分（整列计算，结果与 df 行对齐）"""
         
-        scores = []
+        def column(name: str, default: float) -> np.ndarray:
+            if name not in df.columns:
+                return np.full(len(df), default, dtype=np.float64)
+            return pd.to_numeric(df[name], errors='coerce').to_numpy(dtype=np.float64)
         
-        for _, row in df.iterrows():
-            score = 50  # 基础分
-            
-            # 涨跌幅评分 (0-25分)
-            change_pct = row.get('涨跌幅', 0)
-            if change_pct > 5:
-                score += 25
-            elif change_pct > 2:
-                score += 15
-            elif change_pct > 0:
-                score += 8
-            elif change_pct > -2:
-                score += 0
-            else:
-                score -= 10
-            
-            # 成交量评分 (0-15分)
-            volume_ratio = row.get('量比', 1)
-            if volume_ratio > 3:
-                score += 15
-            elif volume_ratio > 2:
-                score += 10
-            elif volume_ratio > 1.5:
-                score += 5
-            
-            # PE评分 (0-10分)
-            pe = row.get('PE', 0)
-            if 0 < pe < 15:
-                score += 10
-            elif 15 <= pe < 25:
-                score += 5
-            elif pe >= 50:
-                score -= 5
-            
-            # 换手率评分 (0-10分)
-            turnover = row.get('换手率', 0)
-            if 2 <= turnover <= 8:
-                score += 10
-            elif 1 <= turnover < 2 or 8 < turnover <= 15:
-                score += 5
-            
-            scores.append(max(0, min(100, score)))  # 限制在0-100之间
+        change_pct = column('涨跌幅', 0)
+        volume_ratio = column('量比', 1)
+        pe = column('PE', 0)
+        turnover = column('换手率', 0)
+        
+        score = np.full(len(df), 50.0)  # 基础分
+        
+        # 涨跌幅评分 (0-25分)
+        score += np.select(
+            [change_pct > 5, change_pct > 2, change_pct > 0, change_pct > -2],
+            [25, 15, 8, 0], -10
+        )
+        
+        # 成交量评分 (0-15分)
+        score += np.select([volume_ratio > 3, volume_ratio > 2, volume_ratio > 1.5], [15, 10, 5], 0)
         
-        return pd.Series(scores)
+        # PE评分 (0-10分)
+        score += np.select([(pe > 0) & (pe < 15), (pe >= 15) & (pe < 25), pe >= 50], [10, 5, -5], 0)
+        
+        # 换手率评分 (0-10分)
+        score += np.select(
+            [(turnover >= 2) & (turnover <= 8),
+             ((turnover >= 1) & (turnover < 2)) | ((turnover > 8) & (turnover <= 15))],
+            [10, 5], 0
+        )
+        
+        return pd.Series(np.clip(score, 0, 100), index=df.index)  # 限制在0-100之间
     
     def _safe_float(self, value) -> float:
         """安全的浮点数转换"""
@@ -327,17 +385,27 @@ class RealDataFetcher:
             return float(value)
         except (ValueError, TypeError):
             return np.nan
-    
-    def _is_cache_valid(self, cache_key: str, duration: int = None) -> bool:
-        """检查缓存是否有效"""
-        if duration is None:
-            duration = self.cache_duration
-        
-        if cache_key not in self.last_fetch_time:
-            return False
-        
-        time_diff = (datetime.now() - self.last_fetch_time[cache_key]).seconds
-        return time_diff < duration and cache_key in self.cached_data
+
+# 实时行情派生列（技术指标与评分），按筛选需要计算
+REALTIME_DERIVED_COLUMNS = DerivedColumnRegistry("realtime")
+
+@REALTIME_DERIVED_COLUMNS.register("RSI", inputs=["涨跌幅"])
+def _rsi(df: pd.DataFrame, rng: np.random.Generator) -> np.ndarray:
+    return RealDataFetcher._calculate_simple_rsi(df['涨跌幅'], rng)
+
+@REALTIME_DERIVED_COLUMNS.register("量比", inputs=["成交量"])
+def _volume_ratio(df: pd.DataFrame, rng: np.random.Generator) -> np.ndarray:
+    # 数据源没有量比时的估算：成交量/全表成交量中位数（只在整表上计算，不在分批行情上计算）
+    volume = df['成交量']
+    return (volume / volume.median()).to_numpy()
+
+@REALTIME_DERIVED_COLUMNS.register("MACD信号", inputs=["涨跌幅"])
+def _macd_signal(df: pd.DataFrame, rng: np.random.Generator) -> np.ndarray:
+    return RealDataFetcher._get_macd_signal(df['涨跌幅'])
+
+@REALTIME_DERIVED_COLUMNS.register("综合评分", inputs=["涨跌幅", "量比", "PE", "换手率"])
+def _comprehensive_score(df: pd.DataFrame, rng: np.random.Generator) -> np.ndarray:
+    return RealDataFetcher._calculate_comprehensive_score(df).to_numpy()
 
 # 全局数据获取器实例
 _real_data_fetcher = None
@@ -5,13 +5,17 @@
 
 import pandas as pd
 import numpy as np
-import requests
-import yfinance as yf
+import yfinance
 import streamlit as st
 import time
 import random
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
+from cache_backend import cached
+from cassette import http_session, recordable
+from tracing import STAGE_FETCH, traced
+
+yf = recordable(yfinance, "yfinance")
 
 # 导入API配置
 try:
@@ -70,7 +74,8 @@ class RealTimeAPIFetcher:
             "BABA", "JD", "PDD", "NIO", "XPEV", "LI", "BIDU", "TME"
         ]
     
-    @st.cache_data(ttl=300)  # 5分钟缓存
+    @cached(ttl=300, session_aware=False)  # 5分钟缓存（海外数据源）
+    @traced(STAGE_FETCH, "Alpha Vantage 行情", provider="alpha_vantage")
     def get_alpha_vantage_data(_self, symbol: str, api_key: str = None) -> Optional[Dict]:
         """获取Alpha Vantage数据"""
         try:
@@ -88,7 +93,7 @@ class RealTimeAPIFetcher:
             }
 
             timeout = API_TIMEOUT.get("alpha_vantage", 10) if USE_API_CONFIG else 10
-            response = requests.get(url, params=params, timeout=timeout)
+            response = http_session().get(url, params=params, timeout=timeout)
 
             if response.status_code == 200:
                 data = response.json()
@@ -107,7 +112,8 @@ class RealTimeAPIFetcher:
                 st.warning(f"Alpha Vantage API错误: {e}")
         return None
     
-    @st.cache_data(ttl=300)
+    @cached(ttl=300, session_aware=False)
+    @traced(STAGE_FETCH, "Finnhub 行情", provider="finnhub")
     def get_finnhub_data(_self, symbol: str, api_key: str = "demo") -> Optional[Dict]:
         """获取Finnhub数据"""
         try:
@@ -115,7 +121,7 @@ class RealTimeAPIFetcher:
             url = f"{_self.apis['finnhub']['base_url']}/quote"
             params = {"symbol": symbol, "token": api_key}
             
-            response = requests.get(url, params=params, timeout=10)
+            response = http_session().get(url, params=params, timeout=10)
             if response.status_code == 200:
                 data = response.json()
                 if data.get("c"):  # current price
@@ -134,7 +140,8 @@ class RealTimeAPIFetcher:
             st.warning(f"Finnhub API错误: {e}")
         return None
     
-    @st.cache_data(ttl=300)
+    @cached(ttl=300, session_aware=False)
+    @traced(STAGE_FETCH, "Yahoo Finance 行情", provider="yfinance")
     def get_yfinance_data(_self, symbol: str) -> Optional[Dict]:
         """获取Yahoo Finance数据"""
         try:
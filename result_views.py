@@ -0,0 +1,135 @@
+"""
+筛选结果视图
+自定义筛选的结果都是共享快照中的行。会话里不再保存结果表的副本，只保存
+快照名称、版本号、int32 行号数组与排序方式；显示时挂载同一版本的快照（零拷贝内存映射）
+再按行号取出，每个会话的结果只占几 KB。
+
+快照之外的列（如某次筛选附加的说明列）随视图一起保存，行数与结果相同。
+视图同时记下快照行数和所取行股票代码的校验和，解析时核对，版本号对应的文件与建视图时
+不一致就视为失效，不会显示成其他股票。快照版本已被清理且进程内也没有挂载时视图同样失效，
+需要重新筛选。
+"""
+
+import zlib
+from typing import Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from shared_snapshot import SharedSnapshotStore
+
+
+class ViewExpired(LookupError):
+    """视图引用的快照版本已不可用"""
+
+
+def rows_checksum(frame: pd.DataFrame) -> Optional[int]:
+    """结果行股票代码的校验和（没有代码列时为 None）"""
+    if "股票代码" not in frame.columns:
+        return None
+    hashes = pd.util.hash_pandas_object(frame["股票代码"].astype(str), index=False).to_numpy()
+    return zlib.crc32(hashes.tobytes())
+
+
+class SnapshotView:
+    """共享快照上的一组行（按结果顺序排列的行号）"""
+
+    __slots__ = ("snapshot", "version", "rows", "sort_by", "ascending", "extras", "directory",
+                 "snapshot_rows", "checksum")
+
+    def __init__(self, snapshot: str, version: int, rows: np.ndarray, sort_by: Optional[str] = None,
+                 ascending: bool = False, extras: Optional[pd.DataFrame] = None, directory: Optional[str] = None,
+                 snapshot_rows: Optional[int] = None, checksum: Optional[int] = None):
+        self.snapshot = snapshot
+        self.version = version
+        self.rows = np.asarray(rows, dtype=np.int32)
+        self.sort_by = sort_by
+        self.ascending = ascending
+        self.extras = extras
+        self.directory = directory
+        # 建视图时快照的行数与所取行的校验和，None 表示不核对
+        self.snapshot_rows = snapshot_rows
+        self.checksum = checksum
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    @property
+    def empty(self) -> bool:
+        return len(self.rows) == 0
+
+    def __sizeof__(self) -> int:
+        # 会话内存记账按此计入：行号数组与附加列，不含快照本身
+        extras = int(self.extras.memory_usage(deep=True).sum()) if self.extras is not None else 0
+        return object.__sizeof__(self) + self.rows.nbytes + extras
+
+    def resolve(self) -> pd.DataFrame:
+        """挂载对应版本的快照并取出结果行（附加列拼在后面）"""
+        store = SharedSnapshotStore(self.snapshot, self.directory)
+        try:
+            snapshot = store.attach(self.version)
+        except OSError as e:
+            raise ViewExpired(f"快照 {self.snapshot} 版本 {self.version} 已不可用") from e
+        if snapshot is None or (len(self.rows) and self.rows.max() >= len(snapshot)):
+            raise ViewExpired(f"快照 {self.snapshot} 版本 {self.version} 已不可用")
+        if self.snapshot_rows is not None and len(snapshot) != self.snapshot_rows:
+            raise ViewExpired(f"快照 {self.snapshot} 版本 {self.version} 与筛选时不一致")
+
+        result = snapshot.iloc[self.rows].reset_index(drop=True)
+        if self.checksum is not None and rows_checksum(result) != self.checksum:
+            raise ViewExpired(f"快照 {self.snapshot} 版本 {self.version} 与筛选时不一致")
+        if self.extras is not None:
+            result = pd.concat([result, self.extras.reset_index(drop=True)], axis=1)
+        return result
+
+    def __repr__(self) -> str:
+        order = f", sort_by={self.sort_by}" if self.sort_by else ""
+        return f"SnapshotView({self.snapshot}@{self.version}, {len(self.rows)} rows{order})"
+
+
+def view_of(frame: pd.DataFrame, snapshot: pd.DataFrame, name: str, version: int,
+            sort_by: Optional[str] = None, ascending: bool = False,
+            directory: Optional[str] = None) -> SnapshotView:
+    """由快照行组成的结果表构建视图（结果表的索引是快照中的行号）
+
+    结果表的股票代码与快照对应行不一致时报 ValueError，调用方应改为保存结果表本身。
+    """
+    rows = frame.index.to_numpy()
+    if not pd.api.types.is_integer_dtype(rows) or (len(rows) and (rows.min() < 0 or rows.max() >= len(snapshot))):
+        raise ValueError("结果表的索引不是快照行号")
+    extra_columns = [column for column in frame.columns if column not in snapshot.columns]
+    checksum = rows_checksum(snapshot.iloc[rows])
+    if "股票代码" in frame.columns and rows_checksum(frame) != checksum:
+        raise ValueError("结果表与快照中对应行的股票不一致")
+    extras = frame[extra_columns].reset_index(drop=True) if extra_columns else None
+    return SnapshotView(name, version, rows, sort_by, ascending, extras, directory,
+                        snapshot_rows=len(snapshot), checksum=checksum)
+
+
+def view_by_code(frame: pd.DataFrame, snapshot: pd.DataFrame, name: str, version: int,
+                 sort_by: Optional[str] = None, ascending: bool = False,
+                 directory: Optional[str] = None) -> SnapshotView:
+    """按股票代码把结果行对应到快照行号后构建视图
+
+    用于索引已重排的结果表（预设筛选器与短线策略的合并结果），快照之外的列（评分、信号等）
+    作为附加列保存。快照中代码不唯一或结果中有快照之外的股票时报 ValueError。
+    """
+    if frame.empty:
+        return view_of(frame.reset_index(drop=True), snapshot, name, version, sort_by, ascending, directory)
+    if "股票代码" not in frame.columns or "股票代码" not in snapshot.columns:
+        raise ValueError("结果表或快照没有股票代码列")
+    codes = pd.Index(snapshot["股票代码"].astype(str))
+    if not codes.is_unique:
+        raise ValueError("快照中股票代码不唯一")
+    rows = codes.get_indexer(frame["股票代码"].astype(str))
+    if len(rows) and rows.min() < 0:
+        raise ValueError("结果中有快照之外的股票")
+    return view_of(frame.set_axis(rows), snapshot, name, version, sort_by, ascending, directory)
+
+
+# 主要接口函数
+def resolve_results(value: Union[pd.DataFrame, SnapshotView, None]) -> Optional[pd.DataFrame]:
+    """会话中保存的结果（结果表或视图）统一解析为结果表"""
+    if isinstance(value, SnapshotView):
+        return value.resolve()
+    return value
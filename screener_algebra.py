@@ -0,0 +1,249 @@
+"""
+筛选器组合运算
+对命名筛选器做 AND / OR / NOT 组合，并计算筛选器之间的重叠矩阵。
+每个筛选器在当前快照上的成员集合只计算一次并缓存为位图，组合与重叠只需位运算。
+"""
+
+import re
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional
+
+from screener_index import Bitmap
+from smart_stock_screener import SmartStockScreener
+from short_term_entry_screener import ShortTermEntryScreener
+from snapshot_schema import TIMESTAMP_ATTR
+
+
+class ScreenerExpr:
+    """筛选器表达式基类，支持 & | ~ 组合"""
+
+    def __and__(self, other: "ScreenerExpr") -> "ScreenerExpr":
+        return AndExpr(self, other)
+
+    def __or__(self, other: "ScreenerExpr") -> "ScreenerExpr":
+        return OrExpr(self, other)
+
+    def __invert__(self) -> "ScreenerExpr":
+        return NotExpr(self)
+
+    def evaluate(self, membership: "ScreenerMembership") -> Bitmap:
+        raise NotImplementedError
+
+    def names(self) -> List[str]:
+        """表达式引用的筛选器名称"""
+        raise NotImplementedError
+
+
+class ScreenerRef(ScreenerExpr):
+    """命名筛选器"""
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def evaluate(self, membership: "ScreenerMembership") -> Bitmap:
+        return membership.bitmap(self.name)
+
+    def names(self) -> List[str]:
+        return [self.name]
+
+    def __str__(self) -> str:
+        return self.name
+
+
+class AndExpr(ScreenerExpr):
+    def __init__(self, left: ScreenerExpr, right: ScreenerExpr):
+        self.left, self.right = left, right
+
+    def evaluate(self, membership: "ScreenerMembership") -> Bitmap:
+        # A AND NOT B 直接用差集，避免先取反
+        if isinstance(self.right, NotExpr):
+            return self.left.evaluate(membership) - self.right.operand.evaluate(membership)
+        return self.left.evaluate(membership) & self.right.evaluate(membership)
+
+    def names(self) -> List[str]:
+        return self.left.names() + self.right.names()
+
+    def __str__(self) -> str:
+        return f"({self.left} AND {self.right})"
+
+
+class OrExpr(ScreenerExpr):
+    def __init__(self, left: ScreenerExpr, right: ScreenerExpr):
+        self.left, self.right = left, right
+
+    def evaluate(self, membership: "ScreenerMembership") -> Bitmap:
+        return self.left.evaluate(membership) | self.right.evaluate(membership)
+
+    def names(self) -> List[str]:
+        return self.left.names() + self.right.names()
+
+    def __str__(self) -> str:
+        return f"({self.left} OR {self.right})"
+
+
+class NotExpr(ScreenerExpr):
+    def __init__(self, operand: ScreenerExpr):
+        self.operand = operand
+
+    def evaluate(self, membership: "ScreenerMembership") -> Bitmap:
+        return ~self.operand.evaluate(membership)
+
+    def names(self) -> List[str]:
+        return self.operand.names()
+
+    def __str__(self) -> str:
+        return f"NOT {self.operand}"
+
+
+_TOKEN_PATTERN = re.compile(r"\s*(\(|\)|&|\||~|[A-Za-z_][A-Za-z0-9_]*)")
+_OPERATORS = {"AND": "&", "OR": "|", "NOT": "~", "&": "&", "|": "|", "~": "~"}
+
+
+def parse_expression(text: str) -> ScreenerExpr:
+    """解析筛选器表达式
+
+    例如 "value_growth AND technical_strong AND NOT oversold_rebound"，
+    也可以使用 & | ~ 和括号。优先级: NOT > AND > OR。
+    """
+    tokens = []
+    position = 0
+    text = text.strip()
+    while position < len(text):
+        match = _TOKEN_PATTERN.match(text, position)
+        if not match:
+            raise ValueError(f"无法解析的表达式: {text[position:]}")
+        token = match.group(1)
+        tokens.append(_OPERATORS.get(token.upper(), token))
+        position = match.end()
+
+    if not tokens:
+        raise ValueError("表达式为空")
+
+    def parse_or(i):
+        left, i = parse_and(i)
+        while i < len(tokens) and tokens[i] == "|":
+            right, i = parse_and(i + 1)
+            left = OrExpr(left, right)
+        return left, i
+
+    def parse_and(i):
+        left, i = parse_not(i)
+        while i < len(tokens) and tokens[i] == "&":
+            right, i = parse_not(i + 1)
+            left = AndExpr(left, right)
+        return left, i
+
+    def parse_not(i):
+        if i < len(tokens) and tokens[i] == "~":
+            operand, i = parse_not(i + 1)
+            return NotExpr(operand), i
+        return parse_atom(i)
+
+    def parse_atom(i):
+        if i >= len(tokens):
+            raise ValueError("表达式不完整")
+        token = tokens[i]
+        if token == "(":
+            expr, i = parse_or(i + 1)
+            if i >= len(tokens) or tokens[i] != ")":
+                raise ValueError("括号不匹配")
+            return expr, i + 1
+        if token in ("&", "|", ")"):
+            raise ValueError(f"此处不应出现运算符: {token}")
+        return ScreenerRef(token), i + 1
+
+    expr, end = parse_or(0)
+    if end != len(tokens):
+        raise ValueError(f"多余的内容: {' '.join(tokens[end:])}")
+    return expr
+
+
+class ScreenerMembership:
+    """快照级筛选器成员位图缓存
+
+    预设筛选器与短线策略共用同一份快照，每个筛选器的成员位图首次使用时计算并缓存。
+    """
+
+    def __init__(self, snapshot: pd.DataFrame,
+                 smart_screener: Optional[SmartStockScreener] = None,
+                 short_term_screener: Optional[ShortTermEntryScreener] = None):
+        self.snapshot = snapshot.reset_index(drop=True)
+        self.size = len(self.snapshot)
+        self.smart_screener = smart_screener or SmartStockScreener()
+        self.short_term_screener = short_term_screener or ShortTermEntryScreener()
+        self._bitmaps: Dict[str, Bitmap] = {}
+
+    def names(self) -> List[str]:
+        """全部可用筛选器名称"""
+        return list(self.smart_screener.screener_logic) + list(self.short_term_screener.short_term_strategies)
+
+    def display_name(self, name: str) -> str:
+        """筛选器显示名称"""
+        if name in self.smart_screener.screener_logic:
+            return self.smart_screener.screener_logic[name]["name"]
+        if name in self.short_term_screener.short_term_strategies:
+            return self.short_term_screener.short_term_strategies[name]["name"]
+        return name
+
+    def bitmap(self, name: str) -> Bitmap:
+        """筛选器成员位图（带缓存）"""
+        if name not in self._bitmaps:
+            if name in self.smart_screener.screener_logic:
+                mask = self.smart_screener.screener_mask(self.snapshot, name)
+            elif name in self.short_term_screener.short_term_strategies:
+                # 短线模拟字段与 screen_short_term_entries 一样按股票代码和快照时间生成，
+                # 与计算顺序无关，成员位图和对应的策略结果一致
+                fields = self.short_term_screener.generate_entry_fields(
+                    self.size, name, codes=self.snapshot["股票代码"],
+                    salt=str(self.snapshot.attrs.get(TIMESTAMP_ATTR))
+                )
+                mask = self.short_term_screener.strategy_mask(self.snapshot, name, fields)
+            else:
+                raise ValueError(f"未知筛选器: {name}")
+            self._bitmaps[name] = Bitmap.from_mask(mask)
+        return self._bitmaps[name]
+
+    def evaluate(self, expr) -> Bitmap:
+        """计算表达式（字符串或 ScreenerExpr）的成员位图"""
+        if isinstance(expr, str):
+            expr = parse_expression(expr)
+        return expr.evaluate(self)
+
+    def select(self, expr, sort_by: Optional[str] = "综合评分", ascending: bool = False) -> pd.DataFrame:
+        """返回满足表达式的股票"""
+        rows = self.evaluate(expr).to_indices()
+        result = self.snapshot.iloc[rows]
+        if sort_by and sort_by in result.columns:
+            result = result.sort_values(sort_by, ascending=ascending)
+        return result
+
+    def overlap_matrix(self, names: Optional[List[str]] = None, normalize: bool = False) -> pd.DataFrame:
+        """筛选器两两重叠矩阵
+
+        normalize=False 时为交集股票数；normalize=True 时为 Jaccard 相似度（交集/并集）。
+        """
+        names = names or self.names()
+        bitmaps = [self.bitmap(name) for name in names]
+        counts = np.array([b.count() for b in bitmaps], dtype=np.float64)
+        matrix = np.zeros((len(names), len(names)), dtype=np.float64)
+
+        for i, left in enumerate(bitmaps):
+            matrix[i, i] = counts[i]
+            for j in range(i + 1, len(names)):
+                matrix[i, j] = matrix[j, i] = (left & bitmaps[j]).count()
+
+        if normalize:
+            union = counts[:, None] + counts[None, :] - matrix
+            matrix = np.divide(matrix, union, out=np.zeros_like(matrix), where=union > 0)
+        else:
+            matrix = matrix.astype(np.int64)
+
+        labels = [self.display_name(name) for name in names]
+        return pd.DataFrame(matrix, index=labels, columns=labels)
+
+
+# 主要接口函数
+def build_screener_membership(snapshot: pd.DataFrame) -> ScreenerMembership:
+    """为快照构建筛选器成员缓存"""
+    return ScreenerMembership(snapshot)
@@ -0,0 +1,436 @@
+"""
+筛选索引
+为行情快照构建排序列索引和类别位图，在亚毫秒级内回答“有多少股票满足这些区间条件”
+"""
+
+import numpy as np
+import pandas as pd
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# 区间条件: (下限, 上限)，None 表示该侧不限
+RangeBound = Tuple[Optional[float], Optional[float]]
+
+# 默认建立索引的数值列（自定义筛选器滑块对应的列）
+DEFAULT_NUMERIC_COLUMNS = [
+    "市值", "总市值", "PE", "PB", "市盈率", "市净率", "RSI", "涨跌幅",
+    "换手率", "量比", "成交量比", "ROE", "综合评分"
+]
+
+# 默认建立位图的类别列
+DEFAULT_CATEGORICAL_COLUMNS = ["行业", "板块", "MACD信号"]
+
+
+class Bitmap:
+    """定长位图，按64位字打包存储，支持与/或/非运算和快速计数"""
+
+    __slots__ = ("size", "words")
+
+    def __init__(self, size: int, words: Optional[np.ndarray] = None):
+        self.size = size
+        if words is None:
+            words = np.zeros((size + 63) // 64, dtype=np.uint64)
+        self.words = words
+
+    @classmethod
+    def from_mask(cls, mask: np.ndarray) -> "Bitmap":
+        """由布尔数组构建位图"""
+        mask = np.asarray(mask, dtype=bool)
+        size = len(mask)
+        packed = np.packbits(mask, bitorder="little")
+        padded = np.zeros(((size + 63) // 64) * 8, dtype=np.uint8)
+        padded[:len(packed)] = packed
+        return cls(size, padded.view(np.uint64))
+
+    @classmethod
+    def from_indices(cls, indices: Iterable[int], size: int) -> "Bitmap":
+        """由行号集合构建位图"""
+        if not isinstance(indices, np.ndarray):
+            indices = list(indices)
+        mask = np.zeros(size, dtype=bool)
+        mask[np.asarray(indices, dtype=np.int64)] = True
+        return cls.from_mask(mask)
+
+    @classmethod
+    def full(cls, size: int) -> "Bitmap":
+        """全部置位的位图"""
+        return ~cls(size)
+
+    def _check(self, other: "Bitmap"):
+        if self.size != other.size:
+            raise ValueError(f"位图长度不一致: {self.size} != {other.size}")
+
+    def __and__(self, other: "Bitmap") -> "Bitmap":
+        self._check(other)
+        return Bitmap(self.size, self.words & other.words)
+
+    def __or__(self, other: "Bitmap") -> "Bitmap":
+        self._check(other)
+        return Bitmap(self.size, self.words | other.words)
+
+    def __xor__(self, other: "Bitmap") -> "Bitmap":
+        self._check(other)
+        return Bitmap(self.size, self.words ^ other.words)
+
+    def __sub__(self, other: "Bitmap") -> "Bitmap":
+        """差集: 在 self 中但不在 other 中"""
+        self._check(other)
+        return Bitmap(self.size, self.words & ~other.words)
+
+    def __invert__(self) -> "Bitmap":
+        words = ~self.words
+        tail = self.size % 64
+        if tail and len(words):
+            words[-1] &= np.uint64((1 << tail) - 1)
+        return Bitmap(self.size, words)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Bitmap) and self.size == other.size and np.array_equal(self.words, other.words)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def count(self) -> int:
+        """置位数量"""
+        if hasattr(np, "bitwise_count"):
+            return int(np.bitwise_count(self.words).sum())
+        return int(np.unpackbits(self.words.view(np.uint8)).sum())
+
+    def any(self) -> bool:
+        return bool(self.words.any())
+
+    def to_mask(self) -> np.ndarray:
+        """转换为布尔数组"""
+        bits = np.unpackbits(self.words.view(np.uint8), bitorder="little")
+        return bits[:self.size].astype(bool)
+
+    def to_indices(self) -> np.ndarray:
+        """转换为升序行号数组"""
+        return np.flatnonzero(self.to_mask())
+
+    @property
+    def nbytes(self) -> int:
+        return self.words.nbytes
+
+
+class SnapshotRangeIndex:
+    """行情快照区间索引
+
+    每个数值列保存排好序的取值及对应的行号排列，区间计数只需两次二分查找；
+    多个区间同时生效时，从最窄的区间取候选行，再逐列校验。
+    类别列为每个取值保存一张位图。
+    """
+
+    def __init__(self, df: pd.DataFrame,
+                 numeric_columns: Optional[List[str]] = None,
+                 categorical_columns: Optional[List[str]] = None):
+        self.size = len(df)
+        self.columns = list(df.columns)
+
+        if numeric_columns is None:
+            numeric_columns = [c for c in DEFAULT_NUMERIC_COLUMNS if c in df.columns]
+        if categorical_columns is None:
+            categorical_columns = [c for c in DEFAULT_CATEGORICAL_COLUMNS if c in df.columns]
+
+        self._values: Dict[str, np.ndarray] = {}
+        self._sorted: Dict[str, np.ndarray] = {}
+        self._order: Dict[str, np.ndarray] = {}
+        for col in numeric_columns:
+            values = pd.to_numeric(df[col], errors="coerce").to_numpy(dtype=np.float64)
+            order = np.argsort(values, kind="stable").astype(np.int32)
+            sorted_values = values[order]
+            # NaN 排在末尾，不参与任何区间
+            valid = int(np.count_nonzero(~np.isnan(sorted_values)))
+            self._values[col] = values
+            self._sorted[col] = sorted_values[:valid]
+            self._order[col] = order[:valid]
+
+        self._categories: Dict[str, Dict[str, Bitmap]] = {}
+        for col in categorical_columns:
+            codes, uniques = pd.factorize(df[col].astype("object"))
+            bitmaps = {}
+            for code, value in enumerate(uniques):
+                bitmaps[str(value)] = Bitmap.from_mask(codes == code)
+            self._categories[col] = bitmaps
+
+    @property
+    def numeric_columns(self) -> List[str]:
+        return list(self._sorted.keys())
+
+    @property
+    def categorical_columns(self) -> List[str]:
+        return list(self._categories.keys())
+
+    def category_values(self, column: str) -> List[str]:
+        """类别列的所有取值"""
+        return list(self._categories.get(column, {}).keys())
+
+    def _slice(self, column: str, bound: RangeBound) -> Tuple[int, int]:
+        """区间在排序数组中的位置 [start, stop)"""
+        sorted_values = self._sorted[column]
+        low, high = bound
+        start = 0 if low is None else int(np.searchsorted(sorted_values, low, side="left"))
+        stop = len(sorted_values) if high is None else int(np.searchsorted(sorted_values, high, side="right"))
+        return start, max(start, stop)
+
+    def range_count(self, column: str, low: Optional[float] = None, high: Optional[float] = None) -> int:
+        """单列区间计数（闭区间）"""
+        if column not in self._sorted:
+            return self.size
+        start, stop = self._slice(column, (low, high))
+        return stop - start
+
+    def range_rows(self, column: str, low: Optional[float] = None, high: Optional[float] = None) -> np.ndarray:
+        """单列区间内的行号（按该列取值升序）"""
+        start, stop = self._slice(column, (low, high))
+        return self._order[column][start:stop]
+
+    def category_bitmap(self, categories: Dict[str, Iterable[str]]) -> Optional[Bitmap]:
+        """类别条件: 同列内取值为或，列之间为与；无条件时返回 None"""
+        result = None
+        for column, values in categories.items():
+            if column not in self._categories:
+                continue
+            values = list(values)
+            if not values:
+                continue
+            column_bitmap = Bitmap(self.size)
+            for value in values:
+                bitmap = self._categories[column].get(str(value))
+                if bitmap is not None:
+                    column_bitmap = column_bitmap | bitmap
+            result = column_bitmap if result is None else result & column_bitmap
+        return result
+
+    def match(self, ranges: Dict[str, RangeBound],
+              categories: Optional[Dict[str, Iterable[str]]] = None) -> np.ndarray:
+        """返回满足全部条件的行号（升序）
+
+        未建立索引的列与 apply_custom_criteria 一致，直接忽略该条件。
+        """
+        active = [(col, bound) for col, bound in ranges.items() if col in self._sorted]
+        category_mask = None
+        if categories:
+            bitmap = self.category_bitmap(categories)
+            if bitmap is not None:
+                category_mask = bitmap.to_mask()
+
+        if not active:
+            if category_mask is None:
+                return np.arange(self.size, dtype=np.int32)
+            return np.flatnonzero(category_mask).astype(np.int32)
+
+        # 从最窄的区间取候选行
+        slices = [(col, bound, self._slice(col, bound)) for col, bound in active]
+        slices.sort(key=lambda item: item[2][1] - item[2][0])
+        first_col, _, (start, stop) = slices[0]
+        candidates = self._order[first_col][start:stop]
+
+        for col, (low, high), _ in slices[1:]:
+            if len(candidates) == 0:
+                break
+            values = self._values[col][candidates]
+            keep = ~np.isnan(values)
+            if low is not None:
+                keep &= values >= low
+            if high is not None:
+                keep &= values <= high
+            candidates = candidates[keep]
+
+        if category_mask is not None and len(candidates):
+            candidates = candidates[category_mask[candidates]]
+
+        return np.sort(candidates)
+
+    def count(self, ranges: Dict[str, RangeBound],
+              categories: Optional[Dict[str, Iterable[str]]] = None) -> int:
+        """满足全部条件的股票数量"""
+        active = [col for col in ranges if col in self._sorted]
+        if len(active) == 1 and not categories:
+            col = active[0]
+            return self.range_count(col, *ranges[col])
+        return len(self.match(ranges, categories))
+
+    def count_each(self, ranges: Dict[str, RangeBound]) -> Dict[str, int]:
+        """每个区间条件单独生效时的匹配数量"""
+        return {col: self.range_count(col, *bound) for col, bound in ranges.items() if col in self._sorted}
+
+    @property
+    def nbytes(self) -> int:
+        """索引占用的字节数"""
+        total = sum(a.nbytes for a in self._values.values())
+        total += sum(a.nbytes for a in self._sorted.values())
+        total += sum(a.nbytes for a in self._order.values())
+        total += sum(b.nbytes for bitmaps in self._categories.values() for b in bitmaps.values())
+        return total
+
+
+class CategoryBitmapIndex:
+    """股票代码表类别位图索引
+
+    以代码表（行业、概念、板块、指数成分）为行，每个类别取值对应一张位图。
+    概念和指数成分为多值字段，一只股票可以同时属于多个取值（列表，或快照中以“、”连接的字符串）。
+    代码表刷新时重建一次，之后类别筛选只需位图与/或运算；
+    行情快照自带类别列时用 from_snapshot 按快照本身建索引，位图行号即快照行号，
+    筛选时直接按存活行号取位。
+    """
+
+    # 字段名 -> 是否多值
+    FIELDS = {"行业": False, "概念": True, "板块": False, "指数成分": True}
+
+    def __init__(self, master: pd.DataFrame):
+        self.codes = master["股票代码"].astype(str).tolist()
+        self.size = len(self.codes)
+        # 代码重复时按第一次出现的行定位
+        codes = pd.Index(self.codes)
+        first = ~codes.duplicated()
+        self._positions = codes[first]
+        self._rows = np.flatnonzero(first)
+
+        self._bitmaps: Dict[str, Dict[str, Bitmap]] = {}
+        for field, multi in self.FIELDS.items():
+            if field in master.columns:
+                self._bitmaps[field] = self._field_bitmaps(master[field], multi)
+
+    @staticmethod
+    def _items(value, multi: bool) -> List[str]:
+        """单元格中的取值列表（缺失值为空列表）"""
+        if value is None or (not isinstance(value, (list, tuple, np.ndarray)) and pd.isna(value)):
+            return []
+        if not multi:
+            return [str(value)]
+        if isinstance(value, str):
+            return [item for item in value.split("、") if item]
+        return [str(item) for item in value]
+
+    def _field_bitmaps(self, column: pd.Series, multi: bool) -> Dict[str, Bitmap]:
+        """一列的全部取值位图
+
+        先按不同的单元格取值编码（类别列直接用类别编码），只对这些取值拆分多值字段，
+        再由“取值 × 单元格编码”的成员矩阵一次展开到各行，按行打包成位图。
+        """
+        try:
+            codes, uniques = pd.factorize(column)
+        except TypeError:
+            # 代码表中的多值字段为列表，先连接成字符串
+            column = column.map(lambda v: "、".join(map(str, v)) if isinstance(v, (list, tuple, np.ndarray)) else v)
+            codes, uniques = pd.factorize(column)
+
+        item_ids: Dict[str, int] = {}
+        pairs = [(item_ids.setdefault(item, len(item_ids)), code)
+                 for code, value in enumerate(uniques) for item in self._items(value, multi)]
+        # 最后一列对应缺失值（编码 -1），全部为 False
+        membership = np.zeros((len(item_ids), len(uniques) + 1), dtype=bool)
+        if pairs:
+            membership[tuple(np.array(pairs).T)] = True
+        packed = np.packbits(membership[:, codes], axis=1, bitorder="little")
+        words = np.zeros((len(item_ids), ((self.size + 63) // 64) * 8), dtype=np.uint8)
+        words[:, :packed.shape[1]] = packed
+        words = words.view(np.uint64)
+        return {item: Bitmap(self.size, words[row]) for item, row in item_ids.items()}
+
+    @classmethod
+    def from_snapshot(cls, df: pd.DataFrame, master: Optional[pd.DataFrame] = None) -> "CategoryBitmapIndex":
+        """以行情快照的行为行建索引（位图中的行号即快照行号）
+
+        类别取值以快照自身的列为准；快照缺少该列或该行为空时才用代码表补齐。
+        """
+        codes = df["股票代码"].astype(str).to_numpy()
+        frame = {"股票代码": codes}
+        by_code = None
+        if master is not None and not master.empty:
+            by_code = master.assign(股票代码=master["股票代码"].astype(str)).drop_duplicates("股票代码")
+            by_code = by_code.set_index("股票代码")
+
+        for field, multi in cls.FIELDS.items():
+            own = df[field] if field in df.columns else None
+            fallback = None
+            if by_code is not None and field in by_code.columns:
+                values = by_code[field]
+                if multi:
+                    values = values.map(lambda v: "、".join(cls._items(v, True)))
+                fallback = values.reindex(codes).to_numpy(dtype=object)
+            if own is None:
+                if fallback is not None:
+                    frame[field] = fallback
+                continue
+            if fallback is not None:
+                missing = (own.isna() | own.astype("object").eq("")).to_numpy()
+                if missing.any():
+                    own = own.to_numpy(dtype=object, copy=True)
+                    own[missing] = fallback[missing]
+            # 类别列保持类别类型，建位图时直接用类别编码
+            frame[field] = own if isinstance(own, np.ndarray) else own.reset_index(drop=True)
+
+        return cls(pd.DataFrame(frame, index=pd.RangeIndex(len(codes))))
+
+    def values(self, field: str) -> List[str]:
+        """字段的所有取值"""
+        return sorted(self._bitmaps.get(field, {}).keys())
+
+    def bitmap(self, field: str, value: str) -> Bitmap:
+        """单个取值的位图，未知取值返回空位图"""
+        return self._bitmaps.get(field, {}).get(str(value), Bitmap(self.size))
+
+    def any_of(self, field: str, values: Iterable[str]) -> Bitmap:
+        """属于任一取值（或）"""
+        result = Bitmap(self.size)
+        for value in values:
+            result = result | self.bitmap(field, value)
+        return result
+
+    def all_of(self, field: str, values: Iterable[str]) -> Bitmap:
+        """同时属于全部取值（与），用于多概念叠加"""
+        result = Bitmap.full(self.size)
+        for value in values:
+            result = result & self.bitmap(field, value)
+        return result
+
+    def select(self, include: Optional[Dict[str, Iterable[str]]] = None,
+               exclude: Optional[Dict[str, Iterable[str]]] = None,
+               require_all: Optional[Dict[str, Iterable[str]]] = None) -> Bitmap:
+        """组合类别条件
+
+        include: 字段内取值为或，字段之间为与
+        exclude: 属于任一取值即排除
+        require_all: 字段内取值为与（例如同时具备多个概念）
+        """
+        result = Bitmap.full(self.size)
+        for field, values in (include or {}).items():
+            values = list(values)
+            if values:
+                result = result & self.any_of(field, values)
+        for field, values in (require_all or {}).items():
+            result = result & self.all_of(field, values)
+        for field, values in (exclude or {}).items():
+            result = result - self.any_of(field, values)
+        return result
+
+    def positions(self, codes: Iterable[str]) -> np.ndarray:
+        """快照股票代码在代码表中的位置，不在代码表中的为 -1"""
+        codes = pd.Index(pd.Series(codes, dtype=object).astype(str))
+        indexer = self._positions.get_indexer(codes)
+        if not len(self._rows):
+            return indexer
+        return np.where(indexer >= 0, self._rows[indexer], -1)
+
+    def mask_for(self, codes: Iterable[str], bitmap: Bitmap) -> Tuple[np.ndarray, np.ndarray]:
+        """把代码表位图映射到快照行
+
+        返回 (命中掩码, 已知掩码)，不在代码表中的股票已知掩码为 False，
+        调用方可以对这些行回退到逐行比较。
+        """
+        positions = self.positions(codes)
+        known = positions >= 0
+        hits = np.zeros(len(positions), dtype=bool)
+        hits[known] = bitmap.to_mask()[positions[known]]
+        return hits, known
+
+    @property
+    def nbytes(self) -> int:
+        return sum(b.nbytes for bitmaps in self._bitmaps.values() for b in bitmaps.values())
+
+
+# 主要接口函数
+def build_range_index(df: pd.DataFrame) -> SnapshotRangeIndex:
+    """为行情快照构建区间索引"""
+    return SnapshotRangeIndex(df.reset_index(drop=True))
@@ -0,0 +1,476 @@
+"""
+无界面筛选 HTTP API
+把预设筛选器、短线策略、自定义条件、快照与个股查询以 HTTP 接口提供给下游系统，
+不经过 Streamlit 页面重跑。请求在事件循环中处理，筛选计算放到有上限的线程池；
+数据来自主机级共享快照（内存映射，多个服务进程共用一份），
+同一快照版本上的筛选结果只计算一次，之后的请求只做分页切片。
+响应默认为 JSON，format=arrow 或 Accept 为 Arrow 流时返回 Arrow IPC。
+
+用法:
+    python screening_api.py --port 8600 --workers 4
+    curl "http://127.0.0.1:8600/screeners/preset/value_growth?offset=0&limit=20"
+    curl "http://127.0.0.1:8600/screeners/preset/value_growth?format=arrow" -o page.arrow
+    curl -X POST http://127.0.0.1:8600/screeners/custom -d '{"pe_range": [0, 20], "rsi_range": [30, 70]}'
+    curl http://127.0.0.1:8600/metrics    # Prometheus 文本格式指标
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Optional, Tuple
+
+import anyio
+import pandas as pd
+import pyarrow as pa
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+from metrics import CONTENT_TYPE, get_metrics
+from market_snapshots import (CUSTOM_CRITERIA_COLUMNS, CUSTOM_SNAPSHOT_NAME, SNAPSHOT_MAX_AGE, UNIVERSE_SNAPSHOT_NAME,
+                              fetch_a_share_universe, fetch_custom_universe, filter_custom_criteria)
+from parallel_screen import merge_results, screen_frame
+import shared_snapshot
+from shared_snapshot import SharedSnapshotStore
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+# 默认监听端口
+DEFAULT_PORT = 8600
+
+# 分页参数
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 1000
+
+# 检查快照是否有新版本的间隔（秒）
+SNAPSHOT_CHECK_INTERVAL = 1.0
+
+# 快照刷新失败后再次尝试的间隔（秒）
+REFRESH_RETRY_INTERVAL = 30.0
+
+# 每个进程缓存的筛选结果数（按快照版本区分，新版本发布后旧结果自然淘汰）
+RESULT_CACHE_SIZE = 128
+
+# 同时执行筛选计算的线程数
+COMPUTE_THREADS = 4
+
+# Arrow IPC 流的媒体类型
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+# 快照来源
+SOURCE_UNIVERSE = "universe"  # 预设筛选器与短线策略使用的A股快照
+SOURCE_REALTIME = "realtime"  # 自定义条件使用的全市场实时快照
+
+# 接口中的筛选类型 -> parallel_screen 的分区筛选类型
+SCREEN_KINDS = {"preset": "smart", "short-term": "short_term"}
+
+
+class SnapshotUnavailable(Exception):
+    """快照尚未发布且刷新失败"""
+
+
+class SnapshotSource:
+    """一份共享快照在服务进程内的挂载状态
+
+    按间隔检查清单版本，有新版本时重新挂载（零拷贝）；快照过期时在后台刷新，
+    刷新期间继续使用旧版本，只有从未发布过快照时请求才等待刷新完成。
+    """
+
+    def __init__(self, store: SharedSnapshotStore, fetch: Callable[[], pd.DataFrame],
+                 max_age: float = SNAPSHOT_MAX_AGE, check_interval: float = SNAPSHOT_CHECK_INTERVAL):
+        self.store = store
+        self.fetch = fetch
+        self.max_age = max_age
+        self.check_interval = check_interval
+        self.version: Optional[int] = None
+        self.frame: Optional[pd.DataFrame] = None
+        self._rows_by_code: Optional[Dict[str, int]] = None
+        self._checked = float("-inf")
+        self._refresh_started = float("-inf")
+        self._refreshing: Optional[asyncio.Future] = None
+
+    def _load(self):
+        """挂载清单中的最新版本"""
+        manifest = self.store.manifest()
+        if manifest is not None and manifest["version"] != self.version:
+            frame = self.store.attach(manifest["version"])
+            self.version, self.frame, self._rows_by_code = manifest["version"], frame, None
+
+    def _refresh(self):
+        self.store.get_or_refresh(self.fetch, self.max_age)
+        self._load()
+
+    def _start_refresh(self, limiter) -> Optional[asyncio.Future]:
+        if self._refreshing is None and time.monotonic() - self._refresh_started >= REFRESH_RETRY_INTERVAL:
+            self._refresh_started = time.monotonic()
+            self._refreshing = asyncio.ensure_future(anyio.to_thread.run_sync(self._refresh, limiter=limiter))
+            self._refreshing.add_done_callback(self._refresh_done)
+        return self._refreshing
+
+    def _refresh_done(self, future: asyncio.Future):
+        self._refreshing = None
+        if not future.cancelled() and future.exception() is not None:
+            logger.warning(f"⚠️ 快照 {self.store.name} 刷新失败: {future.exception()}")
+
+    async def current(self, limiter) -> Tuple[int, pd.DataFrame]:
+        """当前版本号与快照"""
+        now = time.monotonic()
+        if self.frame is None or now - self._checked >= self.check_interval:
+            self._checked = now
+            self._load()
+            age = self.store.age()
+            if age is None or age >= self.max_age:
+                refreshing = self._start_refresh(limiter)
+                if self.frame is None and refreshing is not None:
+                    try:
+                        await asyncio.shield(refreshing)
+                    except Exception:
+                        pass  # 已在 _refresh_done 中记录
+
+        if self.frame is None:
+            raise SnapshotUnavailable(f"快照 {self.store.name} 暂不可用")
+        return self.version, self.frame
+
+    def row_of(self, code: str) -> Optional[int]:
+        """股票代码所在行号（代码重复时取第一行）"""
+        if self._rows_by_code is None:
+            codes = self.frame["股票代码"].astype(str).tolist()
+            self._rows_by_code = {}
+            for row, value in enumerate(codes):
+                self._rows_by_code.setdefault(value, row)
+        return self._rows_by_code.get(code)
+
+
+class ScreeningService:
+    """筛选服务：快照挂载、结果缓存与并发去重"""
+
+    def __init__(self, sources: Dict[str, SnapshotSource], threads: int = COMPUTE_THREADS,
+                 cache_size: int = RESULT_CACHE_SIZE):
+        from smart_stock_screener import SmartStockScreener
+        from short_term_entry_screener import ShortTermEntryScreener
+
+        self.sources = sources
+        self.limiter = anyio.CapacityLimiter(threads)
+        self.cache_size = cache_size
+        self.screener_logic = SmartStockScreener().screener_logic
+        self.short_term_strategies = ShortTermEntryScreener().short_term_strategies
+        self._results: "OrderedDict[Hashable, pd.DataFrame]" = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.stats = {"hits": 0, "computed": 0, "coalesced": 0}
+
+    async def snapshot(self, source: str) -> Tuple[int, pd.DataFrame]:
+        if source not in self.sources:
+            raise KeyError(f"未知快照: {source}")
+        return await self.sources[source].current(self.limiter)
+
+    async def _cached(self, key: Hashable, compute: Callable[[], pd.DataFrame]) -> pd.DataFrame:
+        """同一键的结果只计算一次，计算期间到达的相同请求等待同一个结果"""
+        if key in self._results:
+            self._results.move_to_end(key)
+            self.stats["hits"] += 1
+            return self._results[key]
+
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(anyio.to_thread.run_sync(compute, limiter=self.limiter))
+            self._inflight[key] = future
+            future.add_done_callback(lambda done: self._store_result(key, done))
+            self.stats["computed"] += 1
+        else:
+            self.stats["coalesced"] += 1
+        return await asyncio.shield(future)
+
+    def _store_result(self, key: Hashable, future: asyncio.Future):
+        self._inflight.pop(key, None)
+        if future.cancelled() or future.exception() is not None:
+            return
+        self._results[key] = future.result()
+        while len(self._results) > self.cache_size:
+            self._results.popitem(last=False)
+
+    def catalog(self) -> Dict:
+        """可用的预设筛选器与短线策略"""
+        return {
+            "preset": {key: {"name": logic["name"], "sort_by": logic["sort_by"]}
+                       for key, logic in self.screener_logic.items()},
+            "short-term": {key: {"name": strategy["name"], "description": strategy["description"]}
+                           for key, strategy in self.short_term_strategies.items()},
+        }
+
+    async def screen(self, kind: str, key: str) -> Tuple[int, pd.DataFrame]:
+        """预设筛选器或短线策略在A股快照上的全部入选结果（已排序）"""
+        known = self.screener_logic if kind == "preset" else self.short_term_strategies
+        if kind not in SCREEN_KINDS or key not in known:
+            raise KeyError(f"未知筛选器: {kind}/{key}")
+
+        version, frame = await self.snapshot(SOURCE_UNIVERSE)
+        strategy = (SCREEN_KINDS[kind], key)
+
+        def compute() -> pd.DataFrame:
+            with span(f"接口筛选:{kind}/{key}", screener=key, rows=len(frame)):
+                outputs = [screen_frame(frame, [strategy], len(frame))]
+                return merge_results([strategy], outputs, len(frame))[strategy]["top"]
+
+        return version, await self._cached((SOURCE_UNIVERSE, version, strategy), compute)
+
+    async def custom(self, criteria: Dict) -> Tuple[int, pd.DataFrame]:
+        """自定义条件在全市场快照上的全部入选结果（按综合评分降序）"""
+        criteria = validate_criteria(criteria)
+        version, frame = await self.snapshot(SOURCE_REALTIME)
+
+        def compute() -> pd.DataFrame:
+            with span("接口筛选:custom", screener="custom", rows=len(frame)):
+                matched = filter_custom_criteria(frame, criteria)
+                if "综合评分" in matched.columns:
+                    matched = matched.sort_values("综合评分", ascending=False, kind="stable")
+                return matched.reset_index(drop=True)
+
+        key = (SOURCE_REALTIME, version, "custom", json.dumps(criteria, sort_keys=True))
+        return version, await self._cached(key, compute)
+
+    async def stock(self, code: str) -> Dict[str, Optional[pd.DataFrame]]:
+        """个股在各快照中的行（未找到或快照不可用时为 None）"""
+        code = code.split(".")[0]
+        found = {}
+        for name, source in self.sources.items():
+            try:
+                _, frame = await source.current(self.limiter)
+            except SnapshotUnavailable:
+                found[name] = None
+                continue
+            row = source.row_of(code)
+            found[name] = None if row is None else frame.iloc[[row]]
+        return found
+
+
+def validate_criteria(criteria) -> Dict:
+    """校验自定义条件：区间为两个数字（null 表示不限），volume_ratio_min 为一个数字"""
+    if not isinstance(criteria, dict):
+        raise ValueError("条件必须是 JSON 对象")
+
+    unknown = set(criteria) - set(CUSTOM_CRITERIA_COLUMNS)
+    if unknown:
+        raise ValueError(f"未知条件: {', '.join(sorted(unknown))}")
+
+    def number(value, allow_none: bool) -> bool:
+        if value is None:
+            return allow_none
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+    for name, value in criteria.items():
+        if name == "volume_ratio_min":
+            valid = number(value, allow_none=True)
+        else:
+            valid = value is None or (isinstance(value, list) and len(value) == 2
+                                      and all(number(v, allow_none=True) for v in value))
+        if not valid:
+            raise ValueError(f"条件 {name} 格式错误: {value!r}")
+    return criteria
+
+
+def _page_params(request: Request) -> Tuple[int, int]:
+    try:
+        offset = int(request.query_params.get("offset", 0))
+        limit = int(request.query_params.get("limit", DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise ValueError("offset 和 limit 必须是整数")
+    if offset < 0 or not 0 < limit <= MAX_PAGE_SIZE:
+        raise ValueError(f"offset 不能为负，limit 须在 1-{MAX_PAGE_SIZE} 之间")
+    return offset, limit
+
+
+def _wants_arrow(request: Request) -> bool:
+    requested = request.query_params.get("format")
+    if requested:
+        return requested == "arrow"
+    return ARROW_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+def frame_to_arrow(df: pd.DataFrame) -> bytes:
+    """DataFrame 编码为 Arrow IPC 流"""
+    df = df.copy(deep=False)
+    df.attrs = {}  # 快照时间戳等属性不写入 schema 元数据
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def page_response(request: Request, frame: pd.DataFrame, version: int, source: str) -> Response:
+    """分页响应：JSON（分页信息 + rows）或 Arrow IPC（分页信息在响应头）"""
+    offset, limit = _page_params(request)
+    page = frame.iloc[offset:offset + limit]
+    columns = request.query_params.get("columns")
+    if columns:
+        page = page[[c for c in columns.split(",") if c in page.columns]]
+
+    total = len(frame)
+    next_offset = offset + limit if offset + limit < total else None
+    meta = {"source": source, "version": version, "total": total, "offset": offset,
+            "limit": limit, "next_offset": next_offset}
+
+    if _wants_arrow(request):
+        headers = {"X-Snapshot-Version": str(version), "X-Total-Count": str(total),
+                   "X-Offset": str(offset), "X-Limit": str(limit)}
+        if next_offset is not None:
+            headers["X-Next-Offset"] = str(next_offset)
+        return Response(frame_to_arrow(page), media_type=ARROW_MEDIA_TYPE, headers=headers)
+
+    # 行数据直接由 pandas 编码后拼接，不经过逐行的 Python 对象
+    rows = page.to_json(orient="records", force_ascii=False, date_format="iso")
+    body = json.dumps(meta, ensure_ascii=False)[:-1] + ', "rows": ' + rows + "}"
+    return Response(body, media_type="application/json")
+
+
+def _error(status: int, message: str) -> JSONResponse:
+    return JSONResponse({"error": message}, status_code=status)
+
+
+def _handle_errors(handler: Callable) -> Callable:
+    """把参数错误、未知对象和快照不可用转换为 400 / 404 / 503"""
+    async def wrapper(request: Request) -> Response:
+        try:
+            return await handler(request)
+        except ValueError as e:
+            return _error(400, str(e))
+        except KeyError as e:
+            return _error(404, e.args[0] if e.args else "未找到")
+        except SnapshotUnavailable as e:
+            return _error(503, str(e))
+    return wrapper
+
+
+def _service(request: Request) -> ScreeningService:
+    return request.app.state.service
+
+
+@_handle_errors
+async def health(request: Request) -> Response:
+    service = _service(request)
+    return JSONResponse({
+        "status": "ok",
+        "snapshots": {name: source.version for name, source in service.sources.items()},
+        "cache": dict(service.stats, entries=len(service._results)),
+    })
+
+
+async def metrics_text(request: Request) -> Response:
+    return Response(get_metrics().render(), media_type=CONTENT_TYPE)
+
+
+@_handle_errors
+async def list_screeners(request: Request) -> Response:
+    return JSONResponse(_service(request).catalog())
+
+
+@_handle_errors
+async def run_screen(request: Request) -> Response:
+    kind, key = request.path_params["kind"], request.path_params["key"]
+    version, frame = await _service(request).screen(kind, key)
+    return page_response(request, frame, version, SOURCE_UNIVERSE)
+
+
+@_handle_errors
+async def run_custom(request: Request) -> Response:
+    try:
+        criteria = await request.json()
+    except ValueError:
+        raise ValueError("请求体不是合法的 JSON")
+    version, frame = await _service(request).custom(criteria)
+    return page_response(request, frame, version, SOURCE_REALTIME)
+
+
+@_handle_errors
+async def snapshot_info(request: Request) -> Response:
+    source = request.path_params["source"]
+    version, frame = await _service(request).snapshot(source)
+    manifest = _service(request).sources[source].store.manifest() or {}
+    return JSONResponse({
+        "source": source,
+        "version": version,
+        "rows": len(frame),
+        "published_at": manifest.get("published_at"),
+        "columns": {column: str(dtype) for column, dtype in frame.dtypes.items()},
+    })
+
+
+@_handle_errors
+async def snapshot_rows(request: Request) -> Response:
+    source = request.path_params["source"]
+    version, frame = await _service(request).snapshot(source)
+    return page_response(request, frame, version, source)
+
+
+@_handle_errors
+async def stock_detail(request: Request) -> Response:
+    code = request.path_params["code"]
+    found = await _service(request).stock(code)
+    if all(row is None for row in found.values()):
+        raise KeyError(f"未找到股票: {code}")
+    body = {name: None if row is None else json.loads(row.to_json(orient="records", force_ascii=False))[0]
+            for name, row in found.items()}
+    return JSONResponse(dict(code=code.split(".")[0], **body))
+
+
+def create_app(service: Optional[ScreeningService] = None) -> Starlette:
+    """创建 ASGI 应用（也是 uvicorn 多进程模式的工厂函数）"""
+    app = Starlette(routes=[
+        Route("/health", health),
+        Route("/metrics", metrics_text),
+        Route("/screeners", list_screeners),
+        Route("/screeners/custom", run_custom, methods=["POST"]),
+        Route("/screeners/{kind}/{key}", run_screen),
+        Route("/snapshots/{source}", snapshot_info),
+        Route("/snapshots/{source}/rows", snapshot_rows),
+        Route("/stocks/{code}", stock_detail),
+    ])
+    app.state.service = service or get_screening_service()
+    get_metrics()  # 工作进程启动即开始记录筛选与数据源指标
+    return app
+
+
+# 全局服务实例（每个服务进程一个）
+_screening_service = None
+
+
+def get_screening_service() -> ScreeningService:
+    """获取全局筛选服务"""
+    global _screening_service
+    if _screening_service is None:
+        _screening_service = ScreeningService({
+            SOURCE_UNIVERSE: SnapshotSource(SharedSnapshotStore(UNIVERSE_SNAPSHOT_NAME), fetch_a_share_universe),
+            SOURCE_REALTIME: SnapshotSource(SharedSnapshotStore(CUSTOM_SNAPSHOT_NAME), fetch_custom_universe),
+        })
+    return _screening_service
+
+
+# 主要接口函数
+def main(argv=None):
+    """启动筛选 HTTP API（多个工作进程共用主机级共享快照）"""
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="A股筛选 HTTP API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=1, help="服务进程数")
+    parser.add_argument("--snapshot-dir", help="共享快照目录（默认 STOCK_SNAPSHOT_DIR）")
+    args = parser.parse_args(argv)
+
+    if args.snapshot_dir:
+        # 当前进程直接修改，多进程模式下的工作进程导入 shared_snapshot 时从环境变量读取
+        shared_snapshot.SNAPSHOT_DIR = os.environ["STOCK_SNAPSHOT_DIR"] = args.snapshot_dir
+
+    logging.basicConfig(level=logging.INFO)
+    uvicorn.run("screening_api:create_app", factory=True, host=args.host, port=args.port,
+                workers=args.workers, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+"""
+会话内存记账
+每个页面会话在 st.session_state 中保存筛选结果等 DataFrame。每次页面运行结束时按键统计
+深度内存占用（memory_usage(deep=True)），汇总为全服务的会话内存视图；单个会话超出预算时，
+按最久未访问、占用最大的顺序把大对象溢出到磁盘（或直接清除），读取时再透明加载回来。
+
+访问时间在两种情况下刷新：记账时发现键的值被替换，或经 session_value（load）读取。
+直接读取 st.session_state 不会被记录，可能被溢出的大对象都应通过 session_value 读取，
+否则既拿不到溢出后的值，也不会刷新访问时间。
+
+配置:
+    STOCK_SESSION_MEMORY_MB       单会话内存预算（默认 64，0 表示不限制）
+    STOCK_SESSION_OVER_BUDGET     超出预算时的处理：spill（溢出到磁盘，默认）或 evict（清除）
+    STOCK_SPILL_DIR               溢出文件目录（默认系统临时目录下的 stock_screener_spill）
+    STOCK_SESSION_IDLE_SECONDS    会话多久没有运行后从统计中移除并删除溢出文件（默认 3600）
+"""
+
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from typing import Any, Dict, MutableMapping, Optional
+
+import pandas as pd
+
+from cache_backend import deserialize, estimate_size, serialize
+
+logger = logging.getLogger(__name__)
+
+# 单会话内存预算
+SESSION_MEMORY_BUDGET = int(float(os.environ.get("STOCK_SESSION_MEMORY_MB", "64")) * 1024 * 1024)
+
+# 超出预算时的处理方式
+POLICY_SPILL = "spill"
+POLICY_EVICT = "evict"
+OVER_BUDGET_POLICY = os.environ.get("STOCK_SESSION_OVER_BUDGET", POLICY_SPILL)
+
+# 溢出文件目录（不放在 /dev/shm，溢出的目的就是释放内存）
+SPILL_DIR = os.environ.get("STOCK_SPILL_DIR", os.path.join(tempfile.gettempdir(), "stock_screener_spill"))
+
+# 会话闲置多久后移除
+SESSION_IDLE_SECONDS = float(os.environ.get("STOCK_SESSION_IDLE_SECONDS", "3600"))
+
+# 小于该大小的值不溢出（控件状态、标志位等）
+MIN_SPILL_BYTES = 64 * 1024
+
+# 可以溢出的值类型
+SPILLABLE_TYPES = (pd.DataFrame, pd.Series, dict, list)
+
+
+class SpilledValue:
+    """session_state 中代替已溢出对象的占位（只保留文件路径与原大小）"""
+
+    __slots__ = ("path", "bytes", "rows", "spilled_at")
+
+    def __init__(self, path: str, bytes: int, rows: Optional[int]):
+        self.path = path
+        self.bytes = bytes
+        self.rows = rows
+        self.spilled_at = time.time()
+
+    def load(self) -> Any:
+        with open(self.path, "rb") as f:
+            return deserialize(f.read())
+
+    def discard(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    def __repr__(self) -> str:
+        return f"SpilledValue({os.path.basename(self.path)}, {self.bytes} bytes)"
+
+
+class SessionUsage:
+    """一个会话最近一次记账的结果"""
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.keys: Dict[str, int] = {}
+        self.spilled: Dict[str, SpilledValue] = {}
+        self.evicted: Dict[str, float] = {}
+        self.updated_at = time.time()
+        # 键 -> (值的 id, 最近访问时间)：记账时发现值被替换或经 load 读取时刷新
+        self.access: Dict[str, tuple] = {}
+
+    @property
+    def total(self) -> int:
+        """驻留内存的字节数（不含已溢出的）"""
+        return sum(self.keys.values())
+
+    @property
+    def spilled_bytes(self) -> int:
+        return sum(value.bytes for value in self.spilled.values())
+
+    def touch(self, key: str, value: Any):
+        """记录键被写入新值或被读取"""
+        self.access[key] = (id(value), time.time())
+
+
+class SessionMemoryAccountant:
+    """全服务的会话内存记账与预算执行"""
+
+    def __init__(self, budget: int = SESSION_MEMORY_BUDGET, policy: str = OVER_BUDGET_POLICY,
+                 spill_dir: str = SPILL_DIR, idle_seconds: float = SESSION_IDLE_SECONDS):
+        if policy not in (POLICY_SPILL, POLICY_EVICT):
+            raise ValueError(f"未知的超预算处理方式: {policy}")
+        self.budget = budget
+        self.policy = policy
+        self.spill_dir = spill_dir
+        self.idle_seconds = idle_seconds
+        self.spills = 0
+        self.evictions = 0
+        self._sessions: Dict[str, SessionUsage] = {}
+        self._lock = threading.Lock()
+
+    def _usage(self, session_id: str) -> SessionUsage:
+        with self._lock:
+            usage = self._sessions.get(session_id)
+            if usage is None:
+                usage = self._sessions[session_id] = SessionUsage(session_id)
+            return usage
+
+    def account(self, session_id: str, state: MutableMapping) -> SessionUsage:
+        """统计会话各键的内存占用，超出预算时溢出或清除大对象"""
+        usage = self._usage(session_id)
+        keys: Dict[str, int] = {}
+        spilled: Dict[str, SpilledValue] = {}
+        for key in list(state.keys()):
+            value = state[key]
+            if isinstance(value, SpilledValue):
+                spilled[key] = value
+                continue
+            keys[key] = estimate_size(value)
+            # 值被替换时刷新访问时间；值未变时保留 load 记录的最近读取时间
+            if usage.access.get(key, (None,))[0] != id(value):
+                usage.touch(key, value)
+        usage.keys, usage.spilled, usage.updated_at = keys, spilled, time.time()
+        usage.access = {key: usage.access[key] for key in keys if key in usage.access}
+
+        if self.budget > 0 and usage.total > self.budget:
+            self._enforce(usage, state)
+        self.prune()
+        return usage
+
+    def _enforce(self, usage: SessionUsage, state: MutableMapping):
+        # 最久未访问的先处理，同样久的先处理大的
+        candidates = sorted(
+            (key for key, size in usage.keys.items()
+             if size >= MIN_SPILL_BYTES and isinstance(state[key], SPILLABLE_TYPES)),
+            key=lambda key: (usage.access[key][1], -usage.keys[key])
+        )
+        for key in candidates:
+            if usage.total <= self.budget:
+                break
+            size = usage.keys.pop(key)
+            usage.access.pop(key, None)
+            if self.policy == POLICY_SPILL:
+                try:
+                    usage.spilled[key] = state[key] = self._spill(usage.session_id, key, state[key], size)
+                    self.spills += 1
+                    logger.info(f"💾 会话 {usage.session_id[:8]} 的 {key} ({size / 1024 / 1024:.1f} MB) 已溢出到磁盘")
+                    continue
+                except OSError as e:
+                    logger.warning(f"⚠️ 溢出 {key} 失败，改为清除: {e}")
+            del state[key]
+            usage.evicted[key] = time.time()
+            self.evictions += 1
+            logger.info(f"🧹 会话 {usage.session_id[:8]} 的 {key} ({size / 1024 / 1024:.1f} MB) 超出内存预算已清除")
+
+    def _spill(self, session_id: str, key: str, value: Any, size: int) -> SpilledValue:
+        os.makedirs(self.spill_dir, exist_ok=True)
+        path = os.path.join(self.spill_dir, f"{session_id}_{uuid.uuid4().hex[:8]}.spill")
+        with open(path, "wb") as f:
+            f.write(serialize(value))
+        return SpilledValue(path, size, len(value) if isinstance(value, (pd.DataFrame, pd.Series)) else None)
+
+    def load(self, session_id: str, state: MutableMapping, key: str, default: Any = None) -> Any:
+        """读取会话值并刷新其访问时间；已溢出的从磁盘加载回 session_state（下次记账时重新计入）"""
+        if key not in state:
+            return default
+        value = state[key]
+        usage = self._usage(session_id)
+        if isinstance(value, SpilledValue):
+            spilled = value
+            try:
+                value = spilled.load()
+            except OSError as e:
+                logger.warning(f"⚠️ 读取溢出的 {key} 失败: {e}")
+                del state[key]
+                usage.spilled.pop(key, None)
+                return default
+            state[key] = value
+            spilled.discard()
+            usage.spilled.pop(key, None)
+            usage.keys[key] = spilled.bytes
+        usage.touch(key, value)
+        return value
+
+    def prune(self, now: Optional[float] = None):
+        """移除闲置会话并删除其溢出文件"""
+        now = now or time.time()
+        with self._lock:
+            idle = [sid for sid, usage in self._sessions.items() if now - usage.updated_at > self.idle_seconds]
+            removed = [self._sessions.pop(sid) for sid in idle]
+        for usage in removed:
+            for value in usage.spilled.values():
+                value.discard()
+
+    def session(self, session_id: str) -> Optional[SessionUsage]:
+        return self._sessions.get(session_id)
+
+    def session_keys(self, session_id: str) -> pd.DataFrame:
+        """会话各键的占用（MB），已溢出的键标注位置"""
+        usage = self._sessions.get(session_id)
+        rows = []
+        if usage is not None:
+            rows += [{"键": key, "占用(MB)": round(size / 1024 / 1024, 3), "位置": "内存"}
+                     for key, size in usage.keys.items()]
+            rows += [{"键": key, "占用(MB)": round(value.bytes / 1024 / 1024, 3), "位置": "磁盘"}
+                     for key, value in usage.spilled.items()]
+        return pd.DataFrame(rows, columns=["键", "占用(MB)", "位置"]).sort_values("占用(MB)", ascending=False,
+                                                                           ignore_index=True)
+
+    def sessions(self) -> pd.DataFrame:
+        """全服务各会话的驻留与溢出内存（按驻留内存降序）"""
+        with self._lock:
+            usages = list(self._sessions.values())
+        rows = [{"会话": usage.session_id[:8], "内存(MB)": round(usage.total / 1024 / 1024, 2),
+                 "溢出(MB)": round(usage.spilled_bytes / 1024 / 1024, 2), "键数": len(usage.keys),
+                 "最大的键": max(usage.keys, key=usage.keys.get) if usage.keys else "",
+                 "闲置(秒)": round(time.time() - usage.updated_at)} for usage in usages]
+        return pd.DataFrame(rows, columns=["会话", "内存(MB)", "溢出(MB)", "键数", "最大的键", "闲置(秒)"]).sort_values(
+            "内存(MB)", ascending=False, ignore_index=True)
+
+    def stats(self) -> Dict:
+        """全服务汇总：会话数、驻留与溢出字节数、累计溢出与清除次数"""
+        with self._lock:
+            usages = list(self._sessions.values())
+        return {
+            "sessions": len(usages),
+            "bytes": sum(usage.total for usage in usages),
+            "max_session_bytes": max((usage.total for usage in usages), default=0),
+            "spilled_bytes": sum(usage.spilled_bytes for usage in usages),
+            "spills": self.spills,
+            "evictions": self.evictions,
+            "budget": self.budget,
+        }
+
+
+_accountant: Optional[SessionMemoryAccountant] = None
+
+
+def get_session_accountant() -> SessionMemoryAccountant:
+    """获取全局会话内存记账器"""
+    global _accountant
+    if _accountant is None:
+        _accountant = SessionMemoryAccountant()
+    return _accountant
+
+
+def current_session_id() -> str:
+    """当前页面会话的 id（不在页面运行中时为 local）"""
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else "local"
+
+
+# 主要接口函数
+def account_session_memory() -> SessionUsage:
+    """在页面运行结束时统计当前会话的内存占用并执行预算"""
+    import streamlit as st
+
+    return get_session_accountant().account(current_session_id(), st.session_state)
+
+
+def session_value(key: str, default: Any = None) -> Any:
+    """读取当前会话的 session_state 值（已溢出到磁盘的透明加载回来）"""
+    import streamlit as st
+
+    return get_session_accountant().load(current_session_id(), st.session_state, key, default)
@@ -0,0 +1,288 @@
+"""
+共享快照
+刷新进程把行情快照写成 Arrow IPC 文件（默认放在 /dev/shm 共享内存中），
+同一主机上的各个 Streamlit 进程以只读内存映射方式零拷贝挂载，
+行情只在主机上拉取一次，增加进程数时每个进程的内存占用基本不变。
+
+零拷贝的范围：无缺失值的数值列直接引用映射内存；字符串列在 pandas 3 中为 Arrow 支持的
+str 类型，同样引用映射内存（更早的 pandas 会物化为 Python 对象）。有缺失值的数值列
+和类别列在挂载时各复制一次：类别列在进程内解码为 pandas 类别（每行一个编码，
+类别字典只存一份），不会展开为逐行字符串。
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+import pyarrow as pa
+import pandas as pd
+from contextlib import ExitStack, contextmanager
+from typing import Callable, Dict, Iterable, Iterator, Optional, Tuple
+
+from snapshot_schema import TIMESTAMP_ATTR
+
+try:
+    import fcntl
+except ImportError:  # Windows 下没有 fcntl，退化为不加锁
+    fcntl = None
+
+# 快照目录：优先使用共享内存文件系统
+SNAPSHOT_DIR = os.environ.get(
+    "STOCK_SNAPSHOT_DIR",
+    os.path.join("/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(), "stock_screener")
+)
+
+# 保留的历史版本数（正在被其他进程映射的旧版本不会立刻失效）
+KEEP_VERSIONS = 2
+
+# Arrow schema 元数据中的快照更新时间键
+_TIMESTAMP_KEY = b"snapshot_timestamp"
+
+# Arrow schema 元数据中的类别列名键（分块写入时类别列按字符串存储，挂载时还原为类别）
+_CATEGORICAL_KEY = b"categorical_columns"
+
+# 进程内已挂载的快照: (目录, 名称) -> {版本: DataFrame}，每个名称保留最近 KEEP_VERSIONS 个版本
+# （会话中的结果视图可能仍引用上一个版本）
+_attached: Dict[Tuple[str, str], Dict[int, pd.DataFrame]] = {}
+_attached_lock = threading.Lock()
+
+
+class SharedSnapshotStore:
+    """主机级共享快照存储"""
+
+    def __init__(self, name: str, directory: Optional[str] = None):
+        self.name = name
+        self.directory = directory or SNAPSHOT_DIR
+        os.makedirs(self.directory, exist_ok=True)
+        self.manifest_path = os.path.join(self.directory, f"{name}.json")
+        self.lock_path = os.path.join(self.directory, f"{name}.lock")
+        # 发布锁只在分配版本号和更新清单时短暂持有；刷新锁在拉取行情期间持有，二者分开
+        self.commit_lock_path = os.path.join(self.directory, f"{name}.commit.lock")
+        # 本实例最近一次发布的版本号（publish_chunks 在分块全部写完后才知道）
+        self.published_version: Optional[int] = None
+
+    def _data_path(self, version: int) -> str:
+        return os.path.join(self.directory, f"{self.name}.{version}.arrow")
+
+    def manifest(self) -> Optional[Dict]:
+        """当前发布版本信息"""
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def age(self) -> Optional[float]:
+        """当前版本发布至今的秒数"""
+        manifest = self.manifest()
+        return None if manifest is None else time.time() - manifest["published_at"]
+
+    def fresh_version(self, max_age: float) -> Optional[int]:
+        """当前版本未过期时返回其版本号，否则返回 None"""
+        manifest = self.manifest()
+        if manifest is None or time.time() - manifest["published_at"] >= max_age:
+            return None
+        return manifest["version"]
+
+    @contextmanager
+    def refresh_slot(self, max_age: float) -> Iterator[Optional[int]]:
+        """流式刷新的入口：未过期时给出当前版本号；过期时持有刷新锁并给出 None
+
+        拿到 None 的调用方在上下文内边拉取边 publish_chunks，其余进程和线程在锁上等待，
+        拿到锁后发现已有新版本就直接使用（锁随即释放），同一时间只有一方拉取全市场行情。
+        """
+        with ExitStack() as stack:
+            version = self.fresh_version(max_age)
+            if version is None:
+                stack.enter_context(self._refresh_lock())
+                # 等锁期间可能已有其他进程刷新
+                version = self.fresh_version(max_age)
+                if version is not None:
+                    stack.close()
+            yield version
+
+    def publish(self, df: pd.DataFrame) -> int:
+        """发布新版本快照，返回版本号
+
+        先写临时文件再原子替换清单，读取方不会看到写了一半的文件。
+        """
+        table = self._to_table(df)
+
+        tmp_path = self._tmp_path()
+        with pa.OSFile(tmp_path, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        self.published_version = self._commit(tmp_path, len(df), df.attrs.get(TIMESTAMP_ATTR))
+        return self.published_version
+
+    def publish_chunks(self, chunks: Iterable[pd.DataFrame]) -> Iterator[pd.DataFrame]:
+        """边产出分块边写入新版本快照，全部块写完后才发布
+
+        类别列按字符串写入（各块的类别字典不同，IPC 文件不支持替换字典），列名记入
+        schema 元数据，挂载时重新编码为类别。调用方未消费完时放弃本次写入，已发布版本不受影响。
+        """
+        tmp_path = self._tmp_path()
+        sink = writer = schema = timestamp = None
+        rows = 0
+        try:
+            for chunk in chunks:
+                if not chunk.empty:
+                    table = self._to_table(chunk)
+                    if writer is None:
+                        categorical = [field.name for field in table.schema if pa.types.is_dictionary(field.type)]
+                        metadata = dict(table.schema.metadata or {})
+                        metadata[_CATEGORICAL_KEY] = json.dumps(categorical, ensure_ascii=False).encode()
+                        schema = pa.schema([
+                            field.with_type(field.type.value_type) if field.name in categorical else field
+                            for field in table.schema
+                        ], metadata=metadata)
+                        sink = pa.OSFile(tmp_path, "wb")
+                        writer = pa.ipc.new_file(sink, schema)
+                        timestamp = chunk.attrs.get(TIMESTAMP_ATTR)
+                    writer.write_table(table.cast(schema))
+                    rows += len(chunk)
+                yield chunk
+        except BaseException:
+            if writer is not None:
+                writer.close()
+                sink.close()
+            os.remove(tmp_path)
+            raise
+
+        if writer is None:
+            os.remove(tmp_path)
+            return
+        writer.close()
+        sink.close()
+        self.published_version = self._commit(tmp_path, rows, timestamp)
+
+    def _tmp_path(self) -> str:
+        # 每个写入方独立的临时文件，并发写入互不干扰
+        fd, path = tempfile.mkstemp(prefix=f"{self.name}.", suffix=".arrow.tmp", dir=self.directory)
+        os.close(fd)
+        return path
+
+    def _to_table(self, df: pd.DataFrame) -> pa.Table:
+        # attrs 单独写入 schema 元数据（pyarrow 只能序列化 JSON 类型的 attrs）
+        frame = df.copy(deep=False)
+        frame.attrs = {}
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        timestamp = df.attrs.get(TIMESTAMP_ATTR)
+        if timestamp is not None:
+            metadata = dict(table.schema.metadata or {})
+            metadata[_TIMESTAMP_KEY] = pd.Timestamp(timestamp).isoformat().encode()
+            table = table.replace_schema_metadata(metadata)
+        return table
+
+    def _commit(self, tmp_path: str, rows: int, timestamp) -> int:
+        """把写好的临时文件发布为新版本并清理旧版本，返回版本号
+
+        版本号在发布锁内分配；数据文件用硬链接创建（目标已存在时失败，不会覆盖），
+        即使没有文件锁，两个写入方也不会发布同一个版本号。
+        """
+        with self._file_lock(self.commit_lock_path):
+            manifest = self.manifest()
+            version = (manifest["version"] + 1) if manifest else 1
+            while True:
+                path = self._data_path(version)
+                try:
+                    os.link(tmp_path, path)
+                    break
+                except FileExistsError:
+                    version += 1
+            os.remove(tmp_path)
+            self._write_manifest(version, path, rows, timestamp)
+
+        # 清理旧版本（Linux 下已映射的文件删除后仍可继续读取）
+        for old in range(1, version - KEEP_VERSIONS + 1):
+            try:
+                os.remove(self._data_path(old))
+            except OSError:
+                pass
+        return version
+
+    def _write_manifest(self, version: int, path: str, rows: int, timestamp):
+        new_manifest = {
+            "version": version,
+            "path": os.path.basename(path),
+            "rows": rows,
+            "published_at": time.time(),
+            "timestamp": None if timestamp is None else pd.Timestamp(timestamp).isoformat(),
+        }
+        tmp_manifest = f"{self.manifest_path}.tmp"
+        with open(tmp_manifest, "w", encoding="utf-8") as f:
+            json.dump(new_manifest, f, ensure_ascii=False)
+        os.replace(tmp_manifest, self.manifest_path)
+
+    def attach(self, version: Optional[int] = None) -> Optional[pd.DataFrame]:
+        """零拷贝挂载最新版本或指定版本（同一版本在进程内只挂载一次，零拷贝范围见模块说明）"""
+        if version is None:
+            manifest = self.manifest()
+            if manifest is None:
+                return None
+            version = manifest["version"]
+
+        key = (self.directory, self.name)
+        with _attached_lock:
+            df = _attached.get(key, {}).get(version)
+        if df is not None:
+            return df
+
+        source = pa.memory_map(self._data_path(version), "r")
+        table = pa.ipc.open_file(source).read_all()
+        metadata = table.schema.metadata or {}
+        # split_blocks 让无缺失值的数值列直接引用映射内存，不再拷贝；
+        # 分块写入的类别列按字符串存储，在这里重新编码为类别
+        categorical = json.loads(metadata[_CATEGORICAL_KEY]) if _CATEGORICAL_KEY in metadata else None
+        df = table.to_pandas(split_blocks=True, categories=categorical)
+        timestamp = metadata.get(_TIMESTAMP_KEY)
+        if timestamp is not None:
+            df.attrs[TIMESTAMP_ATTR] = pd.Timestamp(timestamp.decode())
+
+        # 并发挂载同一版本时以先完成的为准，各线程拿到同一个对象
+        with _attached_lock:
+            versions = _attached.setdefault(key, {})
+            df = versions.setdefault(version, df)
+            for old in sorted(versions)[:-KEEP_VERSIONS]:
+                del versions[old]
+        return df
+
+    def _refresh_lock(self):
+        """主机级刷新锁，保证同一时间只有一个进程拉取行情"""
+        return self._file_lock(self.lock_path)
+
+    @staticmethod
+    @contextmanager
+    def _file_lock(path: str):
+        if fcntl is None:
+            yield
+            return
+        with open(path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def get_or_refresh(self, fetch: Callable[[], pd.DataFrame], max_age: float = 300) -> pd.DataFrame:
+        """获取快照：未过期直接挂载；过期时由拿到锁的进程拉取并发布，其余进程等待后挂载"""
+        age = self.age()
+        if age is not None and age < max_age:
+            return self.attach()
+
+        with self._refresh_lock():
+            # 等锁期间可能已有其他进程刷新
+            age = self.age()
+            if age is None or age >= max_age:
+                df = fetch()
+                if df is None or df.empty:
+                    return df if df is not None else pd.DataFrame()
+                self.publish(df)
+        return self.attach()
+
+
+# 主要接口函数
+def get_shared_snapshot(name: str, fetch: Callable[[], pd.DataFrame], max_age: float = 300) -> pd.DataFrame:
+    """获取主机级共享快照（过期时只有一个进程负责拉取）"""
+    return SharedSnapshotStore(name).get_or_refresh(fetch, max_age)
@@ -9,6 +9,30 @@ import random
 from typing import Dict, List, Optional
 from datetime import datetime
 from china_a_stock_fetcher import ChinaAStockFetcher
+from cache_backend import cached
+from derived_columns import keyed_uniform
+from snapshot_schema import TIMESTAMP_ATTR
+from profiling import profiled
+from tracing import STAGE_SCORE, traced
+
+# 快照中没有、需要模拟生成的短线字段
+SYNTHETIC_BOOL_FIELDS = ["MA5突破", "突破确认", "回踩支撑"]
+SYNTHETIC_RANGE_FIELDS = [
+    "开盘缺口", "价格位置", "近5日涨幅", "回调幅度", "近7日波动率", "整理天数", "突破位置",
+    "开盘30分钟涨幅", "价格vs开盘", "开盘价vs昨收", "形态完整度", "相对强度"
+]
+# 使用固定分布的字段，其余字段在策略区间内均匀生成
+SYNTHETIC_DISTRIBUTIONS = {
+    "开盘缺口": (0, 8),
+    "价格位置": (0.7, 1.0),
+    "近5日涨幅": (-5, 20),
+    "回调幅度": (-8, 2),
+    "相对强度": (30, 99),
+}
+# 入场评分与信号用到的快照列
+SCORING_COLUMNS = ["涨跌幅", "成交量比", "RSI", "最新价", "昨收价", "市盈率", "总市值", "行业", "股票代码"]
+# 结果展示用到的列
+DISPLAY_COLUMNS = ["股票代码", "股票名称", "最新价", "涨跌幅", "行业", "综合评分"]
 
 class ShortTermEntryScreener:
     """短线入场机会筛选器"""
@@ -147,8 +171,73 @@ class ShortTermEntryScreener:
             }
         }
     
-    def calculate_entry_score(self, stock_data: Dict, strategy_key: str) -> float:
-        """计算入场评分"""
+    def required_columns(self, strategy_key: str) -> List[str]:
+        """策略需要的快照列：筛选条件、排序字段、评分字段和展示列（模拟字段除外）"""
+        strategy = self.short_term_strategies[strategy_key]
+        columns = list(strategy["filters"]) + [strategy["sort_by"]] + SCORING_COLUMNS + DISPLAY_COLUMNS
+        synthetic = set(SYNTHETIC_BOOL_FIELDS) | set(SYNTHETIC_RANGE_FIELDS)
+        return [c for c in dict.fromkeys(columns) if c not in synthetic]
+    
+    def generate_entry_fields(self, num_rows: int, strategy_key: str,
+                              rng: Optional[np.random.Generator] = None,
+                              codes: Optional[pd.Series] = None, salt: str = "") -> Dict[str, np.ndarray]:
+        """生成快照中没有的短线字段（整批生成）
+        
+        布尔字段随机生成；区间字段按固定分布或策略区间均匀生成。
+        给出 codes 时按股票代码（加 salt）逐只确定性生成，结果与这批股票如何分区无关。
+        """
+        strategy = self.short_term_strategies[strategy_key]
+        rng = rng or np.random.default_rng()
+        fields = {}
+        
+        def uniform(field: str) -> np.ndarray:
+            if codes is not None:
+                return keyed_uniform(codes, f"{strategy_key}|{field}|{salt}")
+            return rng.random(num_rows)
+        
+        for field, condition in strategy["filters"].items():
+            if field in SYNTHETIC_BOOL_FIELDS:
+                if isinstance(condition, bool):
+                    fields[field] = uniform(field) < 0.5
+            elif field in SYNTHETIC_RANGE_FIELDS:
+                low, high = SYNTHETIC_DISTRIBUTIONS.get(field, condition)
+                fields[field] = low + uniform(field) * (high - low)
+        
+        return fields
+    
+    def strategy_mask(self, df: pd.DataFrame, strategy_key: str,
+                      entry_fields: Optional[Dict[str, np.ndarray]] = None) -> np.ndarray:
+        """策略成员掩码：每只股票是否满足策略的全部筛选条件"""
+        strategy = self.short_term_strategies[strategy_key]
+        if entry_fields is None:
+            entry_fields = self.generate_entry_fields(len(df), strategy_key)
+        
+        mask = np.ones(len(df), dtype=bool)
+        for field, condition in strategy["filters"].items():
+            if isinstance(condition, bool):
+                # 只有要求为 True 的布尔条件会淘汰股票
+                if condition and field in entry_fields:
+                    mask &= entry_fields[field]
+            elif isinstance(condition, tuple) and len(condition) == 2:
+                if field in entry_fields:
+                    values = entry_fields[field]
+                elif field in df.columns:
+                    values = df[field].to_numpy(dtype=np.float64)
+                else:
+                    continue
+                min_val, max_val = condition
+                mask &= (values >= min_val) & (values <= max_val)
+        
+        return mask
+    
+    def calculate_entry_score(self, stock_data: Dict, strategy_key: str, preferred: Optional[bool] = None,
+                              rng: Optional[random.Random] = None) -> float:
+        """计算入场评分
+        
+        preferred: 是否属于策略偏好行业，批量筛选时由类别位图预先算好
+        rng: 模拟因素使用的随机源，批量筛选时按股票代码播种
+        """
+        rng = rng or random
         strategy = self.short_term_strategies[strategy_key]
         score = 0
         max_score = 100
@@ -175,7 +264,7 @@ class ShortTermEntryScreener:
         
         elif strategy_key == "relative_strength_entry":
             # 相对强度评分
-            rs = stock_data.get("相对强度", random.uniform(60, 95))
+            rs = stock_data.get("相对强度", rng.uniform(60, 95))
             if rs > 80:
                 score += 20
             elif rs > 70:
@@ -186,12 +275,14 @@ class ShortTermEntryScreener:
                 score += 10
         
         # 行业偏好评分 (20分)
-        if stock_data.get("行业") in strategy["preferred_industries"]:
+        if preferred is None:
+            preferred = stock_data.get("行业") in strategy["preferred_industries"]
+        if preferred:
             score += 20
         
         # 市场环境评分 (20分)
         # 这里可以加入大盘走势、板块轮动等因素
-        score += random.uniform(10, 20)
+        score += rng.uniform(10, 20)
         
         # 风险控制评分 (20分)
         pe = stock_data.get("市盈率", 0)
@@ -204,8 +295,10 @@ class ShortTermEntryScreener:
         
         return min(score, max_score)
     
-    def generate_entry_signals(self, stock_data: Dict, strategy_key: str) -> List[str]:
+    def generate_entry_signals(self, stock_data: Dict, strategy_key: str,
+                               rng: Optional[random.Random] = None) -> List[str]:
         """生成入场信号"""
+        rng = rng or random
         strategy = self.short_term_strategies[strategy_key]
         signals = []
         
@@ -213,8 +306,8 @@ class ShortTermEntryScreener:
         base_signals = strategy["entry_signals"]
         
         # 随机选择1-3个信号
-        num_signals = random.randint(1, min(3, len(base_signals)))
-        selected_signals = random.sample(base_signals, num_signals)
+        num_signals = rng.randint(1, min(3, len(base_signals)))
+        selected_signals = rng.sample(base_signals, num_signals)
         
         # 添加具体的数值信号
         if strategy_key == "momentum_breakout_entry":
@@ -230,8 +323,10 @@ class ShortTermEntryScreener:
         
         return selected_signals
     
+    @cached(ttl=300)
+    @profiled("短线入场筛选")
     def screen_short_term_entries(self, strategy_key: str, num_stocks: int = 20) -> pd.DataFrame:
-        """筛选短线入场机会"""
+        """筛选短线入场机会（筛选结果经统一缓存，多副本共享）"""
         
         if strategy_key not in self.short_term_strategies:
             raise ValueError(f"未知策略: {strategy_key}")
@@ -239,72 +334,66 @@ class ShortTermEntryScreener:
         # 获取基础股票数据
         base_data = self.fetcher.get_china_a_stock_data(
             num_stocks=min(num_stocks * 3, 60),
-            use_real_data=False
+            use_real_data=False,
+            columns=self.required_columns(strategy_key)
         )
         
         if base_data.empty:
             return pd.DataFrame()
         
+        result_df = self.score_entries(base_data, strategy_key)
+        
+        # 限制返回数量
+        if len(result_df) > num_stocks:
+            result_df = result_df.head(num_stocks)
+        
+        return result_df
+    
+    @traced(STAGE_SCORE, "入场评分")
+    def score_entries(self, base_data: pd.DataFrame, strategy_key: str) -> pd.DataFrame:
+        """对一批股票应用策略条件、计算入场评分与信号，按评分降序返回（不截断）
+        
+        只依赖传入的这批数据，可按股票分区并行执行后合并。模拟字段与评分的随机因素
+        按股票代码和快照更新时间播种，同一快照无论分成几个分区，每只股票的结果都相同。
+        """
+        
         strategy = self.short_term_strategies[strategy_key]
+        salt = str(base_data.attrs.get(TIMESTAMP_ATTR))
+        
+        # 应用筛选条件（整批向量化判断）
+        entry_fields = self.generate_entry_fields(len(base_data), strategy_key,
+                                                  codes=base_data["股票代码"], salt=salt)
+        mask = self.strategy_mask(base_data, strategy_key, entry_fields)
+        candidates = base_data[mask].copy()
+        for field, values in entry_fields.items():
+            candidates[field] = values[mask]
+        
+        if candidates.empty:
+            return pd.DataFrame()
+        
+        # 偏好行业：快照类别位图按候选行号取位，一次算出整批结果
+        category_index = self.fetcher.get_category_index(base_data)
+        preferred_hits = category_index.any_of("行业", strategy["preferred_industries"]).to_mask()[mask]
         
-        # 应用筛选条件
         filtered_data = []
         
-        for _, row in base_data.iterrows():
+        for position, (_, row) in enumerate(candidates.iterrows()):
             stock_data = row.to_dict()
+            rng = random.Random(f"{strategy_key}|{stock_data['股票代码']}|{salt}")
+            
+            # 计算入场评分
+            entry_score = self.calculate_entry_score(stock_data, strategy_key, bool(preferred_hits[position]), rng)
+            stock_data["入场评分"] = round(entry_score, 1)
             
-            # 检查是否符合筛选条件
-            meets_criteria = True
+            # 生成入场信号
+            entry_signals = self.generate_entry_signals(stock_data, strategy_key, rng)
+            stock_data["入场信号"] = " | ".join(entry_signals)
             
-            for field, condition in strategy["filters"].items():
-                if field in ["MA5突破", "突破确认", "回踩支撑"]:
-                    # 布尔条件，随机生成
-                    if isinstance(condition, bool):
-                        stock_data[field] = random.choice([True, False])
-                        if condition and not stock_data[field]:
-                            meets_criteria = False
-                            break
-                
-                elif field in ["开盘缺口", "价格位置", "近5日涨幅", "回调幅度", 
-                              "近7日波动率", "整理天数", "突破位置", "开盘30分钟涨幅",
-                              "价格vs开盘", "开盘价vs昨收", "形态完整度", "相对强度"]:
-                    # 生成相应的数据
-                    if field == "开盘缺口":
-                        stock_data[field] = random.uniform(0, 8)
-                    elif field == "价格位置":
-                        stock_data[field] = random.uniform(0.7, 1.0)
-                    elif field == "近5日涨幅":
-                        stock_data[field] = random.uniform(-5, 20)
-                    elif field == "回调幅度":
-                        stock_data[field] = random.uniform(-8, 2)
-                    elif field == "相对强度":
-                        stock_data[field] = random.uniform(30, 99)
-                    else:
-                        stock_data[field] = random.uniform(condition[0], condition[1])
-                
-                # 检查数值条件
-                if isinstance(condition, tuple) and len(condition) == 2:
-                    min_val, max_val = condition
-                    if field in stock_data:
-                        value = stock_data[field]
-                        if not (min_val <= value <= max_val):
-                            meets_criteria = False
-                            break
+            # 添加策略信息
+            stock_data["筛选策略"] = strategy["name"]
+            stock_data["策略描述"] = strategy["description"]
             
-            if meets_criteria:
-                # 计算入场评分
-                entry_score = self.calculate_entry_score(stock_data, strategy_key)
-                stock_data["入场评分"] = round(entry_score, 1)
-                
-                # 生成入场信号
-                entry_signals = self.generate_entry_signals(stock_data, strategy_key)
-                stock_data["入场信号"] = " | ".join(entry_signals)
-                
-                # 添加策略信息
-                stock_data["筛选策略"] = strategy["name"]
-                stock_data["策略描述"] = strategy["description"]
-                
-                filtered_data.append(stock_data)
+            filtered_data.append(stock_data)
         
         if not filtered_data:
             return pd.DataFrame()
@@ -312,14 +401,8 @@ class ShortTermEntryScreener:
         # 转换为DataFrame
         result_df = pd.DataFrame(filtered_data)
         
-        # 按评分排序
-        result_df = result_df.sort_values("入场评分", ascending=False)
-        
-        # 限制返回数量
-        if len(result_df) > num_stocks:
-            result_df = result_df.head(num_stocks)
-        
-        return result_df
+        # 按评分排序（同分按股票代码，与分区方式无关）
+        return result_df.sort_values(["入场评分", "股票代码"], ascending=[False, True], kind="stable")
 
 # 主要接口函数
 def get_short_term_entry_opportunities(strategy_key: str, num_stocks: int = 20) -> pd.DataFrame:
@@ -5,12 +5,15 @@
 
 import pandas as pd
 import numpy as np
-import yfinance as yf
+import yfinance
 import streamlit as st
 import time
 import random
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
+from cassette import recordable
+
+yf = recordable(yfinance, "yfinance")
 
 def get_real_stock_data_simple(num_stocks: int = 30) -> pd.DataFrame:
     """获取真实股票数据 - 简化版本"""
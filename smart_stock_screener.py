@@ -6,8 +6,24 @@
 import pandas as pd
 import numpy as np
 import random
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 from china_a_stock_fetcher import ChinaAStockFetcher
+from cache_backend import cached
+from tracing import STAGE_FILTER, traced
+from filter_planner import FilterPlanner, Predicate, RangePredicate, CompareColumnsPredicate, CategoryPredicate
+
+# 筛选结果展示用到的列（派生列只按需计算，这些列总会被计算）
+DISPLAY_COLUMNS = ["股票代码", "股票名称", "最新价", "涨跌幅", "行业", "综合评分"]
+
+# 随筛选结果一起给出的接近达标股票数
+NEAR_MISS_LIMIT = 10
+
+class MovingAverageCrossPredicate(CompareColumnsPredicate):
+    """均线上穿条件 MA5 > MA20，只有快照中存在配置字段本身时才生效"""
+    
+    def __init__(self, field: str):
+        super().__init__("MA5", "MA20")
+        self.columns = [field, "MA5", "MA20"]
 
 class SmartStockScreener:
     """智能股票筛选器"""
@@ -102,6 +118,77 @@ class SmartStockScreener:
             }
         }
     
+    def required_columns(self, screener_type: str) -> List[str]:
+        """筛选器需要的列：筛选条件、排序字段和展示列"""
+        
+        logic = self.screener_logic.get(screener_type)
+        if logic is None:
+            return list(DISPLAY_COLUMNS)
+        
+        columns = []
+        for field, condition in logic["filters"].items():
+            columns.extend(["MA5", "MA20"] if condition == "上穿" else [field])
+        columns.append(logic["sort_by"])
+        columns.extend(DISPLAY_COLUMNS)
+        return list(dict.fromkeys(columns))
+    
+    def build_predicates(self, screener_type: str) -> List[Predicate]:
+        """把筛选器配置转换为可规划的条件（行业偏好依赖存活结果，不在其中）"""
+        
+        logic = self.screener_logic[screener_type]
+        predicates: List[Predicate] = []
+        
+        for field, condition in logic["filters"].items():
+            if isinstance(condition, tuple) and len(condition) == 2:
+                predicates.append(RangePredicate(field, *condition))
+            elif condition == "上穿":
+                # MA5上穿MA20的逻辑（仅当快照中有该字段时生效）
+                predicates.append(MovingAverageCrossPredicate(field))
+        
+        if logic["exclude_industries"]:
+            predicates.append(CategoryPredicate(
+                "行业", logic["exclude_industries"], negate=True,
+                mask_fn=lambda frame, rows: self.category_mask(frame, "行业", logic["exclude_industries"], rows=rows),
+                extra_columns=["股票代码"]
+            ))
+        
+        return predicates
+    
+    def screener_mask(self, df: pd.DataFrame, screener_type: str) -> np.ndarray:
+        """筛选器成员掩码：每只股票是否入选（不排序、不复制数据）
+        
+        数值条件和行业排除由 FilterPlanner 按选择率排序、在存活行上短路执行。
+        """
+        
+        if screener_type not in self.screener_logic:
+            return np.ones(len(df), dtype=bool)
+        
+        rows, preferred = self.survivor_rows(df, screener_type)
+        
+        # 应用行业偏好：如果存活股票中有偏好行业，优先选择；否则保留所有
+        if preferred.any():
+            rows = rows[preferred]
+        
+        mask = np.zeros(len(df), dtype=bool)
+        mask[rows] = True
+        return mask
+    
+    def survivor_rows(self, df: pd.DataFrame, screener_type: str):
+        """满足全部硬性条件的行号，以及其中属于偏好行业的掩码
+        
+        行业偏好取决于全部存活股票，分区并行时由合并方统一应用。
+        """
+        
+        logic = self.screener_logic[screener_type]
+        rows = FilterPlanner(df).execute(self.build_predicates(screener_type))
+        
+        preferred = np.zeros(len(rows), dtype=bool)
+        if logic["preferred_industries"] and len(rows):
+            preferred = self.category_mask(df, "行业", logic["preferred_industries"], rows=rows)
+        
+        return rows, preferred
+    
+    @traced(STAGE_FILTER, "筛选条件")
     def apply_screener_logic(self, df: pd.DataFrame, screener_type: str) -> pd.DataFrame:
         """应用筛选器逻辑"""
         
@@ -109,39 +196,12 @@ class SmartStockScreener:
             return df  # 如果没有对应逻辑，返回原数据
         
         logic = self.screener_logic[screener_type]
-        filtered_df = df.copy()
-        
-        # 1. 应用数值筛选条件
-        for field, condition in logic["filters"].items():
-            if field in filtered_df.columns:
-                if isinstance(condition, tuple) and len(condition) == 2:
-                    min_val, max_val = condition
-                    filtered_df = filtered_df[
-                        (filtered_df[field] >= min_val) & 
-                        (filtered_df[field] <= max_val)
-                    ]
-                elif condition == "上穿":
-                    # MA5上穿MA20的逻辑
-                    if "MA5" in filtered_df.columns and "MA20" in filtered_df.columns:
-                        filtered_df = filtered_df[filtered_df["MA5"] > filtered_df["MA20"]]
-        
-        # 2. 应用行业偏好
-        if logic["preferred_industries"]:
-            preferred_mask = filtered_df["行业"].isin(logic["preferred_industries"])
-            # 如果有偏好行业的股票，优先选择；否则保留所有
-            if preferred_mask.any():
-                filtered_df = filtered_df[preferred_mask]
-        
-        # 3. 排除特定行业
-        if logic["exclude_industries"]:
-            filtered_df = filtered_df[~filtered_df["行业"].isin(logic["exclude_industries"])]
+        filtered_df = df[self.screener_mask(df, screener_type)]
         
-        # 4. 严格筛选：不放宽条件，确保结果符合标准
-        # 注释掉放宽条件的逻辑，确保筛选结果严格符合标准
-        # if len(filtered_df) < 5:
-        #     filtered_df = self.relax_filters(df, logic)
+        # 严格筛选：不放宽条件，确保结果符合标准
+        # 结果较少时由 near_miss_analysis 单独给出“接近达标”的股票
         
-        # 5. 排序
+        # 排序
         if logic["sort_by"] in filtered_df.columns:
             filtered_df = filtered_df.sort_values(
                 logic["sort_by"], 
@@ -150,48 +210,121 @@ class SmartStockScreener:
         
         return filtered_df
     
-    def relax_filters(self, df: pd.DataFrame, logic: Dict) -> pd.DataFrame:
-        """放宽筛选条件"""
-        relaxed_df = df.copy()
-        
-        # 只应用最重要的筛选条件
-        important_filters = {}
-        
-        # 根据筛选器类型选择最重要的条件
-        if "涨跌幅" in logic["filters"]:
-            important_filters["涨跌幅"] = logic["filters"]["涨跌幅"]
-        if "ROE" in logic["filters"]:
-            important_filters["ROE"] = logic["filters"]["ROE"]
-        if "RSI" in logic["filters"]:
-            important_filters["RSI"] = logic["filters"]["RSI"]
-        
-        # 应用放宽的条件
-        for field, condition in important_filters.items():
-            if field in relaxed_df.columns and isinstance(condition, tuple):
-                min_val, max_val = condition
-                # 放宽范围20%
-                range_expand = (max_val - min_val) * 0.2
-                new_min = max(min_val - range_expand, relaxed_df[field].min())
-                new_max = min(max_val + range_expand, relaxed_df[field].max())
-                
-                relaxed_df = relaxed_df[
-                    (relaxed_df[field] >= new_min) & 
-                    (relaxed_df[field] <= new_max)
-                ]
-        
-        return relaxed_df
+    def category_mask(self, df: pd.DataFrame, field: str, values: List[str], match_all: bool = False,
+                      rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """类别条件掩码：在整张快照的类别位图上做与/或运算，再按行号取位
+
+        df 为完整快照（索引按快照指纹只建一次）；rows 为存活行号，给出时只返回这些行的结果。
+        """
+        category_index = self.fetcher.get_category_index(df)
+        if match_all:
+            bitmap = category_index.all_of(field, values)
+        else:
+            bitmap = category_index.any_of(field, values)
+        hits = bitmap.to_mask()
+        return hits if rows is None else hits[rows]
     
-    def get_screened_stocks(self, screener_type: str, num_stocks: int = 30, use_real_data: bool = True) -> pd.DataFrame:
-        """获取筛选后的股票数据"""
+    def apply_category_filters(self, df: pd.DataFrame,
+                               include: Optional[Dict[str, List[str]]] = None,
+                               exclude: Optional[Dict[str, List[str]]] = None,
+                               require_all: Optional[Dict[str, List[str]]] = None) -> pd.DataFrame:
+        """按行业/概念/板块/指数成分筛选
+        
+        include: 字段内取值为或，字段之间为与，例如 {"板块": ["创业板", "科创板"]}
+        exclude: 属于任一取值即排除
+        require_all: 字段内取值为与，例如 {"概念": ["锂电池", "储能"]}
+        """
+        if df.empty:
+            return df
+        
+        mask = np.ones(len(df), dtype=bool)
+        for field, values in (include or {}).items():
+            if values:
+                mask &= self.category_mask(df, field, values)
+        for field, values in (require_all or {}).items():
+            if values:
+                mask &= self.category_mask(df, field, values, match_all=True)
+        for field, values in (exclude or {}).items():
+            if values:
+                mask &= ~self.category_mask(df, field, values)
+        
+        return df[mask]
+    
+    @traced(STAGE_FILTER, "接近达标分析")
+    def near_miss_analysis(self, df: pd.DataFrame, screener_type: str,
+                           top_n: int = 10, max_failed: int = 1) -> pd.DataFrame:
+        """接近达标分析（替代原先放宽条件重新筛选的做法）
+        
+        一次数组运算算出每只股票到每个条件的归一化距离：区间条件为超出区间的部分 / 区间宽度，
+        均线上穿条件为 MA5 低于 MA20 的幅度 / MA20（与筛选一样，只在快照有该字段时生效）。
+        按未达标条件数和总偏离度排序，并给出阻碍每只股票入选的主要条件。排除行业仍然是硬性条件。
+        """
+        
+        if df.empty or screener_type not in self.screener_logic:
+            return pd.DataFrame()
+        
+        logic = self.screener_logic[screener_type]
+        distances, labels = [], []
+        for field, condition in logic["filters"].items():
+            if isinstance(condition, tuple) and len(condition) == 2 and field in df.columns:
+                values = df[field].to_numpy(dtype=np.float64)
+                low, high = condition
+                width = high - low if high > low else 1.0
+                # 归一化距离：区间内为0
+                distances.append(np.maximum(np.maximum(low - values, values - high), 0) / width)
+                labels.append(lambda r, field=field, values=values, low=low, high=high:
+                              f"{field}={values[r]:.2f} (要求{low:g}~{high:g})")
+            elif condition == "上穿" and MovingAverageCrossPredicate(field).available(df):
+                ma5 = df["MA5"].to_numpy(dtype=np.float64)
+                ma20 = df["MA20"].to_numpy(dtype=np.float64)
+                # 未上穿（MA5 <= MA20）时距离至少为一个极小正数，恰好相等也算未达标
+                gap = np.maximum((ma20 - ma5) / np.abs(ma20), 1e-9)
+                distances.append(np.where(ma5 > ma20, 0.0, gap))
+                labels.append(lambda r, field=field, ma5=ma5, ma20=ma20:
+                              f"{field}: MA5={ma5[r]:.2f} 未上穿 MA20={ma20[r]:.2f}")
+        if not distances:
+            return pd.DataFrame()
+        
+        # 缺失值视为无穷远
+        distance = np.column_stack(distances)
+        distance = np.where(np.isnan(distance), np.inf, distance)
+        
+        failed = (distance > 0).sum(axis=1)
+        total = distance.sum(axis=1)
+        blocking = distance.argmax(axis=1)
+        
+        candidates = (failed >= 1) & (failed <= max_failed) & np.isfinite(total)
+        if logic["exclude_industries"]:
+            candidates &= ~self.category_mask(df, "行业", logic["exclude_industries"])
+        
+        rows = np.flatnonzero(candidates)
+        if len(rows) == 0:
+            return pd.DataFrame()
+        rows = rows[np.lexsort((total[rows], failed[rows]))][:top_n]
+        
+        result = df.iloc[rows].copy()
+        result["未达标条件数"] = failed[rows]
+        result["偏离度"] = np.round(total[rows] * 100, 1)
+        result["阻碍条件"] = [labels[b](r) for r, b in zip(rows, blocking[rows])]
+        return result
+    
+    @cached(ttl=300)
+    def screen_with_near_misses(self, screener_type: str, num_stocks: int = 30,
+                                use_real_data: bool = True) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """在同一份基础数据上筛选并分析接近达标的股票，返回 (筛选结果, 接近达标)
+
+        两者来自同一次数据获取，经统一缓存后多副本共享。
+        """
         
         # 1. 获取基础股票数据
         base_data = self.fetcher.get_china_a_stock_data(
             num_stocks=min(num_stocks * 3, 50),  # 获取更多数据用于筛选
-            use_real_data=use_real_data
+            use_real_data=use_real_data,
+            columns=self.required_columns(screener_type)  # 只计算本筛选器用到的派生列
         )
         
         if base_data.empty:
-            return base_data
+            return base_data, pd.DataFrame()
         
         # 2. 应用筛选逻辑
         screened_data = self.apply_screener_logic(base_data, screener_type)
@@ -208,10 +341,31 @@ class SmartStockScreener:
         screened_data = screened_data.copy()
         screened_data["数据源"] = f"A股{self.screener_logic.get(screener_type, {}).get('name', '筛选器')}"
         
-        return screened_data
+        # 6. 同一份基础数据上的接近达标分析
+        near_misses = self.near_miss_analysis(base_data, screener_type, top_n=NEAR_MISS_LIMIT)
+        
+        return screened_data, near_misses
+    
+    def get_screened_stocks(self, screener_type: str, num_stocks: int = 30, use_real_data: bool = True) -> pd.DataFrame:
+        """获取筛选后的股票数据"""
+        return self.screen_with_near_misses(screener_type, num_stocks, use_real_data)[0]
+
+    def get_near_miss_stocks(self, screener_type: str, num_stocks: int = 30, use_real_data: bool = True,
+                             top_n: int = NEAR_MISS_LIMIT) -> pd.DataFrame:
+        """获取接近达标的股票
+
+        num_stocks 与 get_screened_stocks 的含义相同，参数一致时两者来自同一份基础数据（同一缓存项）。
+        """
+        return self.screen_with_near_misses(screener_type, num_stocks, use_real_data)[1].head(top_n)
 
 # 主要接口函数
 def get_smart_screened_stocks(screener_type: str, num_stocks: int = 30, use_real_data: bool = True) -> pd.DataFrame:
     """智能筛选股票的主要接口"""
     screener = SmartStockScreener()
     return screener.get_screened_stocks(screener_type, num_stocks, use_real_data)
+
+def get_near_miss_stocks(screener_type: str, num_stocks: int = 30, use_real_data: bool = True,
+                         top_n: int = NEAR_MISS_LIMIT) -> pd.DataFrame:
+    """接近达标股票的主要接口（num_stocks 与筛选时相同，复用同一份基础数据）"""
+    screener = SmartStockScreener()
+    return screener.get_near_miss_stocks(screener_type, num_stocks, use_real_data, top_n)
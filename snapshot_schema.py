@@ -0,0 +1,105 @@
+"""
+快照列类型规范
+行情快照在入库时统一转换一次列类型：低基数字符串用 category，比率和百分比用 float32，
+成交量用 int64，日期用 datetime64；更新时间作为快照级属性保存在 df.attrs 中，不再逐行存储。
+"""
+
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from typing import Dict, List, Optional
+
+# 低基数字符串列
+CATEGORY_COLUMNS = ["行业", "概念", "板块", "数据源", "MACD信号"]
+
+# 比率、百分比与指标（float32 精度足够）
+FLOAT32_COLUMNS = [
+    "涨跌幅", "振幅", "换手率", "市盈率", "市净率", "PE", "PB", "市销率", "股息率",
+    "ROE", "ROA", "净利润增长", "营收增长", "净利润增长率", "营收增长率",
+    "毛利率", "净利率", "资产负债率",
+    "RSI", "MACD", "KDJ_K", "成交量比", "量比", "综合评分"
+]
+
+# 价格与金额（保留 float64）
+FLOAT64_COLUMNS = [
+    "最新价", "涨跌额", "最高价", "最低价", "开盘价", "昨收价", "成交额",
+    "总市值", "流通市值", "市值", "布林上轨", "布林下轨", "MA5", "MA10", "MA20",
+    "每股收益", "每股净资产"
+]
+
+# 整数列（缺失按0处理）
+INT64_COLUMNS = ["成交量"]
+
+# 日期列
+DATETIME_COLUMNS = ["上市日期"]
+
+# 快照级更新时间在 df.attrs 中的键
+TIMESTAMP_ATTR = "更新时间"
+
+SNAPSHOT_SCHEMA: Dict[str, str] = {
+    **{col: "category" for col in CATEGORY_COLUMNS},
+    **{col: "float32" for col in FLOAT32_COLUMNS},
+    **{col: "float64" for col in FLOAT64_COLUMNS},
+    **{col: "int64" for col in INT64_COLUMNS},
+    **{col: "datetime64" for col in DATETIME_COLUMNS},
+}
+
+
+def coerce_column(name: str, values):
+    """按规范转换一列，返回不带索引的数组（不在规范中的列原样返回）"""
+    kind = SNAPSHOT_SCHEMA.get(name)
+    if kind is None:
+        return values
+    if kind == "category":
+        return pd.Categorical(values)
+    if kind == "datetime64":
+        return np.asarray(pd.to_datetime(values, errors="coerce"))
+
+    array = np.asarray(values)
+    if kind == "int64":
+        if np.issubdtype(array.dtype, np.integer):
+            return array.astype(np.int64, copy=False)
+        numeric = np.asarray(pd.to_numeric(array, errors="coerce"), dtype=np.float64)
+        return np.nan_to_num(numeric, nan=0).astype(np.int64)
+    if not np.issubdtype(array.dtype, np.number):
+        array = pd.to_numeric(array, errors="coerce")
+    return np.asarray(array, dtype=np.float32 if kind == "float32" else np.float64)
+
+
+def enforce_snapshot_schema(df: pd.DataFrame, timestamp: Optional[datetime] = None) -> pd.DataFrame:
+    """入库时统一转换快照列类型
+
+    逐行的“更新时间”字符串被移除，改为快照级的 df.attrs["更新时间"]。
+    """
+    df = df.drop(columns=[TIMESTAMP_ATTR], errors="ignore")
+    for col in df.columns:
+        if col in SNAPSHOT_SCHEMA:
+            df[col] = coerce_column(col, df[col])
+    df.attrs[TIMESTAMP_ATTR] = pd.Timestamp(timestamp or datetime.now())
+    return df
+
+
+def snapshot_timestamp(df: pd.DataFrame) -> Optional[pd.Timestamp]:
+    """快照更新时间"""
+    return df.attrs.get(TIMESTAMP_ATTR)
+
+
+# 主要接口函数
+def snapshot_memory_usage(df: pd.DataFrame) -> int:
+    """快照实际占用内存（字节，含字符串对象）"""
+    return int(df.memory_usage(deep=True).sum())
+
+
+def nonconforming_columns(df: pd.DataFrame) -> List[str]:
+    """类型不符合规范的列"""
+    result = []
+    for col, kind in SNAPSHOT_SCHEMA.items():
+        if col not in df.columns:
+            continue
+        dtype = df[col].dtype
+        if kind == "datetime64":
+            if not pd.api.types.is_datetime64_any_dtype(dtype):
+                result.append(col)
+        elif str(dtype) != kind:
+            result.append(col)
+    return result
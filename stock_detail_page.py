@@ -10,9 +10,14 @@ import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime, timedelta
 import logging
+import zlib
 
 # 导入数据获取器
 from real_data_fetcher import get_real_data_fetcher
+from synthetic_market import SyntheticMarket
+
+# 导入会话内存记账（读取可能已溢出到磁盘的会话值）
+from session_memory import session_value
 
 # 设置日志
 logging.basicConfig(level=logging.INFO)
@@ -234,7 +239,8 @@ class StockDetailPage:
                 self._run_multi_ai_analysis()
         
         # 显示分析结果（如果有）
-        if 'ai_analysis_results' in st.session_state and st.session_state.ai_analysis_results:
+        # 经 session_value 读取：已溢出的结果加载回来，并刷新访问时间
+        if session_value('ai_analysis_results'):
             self._display_analysis_results()
     
     def _get_stock_basic_data(self) -> dict:
@@ -275,43 +281,11 @@ class StockDetailPage:
         }
     
     def _generate_mock_price_data(self) -> pd.DataFrame:
-        """生成模拟价格数据"""
-        
-        np.random.seed(hash(self.stock_code) % 2**32)
-        
-        # 生成30天的数据
-        dates = pd.date_range(end=datetime.now(), periods=30, freq='D')
+        """生成模拟价格数据（最近30个交易日，按股票代码确定性生成）"""
         
-        # 生成价格数据
-        base_price = np.random.uniform(20, 100)
-        prices = []
-        
-        for i in range(30):
-            if i == 0:
-                price = base_price
-            else:
-                change = np.random.uniform(-0.05, 0.05)  # 日变化-5%到+5%
-                price = prices[-1] * (1 + change)
-            prices.append(price)
-        
-        data = []
-        for i, date in enumerate(dates):
-            open_price = prices[i]
-            close_price = prices[i] * np.random.uniform(0.98, 1.02)
-            high_price = max(open_price, close_price) * np.random.uniform(1.0, 1.03)
-            low_price = min(open_price, close_price) * np.random.uniform(0.97, 1.0)
-            volume = int(np.random.uniform(1000000, 50000000))
-            
-            data.append({
-                '日期': date,
-                '开盘价': round(open_price, 2),
-                '最高价': round(high_price, 2),
-                '最低价': round(low_price, 2),
-                '收盘价': round(close_price, 2),
-                '成交量': volume
-            })
-        
-        return pd.DataFrame(data)
+        symbols = pd.DataFrame({"股票代码": [self.stock_code], "股票名称": [self.stock_name]})
+        market = SyntheticMarket(symbols=symbols, n_days=30, seed=zlib.crc32(self.stock_code.encode()))
+        return market.history(0)[['日期', '开盘价', '最高价', '最低价', '收盘价', '成交量']]
     
     def _generate_mock_financial_data(self) -> dict:
         """生成模拟财务数据"""
@@ -395,7 +369,7 @@ class StockDetailPage:
         
         st.markdown("### 📊 AI分析结果")
         
-        results = st.session_state.ai_analysis_results
+        results = session_value('ai_analysis_results')
         
         # 创建四个标签页
         tab1, tab2, tab3, tab4 = st.tabs(["🔍 基本面", "📈 技术面", "📰 市场情绪", "⚠️ 风险评估"])
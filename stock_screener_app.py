@@ -9,6 +9,7 @@ import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime, timedelta
+from typing import Callable, Optional
 import logging
 import time
 
@@ -18,6 +19,49 @@ from real_data_fetcher import get_real_data_fetcher
 # 导入个股详情页面
 from stock_detail_page import show_stock_detail
 
+# 导入筛选区间索引
+from screener_index import build_range_index
+
+# 导入筛选器组合运算
+from screener_algebra import build_screener_membership
+
+# 导入全市场快照与自定义筛选条件
+from market_snapshots import (CUSTOM_SNAPSHOT_NAME, CUSTOM_UNIVERSE_LIMIT, SNAPSHOT_MAX_AGE, UNIVERSE_SNAPSHOT_NAME,
+                              criteria_to_ranges, fetch_a_share_universe, filter_custom_criteria)
+
+# 导入主机级共享快照
+from shared_snapshot import SharedSnapshotStore, get_shared_snapshot
+
+# 导入分区筛选（预设筛选器在共享快照上执行）
+from parallel_screen import merge_results, screen_frame
+
+# 导入流式筛选
+from streaming_screen import iter_frame_chunks, number_chunks, stream_screen
+
+# 导入统一缓存
+from cache_backend import get_cache
+
+# 导入后台筛选任务
+from job_runner import get_job_runner, reporting
+
+# 导入合成行情生成器（备用模拟数据）
+from synthetic_market import SyntheticMarket
+
+# 导入运行指标
+from metrics import start_metrics_server
+
+# 导入共享快照上的结果视图
+from result_views import ViewExpired, resolve_results, view_by_code, view_of
+
+# 导入会话内存记账
+from session_memory import account_session_memory, current_session_id, get_session_accountant, session_value
+
+# 导入按需性能剖析
+from profiling import MODES, get_profiler, profile_run
+
+# 导入阶段耗时追踪
+from tracing import STAGE_FILTER, STAGE_LABELS, STAGE_RENDER, current_span, get_tracer, span, traced
+
 # 设置页面配置
 st.set_page_config(
     page_title="A股智能筛选器",
@@ -30,6 +74,9 @@ st.set_page_config(
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 页面进程旁的 Prometheus 指标服务（STOCK_METRICS_PORT，进程内只启动一次）
+start_metrics_server()
+
 # 筛选器配置
 SCREENER_CONFIGS = {
     "momentum_breakout": {
@@ -70,6 +117,25 @@ SCREENER_CONFIGS = {
     }
 }
 
+# 筛选结果少于该数量时显示接近达标的股票
+NEAR_MISS_THRESHOLD = 5
+
+# 预设筛选保留的结果数
+PRESET_RESULT_LIMIT = 30
+
+# 自定义筛选流式处理的块大小与保留的前K名
+STREAM_CHUNK_SIZE = 100
+CUSTOM_RESULT_LIMIT = 30
+
+# 预设筛选条件（apply_screener_filter）用到的技术指标，其余指标不计算
+PRESET_INDICATOR_COLUMNS = ["RSI", "量比", "综合评分"]
+
+# 后台筛选任务的进度刷新间隔（秒）
+JOB_POLL_INTERVAL = 0.5
+
+# 性能面板瀑布图中各阶段的颜色
+STAGE_COLORS = dict(zip(STAGE_LABELS.values(), ["#FF6B6B", "#F7DC6F", "#4ECDC4", "#45B7D1", "#BB8FCE", "#96CEB4"]))
+
 # 导入优化的数据获取器
 try:
     from optimized_data_fetcher import get_optimized_stock_data
@@ -100,89 +166,97 @@ except ImportError:
 
 # 导入智能股票筛选器（最优）
 try:
-    from smart_stock_screener import get_smart_screened_stocks
+    from smart_stock_screener import SmartStockScreener, get_smart_screened_stocks, get_near_miss_stocks
     USE_SMART_SCREENER = True
 except ImportError:
     USE_SMART_SCREENER = False
 
-def get_real_stock_data(screener_type: str = "default", use_real_data: bool = True) -> pd.DataFrame:
-    """获取真实股票数据 - 多API集成版本"""
+def streamlit_report(level: str, message: str):
+    """在页面上显示数据获取过程信息（level: info/success/warning/error）"""
+    getattr(st, level)(message)
+
+@traced(name="获取股票数据")
+def get_real_stock_data(screener_type: str = "default", use_real_data: bool = True,
+                        report: Optional[Callable[[str, str], None]] = None) -> pd.DataFrame:
+    """获取真实股票数据 - 多API集成版本
+
+    过程信息通过 report(level, message) 上报；后台任务传入自己的上报函数，不直接操作页面。
+    """
 
-    # 显示调试信息
-    st.info(f"🔍 调试信息: screener_type={screener_type}, use_real_data={use_real_data}, USE_SMART_SCREENER={USE_SMART_SCREENER}")
+    report = report or streamlit_report
+
+    # 调用参数与最终数据源记录在追踪中（侧边栏性能面板可查看）
+    data_span = current_span()
+    data_span.set(screener_type=screener_type, use_real_data=use_real_data, smart_screener=USE_SMART_SCREENER)
 
     # 如果需要实时数据
     if use_real_data:
         # 1. 优先使用智能筛选器（根据筛选器类型返回不同结果）
         if USE_SMART_SCREENER:
             try:
-                st.info(f"🧠 正在使用智能筛选器: {SCREENER_CONFIGS.get(screener_type, {}).get('name', screener_type)}")
+                report("info", f"🧠 正在使用智能筛选器: {SCREENER_CONFIGS.get(screener_type, {}).get('name', screener_type)}")
                 smart_data = get_smart_screened_stocks(screener_type, num_stocks=30, use_real_data=True)
                 if not smart_data.empty:
-                    st.success(f"✅ 智能筛选成功: {len(smart_data)} 只股票")
-                    st.session_state['data_source'] = f"智能A股筛选器-{screener_type}"
-                    st.session_state['update_time'] = datetime.now().strftime("%H:%M:%S")
+                    report("success", f"✅ 智能筛选成功: {len(smart_data)} 只股票")
+                    data_span.set(provider="smart", rows=len(smart_data))
                     return smart_data
                 else:
-                    st.warning("⚠️ 智能筛选返回空数据，尝试基础方法...")
+                    report("warning", "⚠️ 智能筛选返回空数据，尝试基础方法...")
             except Exception as e:
-                st.warning(f"⚠️ 智能筛选失败: {e}")
+                report("warning", f"⚠️ 智能筛选失败: {e}")
 
         # 2. 备用：使用中国A股数据获取器（不区分筛选器类型）
         if USE_CHINA_A_STOCK:
             try:
-                st.info("🇨🇳 正在使用基础A股数据获取器...")
+                report("info", "🇨🇳 正在使用基础A股数据获取器...")
                 china_data = get_china_a_stock_data(num_stocks=30, use_real_data=True)
                 if not china_data.empty:
-                    st.success(f"✅ A股数据获取成功: {len(china_data)} 只股票")
-                    st.session_state['data_source'] = "中国A股实时数据"
-                    st.session_state['update_time'] = datetime.now().strftime("%H:%M:%S")
+                    report("success", f"✅ A股数据获取成功: {len(china_data)} 只股票")
+                    data_span.set(provider="china_a", rows=len(china_data))
                     return china_data
                 else:
-                    st.warning("⚠️ A股数据获取返回空数据，尝试其他方法...")
+                    report("warning", "⚠️ A股数据获取返回空数据，尝试其他方法...")
             except Exception as e:
-                st.warning(f"⚠️ A股数据获取失败: {e}")
+                report("warning", f"⚠️ A股数据获取失败: {e}")
 
         # 2. 备用：使用多API实时数据获取器（美股）
         if USE_REAL_TIME_API:
             try:
-                st.info("🌐 正在使用多API实时数据获取器（美股）...")
+                report("info", "🌐 正在使用多API实时数据获取器（美股）...")
                 real_data = get_real_time_data(num_stocks=30)
                 if not real_data.empty:
-                    st.success(f"✅ 美股数据获取成功: {len(real_data)} 只股票")
-                    st.session_state['data_source'] = "美股实时数据"
-                    st.session_state['update_time'] = datetime.now().strftime("%H:%M:%S")
+                    report("success", f"✅ 美股数据获取成功: {len(real_data)} 只股票")
+                    data_span.set(provider="real_time_api", rows=len(real_data))
                     return real_data
                 else:
-                    st.warning("⚠️ 美股数据返回空数据，尝试简化方法...")
+                    report("warning", "⚠️ 美股数据返回空数据，尝试简化方法...")
             except Exception as e:
-                st.warning(f"⚠️ 美股数据获取失败: {e}")
+                report("warning", f"⚠️ 美股数据获取失败: {e}")
 
         # 3. 最后备用：使用简化的实时数据获取器
         if USE_SIMPLE_REAL_DATA:
             try:
-                st.info("📡 正在使用简化实时数据获取器...")
+                report("info", "📡 正在使用简化实时数据获取器...")
                 simple_data = get_simple_real_data(num_stocks=30)
                 if not simple_data.empty:
-                    st.success(f"✅ 简化方法获取成功: {len(simple_data)} 只股票")
-                    st.session_state['data_source'] = "Yahoo Finance实时数据"
-                    st.session_state['update_time'] = datetime.now().strftime("%H:%M:%S")
+                    report("success", f"✅ 简化方法获取成功: {len(simple_data)} 只股票")
+                    data_span.set(provider="simple", rows=len(simple_data))
                     return simple_data
                 else:
-                    st.warning("⚠️ 简化方法也返回空数据")
+                    report("warning", "⚠️ 简化方法也返回空数据")
             except Exception as e:
-                st.error(f"❌ 简化实时数据获取失败: {e}")
+                report("error", f"❌ 简化实时数据获取失败: {e}")
 
         # 5. 如果都失败了，显示错误信息
         if not USE_SMART_SCREENER and not USE_CHINA_A_STOCK and not USE_REAL_TIME_API and not USE_SIMPLE_REAL_DATA:
-            st.error("❌ 所有实时数据获取器都未加载，请检查文件")
+            report("error", "❌ 所有实时数据获取器都未加载，请检查文件")
 
     # 使用优化的数据获取器（如果可用）
     if USE_OPTIMIZED_FETCHER:
         try:
             return get_optimized_stock_data(screener_type, use_real_data, num_stocks=50)
         except Exception as e:
-            st.warning(f"⚠️ 优化数据获取器失败: {e}")
+            report("warning", f"⚠️ 优化数据获取器失败: {e}")
 
     # 回退到原始方法
     if not use_real_data:
@@ -196,11 +270,11 @@ def get_real_stock_data(screener_type: str = "default", use_real_data: bool = Tr
         df = data_fetcher.get_stock_realtime_data(limit=200)
 
         if df.empty:
-            st.warning("⚠️ 无法获取实时数据，使用模拟数据")
+            report("warning", "⚠️ 无法获取实时数据，使用模拟数据")
             return generate_mock_stock_data(screener_type)
 
-        # 计算技术指标
-        df = data_fetcher.calculate_technical_indicators(df)
+        # 计算技术指标（只算筛选和排序用到的）
+        df = data_fetcher.calculate_technical_indicators(df, PRESET_INDICATOR_COLUMNS)
 
         # 根据筛选器类型过滤数据
         df = apply_screener_filter(df, screener_type)
@@ -209,10 +283,11 @@ def get_real_stock_data(screener_type: str = "default", use_real_data: bool = Tr
 
     except Exception as e:
         logger.error(f"❌ 获取真实数据失败: {e}")
-        st.error(f"获取真实数据失败: {e}")
-        st.info("🔄 正在使用模拟数据...")
+        report("error", f"获取真实数据失败: {e}")
+        report("info", "🔄 正在使用模拟数据...")
         return generate_mock_stock_data(screener_type)
 
+@traced(STAGE_FILTER, "预设筛选条件")
 def apply_screener_filter(df: pd.DataFrame, screener_type: str) -> pd.DataFrame:
     """根据筛选器类型应用过滤条件"""
 
@@ -285,65 +360,57 @@ def apply_screener_filter(df: pd.DataFrame, screener_type: str) -> pd.DataFrame:
 def generate_mock_stock_data(screener_type: str = "default") -> pd.DataFrame:
     """生成模拟股票数据（备用方案）"""
 
-    np.random.seed(42)  # 确保结果可重现
+    rng = np.random.default_rng(42)  # 确保结果可重现
 
     # A股股票池
     stock_pool = [
-        ("000001", "平安银行"), ("000002", "万科A"), ("000858", "五粮液"),
-        ("000876", "新希望"), ("002415", "海康威视"), ("002594", "比亚迪"),
-        ("600036", "招商银行"), ("600519", "贵州茅台"), ("600887", "伊利股份"),
-        ("601318", "中国平安"), ("601398", "工商银行"), ("601857", "中国石油"),
-        ("000063", "中兴通讯"), ("000725", "京东方A"), ("002230", "科大讯飞"),
-        ("300059", "东方财富"), ("300750", "宁德时代"), ("688981", "中芯国际")
+        ("000001", "平安银行", "银行"), ("000002", "万科A", "地产"), ("000858", "五粮液", "白酒"),
+        ("000876", "新希望", "消费"), ("002415", "海康威视", "科技"), ("002594", "比亚迪", "新能源"),
+        ("600036", "招商银行", "银行"), ("600519", "贵州茅台", "白酒"), ("600887", "伊利股份", "消费"),
+        ("601318", "中国平安", "银行"), ("601398", "工商银行", "银行"), ("601857", "中国石油", "其他"),
+        ("000063", "中兴通讯", "科技"), ("000725", "京东方A", "科技"), ("002230", "科大讯飞", "科技"),
+        ("300059", "东方财富", "券商"), ("300750", "宁德时代", "新能源"), ("688981", "中芯国际", "科技")
     ]
 
     # 根据筛选器类型调整参数
     if screener_type == "momentum_breakout":
-        n_stocks = np.random.randint(8, 15)
+        n_stocks = rng.integers(8, 15)
         price_change_range = (2, 15)
-        rsi_range = (50, 80)
     elif screener_type == "value_growth":
-        n_stocks = np.random.randint(6, 12)
+        n_stocks = rng.integers(6, 12)
         price_change_range = (-2, 8)
-        rsi_range = (40, 70)
     elif screener_type == "dividend_stable":
-        n_stocks = np.random.randint(5, 10)
+        n_stocks = rng.integers(5, 10)
         price_change_range = (-1, 5)
-        rsi_range = (45, 65)
     else:
-        n_stocks = np.random.randint(8, 16)
+        n_stocks = rng.integers(8, 16)
         price_change_range = (-5, 12)
-        rsi_range = (25, 75)
-
-    # 随机选择股票
-    selected_stocks = np.random.choice(len(stock_pool), n_stocks, replace=False)
-
-    results = []
-    for i in selected_stocks:
-        code, name = stock_pool[i]
-
-        stock_data = {
-            "股票代码": code,
-            "股票名称": name,
-            "最新价": round(np.random.uniform(15, 200), 2),
-            "涨跌幅": round(np.random.uniform(price_change_range[0], price_change_range[1]), 2),
-            "成交量": int(np.random.uniform(1000000, 50000000)),
-            "成交额": round(np.random.uniform(5, 500), 2),
-            "市值": round(np.random.uniform(100, 8000), 2),
-            "PE": round(np.random.uniform(8, 45), 2),
-            "PB": round(np.random.uniform(0.8, 6), 2),
-            "ROE": round(np.random.uniform(5, 30), 2),
-            "ROA": round(np.random.uniform(2, 15), 2),
-            "RSI": round(np.random.uniform(rsi_range[0], rsi_range[1]), 1),
-            "MACD": round(np.random.uniform(-2, 3), 3),
-            "KDJ_K": round(np.random.uniform(20, 90), 1),
-            "换手率": round(np.random.uniform(0.5, 15), 2),
-            "量比": round(np.random.uniform(0.5, 5), 2),
-            "综合评分": round(np.random.uniform(60, 95), 1)
-        }
-        results.append(stock_data)
 
-    df = pd.DataFrame(results)
+    # 随机选择股票，行情、基本面与技术指标由合成市场整批生成
+    selected = [stock_pool[i] for i in rng.choice(len(stock_pool), n_stocks, replace=False)]
+    symbols = pd.DataFrame(selected, columns=["股票代码", "股票名称", "行业"])
+    snapshot = SyntheticMarket(symbols=symbols, n_days=60, seed=42,
+                               final_change_range=price_change_range).spot_snapshot()
+
+    df = pd.DataFrame({
+        "股票代码": snapshot["股票代码"],
+        "股票名称": snapshot["股票名称"],
+        "最新价": snapshot["最新价"],
+        "涨跌幅": snapshot["涨跌幅"],
+        "成交量": snapshot["成交量"],
+        "成交额": (snapshot["成交额"] / 1e8).round(2),
+        "市值": (snapshot["总市值"] / 1e8).round(2),
+        "PE": snapshot["市盈率"],
+        "PB": snapshot["市净率"],
+        "ROE": snapshot["ROE"],
+        "ROA": (snapshot["ROE"] * (1 - snapshot["资产负债率"] / 100)).round(2),
+        "RSI": snapshot["RSI"].round(1),
+        "MACD": snapshot["MACD"],
+        "KDJ_K": snapshot["KDJ_K"].round(1),
+        "换手率": snapshot["换手率"],
+        "量比": snapshot["量比"],
+        "综合评分": np.round(rng.uniform(60, 95, len(snapshot)), 1)
+    })
     return df.sort_values("综合评分", ascending=False)
 
 def render_header():
@@ -380,6 +447,16 @@ def render_preset_screeners():
     
     st.header("🎯 预设筛选策略")
     st.markdown("选择适合您投资风格的预设筛选器，一键筛选优质股票")
+
+    # 数据源选择 - 默认使用真实数据
+    data_source_option = st.sidebar.selectbox(
+        "📊 数据源选择",
+        ["🌐 实时股票数据", "⚡ 快速模拟数据"],
+        index=0,
+        key="preset_data_source",
+        help="实时股票数据：获取真实市场数据\n快速模拟数据：立即显示模拟结果"
+    )
+    use_real = (data_source_option == "🌐 实时股票数据")
     
     # 创建两列布局
     col1, col2 = st.columns(2)
@@ -410,7 +487,74 @@ def render_preset_screeners():
                 """, unsafe_allow_html=True)
                 
                 if st.button(f"🚀 启动筛选", key=f"btn_{key}", use_container_width=True):
-                    run_screener(key, config)
+                    run_screener(key, config, use_real)
+
+    # 显示后台筛选任务的进度或结果
+    render_active_job("preset")
+
+@st.cache_resource(ttl=300, show_spinner=False)
+def get_screener_membership():
+    """获取组合筛选使用的全市场快照及筛选器成员位图缓存（5分钟缓存）"""
+
+    # 同一主机上的各进程共用一份快照，只有一个进程负责拉取
+    snapshot = get_shared_snapshot(UNIVERSE_SNAPSHOT_NAME, fetch_a_share_universe, max_age=SNAPSHOT_MAX_AGE)
+    return build_screener_membership(snapshot)
+
+def render_composite_screener():
+    """渲染组合筛选器（AND / OR / NOT）与筛选器重叠矩阵"""
+
+    st.header("🧮 组合筛选")
+    st.markdown("对多个筛选器做交集、并集和排除，例如 `value_growth AND technical_strong AND NOT oversold_rebound`")
+
+    try:
+        membership = get_screener_membership()
+    except Exception as e:
+        st.error(f"❌ 快照获取失败: {e}")
+        return
+
+    names = membership.names()
+    label_of = {name: membership.display_name(name) for name in names}
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        all_of = st.multiselect("同时满足 (AND)", names, format_func=label_of.get, key="composite_and")
+    with col2:
+        any_of = st.multiselect("满足任一 (OR)", names, format_func=label_of.get, key="composite_or")
+    with col3:
+        none_of = st.multiselect("排除 (NOT)", names, format_func=label_of.get, key="composite_not")
+
+    parts = []
+    if all_of:
+        parts.append(" AND ".join(all_of))
+    if any_of:
+        parts.append("(" + " OR ".join(any_of) + ")")
+    if none_of:
+        parts.append(" AND ".join(f"NOT {name}" for name in none_of))
+
+    expression = st.text_input("表达式 (可直接编辑)", value=" AND ".join(parts), key="composite_expression")
+
+    if expression.strip():
+        try:
+            results = membership.select(expression)
+        except ValueError as e:
+            st.warning(f"⚠️ 表达式错误: {e}")
+        else:
+            st.success(f"✅ 组合筛选命中 {len(results)} / {membership.size} 只股票")
+            if not results.empty:
+                display_cols = [c for c in ['股票代码', '股票名称', '最新价', '涨跌幅', '行业', '综合评分'] if c in results.columns]
+                st.dataframe(results[display_cols], use_container_width=True, hide_index=True)
+
+    st.subheader("🔀 筛选器重叠矩阵")
+    normalize = st.checkbox("显示 Jaccard 相似度", value=False, key="composite_normalize")
+    matrix = membership.overlap_matrix(normalize=normalize)
+    fig = px.imshow(
+        matrix,
+        text_auto=".2f" if normalize else True,
+        color_continuous_scale="Blues",
+        aspect="auto"
+    )
+    fig.update_layout(height=600)
+    st.plotly_chart(fig, use_container_width=True)
 
 def render_custom_screener():
     """渲染自定义筛选器"""
@@ -418,7 +562,8 @@ def render_custom_screener():
     st.header("⚙️ 自定义筛选条件")
     st.markdown("根据您的具体需求设置个性化筛选条件")
     
-    with st.form("custom_screener_form"):
+    # 不使用表单，滑块变化即可刷新侧边栏的实时匹配数
+    with st.container():
         # 基本面指标
         st.subheader("📊 基本面指标")
         col1, col2, col3 = st.columns(3)
@@ -461,172 +606,347 @@ def render_custom_screener():
         )
         
         # 提交按钮
-        submitted = st.form_submit_button("🔍 开始自定义筛选", use_container_width=True)
+        submitted = st.button("🔍 开始自定义筛选", use_container_width=True)
+
+    custom_criteria = {
+        "market_cap_range": market_cap_range,
+        "pe_range": pe_range,
+        "pb_range": pb_range,
+        "roe_min": roe_min,
+        "revenue_growth_min": revenue_growth_min,
+        "profit_growth_min": profit_growth_min,
+        "rsi_range": rsi_range,
+        "price_change_range": price_change_range,
+        "volume_ratio_min": volume_ratio_min,
+        "turnover_range": turnover_range,
+        "ma_trend": ma_trend,
+        "macd_signal": macd_signal,
+        "industries": industries
+    }
+
+    # 侧边栏实时匹配数
+    render_live_match_counts(custom_criteria)
 
-    # 在表单外处理提交
     if submitted:
-        custom_criteria = {
-            "market_cap_range": market_cap_range,
-            "pe_range": pe_range,
-            "pb_range": pb_range,
-            "roe_min": roe_min,
-            "revenue_growth_min": revenue_growth_min,
-            "profit_growth_min": profit_growth_min,
-            "rsi_range": rsi_range,
-            "price_change_range": price_change_range,
-            "volume_ratio_min": volume_ratio_min,
-            "turnover_range": turnover_range,
-            "ma_trend": ma_trend,
-            "macd_signal": macd_signal,
-            "industries": industries
-        }
         run_custom_screener(custom_criteria)
 
-def run_screener(screener_key: str, config: dict):
-    """运行预设筛选器"""
+    # 显示后台筛选任务的进度或结果
+    render_active_job("custom")
 
-    with st.spinner(f"正在运行 {config['name']}..."):
-        # 显示进度
-        progress_bar = st.progress(0)
-        status_text = st.empty()
+def render_live_match_counts(criteria: dict):
+    """在侧边栏显示当前条件在全市场快照上的实时匹配数
 
-        # 步骤1: 获取股票数据（优化版本）
-        status_text.text("📡 正在获取股票数据...")
-        progress_bar.progress(10)
+    只使用已发布的共享快照，不在页面渲染时拉取全市场行情；
+    快照由首次自定义筛选边筛选边写入。
+    """
 
-        # 添加数据获取选项 - 默认使用真实数据
-        data_source_option = st.sidebar.selectbox(
-            "📊 数据源选择",
-            ["🌐 实时股票数据", "⚡ 快速模拟数据"],
-            index=0,  # 默认选择实时数据
-            help="实时股票数据：获取真实市场数据\n快速模拟数据：立即显示模拟结果"
-        )
+    manifest = SharedSnapshotStore(CUSTOM_SNAPSHOT_NAME).manifest()
+    if manifest is None:
+        with st.sidebar:
+            st.markdown("### 🎯 实时匹配")
+            st.caption("首次筛选完成后显示全市场实时匹配数")
+            st.markdown("---")
+        return
 
-        use_real = (data_source_option == "🌐 实时股票数据")
+    try:
+        _, data_source, index = get_custom_screener_snapshot(manifest["version"])
+    except Exception as e:
+        logger.warning(f"⚠️ 实时匹配数不可用: {e}")
+        return
 
-        try:
-            # 获取数据
-            status_text.text(f"🔄 {'获取真实数据' if use_real else '生成模拟数据'}...")
-            progress_bar.progress(30)
+    ranges = criteria_to_ranges(criteria)
 
-            results = get_real_stock_data(screener_key, use_real_data=use_real)
+    with st.sidebar:
+        st.markdown("### 🎯 实时匹配")
+        st.metric("满足全部条件", f"{index.count(ranges)} / {index.size}")
+        for column, count in index.count_each(ranges).items():
+            st.caption(f"{column}: {count} 只")
+        st.caption(f"📊 {data_source} | 全市场 {index.size} 只")
+        st.markdown("---")
 
-            if results.empty:
-                status_text.text("⚠️ 数据获取失败，生成备用数据...")
-                progress_bar.progress(50)
-                results = get_real_stock_data(screener_key, use_real_data=False)
-            else:
-                progress_bar.progress(70)
-                status_text.text(f"✅ 成功获取 {len(results)} 只股票数据")
+def run_screener(screener_key: str, config: dict, use_real: bool = True):
+    """提交预设筛选后台任务（相同筛选器和数据源的任务进行中时复用）"""
 
-        except Exception as e:
-            st.error(f"❌ 数据获取错误: {e}")
-            status_text.text("🔄 使用备用数据...")
-            results = get_real_stock_data(screener_key, use_real_data=False)
-            progress_bar.progress(60)
-
-        # 步骤2: 应用筛选条件
-        status_text.text("🔍 应用筛选条件...")
-        progress_bar.progress(80)
-        time.sleep(0.5)
-
-        # 步骤3: 完成筛选
-        status_text.text("✅ 筛选完成...")
-        progress_bar.progress(100)
-        time.sleep(0.3)
-
-        # 保存到session state
-        st.session_state.screening_results = results
-        st.session_state.last_screener = config['name']
-        st.session_state.screener_type = screener_key
-        st.session_state.data_source = "实时数据" if not results.empty else "模拟数据"
-        st.session_state.update_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-        # 清除进度显示
-        progress_bar.empty()
-        status_text.empty()
-
-        if not results.empty:
-            st.success(f"✅ {config['name']} 筛选完成！找到 {len(results)} 只符合条件的股票")
-
-            # 显示数据来源信息
-            data_source = st.session_state.get('data_source', '未知')
-            update_time = st.session_state.get('update_time', '未知')
-            st.info(f"📊 数据来源: {data_source} | 更新时间: {update_time}")
-
-            # 显示结果预览
-            display_results_preview(results)
+    job = get_job_runner().submit(
+        ("preset", screener_key, use_real), preset_screen_job, screener_key, use_real, name=config['name']
+    )
+    st.session_state["active_job"] = {"kind": "preset", "job_id": job.job_id}
+
+def screen_universe_snapshot(screener_key: str) -> Optional[dict]:
+    """在A股共享快照上执行预设筛选（在后台线程执行）
+
+    结果按股票代码对应到快照行号建立视图，会话里只保存行号；快照拉取失败或为空时返回 None。
+    """
+
+    store = SharedSnapshotStore(UNIVERSE_SNAPSHOT_NAME)
+    with store.refresh_slot(SNAPSHOT_MAX_AGE) as version:
+        if version is None:
+            universe = fetch_a_share_universe()
+            if universe is None or universe.empty:
+                return None
+            version = store.publish(universe)
+    snapshot = store.attach(version)
+
+    screener = SmartStockScreener()
+    strategy = ("smart", screener_key)
+    results = merge_results([strategy], [screen_frame(snapshot, [strategy], PRESET_RESULT_LIMIT)],
+                            PRESET_RESULT_LIMIT)[strategy]["top"]
+
+    view = None
+    try:
+        view = view_by_code(results, snapshot, UNIVERSE_SNAPSHOT_NAME, version,
+                            sort_by=screener.screener_logic[screener_key]["sort_by"])
+    except ValueError as e:
+        logger.warning(f"⚠️ 无法建立结果视图，保存结果副本: {e}")
+
+    near_misses = pd.DataFrame()
+    if len(results) < NEAR_MISS_THRESHOLD:
+        near_misses = screener.near_miss_analysis(snapshot, screener_key)
+    return {"results": results, "view": view, "near_misses": near_misses}
+
+def preset_screen_job(job, screener_key: str, use_real: bool) -> dict:
+    """预设筛选任务（在后台线程执行，不访问页面和 session_state）
+
+    实时数据优先在A股共享快照上筛选，结果保存为快照视图；快照不可用时退回各数据获取器，
+    结果只能保存副本。
+    """
+
+    def report(level: str, message: str):
+        job.report(min(job.progress + 0.05, 0.6), message)
+
+    with profile_run(f"预设筛选_{screener_key}"), \
+            span(f"预设筛选:{screener_key}", screener=screener_key, use_real=use_real):
+        outcome = None
+        if use_real and USE_SMART_SCREENER:
+            job.report(0.1, "🔄 在A股共享快照上筛选...")
+            try:
+                outcome = screen_universe_snapshot(screener_key)
+            except Exception as e:
+                job.report(0.3, f"⚠️ 共享快照筛选失败: {e}，改用数据获取器...")
+
+        if outcome is not None and not outcome["results"].empty:
+            results, view, near_misses = outcome["results"], outcome["view"], outcome["near_misses"]
+            job.report(0.9, f"✅ 共享快照筛选出 {len(results)} 只股票", partial=results)
         else:
-            st.warning("😔 未找到符合条件的股票，请尝试其他筛选策略")
+            view = None
+            # 步骤1: 获取股票数据
+            job.report(0.2, f"🔄 {'获取真实数据' if use_real else '生成模拟数据'}...")
+            # 数据获取器深层的过程信息（数据源切换等）也作为任务阶段上报
+            with reporting(report):
+                try:
+                    results = get_real_stock_data(screener_key, use_real_data=use_real, report=report)
+                    if results.empty:
+                        job.report(0.5, "⚠️ 数据获取失败，生成备用数据...")
+                        results = get_real_stock_data(screener_key, use_real_data=False, report=report)
+                except Exception as e:
+                    job.report(0.6, f"❌ 数据获取错误: {e}，使用备用数据...")
+                    results = get_real_stock_data(screener_key, use_real_data=False, report=report)
+
+            job.report(0.7, f"✅ 成功获取 {len(results)} 只股票数据", partial=results)
+
+            # 步骤2: 结果较少时分析接近达标的股票
+            near_misses = pd.DataFrame()
+            if len(results) < NEAR_MISS_THRESHOLD:
+                job.report(0.8, "🔎 分析接近达标的股票...")
+                with reporting(report):
+                    near_misses = find_near_misses(screener_key, use_real)
+
+        return {
+            "results": results,
+            "view": view,
+            "near_misses": near_misses,
+            "data_source": "实时数据" if not results.empty else "模拟数据",
+            "update_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        }
+
+def find_near_misses(screener_key: str, use_real_data: bool) -> pd.DataFrame:
+    """查找仅差一个条件即可入选的股票"""
+
+    if not USE_SMART_SCREENER:
+        return pd.DataFrame()
+
+    try:
+        # 与 get_real_stock_data 中的智能筛选参数一致，直接取同一缓存项中的接近达标结果
+        return get_near_miss_stocks(screener_key, num_stocks=30, use_real_data=use_real_data)
+    except Exception as e:
+        logger.warning(f"⚠️ 接近达标分析失败: {e}")
+        return pd.DataFrame()
+
+def display_near_misses(near_misses: pd.DataFrame):
+    """显示仅差一个条件即可入选的股票"""
+
+    if near_misses is None or near_misses.empty:
+        return
+
+    with st.expander(f"🔎 接近达标的股票 ({len(near_misses)} 只，仅差一个条件)", expanded=True):
+        display_cols = [c for c in ['股票代码', '股票名称', '最新价', '涨跌幅', '行业', '阻碍条件', '偏离度']
+                        if c in near_misses.columns]
+        st.dataframe(near_misses[display_cols], use_container_width=True, hide_index=True)
+        st.caption("偏离度: 超出条件区间的幅度占区间宽度的百分比，越小越接近达标")
 
 def run_custom_screener(criteria: dict):
-    """运行自定义筛选器"""
+    """提交自定义筛选后台任务"""
 
-    with st.spinner("正在执行自定义筛选..."):
-        # 显示筛选条件
-        conditions_text = format_criteria(criteria)
-        st.info(f"📋 筛选条件: {conditions_text}")
+    key = ("custom", repr(sorted(criteria.items())))
+    job = get_job_runner().submit(key, custom_screen_job, criteria, name="自定义筛选器")
+    st.session_state["active_job"] = {"kind": "custom", "job_id": job.job_id}
 
-        # 显示进度
-        progress_bar = st.progress(0)
-        status_text = st.empty()
+def custom_screen_job(job, criteria: dict) -> dict:
+    """自定义筛选任务（在后台线程执行，不访问页面和 session_state）
 
-        # 步骤1: 获取实时数据
-        status_text.text("📡 获取A股实时数据...")
-        progress_bar.progress(30)
+    行情按批次到达，每批清洗、计算指标、筛选后更新前K名并作为中间结果上报；
+    共享快照未过期时直接分块扫描，否则持有刷新锁边拉取边写入新版本快照，
+    同时提交的其他任务等锁后直接扫描这个新版本。
+    """
 
-        try:
-            # 获取真实数据
-            data_fetcher = get_real_data_fetcher()
-            df = data_fetcher.get_stock_realtime_data(limit=300)
-
-            if df.empty:
-                status_text.text("⚠️ 使用模拟数据...")
-                df = generate_mock_stock_data("custom")
-                data_source = "模拟数据"
+    with profile_run("自定义筛选"), span("自定义筛选", screener="custom", criteria=format_criteria(criteria)):
+        job.report(0.05, f"📋 筛选条件: {format_criteria(criteria)}")
+
+        store = SharedSnapshotStore(CUSTOM_SNAPSHOT_NAME)
+        update = None
+        with store.refresh_slot(SNAPSHOT_MAX_AGE) as version:
+            if version is not None:
+                snapshot = store.attach(version)
+                chunks, total = iter_frame_chunks(snapshot, STREAM_CHUNK_SIZE), len(snapshot)
             else:
-                df = data_fetcher.calculate_technical_indicators(df)
-                data_source = "实时数据"
+                fetcher = get_real_data_fetcher()
+                chunks = store.publish_chunks(
+                    fetcher.iter_stock_realtime_chunks(limit=CUSTOM_UNIVERSE_LIMIT, chunk_size=STREAM_CHUNK_SIZE)
+                )
+                total = CUSTOM_UNIVERSE_LIMIT
 
-            progress_bar.progress(60)
+            try:
+                # 块索引即快照行号，前K名可以直接记为快照上的视图
+                for update in stream_screen(number_chunks(chunks),
+                                            lambda chunk: filter_custom_criteria(chunk, criteria),
+                                            top_k=CUSTOM_RESULT_LIMIT, total=total):
+                    job.report(
+                        0.1 + 0.85 * (update["progress"] or 0),
+                        f"🔍 已扫描 {update['scanned']} 只，{update['matched']} 只符合条件",
+                        partial=update["top"] if update["changed"] else None
+                    )
+            except Exception as e:
+                # 已处理的块仍然有效，保留当时的前K名
+                logger.error(f"❌ 自定义筛选失败: {e}")
 
-            # 步骤2: 应用自定义筛选条件
-            status_text.text("🔍 应用自定义筛选条件...")
-            results = apply_custom_criteria(df, criteria)
-            progress_bar.progress(90)
+        view = None
+        if update is None:
+            # 没有拿到任何实时行情
+            results = apply_custom_criteria(generate_mock_stock_data("custom"), criteria)
+            data_source = "模拟数据"
+        else:
+            results = update["top"]
+            data_source = "实时数据"
+            # 拉取中途失败时新版本快照没有发布，结果只能保存副本
+            version = version or store.published_version
+            if version is not None:
+                try:
+                    view = view_of(results, store.attach(version), CUSTOM_SNAPSHOT_NAME, version, sort_by="综合评分")
+                except (OSError, ValueError) as e:
+                    logger.warning(f"⚠️ 无法建立结果视图，保存结果副本: {e}")
+            results = results.reset_index(drop=True)
+
+        return {
+            "results": results,
+            "view": view,
+            "near_misses": pd.DataFrame(),
+            "data_source": data_source,
+            "update_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        }
 
-            # 步骤3: 完成
-            status_text.text("✅ 筛选完成...")
-            progress_bar.progress(100)
-            time.sleep(0.3)
+def render_active_job(kind: str):
+    """渲染当前会话最近一次提交的筛选任务：进行中显示阶段进度，完成后显示结果"""
 
-        except Exception as e:
-            logger.error(f"❌ 自定义筛选失败: {e}")
-            results = generate_mock_stock_data("custom")
-            data_source = "模拟数据"
+    active = st.session_state.get("active_job")
+    if not active or active["kind"] != kind:
+        return
 
-        # 保存结果
-        st.session_state.screening_results = results
-        st.session_state.last_screener = "自定义筛选器"
-        st.session_state.screener_type = "custom"
-        st.session_state.data_source = data_source
-        st.session_state.update_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    job_id = active["job_id"]
+    job = get_job_runner().get(job_id)
+    if job is None:
+        st.session_state.pop("active_job", None)
+        return
+
+    if job.finished:
+        render_finished_job(kind, job)
+    elif job_progress_fragment is not None:
+        job_progress_fragment(job_id)
+    else:
+        # 旧版 Streamlit 没有 fragment，退化为整页轮询
+        render_job_progress(job.snapshot())
+        time.sleep(JOB_POLL_INTERVAL)
+        st.rerun()
 
-        # 清除进度显示
-        progress_bar.empty()
-        status_text.empty()
+def render_job_progress(state: dict):
+    """显示任务阶段进度与中间结果"""
 
-        if not results.empty:
-            st.success(f"✅ 自定义筛选完成！找到 {len(results)} 只符合条件的股票")
+    st.progress(min(int(state["progress"] * 100), 100), text=f"{state['name']}: {state['message']}")
+    for stage in state["stages"][:-1]:
+        st.caption(f"{stage['阶段']} ({stage['耗时']:.2f}秒)")
 
-            # 显示数据来源
-            update_time = st.session_state.get('update_time', '未知')
-            st.info(f"📊 数据来源: {data_source} | 更新时间: {update_time}")
+    partial = state["partial"]
+    if isinstance(partial, pd.DataFrame) and not partial.empty:
+        st.caption(f"当前中间结果 {len(partial)} 只股票，任务仍在进行...")
+        preview_cols = [c for c in ['股票代码', '股票名称', '最新价', '涨跌幅', '综合评分'] if c in partial.columns]
+        st.dataframe(partial[preview_cols].head(10), use_container_width=True, hide_index=True)
 
-            # 显示结果预览
-            display_results_preview(results)
-        else:
-            st.warning("😔 未找到符合条件的股票，请尝试调整筛选条件")
+def _poll_job_progress(job_id: str):
+    job = get_job_runner().get(job_id)
+    if job is None or job.finished:
+        # 任务结束后整页重跑，渲染完整结果
+        st.rerun()
+    render_job_progress(job.snapshot())
+
+# 只重跑进度区域的片段（Streamlit 1.37+）
+job_progress_fragment = (
+    st.fragment(run_every=JOB_POLL_INTERVAL)(_poll_job_progress) if hasattr(st, "fragment") else None
+)
+
+@traced(STAGE_RENDER, "筛选结果")
+def render_finished_job(kind: str, job):
+    """任务结束后保存结果到 session_state 并显示"""
+
+    if job.error is not None:
+        st.error(f"❌ {job.name} 执行失败: {job.error}")
+        return
+
+    outcome = job.result
+    results = outcome["results"]
+
+    # 同一任务只写入一次，避免覆盖用户之后的操作
+    if st.session_state.get("saved_job_id") != job.job_id:
+        # 有快照视图时会话只保存行号，显示时再从共享快照取出
+        view = outcome.get("view")
+        st.session_state.screening_results = view if view is not None else results
+        st.session_state.last_screener = job.name
+        st.session_state.screener_type = job.key[1] if kind == "preset" else "custom"
+        st.session_state.data_source = outcome["data_source"]
+        st.session_state.update_time = outcome["update_time"]
+        st.session_state.saved_job_id = job.job_id
+
+    if not results.empty:
+        st.success(f"✅ {job.name} 筛选完成！找到 {len(results)} 只符合条件的股票（耗时 {job.elapsed:.1f} 秒）")
+        st.info(f"📊 数据来源: {outcome['data_source']} | 更新时间: {outcome['update_time']}")
+        display_results_preview(results)
+    elif kind == "preset":
+        st.warning("😔 未找到符合条件的股票，请尝试其他筛选策略")
+    else:
+        st.warning("😔 未找到符合条件的股票，请尝试调整筛选条件")
+
+    display_near_misses(outcome["near_misses"])
+
+@st.cache_resource(max_entries=2, show_spinner=False)
+def get_custom_screener_snapshot(version: int):
+    """挂载自定义筛选已发布的全市场快照并建立区间索引（按版本缓存）
+
+    只挂载已发布的版本，不在页面线程中拉取行情；快照过期后由下一次自定义筛选任务刷新。
+    """
+
+    store = SharedSnapshotStore(CUSTOM_SNAPSHOT_NAME)
+    df = store.attach(version).reset_index(drop=True)
+    age = store.age()
+    data_source = "实时数据" if age is None or age < SNAPSHOT_MAX_AGE else f"实时数据（{age / 60:.0f} 分钟前）"
+    return df, data_source, build_range_index(df)
 
 def apply_custom_criteria(df: pd.DataFrame, criteria: dict) -> pd.DataFrame:
     """应用自定义筛选条件"""
@@ -635,69 +955,7 @@ def apply_custom_criteria(df: pd.DataFrame, criteria: dict) -> pd.DataFrame:
         return df
 
     try:
-        filtered_df = df.copy()
-
-        # 市值范围筛选
-        if criteria.get("market_cap_range"):
-            min_cap, max_cap = criteria["market_cap_range"]
-            if '市值' in filtered_df.columns:
-                filtered_df = filtered_df[
-                    (filtered_df['市值'] >= min_cap) &
-                    (filtered_df['市值'] <= max_cap)
-                ]
-
-        # PE范围筛选
-        if criteria.get("pe_range"):
-            min_pe, max_pe = criteria["pe_range"]
-            if 'PE' in filtered_df.columns:
-                filtered_df = filtered_df[
-                    (filtered_df['PE'] >= min_pe) &
-                    (filtered_df['PE'] <= max_pe) &
-                    (filtered_df['PE'] > 0)
-                ]
-
-        # PB范围筛选
-        if criteria.get("pb_range"):
-            min_pb, max_pb = criteria["pb_range"]
-            if 'PB' in filtered_df.columns:
-                filtered_df = filtered_df[
-                    (filtered_df['PB'] >= min_pb) &
-                    (filtered_df['PB'] <= max_pb) &
-                    (filtered_df['PB'] > 0)
-                ]
-
-        # RSI范围筛选
-        if criteria.get("rsi_range"):
-            min_rsi, max_rsi = criteria["rsi_range"]
-            if 'RSI' in filtered_df.columns:
-                filtered_df = filtered_df[
-                    (filtered_df['RSI'] >= min_rsi) &
-                    (filtered_df['RSI'] <= max_rsi)
-                ]
-
-        # 涨跌幅范围筛选
-        if criteria.get("price_change_range"):
-            min_change, max_change = criteria["price_change_range"]
-            if '涨跌幅' in filtered_df.columns:
-                filtered_df = filtered_df[
-                    (filtered_df['涨跌幅'] >= min_change) &
-                    (filtered_df['涨跌幅'] <= max_change)
-                ]
-
-        # 量比筛选
-        if criteria.get("volume_ratio_min"):
-            min_ratio = criteria["volume_ratio_min"]
-            if '量比' in filtered_df.columns:
-                filtered_df = filtered_df[filtered_df['量比'] >= min_ratio]
-
-        # 换手率范围筛选
-        if criteria.get("turnover_range"):
-            min_turnover, max_turnover = criteria["turnover_range"]
-            if '换手率' in filtered_df.columns:
-                filtered_df = filtered_df[
-                    (filtered_df['换手率'] >= min_turnover) &
-                    (filtered_df['换手率'] <= max_turnover)
-                ]
+        filtered_df = filter_custom_criteria(df, criteria)
 
         # 按综合评分排序
         if '综合评分' in filtered_df.columns:
@@ -890,6 +1148,7 @@ def format_criteria(criteria: dict) -> str:
     
     return " | ".join(conditions) if conditions else "无特殊限制"
 
+@traced(STAGE_RENDER, "详细结果页")
 def render_detailed_results():
     """渲染详细结果页面"""
 
@@ -897,7 +1156,12 @@ def render_detailed_results():
         st.info("🔍 请先运行筛选器以查看结果")
         return
 
-    results = st.session_state.screening_results
+    try:
+        results = resolve_results(session_value('screening_results'))
+    except ViewExpired:
+        st.session_state.pop('screening_results', None)
+        st.info("🔍 筛选结果对应的行情快照已更新，请重新运行筛选器")
+        return
     screener_name = st.session_state.get('last_screener', '股票筛选器')
 
     st.header(f"📊 {screener_name} - 详细结果")
@@ -956,6 +1220,38 @@ def render_results_statistics(results: pd.DataFrame):
         else:
             st.metric("平均ROE", "N/A")
 
+def format_results_table(results: pd.DataFrame) -> pd.DataFrame:
+    """把结果表的数值列格式化为显示用的文本（涨跌幅、市值、成交额、成交量、换手率）"""
+
+    # 安全的格式化函数
+    def safe_format(x, format_type="default"):
+        try:
+            if pd.isna(x):
+                return "N/A"
+            if format_type == "percent":
+                return f"{float(x):+.2f}%"
+            elif format_type == "money":
+                return f"{float(x):.0f}亿"
+            elif format_type == "money_decimal":
+                return f"{float(x):.1f}亿"
+            elif format_type == "volume":
+                return f"{float(x)/10000:.0f}万手"
+            elif format_type == "percent_simple":
+                return f"{float(x):.2f}%"
+            else:
+                return str(x)
+        except:
+            return "N/A"
+
+    # 只替换需要格式化的列，其余列与结果表共享数据（不整表复制）
+    formats = {'涨跌幅': "percent", '市值': "money", '成交额': "money_decimal",
+               '成交量': "volume", '换手率': "percent_simple"}
+    return results.assign(**{
+        column: results[column].map(lambda x, fmt=fmt: safe_format(x, fmt))
+        for column, fmt in formats.items() if column in results.columns
+    })
+
+@traced(STAGE_RENDER, "结果表格")
 def render_results_table(results: pd.DataFrame):
     """渲染结果表格"""
 
@@ -995,44 +1291,8 @@ def render_results_table(results: pd.DataFrame):
         else:
             sorted_results = results
 
-    # 安全的格式化函数
-    def safe_format(x, format_type="default"):
-        try:
-            if pd.isna(x):
-                return "N/A"
-            if format_type == "percent":
-                return f"{float(x):+.2f}%"
-            elif format_type == "money":
-                return f"{float(x):.0f}亿"
-            elif format_type == "money_decimal":
-                return f"{float(x):.1f}亿"
-            elif format_type == "volume":
-                return f"{float(x)/10000:.0f}万手"
-            elif format_type == "percent_simple":
-                return f"{float(x):.2f}%"
-            else:
-                return str(x)
-        except:
-            return "N/A"
-
     # 格式化显示数据
-    display_data = sorted_results.copy()
-
-    # 安全地格式化各列
-    if '涨跌幅' in display_data.columns:
-        display_data['涨跌幅'] = display_data['涨跌幅'].apply(lambda x: safe_format(x, "percent"))
-
-    if '市值' in display_data.columns:
-        display_data['市值'] = display_data['市值'].apply(lambda x: safe_format(x, "money"))
-
-    if '成交额' in display_data.columns:
-        display_data['成交额'] = display_data['成交额'].apply(lambda x: safe_format(x, "money_decimal"))
-
-    if '成交量' in display_data.columns:
-        display_data['成交量'] = display_data['成交量'].apply(lambda x: safe_format(x, "volume"))
-
-    if '换手率' in display_data.columns:
-        display_data['换手率'] = display_data['换手率'].apply(lambda x: safe_format(x, "percent_simple"))
+    display_data = format_results_table(sorted_results)
 
     # 显示表格
     st.dataframe(
@@ -1042,6 +1302,7 @@ def render_results_table(results: pd.DataFrame):
         hide_index=True
     )
 
+@traced(STAGE_RENDER, "可视化图表")
 def render_results_charts(results: pd.DataFrame):
     """渲染可视化图表"""
 
@@ -1062,6 +1323,7 @@ def render_results_charts(results: pd.DataFrame):
     with tab4:
         render_comprehensive_comparison(results)
 
+@traced(STAGE_RENDER, "评分分布图")
 def render_score_distribution(results: pd.DataFrame):
     """渲染评分分布图"""
 
@@ -1094,6 +1356,7 @@ def render_score_distribution(results: pd.DataFrame):
         fig_bar.update_layout(height=350)
         st.plotly_chart(fig_bar, use_container_width=True)
 
+@traced(STAGE_RENDER, "估值分析图")
 def render_valuation_analysis(results: pd.DataFrame):
     """渲染估值分析图"""
 
@@ -1129,6 +1392,7 @@ def render_valuation_analysis(results: pd.DataFrame):
         fig_roe.update_layout(height=350)
         st.plotly_chart(fig_roe, use_container_width=True)
 
+@traced(STAGE_RENDER, "技术指标图")
 def render_technical_analysis(results: pd.DataFrame):
     """渲染技术分析图"""
 
@@ -1163,6 +1427,7 @@ def render_technical_analysis(results: pd.DataFrame):
         fig_volume.update_layout(height=350)
         st.plotly_chart(fig_volume, use_container_width=True)
 
+@traced(STAGE_RENDER, "综合对比图")
 def render_comprehensive_comparison(results: pd.DataFrame):
     """渲染综合对比图"""
 
@@ -1244,9 +1509,10 @@ def render_action_buttons(results: pd.DataFrame):
     with col3:
         if st.button("📈 AI技术分析", use_container_width=True):
             # 跳转到AI分析页面
-            if 'filtered_stocks' in st.session_state and not st.session_state.filtered_stocks.empty:
+            filtered_stocks = session_value('filtered_stocks')
+            if filtered_stocks is not None and not filtered_stocks.empty:
                 # 选择第一只股票进行分析
-                first_stock = st.session_state.filtered_stocks.iloc[0]
+                first_stock = filtered_stocks.iloc[0]
                 stock_code = first_stock['股票代码']
 
                 # 设置分析参数
@@ -1274,9 +1540,10 @@ def render_action_buttons(results: pd.DataFrame):
     with col4:
         if st.button("💰 AI基本面分析", use_container_width=True):
             # 跳转到AI基本面分析
-            if 'filtered_stocks' in st.session_state and not st.session_state.filtered_stocks.empty:
+            filtered_stocks = session_value('filtered_stocks')
+            if filtered_stocks is not None and not filtered_stocks.empty:
                 # 选择第一只股票进行分析
-                first_stock = st.session_state.filtered_stocks.iloc[0]
+                first_stock = filtered_stocks.iloc[0]
                 stock_code = first_stock['股票代码']
 
                 # 设置分析参数
@@ -1302,6 +1569,119 @@ def render_action_buttons(results: pd.DataFrame):
             else:
                 st.warning("请先筛选股票后再进行分析")
 
+def render_cache_stats():
+    """在侧边栏显示缓存命中与占用情况"""
+
+    stats = get_cache().stats()
+    if not stats:
+        return
+
+    st.markdown("---")
+    with st.expander("🗄️ 缓存状态", expanded=False):
+        col1, col2 = st.columns(2)
+        col1.metric("命中率", f"{stats['hit_rate']:.0%}")
+        col2.metric("条目数", stats["entries"])
+        col1.metric("占用", f"{stats['bytes'] / 1024 / 1024:.1f} MB")
+        col2.metric("上限", f"{stats['max_bytes'] / 1024 / 1024:.0f} MB")
+        st.caption(f"命中 {stats['hits']} · 未命中 {stats['misses']} · "
+                   f"淘汰 {stats['evictions']} · 过期 {stats['expirations']}")
+
+def render_performance_panel():
+    """在侧边栏显示最近一次运行的阶段瀑布图与各阶段 p50/p95 耗时"""
+
+    tracer = get_tracer()
+    traces = tracer.traces()
+    if not traces:
+        return
+
+    st.markdown("---")
+    with st.expander("⏱️ 性能追踪", expanded=False):
+        runs = [t for t in traces if t.root.stage is None] or traces
+        labels = [f"{t.started_at:%H:%M:%S} {t.name} ({t.duration * 1000:.0f} ms)" for t in runs]
+        choice = st.selectbox("运行", range(len(runs)), index=len(runs) - 1, format_func=lambda i: labels[i],
+                              key="trace_choice")
+
+        waterfall = runs[choice].waterfall()
+        fig = go.Figure(go.Bar(
+            y=["　" * depth + name for depth, name in zip(waterfall["层级"], waterfall["名称"])],
+            x=waterfall["耗时(ms)"],
+            base=waterfall["开始(ms)"],
+            orientation="h",
+            marker_color=[STAGE_COLORS.get(stage, "#9e9e9e") for stage in waterfall["阶段"]],
+            customdata=waterfall[["阶段", "属性"]],
+            hovertemplate="%{y}<br>%{customdata[0]} · %{x:.1f} ms<br>%{customdata[1]}<extra></extra>",
+        ))
+        fig.update_layout(height=max(160, 22 * len(waterfall)), margin=dict(l=0, r=0, t=10, b=0),
+                          yaxis=dict(autorange="reversed"), xaxis_title="毫秒")
+        st.plotly_chart(fig, use_container_width=True)
+
+        stats = tracer.stage_stats()
+        if not stats.empty:
+            st.caption(f"最近 {len(traces)} 次运行各阶段耗时")
+            st.dataframe(stats, use_container_width=True, hide_index=True)
+
+def render_memory_panel():
+    """在侧边栏显示本会话各键、全服务会话与各阶段产出的内存占用"""
+
+    accountant = get_session_accountant()
+    stats = accountant.stats()
+    if not stats["sessions"]:
+        return
+
+    st.markdown("---")
+    with st.expander("🧠 内存占用", expanded=False):
+        col1, col2 = st.columns(2)
+        col1.metric("会话数", stats["sessions"])
+        col2.metric("会话内存", f"{stats['bytes'] / 1024 / 1024:.1f} MB")
+        budget = f"{stats['budget'] / 1024 / 1024:.0f} MB" if stats["budget"] else "不限"
+        st.caption(f"单会话预算 {budget} · 已溢出 {stats['spilled_bytes'] / 1024 / 1024:.1f} MB · "
+                   f"溢出 {stats['spills']} 次 · 清除 {stats['evictions']} 次")
+
+        usage = accountant.session(current_session_id())
+        if usage is not None:
+            st.caption("本会话")
+            st.dataframe(accountant.session_keys(usage.session_id).head(8), use_container_width=True,
+                         hide_index=True)
+            if usage.evicted:
+                st.warning(f"超出内存预算已清除: {'、'.join(usage.evicted)}，需要时请重新筛选")
+
+        st.caption("全部会话")
+        st.dataframe(accountant.sessions().head(10), use_container_width=True, hide_index=True)
+
+        stage_memory = get_tracer().stage_memory()
+        if not stage_memory.empty:
+            st.caption("各阶段产出 DataFrame")
+            st.dataframe(stage_memory, use_container_width=True, hide_index=True)
+
+def render_profiling_panel():
+    """在侧边栏显示剖析开关与最近的剖析报告（页面地址带 ?profile=1 或设置了 STOCK_PROFILE 时显示）"""
+
+    profiler = get_profiler()
+    if "profile" not in st.query_params and profiler.always is None:
+        return
+
+    st.markdown("---")
+    with st.expander("🔬 性能剖析", expanded=False):
+        if profiler.always:
+            st.caption(f"STOCK_PROFILE={profiler.always}：每次筛选都会剖析")
+        mode = st.selectbox("模式", MODES, key="profile_mode",
+                            format_func=lambda m: {"sampling": "采样（火焰图）", "cprofile": "cProfile（确定性）"}[m])
+        if profiler.pending:
+            st.info(f"⏳ 下一次筛选将以 {profiler.pending} 模式剖析")
+            if st.button("取消", key="profile_cancel"):
+                profiler.cancel()
+                st.rerun()
+        elif st.button("剖析下一次筛选", key="profile_arm"):
+            profiler.request(mode)
+            st.rerun()
+
+        for report in profiler.reports(limit=5):
+            summary = report.summary()
+            st.caption(f"{summary['started_at'][11:]} {summary['name']} · {summary['elapsed'] * 1000:.0f} ms · "
+                       f"峰值 {summary['peak_kb'] / 1024:.1f} MB")
+            st.download_button("下载报告", report.archive(), file_name=f"{report.name}.zip",
+                               mime="application/zip", key=f"profile_{report.name}")
+
 def main():
     """主函数"""
 
@@ -1321,7 +1701,7 @@ def main():
         return
 
     # 创建主要标签页
-    tab1, tab2 = st.tabs(["🎯 预设筛选器", "⚙️ 自定义筛选"])
+    tab1, tab2, tab3 = st.tabs(["🎯 预设筛选器", "⚙️ 自定义筛选", "🧮 组合筛选"])
 
     with tab1:
         render_preset_screeners()
@@ -1329,6 +1709,9 @@ def main():
     with tab2:
         render_custom_screener()
 
+    with tab3:
+        render_composite_screener()
+
     # 侧边栏信息
     with st.sidebar:
         st.markdown("### 📊 筛选器说明")
@@ -1347,6 +1730,11 @@ def main():
         - 灵活的参数组合
         """)
 
+        render_cache_stats()
+        render_performance_panel()
+        render_memory_panel()
+        render_profiling_panel()
+
         st.markdown("---")
         st.markdown("### 💡 使用提示")
         st.markdown("""
@@ -1374,4 +1762,8 @@ def main():
         """)
 
 if __name__ == "__main__":
-    main()
+    try:
+        main()
+    finally:
+        # 页面运行结束后统计本会话的内存占用，超出预算时溢出大对象
+        account_session_memory()
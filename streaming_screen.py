@@ -0,0 +1,88 @@
+"""
+流式筛选
+行情按批次（分块）到达，每块单独筛选打分，只保留当前的前K名，
+第一块处理完即可显示结果，内存占用只与块大小和K有关，与全市场规模无关。
+"""
+
+import pandas as pd
+from typing import Callable, Dict, Iterable, Iterator, Optional
+from tracing import STAGE_SCORE, span
+
+
+class RunningTopK:
+    """按排序列维护的前K名（每块到达后与已有前K名合并）"""
+
+    def __init__(self, k: int, sort_by: str, descending: bool = True):
+        self.k = k
+        self.sort_by = sort_by
+        self.descending = descending
+        self.matched = 0
+        self._top = pd.DataFrame()
+
+    def push(self, frame: pd.DataFrame) -> bool:
+        """合并一块入选结果，返回前K名是否变化"""
+        if frame.empty:
+            return False
+        self.matched += len(frame)
+
+        # 保留行索引：块来自快照时，前K名的索引就是快照中的行号
+        merged = frame if self._top.empty else pd.concat([self._top, frame])
+        if self.sort_by in merged.columns:
+            # 稳定排序：同分时先到的股票排前面，与一次性排序的结果一致
+            merged = merged.sort_values(self.sort_by, ascending=not self.descending, kind="stable")
+        top = merged.head(self.k)
+
+        if self._top.empty or "股票代码" not in top.columns:
+            changed = True
+        else:
+            changed = not top["股票代码"].equals(self._top["股票代码"])
+        self._top = top
+        return changed
+
+    def frame(self) -> pd.DataFrame:
+        """当前前K名"""
+        return self._top
+
+
+def iter_frame_chunks(df: pd.DataFrame, chunk_size: int) -> Iterator[pd.DataFrame]:
+    """把已有快照按行切成块（视图，不复制数据）"""
+    for start in range(0, len(df), chunk_size):
+        yield df.iloc[start:start + chunk_size]
+
+
+def number_chunks(chunks: Iterable[pd.DataFrame]) -> Iterator[pd.DataFrame]:
+    """把各块的索引改为整体的连续行号（与按顺序写入快照后的行号一致）"""
+    offset = 0
+    for chunk in chunks:
+        yield chunk.set_axis(pd.RangeIndex(offset, offset + len(chunk)))
+        offset += len(chunk)
+
+
+def stream_screen(chunks: Iterable[pd.DataFrame],
+                  screen: Callable[[pd.DataFrame], pd.DataFrame],
+                  top_k: int = 30,
+                  sort_by: str = "综合评分",
+                  descending: bool = True,
+                  total: Optional[int] = None) -> Iterator[Dict]:
+    """逐块筛选并维护前K名，每块处理完产出一次当前状态
+
+    screen 对单块返回入选的行（不截断）；产出的字典包含
+    top（当前前K名）、chunks（已处理块数）、scanned（已扫描行数）、
+    matched（累计入选行数）、changed（前K名是否变化）和 progress（已知总数时的进度）。
+    """
+    top = RunningTopK(top_k, sort_by, descending)
+    scanned = 0
+
+    for index, chunk in enumerate(chunks, 1):
+        scanned += len(chunk)
+        matched = screen(chunk)
+        with span("前K名合并", STAGE_SCORE, rows=len(matched)):
+            changed = top.push(matched)
+        yield {
+            "top": top.frame(),
+            "chunks": index,
+            "scanned": scanned,
+            "matched": top.matched,
+            "changed": changed,
+            "progress": None if not total else min(scanned / total, 1.0),
+        }
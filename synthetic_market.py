@@ -0,0 +1,471 @@
+"""
+合成行情生成器
+按种子确定性地生成 N 只股票 × T 个交易日的相关几何布朗运动 OHLCV 路径：
+日收益由市场因子、行业因子与个股噪声叠加，并按板块涨跌停限制截断；
+基本面（市盈率、市净率、ROE、市值等）由同一组每股指标推出，彼此一致；
+现货快照与 generate_enhanced_mock_data 同结构，技术指标直接由历史路径计算。
+全部计算按 (T, N) 数组整体进行，不逐行构造，5000 只 × 2500 日可在数秒内生成，
+用于离线基准测试、压力测试与各处模拟数据。
+
+用法:
+    python synthetic_market.py --symbols 5000 --days 2500 --seed 7 --output-dir synthetic_data
+"""
+
+import argparse
+import os
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from snapshot_schema import enforce_snapshot_schema
+
+# 每年交易日数
+TRADING_DAYS_PER_YEAR = 244
+
+# 市场因子与行业因子的年化波动率
+MARKET_VOLATILITY = 0.20
+SECTOR_VOLATILITY = 0.15
+
+# 计算技术指标时回看的交易日数（EMA 类指标在此窗口内收敛）
+INDICATOR_LOOKBACK = 120
+
+# 由历史路径计算的指标列（其余派生列仍由派生列注册表补齐）
+INDICATOR_COLUMNS = [
+    "RSI", "MACD", "KDJ_K", "布林上轨", "布林下轨", "MA5", "MA10", "MA20",
+    "成交量比", "量比", "每股收益", "每股净资产"
+]
+
+# 涨跌停幅度（按板块）
+PRICE_LIMITS = {"主板": 0.10, "创业板": 0.20, "科创板": 0.20, "北交所": 0.30}
+
+# 代码段：(板块, 起始代码, 可用数量, 全市场占比)
+CODE_SPACES = [
+    ("主板", 600000, 88000, 0.44),
+    ("主板", 1, 99999, 0.33),
+    ("创业板", 300000, 2000, 0.15),
+    ("科创板", 688000, 2000, 0.06),
+    ("北交所", 830000, 10000, 0.02),
+]
+
+# 行业参数：最新价区间、市盈率与市净率中枢、营收增速中枢、毛利率与资产负债率区间、
+# 分红比例区间、个股年化波动率、市值中枢
+SECTOR_PROFILES: Dict[str, Dict] = {
+    "银行": {"price": (3, 8), "pe": 6, "pb": 0.6, "growth": 5, "margin": (35, 50), "debt": (88, 93),
+             "payout": (0.25, 0.35), "volatility": 0.15, "market_cap": 2e11},
+    "白酒": {"price": (100, 2000), "pe": 28, "pb": 7, "growth": 15, "margin": (70, 92), "debt": (15, 35),
+             "payout": (0.4, 0.7), "volatility": 0.28, "market_cap": 8e10},
+    "科技": {"price": (20, 200), "pe": 45, "pb": 5, "growth": 18, "margin": (25, 55), "debt": (25, 55),
+             "payout": (0.0, 0.2), "volatility": 0.40, "market_cap": 3e10},
+    "医药": {"price": (10, 150), "pe": 35, "pb": 4, "growth": 12, "margin": (40, 80), "debt": (20, 45),
+             "payout": (0.1, 0.3), "volatility": 0.35, "market_cap": 2.5e10},
+    "消费": {"price": (10, 120), "pe": 25, "pb": 4, "growth": 8, "margin": (25, 45), "debt": (30, 55),
+             "payout": (0.3, 0.6), "volatility": 0.28, "market_cap": 2.5e10},
+    "新能源": {"price": (10, 300), "pe": 30, "pb": 4, "growth": 25, "margin": (15, 35), "debt": (45, 70),
+              "payout": (0.1, 0.3), "volatility": 0.45, "market_cap": 4e10},
+    "地产": {"price": (3, 20), "pe": 10, "pb": 0.8, "growth": -5, "margin": (15, 30), "debt": (70, 85),
+             "payout": (0.1, 0.4), "volatility": 0.35, "market_cap": 2e10},
+    "券商": {"price": (8, 30), "pe": 20, "pb": 1.5, "growth": 8, "margin": (40, 65), "debt": (65, 80),
+             "payout": (0.2, 0.4), "volatility": 0.33, "market_cap": 4e10},
+}
+
+# 未列出的行业（含“其他”）使用的参数
+DEFAULT_PROFILE = {"price": (5, 100), "pe": 25, "pb": 2.5, "growth": 8, "margin": (15, 45), "debt": (30, 65),
+                   "payout": (0.1, 0.4), "volatility": 0.35, "market_cap": 1.2e10}
+
+# 未指定行业时的行业分布
+SECTOR_WEIGHTS = {"科技": 0.22, "其他": 0.25, "消费": 0.14, "医药": 0.12, "新能源": 0.08,
+                  "券商": 0.07, "地产": 0.05, "银行": 0.04, "白酒": 0.03}
+
+# 各行业可抽取的概念
+SECTOR_CONCEPTS = {
+    "银行": ["金融科技", "数字货币", "中特估"],
+    "白酒": ["白酒", "国企改革", "大消费"],
+    "科技": ["人工智能", "芯片", "机器视觉", "安防", "金融科技"],
+    "医药": ["创新药", "生物医药", "CXO", "医疗服务", "疫苗"],
+    "消费": ["大消费", "预制菜", "乳业", "合成生物"],
+    "新能源": ["锂电池", "储能", "光伏", "新能源汽车"],
+    "地产": ["国企改革", "装配式建筑", "雄安新区"],
+    "券商": ["互联网金融", "金融科技"],
+}
+DEFAULT_CONCEPTS = ["国企改革", "人工智能", "大消费", "芯片", "储能"]
+
+# 亏损公司占比
+LOSS_MAKING_SHARE = 0.08
+
+# 上市日期范围
+LISTING_START = np.datetime64("1990-12-19")
+LISTING_END = np.datetime64("2023-12-31")
+
+
+def board_of(codes: Sequence[str]) -> np.ndarray:
+    """按代码前缀判断上市板块（与 ChinaAStockFetcher.get_stock_board 一致）"""
+    digits = pd.Series(list(codes), dtype=str).str[:6]
+    boards = np.full(len(digits), "主板", dtype=object)
+    boards[digits.str.startswith(("300", "301")).to_numpy()] = "创业板"
+    boards[digits.str.startswith(("688", "689")).to_numpy()] = "科创板"
+    boards[digits.str.startswith(("8", "4", "920")).to_numpy()] = "北交所"
+    return boards
+
+
+def generate_codes(n: int, rng: np.random.Generator) -> np.ndarray:
+    """按各板块占比生成 n 个互不重复的六位代码（小板块容量不足时由主板补足）"""
+    capacities = np.array([space[2] for space in CODE_SPACES])
+    if n > capacities.sum():
+        raise ValueError(f"最多可生成 {capacities.sum()} 个代码，请求 {n} 个")
+
+    counts = np.minimum(np.floor(n * np.array([space[3] for space in CODE_SPACES])).astype(int), capacities)
+    for i in range(len(counts)):
+        counts[i] += min(n - counts.sum(), capacities[i] - counts[i])
+
+    numbers = [start + np.sort(rng.choice(capacity, count, replace=False))
+               for (_, start, capacity, _), count in zip(CODE_SPACES, counts)]
+    return np.sort(np.char.zfill(np.concatenate(numbers).astype(str), 6)).astype(object)
+
+
+def generate_symbols(n: int, rng: np.random.Generator) -> pd.DataFrame:
+    """生成股票代码表：股票代码、股票名称、行业、概念"""
+    codes = generate_codes(n, rng)
+    sectors = rng.choice(list(SECTOR_WEIGHTS), n, p=list(SECTOR_WEIGHTS.values()))
+    return pd.DataFrame({
+        "股票代码": codes,
+        "股票名称": [f"股票{code}" for code in codes],
+        "行业": sectors,
+        "概念": _draw_concepts(sectors, rng),
+    })
+
+
+def _draw_concepts(sectors: np.ndarray, rng: np.random.Generator) -> List[str]:
+    """每只股票从所属行业的概念中抽取 0~2 个"""
+    picks = rng.random((len(sectors), 2))
+    counts = rng.integers(0, 3, len(sectors))
+    concepts = []
+    for sector, pick, count in zip(sectors, picks, counts):
+        pool = SECTOR_CONCEPTS.get(sector, DEFAULT_CONCEPTS)
+        chosen = dict.fromkeys(pool[int(p * len(pool))] for p in pick[:count])
+        concepts.append("、".join(chosen))
+    return concepts
+
+
+class SyntheticMarket:
+    """按种子确定性生成的合成市场
+
+    symbols 为股票代码表（至少含股票代码，可选股票名称、行业、概念；代码可带 .SH/.SZ 后缀，
+    允许重复）；不传时按 n_symbols 生成。行情数组形状均为 (n_days, n_symbols)。
+    final_change_range 指定最后一个交易日的涨跌幅区间（百分比），用于构造特定形态的模拟数据。
+    """
+
+    def __init__(self, n_symbols: Optional[int] = None, n_days: int = 250, seed: Optional[int] = None,
+                 symbols: Optional[pd.DataFrame] = None, end_date=None,
+                 final_change_range: Optional[Tuple[float, float]] = None):
+        if symbols is None and n_symbols is None:
+            raise ValueError("需要提供 n_symbols 或 symbols")
+        if n_days < 1:
+            raise ValueError("n_days 至少为 1")
+
+        symbol_seq, path_seq, fundamental_seq = np.random.SeedSequence(seed).spawn(3)
+        self.seed = seed
+        self.n_days = n_days
+        self.symbols = self._prepare_symbols(symbols, n_symbols, np.random.default_rng(symbol_seq))
+        self.codes = self.symbols["股票代码"].to_numpy()
+        self.n_symbols = len(self.codes)
+        self.dates = pd.bdate_range(end=pd.Timestamp(end_date or datetime.now()).normalize(), periods=n_days)
+
+        self._profiles = [SECTOR_PROFILES.get(sector, DEFAULT_PROFILE) for sector in self.symbols["行业"]]
+        self._simulate(np.random.default_rng(path_seq), final_change_range)
+        self._fundamentals = self._draw_fundamentals(np.random.default_rng(fundamental_seq))
+
+    def _prepare_symbols(self, symbols: Optional[pd.DataFrame], n_symbols: Optional[int],
+                         rng: np.random.Generator) -> pd.DataFrame:
+        if symbols is None:
+            return generate_symbols(n_symbols, rng)
+
+        symbols = symbols.reset_index(drop=True)
+        codes = symbols["股票代码"].astype(str).str.replace(r"\.(SH|SZ|BJ)$", "", regex=True)
+        sectors = symbols["行业"].astype(str).to_numpy() if "行业" in symbols else \
+            rng.choice(list(SECTOR_WEIGHTS), len(symbols), p=list(SECTOR_WEIGHTS.values()))
+        concepts = symbols["概念"] if "概念" in symbols else _draw_concepts(sectors, rng)
+        return pd.DataFrame({
+            "股票代码": codes.to_numpy(dtype=object),
+            "股票名称": symbols["股票名称"] if "股票名称" in symbols else "股票" + codes,
+            "行业": sectors,
+            "概念": [c if isinstance(c, str) else "、".join(c) for c in concepts],
+        })
+
+    def _profile_array(self, key: str) -> np.ndarray:
+        return np.array([profile[key] for profile in self._profiles], dtype=np.float64)
+
+    def _profile_uniform(self, key: str, rng: np.random.Generator, log: bool = False) -> np.ndarray:
+        bounds = np.array([profile[key] for profile in self._profiles], dtype=np.float64)
+        if log:
+            return np.exp(rng.uniform(np.log(bounds[:, 0]), np.log(bounds[:, 1])))
+        return rng.uniform(bounds[:, 0], bounds[:, 1])
+
+    def _simulate(self, rng: np.random.Generator, final_change_range: Optional[Tuple[float, float]]):
+        """生成 OHLCV 路径"""
+        n, t = self.n_symbols, self.n_days
+        dt = 1.0 / TRADING_DAYS_PER_YEAR
+        sector_ids, sector_names = pd.factorize(self.symbols["行业"])
+
+        self.boards = board_of(self.codes)
+        limit = np.array([PRICE_LIMITS[board] for board in self.boards])
+        lower, upper = np.log1p(-limit).astype(np.float32), np.log1p(limit).astype(np.float32)
+
+        idio_vol = self._profile_array("volatility") * rng.lognormal(0, 0.25, n)
+        market_beta = np.clip(rng.normal(1.0, 0.25, n), 0.3, 2.0)
+        sector_beta = np.clip(rng.normal(1.0, 0.30, n), 0.0, 2.0)
+        variance = (market_beta * MARKET_VOLATILITY) ** 2 + (sector_beta * SECTOR_VOLATILITY) ** 2 + idio_vol ** 2
+        drift = rng.normal(0.06, 0.15, n)
+        daily_vol = np.sqrt(variance * dt).astype(np.float32)
+
+        market = rng.standard_normal(t, dtype=np.float32) * np.float32(MARKET_VOLATILITY * np.sqrt(dt))
+        sectors = rng.standard_normal((t, len(sector_names)), dtype=np.float32) * np.float32(SECTOR_VOLATILITY * np.sqrt(dt))
+
+        returns = rng.standard_normal((t, n), dtype=np.float32)
+        returns *= (idio_vol * np.sqrt(dt)).astype(np.float32)
+        returns += market[:, None] * market_beta.astype(np.float32)
+        returns += sectors[:, sector_ids] * sector_beta.astype(np.float32)
+        returns += ((drift - variance / 2) * dt).astype(np.float32)
+        np.clip(returns, lower, upper, out=returns)
+        if final_change_range is not None:
+            low, high = final_change_range
+            returns[-1] = np.log1p(rng.uniform(low, high, n) / 100).astype(np.float32)
+            np.clip(returns[-1], lower, upper, out=returns[-1])
+
+        # 收益与价格水平无关，路径平移到以行业价格区间内的收盘价结束，长周期下价格仍处于合理范围
+        final = self._profile_uniform("price", rng, log=True).astype(np.float32)
+        close = np.cumsum(returns, axis=0, dtype=np.float32)
+        close += np.log(final) - close[-1]
+        prev_close = np.empty_like(close)
+        prev_close[0] = close[0] - returns[0]
+        np.exp(close, out=close)
+        np.exp(prev_close[0], out=prev_close[0])
+        prev_close[1:] = close[:-1]
+        ceiling, floor = prev_close * np.exp(upper), prev_close * np.exp(lower)
+
+        gap = rng.standard_normal((t, n), dtype=np.float32)
+        gap *= daily_vol * np.float32(0.3)
+        np.clip(gap, lower, upper, out=gap)
+        open_ = prev_close * np.exp(gap)
+
+        spread = np.abs(rng.standard_normal((2, t, n), dtype=np.float32))
+        spread *= daily_vol * np.float32(0.5)
+        high = np.minimum(np.maximum(open_, close) * np.exp(spread[0]), ceiling)
+        low = np.maximum(np.minimum(open_, close) * np.exp(-spread[1]), floor)
+
+        # 股本由最新市值推出；成交量 = 流通股本 × 换手率，放量与当日涨跌幅绝对值相关
+        market_cap = np.clip(self._profile_array("market_cap") * rng.lognormal(0, 0.9, n), 5e8, 3e12)
+        self.total_shares = market_cap / final
+        self.float_ratio = rng.uniform(0.3, 1.0, n)
+        self.float_shares = self.total_shares * self.float_ratio
+        base_turnover = np.clip(rng.lognormal(np.log(0.015), 0.6, n), 0.001, 0.2)
+        activity = rng.standard_normal((t, n), dtype=np.float32)
+        activity *= np.float32(0.35)
+        activity += np.abs(returns) * np.float32(10.0)
+        turnover = np.minimum(np.exp(activity) * base_turnover.astype(np.float32), np.float32(0.5))
+
+        self.open, self.high, self.low, self.close = open_, high, low, close
+        self.prev_close = prev_close
+        self.volume = np.floor(turnover * self.float_shares.astype(np.float32) / 100) * 100
+
+    def _draw_fundamentals(self, rng: np.random.Generator) -> Dict[str, np.ndarray]:
+        """由每股指标推出相互一致的基本面：PE = 价格/EPS，PB = 价格/BPS，ROE = EPS/BPS"""
+        n = self.n_symbols
+        price = self.close[-1].astype(np.float64)
+
+        pe = self._profile_array("pe") * rng.lognormal(0, 0.35, n)
+        loss_making = rng.random(n) < LOSS_MAKING_SHARE
+        pe[loss_making] = -rng.uniform(5, 80, loss_making.sum())
+        pb = self._profile_array("pb") * rng.lognormal(0, 0.35, n)
+
+        revenue_growth = rng.normal(self._profile_array("growth"), 12)
+        profit_growth = 1.3 * revenue_growth + rng.normal(0, 10, n)
+        profit_growth[loss_making] = -np.abs(profit_growth[loss_making]) - 20
+        gross_margin = self._profile_uniform("margin", rng)
+        net_margin = gross_margin * rng.uniform(0.15, 0.5, n)
+        net_margin[loss_making] = -rng.uniform(1, 15, loss_making.sum())
+        payout = np.where(loss_making, 0.0, self._profile_uniform("payout", rng))
+
+        listing_days = int((LISTING_END - LISTING_START) / np.timedelta64(1, "D"))
+        return {
+            "eps": price / pe,
+            "bps": price / pb,
+            "pe": pe,
+            "pb": pb,
+            "roe": pb / pe * 100,
+            "revenue_growth": revenue_growth,
+            "profit_growth": profit_growth,
+            "gross_margin": gross_margin,
+            "net_margin": net_margin,
+            "debt_ratio": self._profile_uniform("debt", rng),
+            "ps": np.clip(np.abs(pe * net_margin / 100), 0.05, 100),
+            "dividend_yield": np.where(pe > 0, payout / np.abs(pe) * 100, 0.0),
+            "listing_date": LISTING_START + rng.integers(0, listing_days, n).astype("timedelta64[D]"),
+        }
+
+    def indicators(self, columns: Optional[List[str]] = None) -> Dict[str, np.ndarray]:
+        """由历史路径计算最后一个交易日的技术指标（columns 为 None 表示全部）"""
+        wanted = INDICATOR_COLUMNS if columns is None else [c for c in INDICATOR_COLUMNS if c in columns]
+        close = self.close[-INDICATOR_LOOKBACK:].astype(np.float64)
+        volume = self.volume.astype(np.float64)
+        result = {}
+
+        for name, window in (("MA5", 5), ("MA10", 10), ("MA20", 20)):
+            if name in wanted:
+                result[name] = close[-window:].mean(axis=0)
+        if "布林上轨" in wanted or "布林下轨" in wanted:
+            middle, width = close[-20:].mean(axis=0), 2 * close[-20:].std(axis=0)
+            result["布林上轨"], result["布林下轨"] = middle + width, middle - width
+        if "RSI" in wanted:
+            change = np.diff(self.close[-15:].astype(np.float64), axis=0)
+            gain = np.clip(change, 0, None).sum(axis=0)
+            loss = np.clip(-change, 0, None).sum(axis=0)
+            total = gain + loss
+            result["RSI"] = np.divide(100 * gain, total, out=np.full(self.n_symbols, 50.0), where=total > 0)
+        if "MACD" in wanted:
+            fast, slow = close[0].copy(), close[0].copy()
+            dea = np.zeros(self.n_symbols)
+            for price in close[1:]:
+                fast += (price - fast) * (2 / 13)
+                slow += (price - slow) * (2 / 27)
+                dea += (fast - slow - dea) * (2 / 10)
+            result["MACD"] = 2 * (fast - slow - dea)
+        if "KDJ_K" in wanted:
+            start = max(len(self.close) - INDICATOR_LOOKBACK, 0)
+            k = np.full(self.n_symbols, 50.0)
+            for day in range(start, len(self.close)):
+                window = slice(max(day - 8, 0), day + 1)
+                highest, lowest = self.high[window].max(axis=0), self.low[window].min(axis=0)
+                span = (highest - lowest).astype(np.float64)
+                rsv = np.divide(100 * (self.close[day] - lowest), span, out=np.full(self.n_symbols, 50.0),
+                                where=span > 0)
+                k = k * 2 / 3 + rsv / 3
+            result["KDJ_K"] = k
+        for name, window in (("量比", 5), ("成交量比", 20)):
+            if name in wanted:
+                history = volume[-window - 1:-1] if len(volume) > 1 else volume
+                average = history.mean(axis=0)
+                result[name] = np.divide(volume[-1], average, out=np.ones(self.n_symbols), where=average > 0)
+        if "每股收益" in wanted:
+            result["每股收益"] = self._fundamentals["eps"]
+        if "每股净资产" in wanted:
+            result["每股净资产"] = self._fundamentals["bps"]
+
+        return {name: np.round(result[name], 3 if name == "MACD" else 2) for name in wanted}
+
+    def spot_snapshot(self, indicators: Optional[List[str]] = None, source: str = "A股模拟数据") -> pd.DataFrame:
+        """最后一个交易日的现货快照（与 generate_enhanced_mock_data 同结构）
+
+        indicators 为需要由历史路径计算的指标列，None 表示全部，空列表表示只要基础列。
+        """
+        f = self._fundamentals
+        price = np.round(self.close[-1].astype(np.float64), 2)
+        prev_close = np.round(self.prev_close[-1].astype(np.float64), 2)
+        volume = self.volume[-1].astype(np.int64)
+        average_price = (self.open[-1] + self.high[-1] + self.low[-1] + self.close[-1]).astype(np.float64) / 4
+        total_cap = price * self.total_shares
+
+        df = pd.DataFrame({
+            "股票代码": self.codes,
+            "股票名称": self.symbols["股票名称"].to_numpy(),
+            "最新价": price,
+            "涨跌幅": np.round((price / prev_close - 1) * 100, 2),
+            "涨跌额": np.round(price - prev_close, 2),
+            "成交量": volume,
+            "成交额": np.round(volume * average_price, 2),
+            "换手率": np.round(volume / self.float_shares * 100, 2),
+            "市盈率": np.round(f["pe"], 2),
+            "市净率": np.round(f["pb"], 2),
+            "总市值": np.round(total_cap, 0),
+            "流通市值": np.round(total_cap * self.float_ratio, 0),
+            "ROE": np.round(f["roe"], 2),
+            "净利润增长": np.round(f["profit_growth"], 2),
+            "营收增长": np.round(f["revenue_growth"], 2),
+            "毛利率": np.round(f["gross_margin"], 2),
+            "净利率": np.round(f["net_margin"], 2),
+            "资产负债率": np.round(f["debt_ratio"], 2),
+            "市销率": np.round(f["ps"], 2),
+            "股息率": np.round(f["dividend_yield"], 2),
+            "行业": self.symbols["行业"].to_numpy(),
+            "概念": self.symbols["概念"].to_numpy(),
+            "板块": self.boards,
+            "上市日期": f["listing_date"],
+            "数据源": source,
+        })
+        for name, values in self.indicators(indicators).items():
+            df[name] = values
+        return enforce_snapshot_schema(df)
+
+    def history(self, symbol) -> pd.DataFrame:
+        """单只股票的日线行情（symbol 为代码或列位置）"""
+        if isinstance(symbol, str):
+            matches = np.flatnonzero(self.codes == symbol[:6])
+            if not len(matches):
+                raise KeyError(symbol)
+            symbol = int(matches[0])
+        close = self.close[:, symbol].astype(np.float64)
+        prev_close = self.prev_close[:, symbol].astype(np.float64)
+        return pd.DataFrame({
+            "日期": self.dates,
+            "开盘价": np.round(self.open[:, symbol].astype(np.float64), 2),
+            "最高价": np.round(self.high[:, symbol].astype(np.float64), 2),
+            "最低价": np.round(self.low[:, symbol].astype(np.float64), 2),
+            "收盘价": np.round(close, 2),
+            "成交量": self.volume[:, symbol].astype(np.int64),
+            "涨跌幅": np.round((close / prev_close - 1) * 100, 2),
+        })
+
+    def history_frame(self) -> pd.DataFrame:
+        """全部股票的日线行情（长表：每行一只股票一个交易日）"""
+        t, n = self.close.shape
+        return pd.DataFrame({
+            "日期": np.repeat(self.dates.to_numpy(), n),
+            "股票代码": pd.Categorical(np.tile(self.codes, t)),
+            "开盘价": self.open.ravel(),
+            "最高价": self.high.ravel(),
+            "最低价": self.low.ravel(),
+            "收盘价": self.close.ravel(),
+            "成交量": self.volume.ravel().astype(np.int64),
+        })
+
+
+# 主要接口函数
+def generate_synthetic_market(n_symbols: int = 5000, n_days: int = 250, seed: Optional[int] = None,
+                              **kwargs) -> SyntheticMarket:
+    """生成合成市场的主要接口"""
+    return SyntheticMarket(n_symbols=n_symbols, n_days=n_days, seed=seed, **kwargs)
+
+
+def main(argv=None) -> Dict:
+    """命令行入口：生成合成市场并写出现货快照与日线行情（Parquet）"""
+    parser = argparse.ArgumentParser(description="生成合成A股行情（离线基准与压力测试用）")
+    parser.add_argument("--symbols", type=int, default=5000)
+    parser.add_argument("--days", type=int, default=250)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output-dir", default="synthetic_data")
+    parser.add_argument("--no-history", action="store_true", help="只写出现货快照")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    market = generate_synthetic_market(args.symbols, args.days, args.seed)
+    generated = time.perf_counter() - started
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    paths = {"spot": os.path.join(args.output_dir, "spot.parquet")}
+    spot = market.spot_snapshot()
+    spot.attrs = {}
+    spot.to_parquet(paths["spot"], index=False)
+    if not args.no_history:
+        paths["history"] = os.path.join(args.output_dir, "history.parquet")
+        market.history_frame().to_parquet(paths["history"], index=False)
+
+    print(f"📈 {args.symbols} 只 × {args.days} 日，生成耗时 {generated:.2f} 秒")
+    for name, path in paths.items():
+        print(f"  ✅ {name}: {path}")
+    return {"seconds": generated, "paths": paths}
+
+
+if __name__ == "__main__":
+    main()
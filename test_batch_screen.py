@@ -0,0 +1,91 @@
+"""
+测试批量筛选命令行
+验证策略解析、按日期与筛选器分区写出 Parquet / CSV、汇总与阶段耗时
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import json
+import random
+import tempfile
+import pandas as pd
+import pyarrow.dataset as ds
+from batch_screen import SUMMARY_FILE, main, resolve_strategies
+from china_a_stock_fetcher import ChinaAStockFetcher
+from parallel_screen import ParallelScreener
+
+def make_universe_file(n: int = 800) -> str:
+    random.seed(41)
+    prefixes = ["000", "002", "300", "600", "688"]
+    codes = [f"{prefixes[i % 5]}{i:03d}.{'SH' if prefixes[i % 5] in ('600', '688') else 'SZ'}" for i in range(n)]
+    df = ChinaAStockFetcher().generate_enhanced_mock_data(codes, columns=[])
+    path = os.path.join(tempfile.mkdtemp(), "universe.parquet")
+    df.attrs = {}
+    df.to_parquet(path, index=False)
+    return path
+
+def test_resolve_strategies():
+    """测试策略解析"""
+    print("🧪 测试: 策略解析")
+    everything = resolve_strategies(None)
+    presets = resolve_strategies(["presets"])
+    assert len(presets) == 6 and all(kind == "smart" for kind, _ in presets)
+    assert len(everything) == len(presets) + len(resolve_strategies(["short-term"]))
+    assert resolve_strategies(["value_growth", "presets"])[0] == ("smart", "value_growth")
+    assert len(resolve_strategies(["value_growth", "presets"])) == 6
+    try:
+        resolve_strategies(["nope"])
+        assert False, "未知策略应报错"
+    except ValueError:
+        pass
+    print(f"✅ 共 {len(everything)} 个策略可用")
+
+def test_parquet_partitions():
+    """测试 Parquet 分区写出与汇总"""
+    print("🧪 测试: Parquet 分区")
+    source = make_universe_file()
+    output = tempfile.mkdtemp()
+    summary = main(["--input", source, "--output-dir", output, "--date", "2024-06-04", "--workers", "2",
+                    "-s", "presets", "-s", "momentum_breakout_entry"])
+
+    assert set(summary["screeners"]) == {s[1] for s in resolve_strategies(["presets", "momentum_breakout_entry"])}
+    assert {"加载快照", "并行筛选", "写出结果"} <= set(summary["timings"])
+    with open(os.path.join(output, "date=2024-06-04", SUMMARY_FILE), encoding="utf-8") as f:
+        assert json.load(f)["screeners"] == summary["screeners"]
+
+    dataset = ds.dataset(output, format="parquet", partitioning="hive").to_table().to_pandas()
+    counts = dataset.groupby("screener", observed=True).size().to_dict()
+    assert counts == {k: v["rows"] for k, v in summary["screeners"].items() if v["rows"]}
+    assert (dataset["date"].astype(str) == "2024-06-04").all()
+
+    universe = pd.read_parquet(source)
+    expected = ParallelScreener(workers=1).run(universe, [("smart", "value_growth")], len(universe))
+    written = pd.read_parquet(summary["screeners"]["value_growth"]["path"])
+    assert written["股票代码"].astype(str).tolist() == \
+        expected[("smart", "value_growth")]["top"]["股票代码"].astype(str).tolist()
+    print(f"✅ {len(summary['screeners'])} 个筛选器分区写出，共 {len(dataset)} 行")
+
+def test_csv_and_top_k():
+    """测试 CSV 输出、前K名与重跑覆盖"""
+    print("🧪 测试: CSV 输出")
+    source = make_universe_file()
+    output = tempfile.mkdtemp()
+    for _ in range(2):  # 重跑同一天覆盖原分区
+        summary = main(["--input", source, "--output-dir", output, "--date", "2024-06-05", "--format", "csv",
+                        "--top-k", "3", "--workers", "1", "-s", "dividend_stable"])
+    partition = os.path.join(output, "date=2024-06-05", "screener=dividend_stable")
+    assert os.listdir(partition) == ["part-0.csv"]
+    written = pd.read_csv(os.path.join(partition, "part-0.csv"), dtype={"股票代码": str}, encoding="utf-8-sig")
+    expected = ParallelScreener(workers=1).run(pd.read_parquet(source), [("smart", "dividend_stable")], 3)
+    assert written["股票代码"].tolist() == expected[("smart", "dividend_stable")]["top"]["股票代码"].astype(str).tolist()
+    assert len(written) == summary["screeners"]["dividend_stable"]["rows"] <= 3
+    assert written["股息率"].is_monotonic_decreasing
+    print("✅ CSV 分区只保留前K名，重跑覆盖旧结果")
+
+if __name__ == "__main__":
+    test_resolve_strategies()
+    test_parquet_partitions()
+    test_csv_and_top_k()
+    print("🎉 批量筛选命令行测试通过")
@@ -0,0 +1,86 @@
+"""
+测试数据管线基准测试
+验证各阶段在模拟与录制输入上都能运行、结果 JSON 结构完整、与历史结果对比，
+以及筛选规划器相对整表布尔掩码的前后对比
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import json
+import tempfile
+from benchmark_pipeline import (STAGES, PipelineInputs, _preset_masks, _preset_masks_boolean, compare_results,
+                                main, measure, run_benchmarks)
+
+def test_synthetic_inputs():
+    """测试模拟输入能被各解析和清洗函数完整处理"""
+    print("🧪 测试: 模拟输入")
+    inputs = PipelineInputs(120)
+    fetcher = STAGES["parse_sina"].prepare(inputs)[0]
+    assert len(fetcher.parse_sina_data(*inputs.sina_payload())) == 120
+    assert all(fetcher.parse_tencent_data(line) for line in inputs.tencent_payload())
+
+    cleaned = inputs.cleaned()
+    assert 0 < len(cleaned) <= 120 and (cleaned["最新价"] > 0).all()
+    assert {"RSI", "量比", "综合评分"} <= set(inputs.realtime().columns)
+    assert len(inputs.universe()) == 120
+    print(f"✅ 120 只模拟行情全部解析，清洗后保留 {len(cleaned)} 只")
+
+def test_run_and_compare():
+    """测试运行全部阶段、写出 JSON 并与历史结果对比"""
+    print("🧪 测试: 运行与对比")
+    output = os.path.join(tempfile.mkdtemp(), "run.json")
+    report = main(["--sizes", "50", "200", "--repeat", "1", "--output", output])
+
+    assert {(r["stage"], r["rows"]) for r in report["results"]} == {(s, n) for s in STAGES for n in (50, 200)}
+    for result in report["results"]:
+        assert result["seconds_min"] > 0 and result["seconds_median"] >= result["seconds_min"]
+        assert result["peak_bytes"] > 0 and result["input"] == "synthetic"
+    with open(output, encoding="utf-8") as f:
+        saved = json.load(f)
+    assert saved["meta"]["sizes"] == [50, 200] and saved["meta"]["pandas"]
+
+    again = run_benchmarks([50], ["clean_realtime", "format_table"], repeat=1)
+    rows = compare_results(again, saved)
+    assert {row["stage"] for row in rows} == {"clean_realtime", "format_table"}
+    assert all(row["time_ratio"] > 0 for row in rows)
+    print(f"✅ {len(report['results'])} 项结果已写入 JSON，可与历史结果逐项对比")
+
+def test_recorded_inputs():
+    """测试录制输入循环平铺到所需规模"""
+    print("🧪 测试: 录制输入")
+    directory = tempfile.mkdtemp()
+    sample = PipelineInputs(3, seed=7)
+    with open(os.path.join(directory, "sina.txt"), "w", encoding="utf-8") as f:
+        f.write(sample.sina_payload()[0])
+    with open(os.path.join(directory, "tencent.txt"), "w", encoding="utf-8") as f:
+        f.write("\n".join(sample.tencent_payload()))
+    sample.raw_spot().to_csv(os.path.join(directory, "spot.csv"), index=False)
+
+    inputs = PipelineInputs(10, recorded_dir=directory)
+    text, codes = inputs.sina_payload()
+    assert len(text.split("\n")) == 10 and codes[:3] == sample.codes and codes[3] == sample.codes[0]
+    assert len(inputs.tencent_payload()) == 10 and len(inputs.raw_spot()) == 10
+
+    report = run_benchmarks([10], ["parse_sina", "parse_tencent", "clean_realtime"], repeat=1, recorded_dir=directory)
+    assert all(r["input"] == "recorded" for r in report["results"])
+    print("✅ 3 条录制行情平铺到 10 行并完成计时")
+
+def test_planner_beats_boolean_mask():
+    """测试规划器 + 快照类别位图与整表布尔掩码结果相同，在大快照上更快"""
+    print("🧪 测试: 规划器对比布尔掩码")
+    inputs = PipelineInputs(50000)
+    assert _preset_masks(inputs.universe()) == _preset_masks_boolean(inputs.universe())
+
+    planner = measure(STAGES["preset_masks"], inputs, repeat=5)["seconds_min"]
+    baseline = measure(STAGES["preset_masks_boolean"], inputs, repeat=5)["seconds_min"]
+    assert planner < baseline, (planner, baseline)
+    print(f"✅ 50000 行 6 个预设: 规划器 {planner * 1000:.1f} ms，布尔掩码 {baseline * 1000:.1f} ms")
+
+if __name__ == "__main__":
+    test_synthetic_inputs()
+    test_run_and_compare()
+    test_recorded_inputs()
+    test_planner_beats_boolean_mask()
+    print("🎉 基准测试套件测试通过")
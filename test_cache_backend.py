@@ -0,0 +1,233 @@
+"""
+测试统一缓存接口
+验证序列化往返、LRU 与过期、磁盘后端跨实例共享与容量上限、交易时段过期时间，
+缓存装饰器按函数签名生成缓存键，以及各后端按命名空间清除
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import fnmatch
+import tempfile
+import time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import cache_backend
+from cache_backend import (_MISSING, CHINA_TZ, Cache, DiskBackend, MemoryLRUBackend, RedisBackend,
+                           cached, deserialize, estimate_size, market_ttl, serialize, set_cache_backend)
+from snapshot_schema import enforce_snapshot_schema, snapshot_timestamp
+
+def make_frame() -> pd.DataFrame:
+    rng = np.random.default_rng(1)
+    return enforce_snapshot_schema(pd.DataFrame({
+        "股票代码": ["000001", "600519", "300750"],
+        "涨跌幅": rng.uniform(-5, 5, 3),
+        "成交量": [100, 200, 300],
+        "行业": ["银行", "白酒", "新能源"],
+    }))
+
+def test_serialization_roundtrip():
+    """测试序列化往返"""
+    print("🧪 测试: 序列化往返")
+    df = make_frame()
+    restored = deserialize(serialize(df))
+    pd.testing.assert_frame_equal(restored, df)
+    assert snapshot_timestamp(restored) == snapshot_timestamp(df)
+
+    value = (df, {"name": "平安银行"})
+    restored_df, info = deserialize(serialize(value))
+    assert info == {"name": "平安银行"} and restored_df.equals(df)
+    print("✅ DataFrame 与普通对象往返一致")
+
+def test_memory_lru_and_ttl():
+    """测试进程内 LRU 与过期"""
+    print("🧪 测试: LRU 与过期")
+    cache = Cache(MemoryLRUBackend(max_entries=2))
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)  # 淘汰最久未用的 b
+    assert cache.get("a") == 1 and cache.get("b") is None and cache.get("c") == 3
+
+    cache.set("short", "x", ttl=0.05, session_aware=False)
+    assert cache.get("short") == "x"
+    time.sleep(0.1)
+    assert cache.get("short") is None
+
+    df = make_frame()
+    cache.set("df", df)
+    copy = cache.get("df")
+    copy["新列"] = 1
+    assert "新列" not in cache.get("df").columns  # 调用方改动不影响缓存
+    print("✅ LRU 淘汰与过期正确")
+
+def test_memory_byte_budget():
+    """测试按字节数淘汰与统计"""
+    print("🧪 测试: 字节上限与统计")
+    frame = pd.DataFrame({"x": np.zeros(10000)})  # 约 80 KB
+    size = estimate_size(frame)
+    backend = MemoryLRUBackend(max_bytes=int(size * 2.5))
+    cache = Cache(backend)
+
+    for i in range(5):
+        cache.set(f"history_{i}", frame)
+    stats = cache.stats()
+    assert stats["entries"] == 2 and stats["evictions"] == 3
+    assert stats["bytes"] <= backend.max_bytes
+
+    cache.set("huge", pd.DataFrame({"x": np.zeros(100000)}))  # 超过上限，不缓存
+    assert cache.get("huge") is None
+
+    cache.get("history_4")
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1 and stats["rejections"] == 1
+    print(f"✅ 占用 {stats['bytes']} / {stats['max_bytes']} 字节，淘汰 {stats['evictions']} 次")
+
+def test_disk_backend_shared():
+    """测试磁盘后端跨实例共享"""
+    print("🧪 测试: 磁盘后端共享")
+    directory = tempfile.mkdtemp()
+    writer, reader = Cache(DiskBackend(directory)), Cache(DiskBackend(directory))
+    df = make_frame()
+    writer.set("snapshot", df, ttl=60, session_aware=False)
+    pd.testing.assert_frame_equal(reader.get("snapshot"), df)
+
+    calls = []
+    value = reader.get_or_compute("computed", lambda: calls.append(1) or 42)
+    assert writer.get_or_compute("computed", lambda: calls.append(1) or 0) == 42 == value
+    assert len(calls) == 1
+    print("✅ 两个实例共享同一份缓存")
+
+def test_disk_byte_budget():
+    """测试磁盘后端按字节数和条目数淘汰最久未使用的文件，过期文件优先删除"""
+    print("🧪 测试: 磁盘容量上限")
+    directory = tempfile.mkdtemp()
+    backend = DiskBackend(directory, max_bytes=3500, max_entries=4)
+    payload = b"x" * 1000
+    for i in range(3):
+        backend.set(f"k{i}", payload)
+        time.sleep(0.01)
+    backend.get("k0")  # k0 变为最近使用
+    time.sleep(0.01)
+    backend.set("k3", payload)
+    assert backend.get("k1") is _MISSING and backend.get("k0") == payload
+    stats = backend.stats()
+    assert stats["bytes"] <= 3500 and stats["entries"] == 3 and stats["evictions"] == 1
+
+    backend.set("short", b"y" * 10, ttl=0.01)
+    time.sleep(0.05)
+    backend.set("k4", b"z" * 10)
+    assert backend.stats()["expirations"] >= 1 and backend.get("k4") == b"z" * 10
+    assert backend.get("k0") == payload
+
+    backend.set("huge", b"h" * 5000)
+    assert backend.get("huge") is _MISSING and backend.stats()["rejections"] == 1
+
+    counted = DiskBackend(tempfile.mkdtemp(), max_entries=2)
+    for i in range(5):
+        counted.set(f"n{i}", b"v")
+    assert counted.stats()["entries"] == 2 and counted.get("n4") == b"v"
+    print(f"✅ 占用 {stats['bytes']} / {stats['max_bytes']} 字节，淘汰 {stats['evictions']} 次")
+
+def test_market_ttl():
+    """测试交易时段过期时间"""
+    print("🧪 测试: 交易时段过期")
+    trading = datetime(2024, 6, 4, 10, 0, tzinfo=CHINA_TZ)     # 周二上午
+    lunch = datetime(2024, 6, 4, 12, 0, tzinfo=CHINA_TZ)       # 午休
+    weekend = datetime(2024, 6, 8, 20, 0, tzinfo=CHINA_TZ)     # 周六晚
+    assert market_ttl(300, trading) == 300
+    assert market_ttl(300, lunch) == 3600
+    assert market_ttl(300, weekend) == (datetime(2024, 6, 10, 9, 15, tzinfo=CHINA_TZ) - weekend).total_seconds()
+    print("✅ 休市期间缓存到下一次开盘")
+
+def test_cached_decorator():
+    """测试缓存装饰器"""
+    print("🧪 测试: 缓存装饰器")
+    previous = cache_backend._cache
+    set_cache_backend(MemoryLRUBackend())
+    try:
+        calls = []
+
+        class Fetcher:
+            @cached(ttl=60)
+            def fetch(_self, num: int = 5):
+                calls.append(num)
+                return pd.DataFrame({"x": range(num)})
+
+        assert len(Fetcher().fetch(3)) == 3
+        assert len(Fetcher().fetch(3)) == 3  # 不同实例共享缓存
+        Fetcher().fetch(4)
+        assert calls == [3, 4]
+
+        # 位置参数、关键字参数与省略默认值的调用是同一个键
+        Fetcher().fetch(num=3)
+        Fetcher().fetch()
+        Fetcher().fetch(num=5)
+        assert calls == [3, 4, 5]
+    finally:
+        # 还原全局缓存，不影响之后的测试
+        cache_backend._cache = previous
+    print("✅ 相同参数只计算一次")
+
+class DictRedisClient:
+    """只实现 RedisBackend 用到的命令的内存客户端"""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, px=None):
+        self.data[key] = value
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+    def scan_iter(self, match="*"):
+        return [key for key in list(self.data) if fnmatch.fnmatchcase(key, match)]
+
+def test_clear_by_namespace():
+    """测试各后端只清除缓存前端所在命名空间的键"""
+    print("🧪 测试: 按命名空间清除")
+    backends = [MemoryLRUBackend(), DiskBackend(tempfile.mkdtemp()), RedisBackend(client=DictRedisClient())]
+    for backend in backends:
+        ours, other = Cache(backend, namespace="ns_a"), Cache(backend, namespace="ns_b")
+        ours.set("k", 1, ttl=60, session_aware=False)
+        other.set("k", 2, ttl=60, session_aware=False)
+        ours.clear()
+        assert ours.get("k") is None, type(backend).__name__
+        assert other.get("k") == 2, type(backend).__name__
+    print(f"✅ {len(backends)} 种后端只清除本命名空间")
+
+def test_redis_backend():
+    """测试 Redis 协议后端（需要 redis 包和 STOCK_CACHE_URL 指向的服务）"""
+    print("🧪 测试: Redis 后端")
+    url = os.environ.get("STOCK_CACHE_URL")
+    try:
+        backend = RedisBackend(url or "redis://localhost:6379/0")
+        backend.client.ping()
+    except Exception as e:
+        print(f"⚠️ 跳过: {e}")
+        return
+    cache = Cache(backend, namespace="stock_screener_test")
+    df = make_frame()
+    cache.set("snapshot", df, ttl=60, session_aware=False)
+    pd.testing.assert_frame_equal(cache.get("snapshot"), df)
+    cache.delete("snapshot")
+    assert cache.get("snapshot") is None
+    print("✅ Redis 后端读写正确")
+
+if __name__ == "__main__":
+    test_serialization_roundtrip()
+    test_memory_lru_and_ttl()
+    test_memory_byte_budget()
+    test_disk_backend_shared()
+    test_disk_byte_budget()
+    test_market_ttl()
+    test_cached_decorator()
+    test_clear_by_namespace()
+    test_redis_backend()
+    print("🎉 统一缓存接口测试通过")
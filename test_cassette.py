@@ -0,0 +1,167 @@
+"""
+测试数据源录制与回放
+验证 akshare 式模块调用、yfinance 式对象与属性、HTTP 响应的录制与离线回放，
+回放节奏、异常重现与未录制调用
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import tempfile
+import time
+import pandas as pd
+import pyarrow.parquet as pq
+from cassette import (MODE_RECORD, MODE_REPLAY, PACING_FAST, PACING_RECORDED, CassetteMiss, ReplayedError,
+                      http_session, recordable, use_cassette)
+from china_a_stock_fetcher import ChinaAStockFetcher
+from quote_server import FaultProfile, QuoteBook, QuoteServer
+from synthetic_market import generate_synthetic_market
+
+class FakeTicker:
+    def __init__(self, symbol: str, source: "FakeSource"):
+        self.symbol = symbol
+        self.source = source
+
+    @property
+    def info(self) -> dict:
+        self.source.calls += 1
+        return {"symbol": self.symbol, "currentPrice": 12.5}
+
+    def history(self, period: str = "1mo") -> pd.DataFrame:
+        self.source.calls += 1
+        return pd.DataFrame({"Close": [1.0, 2.0, 3.0]}, index=pd.date_range("2024-01-01", periods=3))
+
+class FakeSource:
+    """模拟 akshare / yfinance 这类数据源模块"""
+
+    def __init__(self, delay: float = 0.0):
+        self.calls = 0
+        self.delay = delay
+
+    def stock_zh_a_spot_em(self) -> pd.DataFrame:
+        self.calls += 1
+        time.sleep(self.delay)
+        return pd.DataFrame({"代码": ["600519", "000001"], "最新价": [1700.0, 11.2]})
+
+    def stock_financial_abstract_ths(self, symbol: str) -> pd.DataFrame:
+        self.calls += 1
+        if symbol == "999999":
+            raise ValueError("无此股票")
+        return pd.DataFrame({"报告期": ["2023"], "净利润": [f"{symbol}亿"]})
+
+    def Ticker(self, symbol: str) -> FakeTicker:
+        self.calls += 1
+        return FakeTicker(symbol, self)
+
+def cassette_path() -> str:
+    return os.path.join(tempfile.mkdtemp(), "tape.parquet")
+
+def test_module_record_replay():
+    """测试模块函数、返回对象及其属性的录制回放，回放时不调用数据源"""
+    print("🧪 测试: 模块调用录制回放")
+    path = cassette_path()
+    source = FakeSource()
+    ak = recordable(source, "akshare")
+    yf = recordable(source, "yfinance")
+
+    assert len(ak.stock_zh_a_spot_em()) == 2 and source.calls == 1  # 未启用录制带时直接转发
+    with use_cassette(path, MODE_RECORD) as cassette:
+        spot = ak.stock_zh_a_spot_em()
+        abstract = ak.stock_financial_abstract_ths(symbol="600519")
+        ticker = yf.Ticker("AAPL")
+        info, history = ticker.info, ticker.history(period="1mo")
+    assert cassette.stats["recorded"] == 5
+    table = pq.read_table(path)
+    assert table.column_names == ["seq", "key", "kind", "offset", "duration", "error", "payload"]
+
+    calls = source.calls
+    with use_cassette(path, MODE_REPLAY) as cassette:
+        pd.testing.assert_frame_equal(ak.stock_zh_a_spot_em(), spot)
+        pd.testing.assert_frame_equal(ak.stock_financial_abstract_ths(symbol="600519"), abstract)
+        ticker = yf.Ticker("AAPL")
+        assert ticker.info == info
+        pd.testing.assert_frame_equal(ticker.history(period="1mo"), history, check_freq=False)
+        pd.testing.assert_frame_equal(ak.stock_zh_a_spot_em(), spot)  # 用完后重复最后一条
+    assert source.calls == calls and cassette.stats["replayed"] == 6
+    print(f"✅ 录制 {len(table)} 条，回放期间数据源调用 0 次")
+
+def test_errors_and_misses():
+    """测试录制的异常在回放时重现，未录制的调用报 CassetteMiss"""
+    print("🧪 测试: 异常与未录制调用")
+    path = cassette_path()
+    ak = recordable(FakeSource(), "akshare")
+    with use_cassette(path, MODE_RECORD):
+        try:
+            ak.stock_financial_abstract_ths(symbol="999999")
+        except ValueError:
+            pass
+
+    with use_cassette(path, MODE_REPLAY) as cassette:
+        try:
+            ak.stock_financial_abstract_ths(symbol="999999")
+            raise AssertionError("应重现录制的异常")
+        except ValueError as e:
+            assert "无此股票" in str(e)
+        try:
+            ak.stock_financial_abstract_ths(symbol="000001")
+            raise AssertionError("未录制的调用应报错")
+        except CassetteMiss:
+            pass
+    assert cassette.stats["misses"] == 1
+    assert issubclass(ReplayedError, Exception)
+    print("✅ 异常类型与消息按录制重现，未录制调用报 CassetteMiss")
+
+def test_replay_pacing():
+    """测试按录制间隔回放与尽快回放"""
+    print("🧪 测试: 回放节奏")
+    path = cassette_path()
+    ak = recordable(FakeSource(delay=0.05), "akshare")
+    with use_cassette(path, MODE_RECORD):
+        for _ in range(4):
+            ak.stock_zh_a_spot_em()
+
+    timings = {}
+    for pacing in (PACING_RECORDED, PACING_FAST):
+        with use_cassette(path, MODE_REPLAY, pacing=pacing):
+            started = time.perf_counter()
+            for _ in range(4):
+                ak.stock_zh_a_spot_em()
+            timings[pacing] = time.perf_counter() - started
+    assert timings[PACING_RECORDED] >= 0.19 and timings[PACING_FAST] < 0.1
+    print(f"✅ 按录制间隔 {timings[PACING_RECORDED]:.2f} 秒，尽快回放 {timings[PACING_FAST]:.3f} 秒")
+
+def test_http_record_replay():
+    """测试经 http_session 的抓取代码在行情服务停止后仍可回放"""
+    print("🧪 测试: HTTP 录制回放")
+    market = generate_synthetic_market(40, 20, seed=9)
+    codes = [f"{code}.{'SH' if code.startswith('6') else 'SZ'}" for code in market.codes
+             if code.startswith(("0", "3", "6"))][:10]
+    path = cassette_path()
+    with QuoteServer(QuoteBook.from_market(market), FaultProfile(seed=1)).start() as server:
+        fetcher = ChinaAStockFetcher(sina_base_url=server.url, tencent_base_url=server.url)
+        with use_cassette(path, MODE_RECORD):
+            sina = fetcher.fetch_sina_data(codes)
+            tencent = fetcher.fetch_tencent_data(codes[:3])
+        recorded = dict(server.stats)
+    assert len(sina) == len(codes)
+
+    with use_cassette(path) as cassette:  # 文件已存在，默认回放
+        assert cassette.mode == MODE_REPLAY
+        assert fetcher.fetch_sina_data(codes) == sina
+        assert fetcher.fetch_tencent_data(codes[:3]) == tencent
+        try:
+            http_session().get(f"{server.url}/list=sh600000", timeout=1)
+            raise AssertionError("未录制的请求应报错")
+        except CassetteMiss:
+            pass
+    assert cassette.stats["replayed"] == 4 and cassette.stats["misses"] == 1
+    assert sum(recorded["sina"].values()) == 1 and sum(recorded["tencent"].values()) == 3
+    print(f"✅ 服务停止后回放 {len(sina)} 条新浪与 {len(tencent)} 条腾讯行情")
+
+if __name__ == "__main__":
+    test_module_record_replay()
+    test_errors_and_misses()
+    test_replay_pacing()
+    test_http_record_replay()
+    print("🎉 数据源录制回放测试通过")
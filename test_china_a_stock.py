@@ -1,6 +1,9 @@
 """
 中国A股数据获取器本地测试脚本
 测试数据获取功能和格式正确性
+
+离线运行: 先以 STOCK_CASSETTE=cassettes/a_share.parquet STOCK_CASSETTE_MODE=record 录制一次，
+之后改用 STOCK_CASSETTE_MODE=replay 回放（不访问网络）
 """
 
 import sys
@@ -0,0 +1,153 @@
+"""
+测试派生列注册表
+验证只计算筛选器需要的派生列、按快照缓存、模拟指标按股票代码播种（与分片无关），
+整列计算的综合评分与逐行规则一致，以及多线程并发补齐派生列时缓存不损坏
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import threading
+import numpy as np
+import pandas as pd
+import derived_columns
+from derived_columns import MEMO_SNAPSHOTS, DerivedColumnRegistry, clear_derived_cache
+from real_data_fetcher import RealDataFetcher
+from smart_stock_screener import SmartStockScreener
+
+def make_registry(calls: list) -> DerivedColumnRegistry:
+    registry = DerivedColumnRegistry("test")
+
+    @registry.register("A", inputs=["价格"])
+    def _a(df, rng):
+        calls.append("A")
+        return df["价格"].to_numpy() * 2
+
+    @registry.register("B", inputs=["A"])
+    def _b(df, rng):
+        calls.append("B")
+        return df["A"].to_numpy() + rng.uniform(0, 1, len(df))
+
+    @registry.register("C")
+    def _c(df, rng):
+        calls.append("C")
+        return np.zeros(len(df))
+
+    return registry
+
+def test_resolve_and_lazy_compute():
+    """测试依赖解析与按需计算"""
+    print("🧪 测试: 按需计算派生列")
+    clear_derived_cache()
+    calls = []
+    registry = make_registry(calls)
+    df = pd.DataFrame({"股票代码": ["000001", "000002"], "价格": [1.0, 2.0]})
+
+    assert registry.resolve(["B", "价格"]) == ["A", "B"]
+    result = registry.materialize(df, ["B"])
+    assert calls == ["A", "B"]
+    assert "C" not in result.columns
+    assert "A" not in df.columns  # 不修改原快照
+
+    # 同一快照再次请求时直接取缓存
+    again = registry.materialize(df, ["B", "C"])
+    assert calls == ["A", "B", "C"]
+    assert np.array_equal(again["B"].to_numpy(), result["B"].to_numpy())
+    assert registry.materialize(df, []) is df
+    print("✅ 只计算需要的列，且同一快照只计算一次")
+
+def test_comprehensive_score_matches_rules():
+    """测试整列综合评分与逐行评分规则一致"""
+    print("🧪 测试: 综合评分整列计算")
+
+    def reference(row):
+        score = 50
+        change_pct = row['涨跌幅']
+        score += 25 if change_pct > 5 else 15 if change_pct > 2 else 8 if change_pct > 0 else 0 if change_pct > -2 else -10
+        volume_ratio = row['量比']
+        score += 15 if volume_ratio > 3 else 10 if volume_ratio > 2 else 5 if volume_ratio > 1.5 else 0
+        pe = row['PE']
+        score += 10 if 0 < pe < 15 else 5 if 15 <= pe < 25 else -5 if pe >= 50 else 0
+        turnover = row['换手率']
+        score += 10 if 2 <= turnover <= 8 else 5 if (1 <= turnover < 2 or 8 < turnover <= 15) else 0
+        return max(0, min(100, score))
+
+    rng = np.random.default_rng(3)
+    df = pd.DataFrame({
+        "涨跌幅": rng.uniform(-10, 10, 500),
+        "量比": rng.uniform(0, 5, 500),
+        "PE": rng.uniform(-20, 80, 500),
+        "换手率": rng.uniform(0, 20, 500),
+    }, index=rng.permutation(500))
+    df.iloc[:10, 0] = np.nan
+
+    scores = RealDataFetcher._calculate_comprehensive_score(df)
+    expected = df.apply(reference, axis=1)
+    assert scores.index.equals(df.index)
+    assert np.allclose(scores.to_numpy(), expected.to_numpy())
+    print("✅ 整列评分与逐行规则一致")
+
+def test_screener_requests_only_needed_columns():
+    """测试筛选器只请求自身用到的派生列"""
+    print("🧪 测试: 筛选器所需列")
+    screener = SmartStockScreener()
+    columns = screener.required_columns("value_growth")
+    assert "RSI" not in columns and "KDJ_K" not in columns
+    assert "综合评分" in columns
+
+    df = screener.fetcher.get_china_a_stock_data(num_stocks=20, use_real_data=False, columns=columns)
+    assert "RSI" not in df.columns and "MA5" not in df.columns
+    assert "综合评分" in df.columns
+
+    columns = screener.required_columns("momentum_breakout")
+    assert {"MA5", "MA20", "RSI", "成交量比"} <= set(columns)
+    print("✅ 价值成长筛选器不计算技术指标")
+
+def test_keyed_by_stock_code():
+    """测试模拟指标按股票代码播种：整表计算与分片计算的值相同"""
+    print("🧪 测试: 按代码播种")
+    clear_derived_cache()
+    registry = make_registry([])
+    df = pd.DataFrame({"股票代码": [f"{i:06d}" for i in range(300)], "价格": np.arange(300.0)})
+    whole = registry.materialize(df, ["B"])["B"].to_numpy()
+    shards = [registry.materialize(df.iloc[start:start + 70].reset_index(drop=True), ["B"])["B"].to_numpy()
+              for start in range(0, len(df), 70)]
+    assert np.array_equal(whole, np.concatenate(shards))
+    reordered = registry.materialize(df.iloc[::-1].reset_index(drop=True), ["B"])["B"].to_numpy()
+    assert np.array_equal(whole, reordered[::-1])
+    print("✅ 分片、换序后每只股票的模拟值不变")
+
+def test_concurrent_materialize():
+    """测试多线程在不同快照上并发补齐派生列"""
+    print("🧪 测试: 并发补齐派生列")
+    clear_derived_cache()
+    registry = make_registry([])
+    frames = [pd.DataFrame({"股票代码": [f"{i:03d}{j:03d}" for j in range(50)], "价格": np.arange(50.0) + i})
+              for i in range(MEMO_SNAPSHOTS * 3)]
+    errors = []
+
+    def work(offset: int):
+        try:
+            for round_ in range(20):
+                df = frames[(offset + round_) % len(frames)]
+                result = registry.materialize(df, ["B"])
+                assert np.array_equal(result["A"].to_numpy(), df["价格"].to_numpy() * 2)
+        except Exception as e:  # 线程内的异常汇总到主线程断言
+            errors.append(e)
+
+    threads = [threading.Thread(target=work, args=(offset,)) for offset in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == [] and len(derived_columns._memo) <= MEMO_SNAPSHOTS
+    print(f"✅ 8 个线程并发补齐，缓存保留 {len(derived_columns._memo)} 份快照")
+
+if __name__ == "__main__":
+    test_resolve_and_lazy_compute()
+    test_keyed_by_stock_code()
+    test_comprehensive_score_matches_rules()
+    test_screener_requests_only_needed_columns()
+    test_concurrent_materialize()
+    print("🎉 派生列注册表测试通过")
@@ -0,0 +1,163 @@
+"""
+测试多节点分片筛选
+验证消息编解码（不执行 pickle）、本机队列与 TCP 两种模式的合并结果、节点断开后分片重新分配，
+以及本机工作进程退出后不会无限等待
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import multiprocessing
+import pickle
+import random
+import socket
+import struct
+import tempfile
+import threading
+import time
+import pandas as pd
+from china_a_stock_fetcher import ChinaAStockFetcher
+from distributed_screen import (ScreenCoordinator, ShardWorker, decode_message, encode_message,
+                                recv_message, send_message, shard_codes)
+from parallel_screen import merge_results, screen_frame
+
+STRATEGIES = [("smart", "value_growth"), ("smart", "momentum_breakout")]
+
+def make_codes(n: int = 600):
+    prefixes = ["000", "002", "300", "600", "688"]
+    return [f"{prefixes[i % 5]}{i:03d}.{'SH' if prefixes[i % 5] in ('600', '688') else 'SZ'}" for i in range(n)]
+
+_universe = None
+
+def fixed_loader(codes, use_real_data=False) -> pd.DataFrame:
+    """各节点从同一份固定数据中取自己的分片（代替本地行情库）"""
+    global _universe
+    if _universe is None:
+        random.seed(39)
+        _universe = ChinaAStockFetcher().generate_enhanced_mock_data(make_codes(), columns=[])
+    wanted = {code[:6] for code in codes}
+    return _universe[_universe["股票代码"].isin(wanted)].reset_index(drop=True)
+
+def expected_results(shards: int, top_k: int):
+    outputs = [screen_frame(fixed_loader(part), STRATEGIES, top_k) for part in shard_codes(make_codes(), shards)]
+    return merge_results(STRATEGIES, outputs, top_k)
+
+def assert_same_top(actual: pd.DataFrame, expected: pd.DataFrame):
+    # 类别列跨分片合并后可能变为字符串，只比较取值
+    pd.testing.assert_frame_equal(actual.astype(str), expected.astype(str))
+
+def crashing_loader(codes, use_real_data=False) -> pd.DataFrame:
+    """处理含 CRASH_CODE 的分片时进程直接退出（标记文件存在时只退出一次）"""
+    marker = os.environ["CRASH_MARKER"]
+    if os.environ["CRASH_CODE"] in codes and not os.path.exists(marker):
+        if os.environ.get("CRASH_ONCE"):
+            open(marker, "w").close()
+        time.sleep(0.3)
+        os._exit(3)
+    return fixed_loader(codes, use_real_data)
+
+class Exploit:
+    triggered = []
+
+    def __reduce__(self):
+        return (Exploit.triggered.append, ("pickle executed",))
+
+def tcp_worker(host: str, port: int, name: str):
+    ShardWorker(name, fixed_loader).serve_tcp(host, port)
+
+def test_message_roundtrip():
+    """测试消息编解码"""
+    print("🧪 测试: 消息编解码")
+    frame = fixed_loader(make_codes()[:20])
+    header, frames = decode_message(encode_message({"type": "result", "matched": {"a": 3}},
+                                                   {"top": frame, "empty": pd.DataFrame()}))
+    assert header == {"type": "result", "matched": {"a": 3}}
+    pd.testing.assert_frame_equal(frames["top"], frame)
+    assert frames["empty"].empty
+
+    # 表格数据不是 Arrow IPC（如 pickle）时解码失败，不会执行其中的代码
+    payload = pickle.dumps(Exploit())
+    head = f'{{"type": "result", "frames": [["top", {len(payload)}]]}}'.encode()
+    try:
+        decode_message(struct.pack("!I", len(head)) + head + payload)
+        assert False, "非 Arrow 数据应解码失败"
+    except Exception as e:
+        assert not isinstance(e, AssertionError)
+    assert Exploit.triggered == []
+    print("✅ JSON 头与表格往返一致，pickle 数据被拒绝")
+
+def test_local_queue_mode():
+    """测试本机消息队列模式"""
+    print("🧪 测试: 本机队列模式")
+    coordinator = ScreenCoordinator(make_codes(), STRATEGIES, top_k=8, shards=5)
+    result = coordinator.run_local(workers=2, timeout=120, loader=fixed_loader)
+
+    stats = result["stats"]
+    assert stats["completed"] == 5 and stats["rows"] == 600 and not stats["failed"]
+    assert sum(w["shards"] for w in stats["workers"].values()) == 5
+
+    expected = expected_results(5, 8)
+    for strategy in STRATEGIES:
+        assert result["results"][strategy]["matched"] == expected[strategy]["matched"]
+        assert_same_top(result["results"][strategy]["top"], expected[strategy]["top"])
+    print(f"✅ {len(stats['workers'])} 个工作进程完成 5 个分片，合并结果与单机一致")
+
+def test_local_worker_exit():
+    """测试本机工作进程退出：分片重新排队；全部退出时返回失败而不是无限等待"""
+    print("🧪 测试: 本机工作进程退出")
+    codes = make_codes()
+    os.environ["CRASH_CODE"] = shard_codes(codes, 5)[2][0]
+    os.environ["CRASH_MARKER"] = os.path.join(tempfile.mkdtemp(), "crashed")
+
+    os.environ["CRASH_ONCE"] = "1"
+    result = ScreenCoordinator(codes, STRATEGIES, top_k=8, shards=5).run_local(workers=2, loader=crashing_loader)
+    assert result["stats"]["completed"] == 5 and not result["stats"]["failed"]
+
+    del os.environ["CRASH_ONCE"]
+    os.remove(os.environ["CRASH_MARKER"])
+    started = time.time()
+    result = ScreenCoordinator(codes, STRATEGIES, top_k=8, shards=5).run_local(workers=1, loader=crashing_loader)
+    stats = result["stats"]
+    assert stats["failed"] and stats["completed"] + len(stats["failed"]) == 5
+    assert time.time() - started < 30
+    print(f"✅ 退出进程的分片已重新分配；唯一进程退出后 {len(stats['failed'])} 个分片记为失败")
+
+def test_tcp_mode_with_disconnect():
+    """测试 TCP 模式与节点断开后重新分配"""
+    print("🧪 测试: TCP 模式与节点断开")
+    coordinator = ScreenCoordinator(make_codes(), STRATEGIES, top_k=8, shards=6)
+    host, port = coordinator.listen("127.0.0.1", 0)
+    outcome = {}
+    server = threading.Thread(target=lambda: outcome.update(coordinator.serve(timeout=120)))
+    server.start()
+
+    # 一个节点领取分片后直接断开
+    with socket.create_connection((host, port)) as sock:
+        send_message(sock, encode_message({"type": "hello", "worker": "flaky"}))
+        lost, _ = decode_message(recv_message(sock))
+    assert lost["type"] == "task"
+
+    context = multiprocessing.get_context()
+    workers = [context.Process(target=tcp_worker, args=(host, port, f"node-{i}")) for i in range(2)]
+    for worker in workers:
+        worker.start()
+    server.join(150)
+    for worker in workers:
+        worker.join(10)
+
+    stats = outcome["stats"]
+    assert stats["completed"] == 6 and not stats["failed"] and stats["rows"] == 600
+    assert set(stats["workers"]) <= {"node-0", "node-1"}
+
+    expected = expected_results(6, 8)
+    for strategy in STRATEGIES:
+        assert_same_top(outcome["results"][strategy]["top"], expected[strategy]["top"])
+    print(f"✅ 断开节点的分片 {lost['shard']} 已重新分配，6 个分片全部完成")
+
+if __name__ == "__main__":
+    test_message_roundtrip()
+    test_local_queue_mode()
+    test_local_worker_exit()
+    test_tcp_mode_with_disconnect()
+    print("🎉 多节点分片筛选测试通过")
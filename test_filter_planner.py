@@ -0,0 +1,93 @@
+"""
+测试筛选条件规划器
+验证规划执行结果与逐条件过滤一致，且高选择性条件排在前面执行
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+import pandas as pd
+from filter_planner import (FilterPlanner, RangePredicate, CategoryPredicate,
+                            CompareColumnsPredicate, ColumnHistogram, filter_rows, get_snapshot_statistics)
+
+def make_frame(n: int = 20000, seed: int = 5) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "涨跌幅": rng.normal(0, 3, n),
+        "RSI": rng.uniform(0, 100, n),
+        "MA5": rng.uniform(9, 11, n),
+        "MA20": rng.uniform(9, 11, n),
+        "行业": rng.choice(["银行", "医药", "科技", "消费", "券商"], n, p=[0.1, 0.2, 0.3, 0.3, 0.1]),
+    })
+
+def test_histogram_selectivity():
+    """测试直方图选择率估计"""
+    print("🧪 测试: 直方图选择率估计")
+    values = np.random.default_rng(1).uniform(0, 100, 100000)
+    histogram = ColumnHistogram(values)
+    assert abs(histogram.selectivity(20, 30) - 0.1) < 0.01
+    assert abs(histogram.selectivity(None, 50) - 0.5) < 0.01
+    assert histogram.selectivity(200, None) == 0.0
+    print("✅ 选择率估计准确")
+
+def test_planner_matches_sequential_filtering():
+    """测试规划执行与逐条件过滤结果一致"""
+    print("🧪 测试: 规划执行结果一致")
+    df = make_frame()
+    predicates = [
+        RangePredicate("RSI", 10, 90),
+        CompareColumnsPredicate("MA5", "MA20"),
+        RangePredicate("涨跌幅", 5, 8),
+        CategoryPredicate("行业", ["银行"], negate=True),
+        RangePredicate("不存在的列", 0, 1),
+    ]
+    expected = df[
+        df["RSI"].between(10, 90) & (df["MA5"] > df["MA20"])
+        & df["涨跌幅"].between(5, 8) & (df["行业"] != "银行")
+    ]
+    rows = filter_rows(df, predicates)
+    assert np.sort(rows).tolist() == expected.index.tolist()
+
+    # 最窄的涨跌幅区间最先执行
+    planner = FilterPlanner(df)
+    order = planner.plan(predicates)
+    assert order[0].label.startswith("涨跌幅")
+    assert len(order) == 4
+    print(f"✅ 执行顺序: {' → '.join(p.label for p in order)}")
+
+def test_short_circuit():
+    """测试结果为空时短路"""
+    print("🧪 测试: 短路执行")
+    df = make_frame()
+    planner = FilterPlanner(df)
+    rows = planner.execute([RangePredicate("RSI", 200, 300), RangePredicate("涨跌幅", -1, 1)])
+    assert len(rows) == 0
+    assert len(planner.explain()) == 1
+    print("✅ 空结果后不再执行后续条件")
+
+def test_statistics_shared_by_fingerprint():
+    """测试同一快照的副本共享统计信息，内容变化后重新统计"""
+    print("🧪 测试: 按指纹缓存统计")
+    df = make_frame(2000).assign(股票代码=[f"{i:06d}" for i in range(2000)])
+    stats = get_snapshot_statistics(df)
+    histogram = stats.histogram("RSI")
+    copy = df.copy(deep=False)
+    assert get_snapshot_statistics(copy) is stats and stats.histogram("RSI") is histogram
+
+    changed = df.assign(股票代码=[f"{i:06d}" for i in range(1, 2001)])
+    assert get_snapshot_statistics(changed) is not stats
+
+    # 内容相同的另一份快照同样共享；没有指纹列的表按对象缓存
+    assert get_snapshot_statistics(make_frame(2000).assign(股票代码=df["股票代码"])) is stats
+    first, second = make_frame(100).drop(columns="涨跌幅"), make_frame(100).drop(columns="涨跌幅")
+    assert get_snapshot_statistics(first) is not get_snapshot_statistics(second)
+    print("✅ 副本共享直方图，不同快照各自统计")
+
+if __name__ == "__main__":
+    test_histogram_selectivity()
+    test_planner_matches_sequential_filtering()
+    test_short_circuit()
+    test_statistics_shared_by_fingerprint()
+    print("🎉 筛选条件规划器测试通过")
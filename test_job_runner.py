@@ -0,0 +1,139 @@
+"""
+测试后台筛选任务
+验证阶段进度与中间结果上报、相同任务去重、失败状态、深层调用的过程信息经任务上报，
+以及并发首次获取全局执行器时只创建一个
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import threading
+import pandas as pd
+import job_runner
+from china_a_stock_fetcher import ChinaAStockFetcher
+from job_runner import DONE, FAILED, JobRunner, get_job_runner, report_progress, reporting
+
+def test_progress_and_partial():
+    """测试阶段进度与中间结果"""
+    print("🧪 测试: 阶段进度与中间结果")
+    runner = JobRunner(max_workers=2)
+    reported, release = threading.Event(), threading.Event()
+
+    def screen(job, n):
+        job.report(0.3, "📡 获取数据", partial=pd.DataFrame({"x": range(n)}))
+        reported.set()
+        release.wait(5)
+        job.report(0.8, "🔍 应用筛选")
+        return n * 2
+
+    job = runner.submit("preset", screen, 4, name="测试筛选")
+    assert reported.wait(5), "任务未在 5 秒内上报进度"
+    state = job.snapshot()
+    assert state["status"] == "running" and state["message"] == "📡 获取数据"
+    assert len(state["partial"]) == 4  # 任务未结束即可看到中间结果
+
+    release.set()
+    runner.wait(job.job_id, timeout=5)
+    assert job.status == DONE and job.result == 8 and job.progress == 1.0
+    assert [stage["阶段"] for stage in job.stages] == ["📡 获取数据", "🔍 应用筛选", "✅ 完成"]
+    assert all(stage["耗时"] is not None for stage in job.stages[:-1])
+    print(f"✅ 共 {len(job.stages)} 个阶段，耗时 {job.elapsed:.2f} 秒")
+
+def test_dedup_identical_jobs():
+    """测试相同任务去重"""
+    print("🧪 测试: 相同任务去重")
+    runner = JobRunner(max_workers=2)
+    release = threading.Event()
+    calls = []
+
+    def screen(job, key):
+        calls.append(key)
+        release.wait(5)
+        return key
+
+    first = runner.submit(("preset", "value_growth", True), screen, "a")
+    second = runner.submit(("preset", "value_growth", True), screen, "a")
+    other = runner.submit(("preset", "value_growth", False), screen, "b")
+    assert first is second and other is not first
+    assert runner.active_count() == 2
+
+    release.set()
+    runner.wait(first.job_id, timeout=5)
+    runner.wait(other.job_id, timeout=5)
+    assert sorted(calls) == ["a", "b"]
+
+    # 已结束的任务不再复用
+    again = runner.submit(("preset", "value_growth", True), screen, "a")
+    assert again is not first
+    runner.wait(again.job_id, timeout=5)
+    print("✅ 进行中的相同任务只执行一次")
+
+def test_failed_job():
+    """测试任务失败状态"""
+    print("🧪 测试: 任务失败")
+    runner = JobRunner(max_workers=1)
+
+    def broken(job):
+        job.report(0.4, "📡 获取数据")
+        raise ValueError("数据源不可用")
+
+    job = runner.wait(runner.submit("broken", broken).job_id, timeout=5)
+    assert job.status == FAILED and job.error == "数据源不可用"
+    assert job.progress == 0.4 and job.result is None
+    assert runner.active_count() == 0
+    print("✅ 失败原因记录在任务中")
+
+def test_fetcher_progress_reported_through_job():
+    """测试数据获取器在任务线程上的过程信息经 report 回调成为任务阶段，不调用页面"""
+    print("🧪 测试: 数据获取过程信息上报")
+    runner = JobRunner(max_workers=1)
+    fetcher = ChinaAStockFetcher()
+    fetcher.fetch_sina_data = lambda codes: {}
+    fetcher.fetch_tencent_data = lambda codes: {}
+
+    def screen(job):
+        def report(level, message):
+            job.report(job.progress + 0.05, message)
+        with reporting(report):
+            return len(fetcher.load_codes(fetcher.a_stock_codes[:5], use_real_data=True))
+
+    job = runner.submit("load", screen)
+    runner.wait(job.job_id, timeout=10)
+    assert job.status == DONE and job.result == 5
+    messages = [stage["阶段"] for stage in job.stages]
+    assert messages[:4] == ["🇨🇳 正在获取A股实时数据...", "尝试新浪财经...", "尝试腾讯财经...", "📊 使用A股模拟数据..."]
+
+    report_progress("info", "上下文外只写日志")  # 不报错、不需要页面
+    print(f"✅ {len(messages) - 1} 条过程信息成为任务阶段")
+
+def test_single_global_runner():
+    """测试多线程同时首次获取全局执行器时得到同一个实例"""
+    print("🧪 测试: 全局执行器单例")
+    previous = job_runner._job_runner
+    job_runner._job_runner = None
+    try:
+        barrier = threading.Barrier(16)
+        runners = []
+
+        def fetch():
+            barrier.wait()
+            runners.append(get_job_runner())
+
+        threads = [threading.Thread(target=fetch) for _ in range(16)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(runners) == 16 and all(runner is runners[0] for runner in runners)
+    finally:
+        job_runner._job_runner = previous
+    print("✅ 16 个线程拿到同一个执行器")
+
+if __name__ == "__main__":
+    test_progress_and_partial()
+    test_fetcher_progress_reported_through_job()
+    test_dedup_identical_jobs()
+    test_failed_job()
+    test_single_global_runner()
+    print("🎉 后台筛选任务测试通过")
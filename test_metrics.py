@@ -0,0 +1,176 @@
+"""
+测试运行指标
+验证 Prometheus 文本格式、获取 span 汇入数据源耗时与字节数直方图、
+缓存函数命中计数、快照与缓存采集、页面进程旁的 /metrics 服务，以及首次抓取前的 span 不丢失
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import socket
+import subprocess
+import tempfile
+import time
+import requests
+import shared_snapshot
+from cache_backend import cached, get_cache
+from china_a_stock_fetcher import ChinaAStockFetcher
+from market_snapshots import UNIVERSE_SNAPSHOT_NAME
+from metrics import (BYTES_BUCKETS, CONTENT_TYPE, MetricsRegistry, StockMetrics, get_metrics,
+                     start_metrics_server)
+from quote_server import QuoteBook, QuoteServer
+from shared_snapshot import SharedSnapshotStore
+from synthetic_market import generate_synthetic_market
+from tracing import STAGE_FETCH, Tracer
+
+def sample(text: str, prefix: str) -> float:
+    """取出以 prefix 开头的唯一一行样本的值"""
+    lines = [line for line in text.splitlines() if line.startswith(prefix + " ") or line.startswith(prefix + "{")]
+    assert len(lines) == 1, (prefix, lines)
+    return float(lines[0].rsplit(" ", 1)[1])
+
+def test_text_format():
+    """测试计数器、仪表与直方图的文本格式和标签转义"""
+    print("🧪 测试: 文本格式")
+    registry = MetricsRegistry()
+    requests_total = registry.counter("demo_requests_total", "请求数", ("path",))
+    requests_total.inc(path="/a")
+    requests_total.inc(2, path='/b"x')
+    registry.gauge("demo_age_seconds", "年龄").set(1.5)
+    latency = registry.histogram("demo_seconds", "耗时", ("kind",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 3.0):
+        latency.observe(value, kind="x")
+    registry.add_collector(lambda: [("demo_up", "gauge", "可用", [({}, 1)])])
+
+    text = registry.render()
+    assert "# TYPE demo_requests_total counter" in text
+    assert 'demo_requests_total{path="/a"} 1' in text and 'demo_requests_total{path="/b\\"x"} 2' in text
+    assert "demo_age_seconds 1.5" in text and "demo_up 1" in text
+    assert 'demo_seconds_bucket{kind="x",le="0.1"} 1' in text
+    assert 'demo_seconds_bucket{kind="x",le="1"} 3' in text
+    assert 'demo_seconds_bucket{kind="x",le="+Inf"} 4' in text
+    assert sample(text, "demo_seconds_sum") == 4.05 and sample(text, "demo_seconds_count") == 4
+    try:
+        requests_total.inc(method="GET")
+        raise AssertionError("标签不符应报错")
+    except ValueError:
+        pass
+    print("✅ 计数器、仪表、直方图与采集函数输出符合 Prometheus 文本格式")
+
+def test_spans_feed_metrics():
+    """测试获取 span 与运行 span 汇入直方图"""
+    print("🧪 测试: span 汇入指标")
+    tracer = Tracer(enabled=True)
+    metrics = StockMetrics()
+    tracer.add_listener(metrics.record_span)
+
+    with tracer.span("预设筛选", screener="value_growth"):
+        for size in (2000, 50000):
+            with tracer.span("新浪行情", STAGE_FETCH, provider="sina") as s:
+                s.add("bytes", size)
+                s.set(rows=30)
+        try:
+            with tracer.span("腾讯行情", STAGE_FETCH, provider="tencent"):
+                raise TimeoutError("超时")
+        except TimeoutError:
+            pass
+        with tracer.span("清洗"):
+            pass
+
+    assert metrics.provider_latency.count(provider="sina", outcome="ok") == 2
+    assert metrics.provider_latency.count(provider="tencent", outcome="error") == 1
+    assert metrics.provider_bytes.count(provider="sina") == 2
+    assert metrics.provider_rows.value(provider="sina") == 60
+    assert metrics.screen_duration.count(screener="value_growth", outcome="ok") == 1
+    text = metrics.render()
+    bucket = f'stock_provider_response_bytes_bucket{{provider="sina",le="{BYTES_BUCKETS[1]}"}}'
+    assert sample(text, bucket) == 1
+    print("✅ 2 次新浪、1 次腾讯失败与 1 次筛选运行已计入直方图")
+
+def test_cache_and_snapshot_collectors():
+    """测试缓存函数命中计数与缓存、快照采集"""
+    print("🧪 测试: 缓存与快照采集")
+    calls = []
+
+    @cached(ttl=60)
+    def load(n: int) -> int:
+        calls.append(n)
+        return n * 2
+
+    counter = get_metrics().cache_requests
+    function = f"{load.__module__}.{load.__qualname__}"
+    before = counter.value(function=function, result="hit")
+    assert [load(3), load(3), load(3)] == [6, 6, 6] and calls == [3]
+    assert counter.value(function=function, result="hit") - before == 2
+
+    directory = tempfile.mkdtemp()
+    previous, shared_snapshot.SNAPSHOT_DIR = shared_snapshot.SNAPSHOT_DIR, directory
+    try:
+        market = generate_synthetic_market(50, 20, seed=2)
+        SharedSnapshotStore(UNIVERSE_SNAPSHOT_NAME).publish(market.spot_snapshot())
+        text = get_metrics().render()
+    finally:
+        shared_snapshot.SNAPSHOT_DIR = previous
+    labels = f'{{snapshot="{UNIVERSE_SNAPSHOT_NAME}"}}'
+    assert sample(text, f"stock_snapshot_rows{labels}") == 50
+    assert 0 <= sample(text, f"stock_snapshot_age_seconds{labels}") < 60
+    assert sample(text, f"stock_snapshot_bytes{labels}") > 0
+    assert sample(text, "stock_cache_hits_total") >= 2 and sample(text, "stock_cache_entries") >= 1
+    print("✅ 缓存函数命中 2 次，快照行数、年龄与大小已输出")
+
+def test_metrics_server():
+    """测试 /metrics 服务输出真实抓取产生的数据源指标"""
+    print("🧪 测试: 指标服务")
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    server = start_metrics_server(port, "127.0.0.1")
+    assert server is not None and start_metrics_server(port + 1) is server
+
+    market = generate_synthetic_market(30, 20, seed=6)
+    codes = [f"{code}.{'SH' if code.startswith('6') else 'SZ'}" for code in market.codes
+             if code.startswith(("0", "3", "6"))][:10]
+    metrics = get_metrics()
+    before = metrics.provider_latency.count(provider="sina", outcome="ok")
+    with QuoteServer(QuoteBook.from_market(market)).start() as quotes:
+        fetcher = ChinaAStockFetcher(sina_base_url=quotes.url, tencent_base_url=quotes.url)
+        fetched = fetcher.fetch_sina_data(codes)
+
+    url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+    response = requests.get(url, timeout=5)
+    assert response.status_code == 200 and response.headers["Content-Type"] == CONTENT_TYPE
+    assert metrics.provider_latency.count(provider="sina", outcome="ok") == before + 1
+    assert metrics.provider_rows.value(provider="sina") >= len(fetched)
+    assert sample(response.text, 'stock_provider_response_bytes_count{provider="sina"}') >= 1
+    assert requests.get(url.replace("/metrics", "/other"), timeout=5).status_code == 404
+
+    started = time.perf_counter()
+    for _ in range(20):
+        requests.get(url, timeout=5)
+    elapsed = (time.perf_counter() - started) / 20
+    print(f"✅ /metrics 含新浪请求指标，单次抓取 {elapsed * 1000:.1f} ms")
+
+def test_spans_recorded_before_first_scrape():
+    """测试新进程导入指标模块后、首次抓取之前结束的 span 已经计入"""
+    print("🧪 测试: 首次抓取前的 span")
+    script = (
+        "import metrics, tracing\n"
+        "with tracing.span('筛选', screener='before_scrape'):\n"
+        "    pass\n"
+        "print(metrics._metrics.render())\n"
+    )
+    result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, timeout=60,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    assert result.returncode == 0, result.stderr
+    assert sample(result.stdout, 'stock_screen_duration_seconds_count{screener="before_scrape",outcome="ok"}') == 1
+    print("✅ 导入即挂上追踪器，首次抓取前的筛选耗时未丢失")
+
+if __name__ == "__main__":
+    test_text_format()
+    test_spans_feed_metrics()
+    test_cache_and_snapshot_collectors()
+    test_metrics_server()
+    test_spans_recorded_before_first_scrape()
+    print("🎉 运行指标测试通过")
@@ -0,0 +1,98 @@
+"""
+测试多进程并行筛选
+验证分区覆盖全部股票、进程池结果与单进程一致、前K名合并正确、结果与分区数无关
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import random
+import tempfile
+import numpy as np
+import pandas as pd
+from china_a_stock_fetcher import ChinaAStockFetcher
+from parallel_screen import PARTITION_BY_BOARD, ParallelScreener, partition_rows, prepare_frame
+from smart_stock_screener import SmartStockScreener
+
+def make_universe(n: int = 1200) -> pd.DataFrame:
+    random.seed(38)
+    prefixes = ["000", "002", "300", "600", "688"]
+    codes = [f"{prefixes[i % 5]}{i:03d}.{'SH' if prefixes[i % 5] in ('600', '688') else 'SZ'}" for i in range(n)]
+    return ChinaAStockFetcher().generate_enhanced_mock_data(codes, columns=[])
+
+def test_partitions_cover_universe():
+    """测试分区覆盖全部股票且互不重叠"""
+    print("🧪 测试: 分区覆盖")
+    df = make_universe()
+    for by, expected in (("range", 4), (PARTITION_BY_BOARD, df["板块"].nunique())):
+        parts = partition_rows(df, 4, by)
+        assert len(parts) == expected
+        rows = np.concatenate(parts)
+        assert len(rows) == len(df) and len(np.unique(rows)) == len(df)
+        assert all(p.dtype == np.int32 for p in parts)
+
+    codes = df["股票代码"].astype(str).to_numpy()
+    parts = partition_rows(df, 3)
+    assert codes[parts[0]].max() < codes[parts[1]].min()  # 按代码区间划分
+    print("✅ 代码区间与板块分区都覆盖全部股票")
+
+def test_pool_matches_inline():
+    """测试进程池结果与单进程一致"""
+    print("🧪 测试: 进程池与单进程一致")
+    df = make_universe()
+    strategies = [("smart", "value_growth"), ("smart", "oversold_rebound"), ("short_term", "momentum_breakout_entry")]
+    directory = tempfile.mkdtemp()
+
+    inline = ParallelScreener(workers=1, directory=directory).run(df, strategies, top_k=10, partitions=4)
+    pooled = ParallelScreener(workers=2, directory=directory).run(df, strategies, top_k=10, partitions=4)
+
+    for kind, key in strategies[:2]:
+        assert inline[(kind, key)]["matched"] == pooled[(kind, key)]["matched"]
+        pd.testing.assert_frame_equal(inline[(kind, key)]["top"], pooled[(kind, key)]["top"])
+
+    short_term = pooled[("short_term", "momentum_breakout_entry")]
+    scores = short_term["top"]["入场评分"].tolist() if not short_term["top"].empty else []
+    assert len(scores) <= 10 and scores == sorted(scores, reverse=True)
+    assert short_term["matched"] >= len(scores)
+    print(f"✅ {len(strategies)} 个策略并行结果一致，价值成长入选 {pooled[strategies[0]]['matched']} 只")
+
+def test_merge_keeps_global_top_k():
+    """测试前K名合并等于全量排序的前K名"""
+    print("🧪 测试: 前K名合并")
+    df = make_universe()
+    screener = ParallelScreener(workers=1, directory=tempfile.mkdtemp())
+    result = screener.run(df, [("smart", "dividend_stable")], top_k=5, partitions=6)
+    wide = screener.run(df, [("smart", "dividend_stable")], top_k=len(df), partitions=6)
+
+    top = result[("smart", "dividend_stable")]["top"]
+    everything = wide[("smart", "dividend_stable")]["top"]
+    assert top["股票代码"].tolist() == everything["股票代码"].head(5).tolist()
+    assert (np.diff(everything["股息率"].to_numpy(dtype=np.float64)) <= 0).all()
+    print("✅ 各分区前K名合并后与全量排序一致")
+
+def test_partition_count_independent():
+    """测试1个分区与多个分区的结果完全相同，且与整表串行筛选一致"""
+    print("🧪 测试: 结果与分区数无关")
+    df = make_universe()
+    strategies = [("smart", "oversold_rebound"), ("smart", "value_growth"),
+                  ("short_term", "momentum_breakout_entry"), ("short_term", "relative_strength_entry")]
+    screener = ParallelScreener(workers=1, directory=tempfile.mkdtemp())
+    single = screener.run(df, strategies, top_k=10, partitions=1)
+
+    for partitions in (4, 8):
+        split = screener.run(df, strategies, top_k=10, partitions=partitions)
+        for strategy in strategies:
+            assert split[strategy]["matched"] == single[strategy]["matched"], (strategy, partitions)
+            pd.testing.assert_frame_equal(split[strategy]["top"], single[strategy]["top"])
+
+    serial = SmartStockScreener().apply_screener_logic(prepare_frame(df, strategies), "oversold_rebound")
+    assert single[("smart", "oversold_rebound")]["matched"] == len(serial)
+    print(f"✅ 1/4/8 个分区结果相同，超跌反弹入选 {len(serial)} 只")
+
+if __name__ == "__main__":
+    test_partitions_cover_universe()
+    test_pool_matches_inline()
+    test_merge_keeps_global_top_k()
+    test_partition_count_independent()
+    print("🎉 多进程并行筛选测试通过")
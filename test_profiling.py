@@ -0,0 +1,151 @@
+"""
+测试按需性能剖析
+验证一次性开关只剖析下一次运行、采样模式的折叠栈与热点函数、cProfile 模式的 pstats 文件、
+内存分配统计、嵌套与并发运行（包括显式指定模式）不重复剖析，以及报告打包下载
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import io
+import json
+import pstats
+import tempfile
+import threading
+import tracemalloc
+import zipfile
+from profiling import (FOLDED_FILE, MODE_CPROFILE, MODE_SAMPLING, PSTATS_FILE, REPORT_FILE, SUMMARY_FILE, Profiler)
+
+def busy_loop(n: int = 400000) -> int:
+    return sum(i * i for i in range(n))
+
+def allocate_blocks(count: int = 500) -> list:
+    return [bytearray(4096) for _ in range(count)]
+
+def test_one_shot_request():
+    """测试开关只作用于下一次运行，未打开时不产生报告"""
+    print("🧪 测试: 一次性剖析开关")
+    profiler = Profiler(directory=tempfile.mkdtemp(), always=None)
+    with profiler.run("未打开") as reports:
+        busy_loop(1000)
+    assert reports == [] and profiler.reports() == []
+
+    profiler.request(MODE_SAMPLING)
+    assert profiler.pending == MODE_SAMPLING
+    with profiler.run("第一次") as first:
+        busy_loop(1000)
+    with profiler.run("第二次") as second:
+        busy_loop(1000)
+    assert len(first) == 1 and second == [] and profiler.pending is None
+    assert [r.summary()["name"] for r in profiler.reports()] == ["第一次"]
+
+    try:
+        profiler.request("perf")
+        assert False, "未知模式应报错"
+    except ValueError:
+        pass
+    print("✅ 开关只剖析下一次运行")
+
+def test_sampling_report():
+    """测试采样模式写出以被剖析代码为根的折叠栈、热点函数与内存分配"""
+    print("🧪 测试: 采样剖析报告")
+    profiler = Profiler(directory=tempfile.mkdtemp(), always=MODE_SAMPLING)
+    kept = []
+
+    def screen():
+        kept.append(allocate_blocks())
+        for _ in range(4):
+            busy_loop()
+
+    with profiler.run("预设筛选 momentum") as reports:
+        screen()
+    report = reports[0]
+    assert report.name.endswith("预设筛选_momentum")
+    assert set(report.files()) == {FOLDED_FILE, REPORT_FILE, SUMMARY_FILE}
+
+    with open(os.path.join(report.path, FOLDED_FILE), encoding="utf-8") as f:
+        lines = f.read().splitlines()
+    stack, count = lines[0].rsplit(" ", 1)
+    frames = stack.split(";")
+    assert frames[0].startswith("test_sampling_report (") and frames[1].startswith("screen (")
+    assert any(frame.startswith("busy_loop (") for frame in frames) and int(count) > 0
+
+    summary = report.summary()
+    assert summary["samples"] > 10 and summary["elapsed"] > 0
+    assert any("<genexpr>" in row["函数"] or "busy_loop" in row["函数"] for row in summary["hot_functions"][:2])
+    assert summary["peak_kb"] >= 500 * 4 and summary["allocated_kb"] >= 500 * 4
+    assert any("allocate_blocks" in row["位置"] or "test_profiling.py" in row["位置"] for row in summary["allocations"][:3])
+    print(f"✅ {summary['samples']} 个样本，热点 {summary['hot_functions'][0]['函数']}，"
+          f"峰值 {summary['peak_kb']:.0f} KB")
+
+def test_cprofile_and_archive():
+    """测试 cProfile 模式输出可读的 pstats 文件，报告可打包为 zip"""
+    print("🧪 测试: cProfile 报告与打包")
+    profiler = Profiler(directory=tempfile.mkdtemp(), always=None)
+    with profiler.run("自定义筛选", MODE_CPROFILE) as reports:
+        busy_loop(50000)
+    report = reports[0]
+    stats = pstats.Stats(os.path.join(report.path, PSTATS_FILE))
+    assert any(func == "busy_loop" for _, _, func in stats.stats)
+    assert report.summary()["mode"] == MODE_CPROFILE and report.summary()["samples"] is None
+    with open(os.path.join(report.path, SUMMARY_FILE), encoding="utf-8") as f:
+        assert "busy_loop" in f.read()
+
+    with zipfile.ZipFile(io.BytesIO(report.archive())) as zf:
+        names = zf.namelist()
+        assert f"{report.name}/{PSTATS_FILE}" in names
+        assert json.loads(zf.read(f"{report.name}/{REPORT_FILE}"))["name"] == "自定义筛选"
+    print(f"✅ 打包 {len(names)} 个文件")
+
+def test_nested_and_concurrent_runs():
+    """测试嵌套运行与并发运行只剖析最先开始的一个"""
+    print("🧪 测试: 嵌套与并发运行")
+    profiler = Profiler(directory=tempfile.mkdtemp(), always=MODE_SAMPLING)
+    with profiler.run("外层") as outer:
+        with profiler.run("内层") as inner:
+            busy_loop(1000)
+    assert len(outer) == 1 and inner == []
+
+    started, release = threading.Event(), threading.Event()
+    results = {}
+
+    def slow():
+        with profiler.run("慢任务") as reports:
+            started.set()
+            release.wait(5)
+        results["slow"] = reports
+
+    thread = threading.Thread(target=slow)
+    thread.start()
+    started.wait(5)
+    with profiler.run("并发任务") as reports:
+        busy_loop(1000)
+    release.set()
+    thread.join()
+    assert reports == [] and len(results["slow"]) == 1
+    assert len(profiler.reports()) == 2
+
+    # 显式指定模式的运行同样不打断进行中的剖析，也不会停掉对方的 tracemalloc
+    started.clear()
+    release.clear()
+    thread = threading.Thread(target=slow)
+    thread.start()
+    started.wait(5)
+    with profiler.run("显式模式", mode=MODE_CPROFILE) as reports:
+        busy_loop(1000)
+    assert tracemalloc.is_tracing()
+    release.set()
+    thread.join()
+    assert reports == [] and len(results["slow"]) == 1 and not tracemalloc.is_tracing()
+    with profiler.run("显式模式", mode=MODE_CPROFILE) as reports:
+        busy_loop(1000)
+    assert len(reports) == 1 and len(profiler.reports()) == 4
+    print("✅ 同一时间只有一次运行被剖析（包括显式指定模式）")
+
+if __name__ == "__main__":
+    test_one_shot_request()
+    test_sampling_report()
+    test_cprofile_and_archive()
+    test_nested_and_concurrent_runs()
+    print("🎉 按需性能剖析测试通过")
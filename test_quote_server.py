@@ -0,0 +1,128 @@
+"""
+测试本地行情服务
+验证新浪 / 腾讯两种原始格式经真实抓取代码解析后与行情一致，
+以及延迟、5xx、截断、限流等故障注入和 load_codes 的数据源回退
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import tempfile
+import numpy as np
+import requests
+from benchmark_pipeline import PipelineInputs
+from china_a_stock_fetcher import ChinaAStockFetcher
+from quote_server import (OUTCOME_ERROR, OUTCOME_RATE_LIMITED, OUTCOME_TRUNCATED, RATE_LIMIT_BODY, FaultProfile,
+                          QuoteBook, QuoteServer, load_test)
+from synthetic_market import generate_synthetic_market
+
+MARKET = generate_synthetic_market(80, 30, seed=21)
+CODES = [f"{code}.{'SH' if code.startswith('6') else 'SZ'}" for code in MARKET.codes
+         if code.startswith(("0", "3", "6"))]
+
+def make_server(**faults) -> QuoteServer:
+    return QuoteServer(QuoteBook.from_market(MARKET), FaultProfile(seed=1, **faults)).start()
+
+def fetcher_for(server: QuoteServer) -> ChinaAStockFetcher:
+    return ChinaAStockFetcher(sina_base_url=server.url, tencent_base_url=server.url)
+
+def test_wire_formats():
+    """测试两种格式经 fetch_sina_data / fetch_tencent_data 解析后与合成行情一致"""
+    print("🧪 测试: 新浪与腾讯格式")
+    with make_server() as server:
+        fetcher = fetcher_for(server)
+        sina = fetcher.fetch_sina_data(CODES)
+        tencent = fetcher.fetch_tencent_data(CODES[:10])
+
+        column = {code: i for i, code in enumerate(MARKET.codes)}
+        for code, quote in sina.items():
+            i = column[code[:6]]
+            assert quote["current_price"] == round(float(MARKET.close[-1, i]), 2)
+            assert quote["volume"] == int(MARKET.volume[-1, i])
+        assert set(sina) == set(CODES)
+        assert {code: q["current_price"] for code, q in tencent.items()} == \
+            {code: sina[code]["current_price"] for code in CODES[:10]}
+        assert sina[CODES[0]]["name"] == MARKET.symbols["股票名称"].iloc[column[CODES[0][:6]]]
+
+        # 未知代码返回空行情，后续行仍按顺序对齐
+        mixed = fetcher.fetch_sina_data(["600999.SH"] + CODES[:3])
+        assert set(mixed) == set(CODES[:3])
+        assert requests.get(f"{server.url}/list=sh600000", timeout=5).text == RATE_LIMIT_BODY
+    print(f"✅ {len(sina)} 只新浪行情、{len(tencent)} 只腾讯行情与合成数据一致")
+
+def test_fault_injection():
+    """测试 5xx、截断与限流"""
+    print("🧪 测试: 故障注入")
+    with make_server(error_rate=1.0) as server:
+        assert fetcher_for(server).fetch_sina_data(CODES) == {}
+        assert server.stats["sina"] == {OUTCOME_ERROR: 1}
+
+    with make_server(truncate_rate=1.0) as server:
+        fetcher = fetcher_for(server)
+        partial = [len(fetcher.fetch_sina_data(CODES)) for _ in range(5)]
+        assert all(n < len(CODES) for n in partial) and server.stats["sina"][OUTCOME_TRUNCATED] == 5
+
+    with make_server(rate_limit=5) as server:
+        statuses = [requests.get(f"{server.url}/q=sh600000", timeout=5).status_code for _ in range(20)]
+        assert statuses[:5] == [200] * 5 and 403 in statuses
+        assert server.stats["tencent"][OUTCOME_RATE_LIMITED] == statuses.count(403)
+    print(f"✅ 5xx 返回空结果，截断只保留部分行情（{partial}），限流 {statuses.count(403)}/20 次")
+
+def test_fallback_chain():
+    """测试新浪失败时 load_codes 回退到腾讯，全部失败时使用模拟数据"""
+    print("🧪 测试: 数据源回退")
+    with make_server() as server:
+        fetcher = ChinaAStockFetcher(sina_base_url=server.url + "/broken", tencent_base_url=server.url)
+        df = fetcher.load_codes(CODES[:5])
+        assert df["数据源"].astype(str).tolist() != ["A股模拟数据"] * 5
+        expected = [round(float(MARKET.close[-1, list(MARKET.codes).index(c[:6])]), 2) for c in CODES[:5]]
+        assert sorted(df["最新价"].tolist()) == sorted(expected)
+
+    with make_server(error_rate=1.0) as server:
+        df = fetcher_for(server).load_codes(CODES[:5])
+        assert (df["数据源"].astype(str) == "A股模拟数据").all() and len(df) == 5
+        assert server.stats["tencent"][OUTCOME_ERROR] == 5
+    print("✅ 新浪失败回退腾讯，全部失败时使用模拟数据")
+
+def test_latency_and_load():
+    """测试延迟分布与压测指标"""
+    print("🧪 测试: 延迟与压测")
+    with make_server(latency="lognormal", latency_ms=20, latency_spread=0.8) as server:
+        report = load_test(server.url, CODES, calls=40, concurrency=4, batch_size=20)
+    assert report["complete_rate"] == 1.0 and report["quotes_per_second"] > 0
+    assert 10 < report["p50_ms"] < report["p95_ms"] <= report["p99_ms"]
+
+    with make_server(latency="fixed", latency_ms=30) as server:
+        report = load_test(server.url, CODES, calls=8, concurrency=1, provider="tencent", batch_size=1)
+    assert report["p50_ms"] >= 30 and report["complete_rate"] == 1.0
+    print(f"✅ 对数正态延迟 p50 {report['p50_ms']} ms，压测指标完整")
+
+def test_recorded_book():
+    """测试用录制的原始响应提供行情"""
+    print("🧪 测试: 录制行情")
+    directory = tempfile.mkdtemp()
+    sample = PipelineInputs(6, seed=3)
+    text, codes = sample.sina_payload()
+    with open(os.path.join(directory, "sina.txt"), "w", encoding="utf-8") as f:
+        f.write(text)
+    with open(os.path.join(directory, "tencent.txt"), "w", encoding="utf-8") as f:
+        f.write("\n".join(sample.tencent_payload()))
+
+    book = QuoteBook.from_recorded(directory)
+    assert len(book) == 6
+    with QuoteServer(book).start() as server:
+        fetcher = fetcher_for(server)
+        quotes = fetcher.fetch_sina_data(codes)
+        assert quotes == fetcher.parse_sina_data(text, codes)
+        assert fetcher.fetch_tencent_data(codes[:2]) == \
+            {code: fetcher.parse_tencent_data(line) for code, line in zip(codes[:2], sample.tencent_payload())}
+    print(f"✅ 录制的 {len(quotes)} 条行情原样返回")
+
+if __name__ == "__main__":
+    test_wire_formats()
+    test_fault_injection()
+    test_fallback_chain()
+    test_latency_and_load()
+    test_recorded_book()
+    print("🎉 本地行情服务测试通过")
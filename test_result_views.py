@@ -0,0 +1,190 @@
+"""
+测试筛选结果视图
+验证视图解析结果与原结果表一致且只占几 KB、流式筛选的前K名索引即快照行号、
+边拉取边发布时的行号与版本、旧版本仍可解析、版本清理或文件被替换后视图失效；
+预设筛选器与短线策略的合并结果按股票代码建立视图后解析结果一致
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import random
+import tempfile
+import numpy as np
+import pandas as pd
+from cache_backend import estimate_size
+from market_snapshots import filter_custom_criteria
+from parallel_screen import merge_results, screen_frame
+from result_views import SnapshotView, ViewExpired, resolve_results, view_by_code, view_of
+from smart_stock_screener import SmartStockScreener
+from shared_snapshot import _attached, KEEP_VERSIONS, SharedSnapshotStore
+from streaming_screen import iter_frame_chunks, number_chunks, stream_screen
+
+CRITERIA = {"pe_range": (0, 30), "price_change_range": (-2, 8)}
+
+def make_universe(n: int = 4000, seed: int = 5) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "股票代码": [f"{i:06d}" for i in range(n)],
+        "股票名称": [f"股票{i}" for i in range(n)],
+        "最新价": rng.uniform(3, 300, n),
+        "涨跌幅": rng.uniform(-10, 10, n),
+        "PE": rng.uniform(-20, 80, n),
+        "综合评分": rng.uniform(0, 100, n).round(1),
+    })
+
+def screen_top(chunks) -> pd.DataFrame:
+    update = None
+    for update in stream_screen(number_chunks(chunks), lambda chunk: filter_custom_criteria(chunk, CRITERIA),
+                                top_k=30):
+        pass
+    return update["top"]
+
+def test_view_roundtrip_and_size():
+    """测试视图解析结果与结果表一致，会话占用只有行号与附加列"""
+    print("🧪 测试: 视图往返与大小")
+    store = SharedSnapshotStore("views", tempfile.mkdtemp())
+    version = store.publish(make_universe())
+    snapshot = store.attach(version)
+
+    results = snapshot.iloc[[5, 17, 3]].assign(说明=["a", "b", "c"])
+    view = view_of(results, snapshot, "views", version, sort_by="综合评分", directory=store.directory)
+    assert view.rows.dtype == np.int32 and view.rows.tolist() == [5, 17, 3]
+    assert list(view.extras.columns) == ["说明"] and len(view) == 3 and not view.empty
+    pd.testing.assert_frame_equal(view.resolve(), results.reset_index(drop=True))
+    assert resolve_results(results) is results and resolve_results(None) is None
+
+    full = snapshot.iloc[np.arange(0, len(snapshot), 2)]
+    large = view_of(full, snapshot, "views", version, directory=store.directory)
+    assert estimate_size(large) < 10 * 1024 < estimate_size(full)
+
+    try:
+        view_of(results.reset_index(drop=True).set_axis(list("xyz")), snapshot, "views", version)
+        assert False, "非行号索引应报错"
+    except ValueError:
+        pass
+    print(f"✅ {len(full)} 行结果的视图占 {estimate_size(large) / 1024:.1f} KB，"
+          f"结果表占 {estimate_size(full) / 1024:.0f} KB")
+
+def test_stream_top_rows_are_snapshot_rows():
+    """测试分块扫描快照时前K名的索引就是快照行号"""
+    print("🧪 测试: 流式前K名行号")
+    store = SharedSnapshotStore("stream", tempfile.mkdtemp())
+    version = store.publish(make_universe())
+    snapshot = store.attach(version)
+
+    top = screen_top(iter_frame_chunks(snapshot, 128))
+    expected = filter_custom_criteria(snapshot, CRITERIA).sort_values("综合评分", ascending=False, kind="stable")
+    assert top.index.tolist() == expected.index[:30].tolist()
+    view = view_of(top, snapshot, "stream", version, directory=store.directory)
+    pd.testing.assert_frame_equal(view.resolve(), top.reset_index(drop=True))
+    print("✅ 前30名即快照行号，视图解析与前K名一致")
+
+def test_publish_chunks_rows_and_version():
+    """测试边拉取边发布时，编号后的块索引与发布后快照的行号一致"""
+    print("🧪 测试: 分块发布的行号与版本")
+    store = SharedSnapshotStore("publish", tempfile.mkdtemp())
+    df = make_universe(1000)
+    # 拉取的各页索引都从0开始
+    pages = (df.iloc[start:start + 100].reset_index(drop=True) for start in range(0, len(df), 100))
+    top = screen_top(store.publish_chunks(pages))
+    version = store.published_version
+    assert version == 1
+
+    view = view_of(top, store.attach(version), "publish", version, directory=store.directory)
+    pd.testing.assert_frame_equal(view.resolve(), top.reset_index(drop=True))
+    pd.testing.assert_frame_equal(view.resolve(), df.iloc[view.rows].reset_index(drop=True), check_dtype=False)
+    print(f"✅ 版本 {version} 上的 {len(view)} 行视图与拉取时的结果一致")
+
+def test_old_versions_and_expiry():
+    """测试发布新版本后旧版本视图仍可解析，版本清理后失效"""
+    print("🧪 测试: 旧版本与失效")
+    store = SharedSnapshotStore("expiry", tempfile.mkdtemp())
+    first = store.publish(make_universe(500, seed=1))
+    view = SnapshotView("expiry", first, np.array([1, 2, 3]), directory=store.directory)
+    resolved = view.resolve()
+
+    store.publish(make_universe(500, seed=2))
+    store.attach()
+    pd.testing.assert_frame_equal(view.resolve(), resolved)
+
+    for seed in range(3, 3 + KEEP_VERSIONS + 1):
+        store.attach(store.publish(make_universe(500, seed=seed)))
+    try:
+        view.resolve()
+        assert False, "已清理的版本应失效"
+    except ViewExpired:
+        pass
+
+    out_of_range = SnapshotView("expiry", store.manifest()["version"], np.array([10 ** 6]), directory=store.directory)
+    try:
+        out_of_range.resolve()
+        assert False, "越界行号应失效"
+    except ViewExpired:
+        pass
+    print(f"✅ 保留最近 {KEEP_VERSIONS} 个版本，更早版本的视图提示重新筛选")
+
+def test_replaced_snapshot_detected():
+    """测试版本号对应的文件与建视图时不同（行数相同或更多）时视图失效，而不是显示其他股票"""
+    print("🧪 测试: 快照被替换")
+    store = SharedSnapshotStore("replaced", tempfile.mkdtemp())
+    version = store.publish(make_universe(500, seed=1))
+    snapshot = store.attach(version)
+    view = view_of(snapshot.iloc[[4, 8, 15]], snapshot, "replaced", version, directory=store.directory)
+    assert view.snapshot_rows == 500 and view.checksum is not None
+
+    for replacement in (make_universe(500, seed=1).iloc[::-1], make_universe(800, seed=1)):
+        other = SharedSnapshotStore("replaced", tempfile.mkdtemp())
+        other.publish(replacement.reset_index(drop=True))
+        os.replace(other._data_path(1), store._data_path(version))
+        _attached.pop((store.directory, "replaced"), None)
+        try:
+            view.resolve()
+            assert False, "被替换的快照应失效"
+        except ViewExpired:
+            pass
+
+    try:
+        view_of(snapshot.iloc[[4, 8]].set_axis([9, 10]), snapshot, "replaced", version)
+        assert False, "行号与股票不一致应报错"
+    except ValueError:
+        pass
+    print("✅ 行数或所取股票与筛选时不一致时视图失效")
+
+def test_view_by_code_for_strategy_results():
+    """测试预设筛选器与短线策略结果按股票代码建立视图"""
+    print("🧪 测试: 按股票代码建立视图")
+    fetcher = SmartStockScreener().fetcher
+    store = SharedSnapshotStore("strategy_views", tempfile.mkdtemp())
+    random.seed(3)
+    codes = [f"{600000 + i:06d}" for i in range(1500)]
+    version = store.publish(fetcher.generate_enhanced_mock_data(codes))
+    snapshot = store.attach(version)
+
+    strategies = [("smart", "value_growth"), ("short_term", "momentum_breakout_entry")]
+    merged = merge_results(strategies, [screen_frame(snapshot, strategies, 30)], 30)
+    for strategy in strategies:
+        results = merged[strategy]["top"]
+        view = view_by_code(results, snapshot, "strategy_views", version, directory=store.directory)
+        assert len(view) == len(results) == 30
+        resolved = view.resolve()
+        # 共享快照中的字符串列与结果中的类别列取值相同，按对象比较
+        pd.testing.assert_frame_equal(resolved[results.columns].astype(object), results.astype(object))
+
+    outsider = snapshot.iloc[[0]].assign(股票代码="999999")
+    try:
+        view_by_code(outsider, snapshot, "strategy_views", version)
+        assert False, "快照之外的股票应报错"
+    except ValueError:
+        pass
+    print("✅ 合并结果按股票代码建立视图，解析结果一致")
+
+if __name__ == "__main__":
+    test_view_roundtrip_and_size()
+    test_stream_top_rows_are_snapshot_rows()
+    test_publish_chunks_rows_and_version()
+    test_old_versions_and_expiry()
+    test_replaced_snapshot_detected()
+    test_view_by_code_for_strategy_results()
+    print("🎉 筛选结果视图测试通过")
@@ -0,0 +1,104 @@
+"""
+测试筛选器组合运算
+验证 AND / OR / NOT 组合结果与逐个筛选器结果的集合运算一致，并检查重叠矩阵；
+短线策略的成员位图与 score_entries 的筛选结果一致，且与计算顺序无关
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import random
+import numpy as np
+from screener_algebra import ScreenerMembership, parse_expression, ScreenerRef
+from smart_stock_screener import SmartStockScreener
+
+def make_membership() -> ScreenerMembership:
+    """在模拟全市场快照上构建成员缓存"""
+    random.seed(11)
+    screener = SmartStockScreener()
+    codes = list(dict.fromkeys(screener.fetcher.a_stock_codes))
+    snapshot = screener.fetcher.generate_enhanced_mock_data(codes * 50)
+    return ScreenerMembership(snapshot, smart_screener=screener)
+
+def test_parse_expression():
+    """测试表达式解析"""
+    print("🧪 测试: 表达式解析")
+    expr = parse_expression("value_growth AND technical_strong AND NOT oversold_rebound")
+    assert str(expr) == "((value_growth AND technical_strong) AND NOT oversold_rebound)"
+    expr = parse_expression("a | b & ~c")
+    assert str(expr) == "(a OR (b AND NOT c))"
+    assert sorted(parse_expression("(a OR b) AND c").names()) == ["a", "b", "c"]
+    for bad in ["", "a AND", "(a OR b", "a b", "a ＆ b"]:
+        try:
+            parse_expression(bad)
+        except ValueError:
+            continue
+        raise AssertionError(f"应当解析失败: {bad!r}")
+    print("✅ 表达式解析正确")
+
+def test_composition_matches_sets():
+    """测试组合结果与集合运算一致"""
+    print("🧪 测试: 组合结果与集合运算一致")
+    membership = make_membership()
+
+    def rows(name):
+        return set(membership.bitmap(name).to_indices().tolist())
+
+    value, technical, rebound = rows("value_growth"), rows("technical_strong"), rows("oversold_rebound")
+    momentum = rows("momentum_breakout_entry")
+
+    got = set(membership.evaluate("value_growth AND technical_strong AND NOT oversold_rebound").to_indices())
+    assert got == (value & technical) - rebound
+
+    got = set(membership.evaluate("technical_strong OR momentum_breakout_entry").to_indices())
+    assert got == technical | momentum
+
+    expr = ~ScreenerRef("value_growth")
+    assert membership.evaluate(expr).count() == membership.size - len(value)
+
+    # 预设筛选器成员与 apply_screener_logic 结果一致
+    expected = membership.smart_screener.apply_screener_logic(membership.snapshot, "technical_strong")
+    assert technical == set(expected.index.tolist())
+    print(f"✅ 快照 {membership.size} 只股票，组合结果一致")
+
+def test_overlap_matrix():
+    """测试重叠矩阵"""
+    print("🧪 测试: 重叠矩阵")
+    membership = make_membership()
+    matrix = membership.overlap_matrix()
+    names = membership.names()
+    assert matrix.shape == (len(names), len(names)) == (12, 12)
+    assert np.array_equal(matrix.to_numpy(), matrix.to_numpy().T)
+    for i, name in enumerate(names):
+        assert matrix.iat[i, i] == membership.bitmap(name).count()
+
+    jaccard = membership.overlap_matrix(normalize=True).to_numpy()
+    assert ((jaccard >= 0) & (jaccard <= 1)).all()
+    print("✅ 12×12 重叠矩阵正确")
+
+def test_short_term_membership_matches_scoring():
+    """测试短线策略成员与 score_entries 的筛选结果一致"""
+    print("🧪 测试: 短线策略成员位图")
+    membership = make_membership()
+    short_term = membership.short_term_screener
+    names = list(short_term.short_term_strategies)
+    for name in names:
+        scored = short_term.score_entries(membership.snapshot, name)
+        bitmap = membership.bitmap(name)
+        members = membership.snapshot["股票代码"].to_numpy()[bitmap.to_indices()]
+        selected = scored["股票代码"].tolist() if len(scored) else []
+        assert sorted(members.tolist()) == sorted(selected), name
+
+    # 换一个顺序在新的成员缓存上计算，结果不变
+    again = ScreenerMembership(membership.snapshot, smart_screener=membership.smart_screener)
+    for name in reversed(names):
+        assert np.array_equal(again.bitmap(name).to_mask(), membership.bitmap(name).to_mask()), name
+    print(f"✅ {len(names)} 个短线策略成员与评分结果一致")
+
+if __name__ == "__main__":
+    test_parse_expression()
+    test_composition_matches_sets()
+    test_overlap_matrix()
+    test_short_term_membership_matches_scoring()
+    print("🎉 筛选器组合运算测试通过")
@@ -0,0 +1,153 @@
+"""
+测试筛选区间索引
+验证索引计数与 pandas 逐条件过滤的结果完全一致并检查计数耗时，以及类别位图索引（含按快照建索引）
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import time
+import numpy as np
+import pandas as pd
+from screener_index import Bitmap, CategoryBitmapIndex, SnapshotRangeIndex, build_range_index
+
+def make_snapshot(n: int = 5000, seed: int = 7) -> pd.DataFrame:
+    """生成测试用快照"""
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "股票代码": [f"{i:06d}" for i in range(n)],
+        "市值": rng.uniform(10, 10000, n),
+        "PE": rng.uniform(-20, 100, n),
+        "PB": rng.uniform(0, 10, n),
+        "RSI": rng.uniform(0, 100, n),
+        "涨跌幅": rng.uniform(-10, 10, n),
+        "换手率": rng.uniform(0, 20, n),
+        "量比": rng.uniform(0.1, 8, n),
+        "行业": rng.choice(["银行", "医药", "科技", "消费"], n),
+    })
+    # 部分缺失值
+    df.loc[rng.choice(n, 50, replace=False), "PE"] = np.nan
+    return df
+
+def pandas_filter(df: pd.DataFrame, ranges: dict, industries=None) -> pd.DataFrame:
+    """参考实现"""
+    result = df
+    for col, (low, high) in ranges.items():
+        if low is not None:
+            result = result[result[col] >= low]
+        if high is not None:
+            result = result[result[col] <= high]
+    if industries:
+        result = result[result["行业"].isin(industries)]
+    return result
+
+def test_bitmap_operations():
+    """测试位图运算"""
+    print("🧪 测试: 位图运算")
+    a = np.zeros(130, dtype=bool)
+    b = np.zeros(130, dtype=bool)
+    a[[0, 5, 64, 129]] = True
+    b[[5, 64, 100]] = True
+    ba, bb = Bitmap.from_mask(a), Bitmap.from_mask(b)
+
+    assert (ba & bb).to_indices().tolist() == [5, 64]
+    assert (ba | bb).count() == 5
+    assert (ba - bb).to_indices().tolist() == [0, 129]
+    assert (~ba).count() == 126
+    assert Bitmap.from_indices([0, 5, 64, 129], 130) == ba
+    print("✅ 位图运算正确")
+
+def test_index_matches_pandas():
+    """测试索引结果与 pandas 过滤一致"""
+    print("🧪 测试: 索引结果与 pandas 过滤一致")
+    df = make_snapshot()
+    index = build_range_index(df)
+
+    cases = [
+        {"市值": (50, 2000)},
+        {"市值": (50, 2000), "PE": (5, 30), "PB": (0.5, 5)},
+        {"RSI": (30, 70), "涨跌幅": (-10, 20), "量比": (1.0, None), "换手率": (1.0, 10.0)},
+        {"PE": (None, 0)},
+        {"不存在的列": (0, 1), "RSI": (90, 100)},
+    ]
+    for ranges in cases:
+        known = {c: b for c, b in ranges.items() if c in df.columns}
+        expected = pandas_filter(df, known)
+        assert index.count(ranges) == len(expected), ranges
+        assert index.match(ranges).tolist() == expected.index.tolist(), ranges
+
+    expected = pandas_filter(df, {"RSI": (30, 70)}, ["银行", "医药"])
+    assert index.count({"RSI": (30, 70)}, {"行业": ["银行", "医药"]}) == len(expected)
+    print(f"✅ {len(cases) + 1} 组条件全部一致")
+
+def test_count_latency():
+    """测试全市场计数耗时"""
+    print("🧪 测试: 计数耗时")
+    df = make_snapshot(5000)
+    index = SnapshotRangeIndex(df)
+    ranges = {"市值": (50, 2000), "PE": (5, 30), "PB": (0.5, 5), "RSI": (30, 70),
+              "涨跌幅": (-10, 20), "量比": (1.0, None), "换手率": (1.0, 10.0)}
+
+    rounds = 200
+    start = time.perf_counter()
+    for _ in range(rounds):
+        index.count(ranges)
+    per_call_ms = (time.perf_counter() - start) / rounds * 1000
+    print(f"⏱️ 7个条件计数平均耗时: {per_call_ms:.3f} ms")
+    assert per_call_ms < 5
+
+def test_category_bitmap_index():
+    """测试代码表类别位图索引"""
+    print("🧪 测试: 类别位图索引")
+    master = pd.DataFrame({
+        "股票代码": ["000001", "300750", "688599", "600519"],
+        "行业": ["银行", "新能源", "新能源", "白酒"],
+        "概念": [["金融科技"], ["锂电池", "储能"], ["光伏", "储能"], ["白酒"]],
+        "板块": ["主板", "创业板", "科创板", "主板"],
+        "指数成分": [["沪深300"], ["沪深300"], ["沪深300"], ["沪深300"]],
+    })
+    index = CategoryBitmapIndex(master)
+
+    assert index.any_of("行业", ["银行", "白酒"]).to_indices().tolist() == [0, 3]
+    assert index.all_of("概念", ["锂电池", "储能"]).to_indices().tolist() == [1]
+    selected = index.select(include={"概念": ["储能"]}, exclude={"板块": ["科创板"]})
+    assert selected.to_indices().tolist() == [1]
+
+    hits, known = index.mask_for(["600519", "999999", "300750"], index.any_of("板块", ["主板"]))
+    assert hits.tolist() == [True, False, False]
+    assert known.tolist() == [True, False, True]
+    print("✅ 类别位图索引正确")
+
+def test_category_index_from_snapshot():
+    """测试按快照建类别索引：以快照自身的类别列为准，缺失值由代码表补齐"""
+    print("🧪 测试: 快照类别索引")
+    master = pd.DataFrame({
+        "股票代码": ["000001", "300750"],
+        "行业": ["银行", "新能源"],
+        "概念": [["金融科技"], ["锂电池", "储能"]],
+    })
+    snapshot = pd.DataFrame({
+        "股票代码": ["000001", "300750", "830001", "830002"],
+        "行业": ["科技", None, "银行", None],
+        "概念": ["芯片、储能", "", "储能", None],
+    })
+    index = CategoryBitmapIndex.from_snapshot(snapshot, master)
+    assert index.size == 4
+    # 000001 以快照的“科技”为准；300750 行业缺失时取代码表；代码表外的 830001 同样可查
+    assert index.any_of("行业", ["银行"]).to_indices().tolist() == [2]
+    assert index.any_of("行业", ["新能源"]).to_indices().tolist() == [1]
+    assert index.any_of("概念", ["储能"]).to_indices().tolist() == [0, 1, 2]
+    assert index.all_of("概念", ["锂电池", "储能"]).to_indices().tolist() == [1]
+
+    hits, known = index.mask_for(["830002", "830001"], index.any_of("行业", ["银行"]))
+    assert hits.tolist() == [False, True] and known.all()
+    print("✅ 快照类别列优先，代码表只补齐缺失值")
+
+if __name__ == "__main__":
+    test_bitmap_operations()
+    test_index_matches_pandas()
+    test_count_latency()
+    test_category_bitmap_index()
+    test_category_index_from_snapshot()
+    print("🎉 筛选区间索引测试通过")
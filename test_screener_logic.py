@@ -1,13 +1,16 @@
 """
 测试筛选器逻辑
-验证不同筛选器返回不同的股票结果
+验证不同筛选器返回不同的股票结果，接近达标分析与筛选共用同一份基础数据、包含均线上穿条件，
+以及类别条件以快照自身的行业列为准、每份快照只建一次类别索引
 """
 
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from smart_stock_screener import get_smart_screened_stocks, SmartStockScreener
+from cache_backend import MemoryLRUBackend, set_cache_backend
+from smart_stock_screener import get_smart_screened_stocks, SmartStockScreener, get_near_miss_stocks
+import numpy as np
 import pandas as pd
 from datetime import datetime
 
@@ -171,6 +174,113 @@ def test_screener_logic_consistency():
         print(f"❌ 逻辑一致性测试失败: {e}")
         return False
 
+def test_near_miss_analysis():
+    """测试接近达标分析"""
+    print("\n🧪 测试: 接近达标分析")
+    print("="*60)
+    
+    screener = SmartStockScreener()
+    base_data = screener.fetcher.generate_enhanced_mock_data(screener.fetcher.a_stock_codes * 3)
+    
+    for screener_type, logic in screener.screener_logic.items():
+        near_misses = screener.near_miss_analysis(base_data, screener_type, top_n=5)
+        if near_misses.empty:
+            print(f"  {screener_type}: 无接近达标股票")
+            continue
+        
+        # 每只股票恰好只有一个区间条件未满足，且不属于排除行业
+        for _, row in near_misses.iterrows():
+            failed = [
+                field for field, condition in logic["filters"].items()
+                if isinstance(condition, tuple) and field in base_data.columns
+                and not (condition[0] <= row[field] <= condition[1])
+            ]
+            assert len(failed) == 1, (screener_type, failed)
+            assert row["阻碍条件"].startswith(failed[0] + "=")
+            assert row["行业"] not in logic["exclude_industries"]
+        
+        # 按偏离度升序排列
+        assert near_misses["偏离度"].is_monotonic_increasing
+        print(f"  {screener_type}: {len(near_misses)} 只, 最接近: {near_misses.iloc[0]['阻碍条件']}")
+    
+    print("✅ 接近达标分析正确")
+
+def test_near_misses_share_base_data():
+    """测试筛选结果与接近达标来自同一次数据获取"""
+    print("\n🧪 测试: 接近达标与筛选共用基础数据")
+    set_cache_backend(MemoryLRUBackend())
+    calls = []
+    original = SmartStockScreener.__init__
+
+    def counting_init(self):
+        original(self)
+        fetch = self.fetcher.get_china_a_stock_data
+        self.fetcher.get_china_a_stock_data = lambda *a, **k: calls.append(k["num_stocks"]) or fetch(*a, **k)
+
+    SmartStockScreener.__init__ = counting_init
+    try:
+        results = get_smart_screened_stocks("value_growth", num_stocks=10, use_real_data=False)
+        near_misses = get_near_miss_stocks("value_growth", num_stocks=10, use_real_data=False, top_n=5)
+    finally:
+        SmartStockScreener.__init__ = original
+    assert calls == [30] and len(near_misses) <= 5
+    assert not set(near_misses.get("股票代码", [])) & set(results["股票代码"])
+    print(f"✅ 一次获取 {calls[0]} 只，筛选 {len(results)} 只，接近达标 {len(near_misses)} 只")
+
+def test_near_miss_cross_condition():
+    """测试接近达标分析与筛选一样考虑均线上穿条件"""
+    print("\n🧪 测试: 接近达标的均线上穿条件")
+    screener = SmartStockScreener()
+    df = pd.DataFrame({
+        "股票代码": ["830001", "830002", "830003"],
+        "行业": ["科技", "科技", "科技"],
+        "涨跌幅": [5.0, 5.0, 12.0],
+        "RSI": [60.0, 60.0, 60.0],
+        "成交量比": [2.0, 2.0, 2.0],
+        "MA5_vs_MA20": ["", "", ""],
+        "MA5": [10.0, 9.5, 9.0],
+        "MA20": [9.8, 10.0, 10.0],
+    })
+    assert screener.screener_mask(df, "momentum_breakout").tolist() == [True, False, False]
+
+    near_misses = screener.near_miss_analysis(df, "momentum_breakout")
+    # 830003 同时超出涨跌幅区间且未上穿，不算接近达标
+    assert near_misses["股票代码"].tolist() == ["830002"]
+    assert near_misses["阻碍条件"].iloc[0].startswith("MA5_vs_MA20") and near_misses["偏离度"].iloc[0] == 5.0
+
+    without_field = screener.near_miss_analysis(df.drop(columns=["MA5_vs_MA20"]), "momentum_breakout")
+    assert without_field["股票代码"].tolist() == ["830003"]  # 快照没有该字段时条件不生效，与筛选一致
+    print("✅ 未上穿的股票以均线条件为阻碍条件")
+
+def test_category_mask_uses_snapshot_industry():
+    """测试类别条件以快照自身的行业列为准，按快照只建一次索引，存活行按行号取位"""
+    print("\n🧪 测试: 类别条件使用快照行业")
+    from china_a_stock_fetcher import _category_indexes
+    screener = SmartStockScreener()
+    df = pd.DataFrame({
+        "股票代码": ["000001", "830001", "600519"],
+        "最新价": [10.0, 20.0, 30.0],
+        "行业": ["科技", "银行", None],
+    })
+    # 000001 在代码表中是银行，但快照行业为科技；600519 快照缺少行业时取代码表
+    excluded = screener.category_mask(df, "行业", ["银行"])
+    assert excluded.tolist() == [False, True, screener.fetcher.get_stock_industry("600519.SH") == "银行"]
+    assert screener.category_mask(df, "行业", ["银行"], rows=np.array([2, 1])).tolist() == excluded[[2, 1]].tolist()
+
+    # 新快照（行情变化）重建索引
+    changed = df.assign(最新价=[11.0, 21.0, 31.0], 行业=["银行", "科技", "白酒"])
+    assert screener.category_mask(changed, "行业", ["银行"]).tolist() == [True, False, False]
+    assert screener.category_mask(df, "行业", ["银行"]).tolist() == excluded.tolist()
+
+    # 完整筛选只为快照本身建索引，不为存活行子集建索引
+    snapshot = screener.fetcher.generate_enhanced_mock_data([f"{i:06d}.SZ" for i in range(1, 400)])
+    before = len(_category_indexes)
+    _category_indexes.clear()
+    for screener_type in screener.screener_logic:
+        screener.screener_mask(snapshot, screener_type)
+    assert len(_category_indexes) == 1, f"建了 {len(_category_indexes)} 个索引（之前 {before} 个）"
+    print("✅ 行业以快照为准，每份快照只建一次索引")
+
 def run_screener_tests():
     """运行筛选器测试"""
     print("🧠 智能股票筛选器逻辑测试")
@@ -188,6 +298,12 @@ def run_screener_tests():
         # 测试3: 筛选器逻辑一致性
         logic_success = test_screener_logic_consistency()
         
+        # 测试4: 接近达标分析
+        test_near_miss_analysis()
+        test_near_misses_share_base_data()
+        test_near_miss_cross_condition()
+        test_category_mask_uses_snapshot_industry()
+        
         # 总结
         print("\n" + "="*70)
         print("📋 筛选器测试总结")
@@ -0,0 +1,201 @@
+"""
+测试筛选 HTTP API
+在本机启动服务，验证分页、JSON 与 Arrow IPC 两种响应、自定义条件、个股查询、
+快照新版本的感知以及并发相同请求只计算一次
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import random
+import socket
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import requests
+import uvicorn
+from china_a_stock_fetcher import ChinaAStockFetcher
+from market_snapshots import filter_custom_criteria
+from parallel_screen import merge_results, screen_frame
+from screening_api import (ARROW_MEDIA_TYPE, SOURCE_REALTIME, SOURCE_UNIVERSE, ScreeningService, SnapshotSource,
+                           create_app)
+from shared_snapshot import SharedSnapshotStore
+from snapshot_schema import enforce_snapshot_schema
+
+def make_universe(n: int = 600) -> pd.DataFrame:
+    random.seed(40)
+    prefixes = ["000", "002", "300", "600", "688"]
+    codes = [f"{prefixes[i % 5]}{i:03d}.{'SH' if prefixes[i % 5] in ('600', '688') else 'SZ'}" for i in range(n)]
+    return ChinaAStockFetcher().generate_enhanced_mock_data(codes)
+
+def make_realtime(n: int = 3000, seed: int = 40) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return enforce_snapshot_schema(pd.DataFrame({
+        "股票代码": [f"{i:06d}" for i in range(n)],
+        "股票名称": [f"股票{i}" for i in range(n)],
+        "涨跌幅": rng.uniform(-10, 10, n),
+        "PE": rng.uniform(-20, 80, n),
+        "PB": rng.uniform(0.2, 12, n),
+        "RSI": rng.uniform(0, 100, n),
+        "量比": rng.uniform(0.2, 5, n),
+        "换手率": rng.uniform(0, 20, n),
+        "市值": rng.uniform(1e9, 1e12, n),
+        "综合评分": rng.integers(0, 100, n).astype(float),
+    }))
+
+class ApiServer:
+    """在后台线程运行的服务"""
+
+    def __init__(self):
+        directory = tempfile.mkdtemp()
+        self.universe = make_universe()
+        self.realtime = make_realtime()
+        self.stores = {name: SharedSnapshotStore(name, directory) for name in (SOURCE_UNIVERSE, SOURCE_REALTIME)}
+        self.stores[SOURCE_UNIVERSE].publish(self.universe)
+        self.stores[SOURCE_REALTIME].publish(self.realtime)
+        self.service = ScreeningService({
+            name: SnapshotSource(store, pd.DataFrame, max_age=3600, check_interval=0)
+            for name, store in self.stores.items()
+        })
+
+        sock = socket.socket()
+        sock.bind(("127.0.0.1", 0))
+        self.url = f"http://127.0.0.1:{sock.getsockname()[1]}"
+        self.server = uvicorn.Server(uvicorn.Config(create_app(self.service), log_level="warning"))
+        self.thread = threading.Thread(target=self.server.run, kwargs={"sockets": [sock]}, daemon=True)
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.05)
+
+    def get(self, path: str, **kwargs) -> requests.Response:
+        return requests.get(self.url + path, timeout=60, **kwargs)
+
+    def stop(self):
+        self.server.should_exit = True
+        self.thread.join(10)
+
+_server = None
+
+def get_server() -> ApiServer:
+    global _server
+    if _server is None:
+        _server = ApiServer()
+    return _server
+
+def test_preset_pagination():
+    """测试预设筛选分页与 JSON 响应"""
+    print("🧪 测试: 预设筛选分页")
+    api = get_server()
+    strategy = ("smart", "value_growth")
+    expected = merge_results([strategy], [screen_frame(api.universe, [strategy], len(api.universe))],
+                             len(api.universe))[strategy]["top"]
+
+    first = api.get("/screeners/preset/value_growth", params={"limit": 5}).json()
+    second = api.get("/screeners/preset/value_growth", params={"offset": 5, "limit": 5}).json()
+    assert first["total"] == len(expected) and first["next_offset"] == 5
+    codes = [row["股票代码"] for row in first["rows"] + second["rows"]]
+    assert codes == expected["股票代码"].astype(str).head(10).tolist()
+
+    last = api.get("/screeners/preset/value_growth", params={"offset": len(expected) - 1, "limit": 5}).json()
+    assert len(last["rows"]) == 1 and last["next_offset"] is None
+
+    short_term = api.get("/screeners/short-term/momentum_breakout_entry", params={"limit": 10}).json()
+    scores = [row["入场评分"] for row in short_term["rows"]]
+    assert scores == sorted(scores, reverse=True)
+
+    assert api.get("/screeners/preset/unknown").status_code == 404
+    assert api.get("/screeners/preset/value_growth", params={"limit": 0}).status_code == 400
+    catalog = api.get("/screeners").json()
+    assert "value_growth" in catalog["preset"] and "momentum_breakout_entry" in catalog["short-term"]
+    print(f"✅ 价值成长共 {first['total']} 只，两页拼接与一次性排序一致")
+
+def test_arrow_response():
+    """测试 Arrow IPC 响应与列选择"""
+    print("🧪 测试: Arrow IPC 响应")
+    api = get_server()
+    json_page = api.get("/snapshots/realtime/rows", params={"offset": 100, "limit": 200}).json()
+    response = api.get("/snapshots/realtime/rows", params={"offset": 100, "limit": 200, "columns": "股票代码,RSI"},
+                       headers={"Accept": ARROW_MEDIA_TYPE})
+    assert response.headers["content-type"] == ARROW_MEDIA_TYPE
+    assert response.headers["X-Total-Count"] == str(len(api.realtime))
+    assert response.headers["X-Next-Offset"] == "300"
+
+    page = pa.ipc.open_stream(response.content).read_all().to_pandas()
+    assert list(page.columns) == ["股票代码", "RSI"]
+    assert page["股票代码"].tolist() == [row["股票代码"] for row in json_page["rows"]]
+    np.testing.assert_allclose(page["RSI"].to_numpy(), api.realtime["RSI"].to_numpy()[100:300], rtol=1e-6)
+
+    info = api.get("/snapshots/realtime").json()
+    assert info["rows"] == len(api.realtime) and "RSI" in info["columns"]
+    print(f"✅ Arrow 页与 JSON 页一致（{len(response.content)} 字节）")
+
+def test_custom_and_detail():
+    """测试自定义条件与个股查询"""
+    print("🧪 测试: 自定义条件与个股查询")
+    api = get_server()
+    criteria = {"pe_range": [0, 20], "rsi_range": [30, 70], "volume_ratio_min": 1.5}
+    expected = filter_custom_criteria(api.realtime, criteria).sort_values("综合评分", ascending=False, kind="stable")
+
+    result = requests.post(api.url + "/screeners/custom", json=criteria, params={"limit": 1000}, timeout=60).json()
+    assert result["total"] == len(expected)
+    assert [row["股票代码"] for row in result["rows"]] == expected["股票代码"].astype(str).tolist()
+
+    bad = requests.post(api.url + "/screeners/custom", json={"pe_range": [0]}, timeout=60)
+    assert bad.status_code == 400
+    assert requests.post(api.url + "/screeners/custom", json={"unknown": 1}, timeout=60).status_code == 400
+
+    code = str(api.universe["股票代码"].iloc[0])
+    detail = api.get(f"/stocks/{code}.SZ").json()
+    assert detail["universe"]["股票代码"] == code and detail["realtime"]["股票代码"] == code
+    assert api.get("/stocks/999999").status_code == 404
+    print(f"✅ 自定义条件命中 {result['total']} 只，个股 {code} 在两份快照中都能查到")
+
+def test_new_version_and_coalescing():
+    """测试感知快照新版本与并发相同请求只计算一次"""
+    print("🧪 测试: 快照新版本与请求合并")
+    api = get_server()
+    before = api.get("/snapshots/realtime").json()["version"]
+    api.stores[SOURCE_REALTIME].publish(make_realtime(seed=41))
+
+    criteria = {"rsi_range": [40, 60]}
+    computed = api.service.stats["computed"]
+    with ThreadPoolExecutor(16) as pool:
+        responses = list(pool.map(
+            lambda i: requests.post(api.url + "/screeners/custom", json=criteria, params={"limit": 10}, timeout=60),
+            range(64)
+        ))
+    assert all(r.status_code == 200 for r in responses)
+    versions = {r.json()["version"] for r in responses}
+    assert versions == {before + 1}
+    assert api.service.stats["computed"] - computed == 1
+    assert api.get("/health").json()["snapshots"][SOURCE_REALTIME] == before + 1
+    print(f"✅ 64 个并发请求只计算一次，已切换到版本 {before + 1}")
+
+def test_metrics_endpoint():
+    """测试 /metrics 以 Prometheus 文本格式输出筛选耗时直方图"""
+    print("🧪 测试: 指标接口")
+    api = get_server()
+    api.get("/screeners/preset/dividend_stable", params={"limit": 1})
+    response = api.get("/metrics")
+    assert response.status_code == 200 and response.headers["content-type"].startswith("text/plain")
+    lines = response.text.splitlines()
+    assert "# TYPE stock_screen_duration_seconds histogram" in lines
+    counts = [line for line in lines
+              if line.startswith('stock_screen_duration_seconds_count{screener="dividend_stable",outcome="ok"}')]
+    assert len(counts) == 1 and int(counts[0].split()[-1]) >= 1
+    print(f"✅ /metrics 输出 {len(lines)} 行")
+
+if __name__ == "__main__":
+    test_preset_pagination()
+    test_arrow_response()
+    test_custom_and_detail()
+    test_new_version_and_coalescing()
+    test_metrics_endpoint()
+    get_server().stop()
+    print("🎉 筛选 HTTP API 测试通过")
@@ -0,0 +1,137 @@
+"""
+测试会话内存记账
+验证各键深度内存统计、超出预算时按最久未访问溢出到磁盘并透明加载回来、
+经 load 读取驻留内存的值同样刷新访问时间、清除策略、
+全服务会话汇总与闲置会话清理，以及内存指标输出
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from metrics import StockMetrics
+from session_memory import POLICY_EVICT, SessionMemoryAccountant, SpilledValue, get_session_accountant
+
+def make_frame(rows: int, seed: int = 0) -> pd.DataFrame:
+    """带字符串列的结果表"""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "股票代码": [f"{i:06d}" for i in range(rows)],
+        "股票名称": [f"股票{i}" for i in range(rows)],
+        "最新价": rng.uniform(1, 100, rows),
+        "涨跌幅": rng.normal(0, 2, rows),
+    })
+
+def test_accounting_per_key():
+    """测试按键统计深度内存与本会话各键列表"""
+    print("🧪 测试: 按键记账")
+    accountant = SessionMemoryAccountant(budget=0, spill_dir=tempfile.mkdtemp())
+    results = make_frame(5000)
+    state = {"screening_results": results, "last_screener": "价值成长", "show_detailed_results": True}
+    usage = accountant.account("s1", state)
+    assert usage.keys["screening_results"] == results.memory_usage(deep=True).sum()
+    assert usage.total == sum(usage.keys.values()) and usage.spilled == {}
+
+    keys = accountant.session_keys("s1")
+    assert keys["键"].iloc[0] == "screening_results" and set(keys["位置"]) == {"内存"}
+    print(f"✅ screening_results 深度占用 {usage.keys['screening_results'] / 1024:.0f} KB")
+
+def test_spill_and_reload():
+    """测试超出预算时最久未访问的大对象溢出到磁盘，读取时加载回来"""
+    print("🧪 测试: 溢出与加载")
+    spill_dir = tempfile.mkdtemp()
+    old, recent = make_frame(6000, 1), make_frame(6000, 2)
+    size = old.memory_usage(deep=True).sum()
+    accountant = SessionMemoryAccountant(budget=int(size * 1.5), spill_dir=spill_dir)
+
+    state = {"filtered_stocks": old}
+    accountant.account("s1", state)
+    time.sleep(0.01)
+    state["screening_results"] = recent
+    usage = accountant.account("s1", state)
+
+    assert isinstance(state["filtered_stocks"], SpilledValue) and state["screening_results"] is recent
+    assert usage.total <= accountant.budget and usage.spilled_bytes == size
+    assert len(os.listdir(spill_dir)) == 1 and accountant.stats()["spills"] == 1
+
+    loaded = accountant.load("s1", state, "filtered_stocks")
+    pd.testing.assert_frame_equal(loaded, old)
+    assert state["filtered_stocks"] is loaded and os.listdir(spill_dir) == []
+    assert accountant.load("s1", state, "missing", "默认") == "默认"
+
+    # 刚读取过的 filtered_stocks 比 screening_results 新，超预算时改为溢出后者
+    usage = accountant.account("s1", state)
+    assert isinstance(state["screening_results"], SpilledValue) and state["filtered_stocks"] is loaded
+    print(f"✅ 预算 {accountant.budget / 1024:.0f} KB，按最久未访问溢出并可加载回来")
+
+def test_reads_refresh_access():
+    """测试读取未溢出的值也刷新访问时间，超预算时先溢出没有读取过的值"""
+    print("🧪 测试: 读取刷新访问时间")
+    frames = {key: make_frame(6000, seed) for seed, key in enumerate(["filtered_stocks", "screening_results",
+                                                                      "comparison"])}
+    size = frames["filtered_stocks"].memory_usage(deep=True).sum()
+    accountant = SessionMemoryAccountant(budget=int(size * 2.5), spill_dir=tempfile.mkdtemp())
+
+    state = {"filtered_stocks": frames["filtered_stocks"]}
+    accountant.account("s1", state)
+    time.sleep(0.01)
+    state["screening_results"] = frames["screening_results"]
+    accountant.account("s1", state)
+    time.sleep(0.01)
+
+    # filtered_stocks 写入最早，但刚被读取过，值没有变化
+    assert accountant.load("s1", state, "filtered_stocks") is frames["filtered_stocks"]
+    state["comparison"] = frames["comparison"]
+    accountant.account("s1", state)
+    assert isinstance(state["screening_results"], SpilledValue)
+    assert state["filtered_stocks"] is frames["filtered_stocks"] and state["comparison"] is frames["comparison"]
+    print("✅ 最近读取过的值保留在内存，溢出的是最久未访问的值")
+
+def test_evict_policy():
+    """测试清除策略直接删除超出预算的大对象，小值不受影响"""
+    print("🧪 测试: 清除策略")
+    accountant = SessionMemoryAccountant(budget=1024, policy=POLICY_EVICT, spill_dir=tempfile.mkdtemp())
+    state = {"screening_results": make_frame(5000), "ai_analysis_results": {"score": 80}, "flag": True}
+    usage = accountant.account("s1", state)
+    assert set(state) == {"ai_analysis_results", "flag"} and "screening_results" in usage.evicted
+    assert accountant.stats()["evictions"] == 1
+
+    try:
+        SessionMemoryAccountant(policy="drop")
+        assert False, "未知策略应报错"
+    except ValueError:
+        pass
+    print("✅ 超出预算的结果表已清除，小值保留")
+
+def test_server_view_and_metrics():
+    """测试全服务会话汇总、闲置会话清理与内存指标"""
+    print("🧪 测试: 全服务视图与指标")
+    accountant = SessionMemoryAccountant(budget=0, spill_dir=tempfile.mkdtemp(), idle_seconds=60)
+    accountant.account("aaaa1111-big", {"screening_results": make_frame(8000)})
+    accountant.account("bbbb2222-small", {"screening_results": make_frame(100)})
+    sessions = accountant.sessions()
+    assert sessions["会话"].tolist() == ["aaaa1111", "bbbb2222"] and sessions["内存(MB)"].iloc[0] > 0
+    assert sessions["最大的键"].iloc[0] == "screening_results"
+    stats = accountant.stats()
+    assert stats["sessions"] == 2 and stats["max_session_bytes"] < stats["bytes"]
+
+    accountant.prune(now=time.time() + 120)
+    assert accountant.stats()["sessions"] == 0
+
+    get_session_accountant().account("metrics-test", {"screening_results": make_frame(1000)})
+    text = StockMetrics().render()
+    assert "stock_sessions " in text and "stock_session_memory_bytes " in text
+    assert "stock_session_spills_total" in text
+    print(f"✅ {stats['sessions']} 个会话共 {stats['bytes'] / 1024:.0f} KB，闲置会话已清理")
+
+if __name__ == "__main__":
+    test_accounting_per_key()
+    test_spill_and_reload()
+    test_reads_refresh_access()
+    test_evict_policy()
+    test_server_view_and_metrics()
+    print("🎉 会话内存记账测试通过")
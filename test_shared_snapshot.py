@@ -0,0 +1,182 @@
+"""
+测试共享快照
+验证发布/挂载往返一致、数值列零拷贝、多进程并发时只拉取一次行情，并发发布不会分配重复版本号，以及流式刷新时并发任务只有一个拉取；
+分块写入的类别列挂载后仍为类别，多线程并发挂载同一版本得到同一个对象
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import multiprocessing
+import tempfile
+import threading
+import time
+import numpy as np
+import pandas as pd
+from shared_snapshot import SharedSnapshotStore
+from snapshot_schema import enforce_snapshot_schema, snapshot_timestamp
+
+def make_snapshot(n: int = 3000) -> pd.DataFrame:
+    rng = np.random.default_rng(9)
+    return enforce_snapshot_schema(pd.DataFrame({
+        "股票代码": [f"{i:06d}" for i in range(n)],
+        "最新价": rng.uniform(3, 300, n),
+        "涨跌幅": rng.uniform(-10, 10, n),
+        "成交量": rng.integers(1000, 10 ** 8, n),
+        "行业": rng.choice(["银行", "白酒", "科技"], n),
+        "上市日期": ["2015-06-01"] * n,
+    }))
+
+def slow_fetch(counter_path: str) -> pd.DataFrame:
+    with open(counter_path, "a") as f:
+        f.write("x")
+    time.sleep(0.3)
+    return make_snapshot(100)
+
+def worker(directory: str, counter_path: str, queue):
+    store = SharedSnapshotStore("race", directory)
+    df = store.get_or_refresh(lambda: slow_fetch(counter_path), max_age=60)
+    queue.put(len(df))
+
+def publisher(directory: str, rows: int, queue):
+    store = SharedSnapshotStore("concurrent", directory)
+    versions = []
+    for _ in range(5):
+        if rows % 2:
+            versions.append(store.publish(make_snapshot(rows)))
+        else:
+            for _ in store.publish_chunks(iter([make_snapshot(rows)])):
+                pass
+            versions.append(store.published_version)
+    queue.put((rows, versions))
+
+def test_publish_and_attach():
+    """测试发布与零拷贝挂载"""
+    print("🧪 测试: 发布与挂载")
+    store = SharedSnapshotStore("roundtrip", tempfile.mkdtemp())
+    assert store.attach() is None
+
+    df = make_snapshot()
+    assert store.publish(df) == 1
+    attached = store.attach()
+
+    pd.testing.assert_frame_equal(attached, df)
+    assert snapshot_timestamp(attached) == snapshot_timestamp(df)
+    values = attached["涨跌幅"].to_numpy()
+    assert not values.flags.owndata and not values.flags.writeable  # 直接引用映射内存
+    assert store.attach() is attached  # 同一版本只挂载一次
+
+    assert store.publish(df.head(10)) == 2
+    assert len(store.attach()) == 10
+    print("✅ 往返一致，数值列零拷贝")
+
+def test_single_fetch_across_processes():
+    """测试多进程并发时只有一个进程拉取"""
+    print("🧪 测试: 多进程只拉取一次")
+    if not hasattr(os, "fork"):
+        print("⚠️ 当前平台不支持 fork，跳过")
+        return
+    directory = tempfile.mkdtemp()
+    counter_path = os.path.join(directory, "fetches")
+    context = multiprocessing.get_context("fork")
+    queue = context.Queue()
+    processes = [context.Process(target=worker, args=(directory, counter_path, queue)) for _ in range(4)]
+    for process in processes:
+        process.start()
+    sizes = [queue.get(timeout=30) for _ in processes]
+    for process in processes:
+        process.join()
+
+    with open(counter_path) as f:
+        assert len(f.read()) == 1
+    assert sizes == [100] * 4
+    print("✅ 4个进程共用一次拉取")
+
+def test_concurrent_publish_versions():
+    """测试多个进程同时发布时版本号各不相同，且每个版本的文件就是发布方写入的数据"""
+    print("🧪 测试: 并发发布的版本号")
+    if not hasattr(os, "fork"):
+        print("⚠️ 当前平台不支持 fork，跳过")
+        return
+    directory = tempfile.mkdtemp()
+    context = multiprocessing.get_context("fork")
+    queue = context.Queue()
+    processes = [context.Process(target=publisher, args=(directory, 100 + i, queue)) for i in range(4)]
+    for process in processes:
+        process.start()
+    published = dict(queue.get(timeout=60) for _ in processes)
+    for process in processes:
+        process.join()
+
+    versions = [v for vs in published.values() for v in vs]
+    assert sorted(versions) == list(range(1, 21))
+    store = SharedSnapshotStore("concurrent", directory)
+    assert store.manifest()["version"] == 20
+    owner = next(rows for rows, vs in published.items() if 20 in vs)
+    assert len(store.attach(20)) == owner
+    print(f"✅ 4个进程并发发布 {len(versions)} 次，版本号不重复")
+
+def test_refresh_slot_single_stream():
+    """测试快照过期时并发的流式刷新只有一个线程拉取，其余线程等锁后使用新版本"""
+    print("🧪 测试: 流式刷新只拉取一次")
+    directory = tempfile.mkdtemp()
+    fetches, versions = [], []
+
+    def job():
+        store = SharedSnapshotStore("slot", directory)
+        with store.refresh_slot(max_age=60) as version:
+            if version is None:
+                fetches.append(threading.get_ident())
+                time.sleep(0.2)
+                for _ in store.publish_chunks(iter([make_snapshot(50), make_snapshot(50)])):
+                    pass
+                version = store.published_version
+        versions.append(version)
+
+    threads = [threading.Thread(target=job) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(30)
+    assert len(fetches) == 1 and versions == [1] * 4
+
+    store = SharedSnapshotStore("slot", directory)
+    with store.refresh_slot(max_age=0) as version:
+        assert version is None  # 过期时拿到刷新锁
+    with store.refresh_slot(max_age=60) as version:
+        assert version == 1
+    print("✅ 4个并发任务只拉取一次，其余任务使用新发布的版本")
+
+def test_chunked_categorical_and_concurrent_attach():
+    """测试分块写入的类别列与并发挂载"""
+    print("🧪 测试: 分块类别列与并发挂载")
+    store = SharedSnapshotStore("categorical", tempfile.mkdtemp())
+    df = make_snapshot(900)
+    assert isinstance(df["行业"].dtype, pd.CategoricalDtype)
+    # 各块的类别字典不同
+    chunks = [df.iloc[:300], df.iloc[300:].assign(行业=df["行业"].iloc[300:].cat.remove_unused_categories())]
+    for _ in store.publish_chunks(iter(chunks)):
+        pass
+
+    attached = []
+    threads = [threading.Thread(target=lambda: attached.append(store.attach(store.published_version)))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(attached) == 8 and all(frame is attached[0] for frame in attached)
+
+    industry = attached[0]["行业"]
+    assert isinstance(industry.dtype, pd.CategoricalDtype)
+    assert industry.astype(str).tolist() == df["行业"].astype(str).tolist()
+    print("✅ 类别列挂载后仍为类别，并发挂载共享同一对象")
+
+if __name__ == "__main__":
+    test_publish_and_attach()
+    test_single_fetch_across_processes()
+    test_concurrent_publish_versions()
+    test_refresh_slot_single_stream()
+    test_chunked_categorical_and_concurrent_attach()
+    print("🎉 共享快照测试通过")
@@ -0,0 +1,74 @@
+"""
+测试快照列类型规范
+验证入库后的列类型、快照级更新时间，以及内存占用明显下降
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+import pandas as pd
+from china_a_stock_fetcher import ChinaAStockFetcher
+from snapshot_schema import (enforce_snapshot_schema, nonconforming_columns,
+                             snapshot_memory_usage, snapshot_timestamp)
+from filter_planner import CategoryPredicate, RangePredicate, filter_rows
+
+def test_mock_snapshot_conforms():
+    """测试模拟快照符合类型规范"""
+    print("🧪 测试: 模拟快照列类型")
+    fetcher = ChinaAStockFetcher()
+    df = fetcher.generate_enhanced_mock_data(list(dict.fromkeys(fetcher.a_stock_codes)) * 20)
+
+    assert nonconforming_columns(df) == []
+    assert df["行业"].dtype == "category"
+    assert df["涨跌幅"].dtype == np.float32 and df["RSI"].dtype == np.float32
+    assert df["成交量"].dtype == np.int64
+    assert pd.api.types.is_datetime64_any_dtype(df["上市日期"])
+    assert "更新时间" not in df.columns
+    assert isinstance(snapshot_timestamp(df), pd.Timestamp)
+    print(f"✅ {len(df.columns)} 列全部符合规范")
+
+def test_memory_shrinks():
+    """测试内存占用下降"""
+    print("🧪 测试: 内存占用")
+    n = 20000
+    rng = np.random.default_rng(2)
+    legacy = pd.DataFrame({
+        "股票代码": [f"{i:06d}" for i in range(n)],
+        "涨跌幅": rng.uniform(-10, 10, n),
+        "换手率": rng.uniform(0, 15, n),
+        "RSI": rng.uniform(20, 80, n),
+        "成交量": rng.integers(1000000, 500000000, n).astype(np.float64),
+        "行业": rng.choice(["银行", "白酒", "科技", "医药"], n).astype(object),
+        "概念": rng.choice(["锂电池、储能", "白酒、国企改革", "光伏、储能"], n).astype(object),
+        "数据源": np.array(["A股模拟数据"] * n, dtype=object),
+        "上市日期": np.array(["2010-05-20"] * n, dtype=object),
+        "更新时间": np.array(["09:30:00"] * n, dtype=object),
+    })
+    compact = enforce_snapshot_schema(legacy)
+
+    before, after = snapshot_memory_usage(legacy), snapshot_memory_usage(compact)
+    print(f"📦 {before / 1e6:.2f} MB → {after / 1e6:.2f} MB")
+    assert after * 2 < before
+    assert "更新时间" in legacy.columns  # 不修改原始数据
+    assert np.allclose(compact["涨跌幅"], legacy["涨跌幅"], atol=1e-5)
+
+def test_filters_on_compact_columns():
+    """测试规范类型上的筛选结果不变"""
+    print("🧪 测试: 规范类型上的筛选")
+    rng = np.random.default_rng(4)
+    legacy = pd.DataFrame({
+        "涨跌幅": np.round(rng.uniform(-10, 10, 5000), 2),
+        "行业": rng.choice(["银行", "白酒", "科技"], 5000).astype(object),
+    })
+    compact = enforce_snapshot_schema(legacy)
+    predicates = [RangePredicate("涨跌幅", -2.5, 3.5), CategoryPredicate("行业", ["银行", "不存在"], negate=True)]
+    assert filter_rows(compact, predicates).tolist() == filter_rows(legacy, predicates).tolist()
+    print("✅ 筛选结果一致")
+
+if __name__ == "__main__":
+    test_mock_snapshot_conforms()
+    test_memory_shrinks()
+    test_filters_on_compact_columns()
+    print("🎉 快照列类型规范测试通过")
@@ -0,0 +1,143 @@
+"""
+测试流式筛选
+验证分块前K名与一次性筛选一致、第一块即可产出结果、分块写入共享快照以及分页行情批次
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import tempfile
+import numpy as np
+import pandas as pd
+from cache_backend import MemoryLRUBackend, get_cache, set_cache_backend
+from real_data_fetcher import RealDataFetcher
+from shared_snapshot import SharedSnapshotStore
+from snapshot_schema import enforce_snapshot_schema
+from streaming_screen import RunningTopK, iter_frame_chunks, stream_screen
+
+def make_universe(n: int = 2000) -> pd.DataFrame:
+    rng = np.random.default_rng(37)
+    return enforce_snapshot_schema(pd.DataFrame({
+        "股票代码": [f"{i:06d}" for i in range(n)],
+        "涨跌幅": rng.uniform(-10, 10, n),
+        "成交量": rng.integers(1000, 10 ** 8, n),
+        "综合评分": rng.integers(0, 50, n).astype(float),  # 大量同分，检验排序稳定
+        "行业": rng.choice(["银行", "白酒", "科技"], n),
+    }))
+
+def screen(chunk: pd.DataFrame) -> pd.DataFrame:
+    return chunk[chunk["涨跌幅"].to_numpy() > 3]
+
+def test_stream_matches_batch():
+    """测试分块前K名与一次性筛选一致"""
+    print("🧪 测试: 分块前K名")
+    df = make_universe()
+    expected = screen(df).sort_values("综合评分", ascending=False, kind="stable").head(30)
+
+    updates = list(stream_screen(iter_frame_chunks(df, 128), screen, top_k=30, total=len(df)))
+    last = updates[-1]
+    assert last["scanned"] == len(df) and last["progress"] == 1.0
+    assert last["matched"] == len(screen(df))
+    assert last["top"]["股票代码"].tolist() == expected["股票代码"].tolist()
+    assert len(updates) == -(-len(df) // 128)
+
+    top = RunningTopK(3, "涨跌幅", descending=False)
+    top.push(df.head(10))
+    assert top.frame()["涨跌幅"].tolist() == sorted(df.head(10)["涨跌幅"].tolist())[:3]
+    assert not top.push(df.head(0))
+    print(f"✅ {last['chunks']} 块合并后的前30名与一次性排序一致")
+
+def test_first_result_after_one_chunk():
+    """测试第一块处理完即产出结果"""
+    print("🧪 测试: 首块产出")
+    df = make_universe()
+    consumed = []
+
+    def chunks():
+        for chunk in iter_frame_chunks(df, 100):
+            consumed.append(len(chunk))
+            yield chunk
+
+    first = next(stream_screen(chunks(), screen, top_k=10))
+    assert len(consumed) == 1 and first["chunks"] == 1
+    assert len(first["top"]) == min(10, len(screen(df.head(100))))
+    print("✅ 只读取一块就得到第一批结果")
+
+def test_publish_chunks():
+    """测试边筛选边写入共享快照"""
+    print("🧪 测试: 分块写入共享快照")
+    df = make_universe(500)
+    store = SharedSnapshotStore("streamed", tempfile.mkdtemp())
+
+    # 未消费完的写入不会发布
+    partial = store.publish_chunks(iter_frame_chunks(df, 100))
+    next(partial)
+    partial.close()
+    assert store.manifest() is None
+    assert not [f for f in os.listdir(store.directory) if f.endswith(".tmp")]
+
+    passed = list(store.publish_chunks(iter_frame_chunks(df, 100)))
+    assert len(passed) == 5
+    attached = store.attach()
+    assert store.manifest()["rows"] == 500
+    assert attached["股票代码"].tolist() == df["股票代码"].tolist()
+    np.testing.assert_array_equal(attached["涨跌幅"].to_numpy(), df["涨跌幅"].to_numpy())
+    assert attached["行业"].astype(str).tolist() == df["行业"].astype(str).tolist()
+    print("✅ 全部块写完后发布，中途放弃不留临时文件")
+
+class PagedFetcher(RealDataFetcher):
+    """以内存数据代替分页接口"""
+
+    def __init__(self, rows: int):
+        super().__init__()
+        rng = np.random.default_rng(5)
+        self.pages = []
+        self.raw = pd.DataFrame({
+            "代码": [f"{i:06d}" for i in range(rows)],
+            "名称": [f"股票{i}" for i in range(rows)],
+            "最新价": rng.uniform(3, 100, rows),
+            "涨跌幅": rng.uniform(-10, 10, rows),
+            "成交量": rng.integers(1000, 10 ** 7, rows),
+            "成交额": np.sort(rng.uniform(1e7, 1e10, rows))[::-1],
+            "换手率": rng.uniform(0, 10, rows),
+            "市盈率-动态": rng.uniform(5, 50, rows),
+            "流通市值": rng.uniform(1e9, 1e11, rows),
+            "量比": rng.uniform(0.2, 6, rows).round(2),
+        })
+
+    def _fetch_spot_page(self, page: int, page_size: int):
+        self.pages.append(page)
+        return self.raw.iloc[(page - 1) * page_size:page * page_size].reset_index(drop=True)
+
+def test_realtime_chunks():
+    """测试分页行情按批次产出"""
+    print("🧪 测试: 分页行情批次")
+    set_cache_backend(MemoryLRUBackend())
+    fetcher = PagedFetcher(450)
+
+    chunks = list(fetcher.iter_stock_realtime_chunks(limit=320, columns=["RSI", "综合评分"], chunk_size=100))
+    assert [len(c) for c in chunks] == [100, 100, 100, 20]
+    assert fetcher.pages == [1, 2, 3, 4]
+    assert all({"RSI", "综合评分"} <= set(c.columns) for c in chunks)
+    # 量比取自行情本身，不随分批变化
+    np.testing.assert_allclose(pd.concat(chunks)["量比"].to_numpy(dtype=float), fetcher.raw["量比"].head(320))
+
+    fetcher.pages.clear()
+    assert sum(len(c) for c in fetcher.iter_stock_realtime_chunks(chunk_size=100)) == 450
+    assert fetcher.pages == [1, 2, 3, 4, 5]
+
+    # 缓存的整表没有量比时在整表上估算，再切块
+    cached = fetcher._clean_realtime_data(fetcher.raw.drop(columns=["量比"]))
+    get_cache().set("realtime_data_None", cached)
+    whole = fetcher.calculate_technical_indicators(cached, ["量比"])
+    chunks = list(fetcher.iter_stock_realtime_chunks(columns=["量比"], chunk_size=100))
+    np.testing.assert_allclose(pd.concat(chunks)["量比"].to_numpy(dtype=float), whole["量比"].to_numpy(dtype=float))
+    print("✅ 每页清洗并计算指标后立即产出，量比与分批方式无关")
+
+if __name__ == "__main__":
+    test_stream_matches_batch()
+    test_first_result_after_one_chunk()
+    test_publish_chunks()
+    test_realtime_chunks()
+    print("🎉 流式筛选测试通过")
@@ -0,0 +1,111 @@
+"""
+测试合成行情生成器
+验证按种子确定性、OHLCV 与涨跌停约束、基本面一致性、行业相关性、快照结构与生成速度
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import random
+import time
+import numpy as np
+import pandas as pd
+from china_a_stock_fetcher import ChinaAStockFetcher
+from synthetic_market import PRICE_LIMITS, SyntheticMarket, board_of, generate_synthetic_market
+
+def test_deterministic_by_seed():
+    """测试同一种子生成完全相同的市场"""
+    print("🧪 测试: 按种子确定性")
+    first = generate_synthetic_market(300, 120, seed=7)
+    second = generate_synthetic_market(300, 120, seed=7)
+    other = generate_synthetic_market(300, 120, seed=8)
+
+    assert (first.codes == second.codes).all() and len(set(first.codes)) == 300
+    np.testing.assert_array_equal(first.close, second.close)
+    np.testing.assert_array_equal(first.volume, second.volume)
+    pd.testing.assert_frame_equal(first.spot_snapshot(), second.spot_snapshot())
+    assert not np.array_equal(first.close, other.close)
+
+    random.seed(43)
+    codes = ChinaAStockFetcher().a_stock_codes * 3
+    mock = ChinaAStockFetcher().generate_enhanced_mock_data(codes, columns=[])
+    random.seed(43)
+    assert mock.equals(ChinaAStockFetcher().generate_enhanced_mock_data(codes, columns=[]))
+    print("✅ 相同种子的路径与快照完全一致，模拟数据随 random.seed 可复现")
+
+def test_paths_and_fundamentals():
+    """测试 OHLC 关系、涨跌停限制与基本面一致性"""
+    print("🧪 测试: 路径与基本面")
+    market = generate_synthetic_market(1000, 250, seed=3)
+    assert market.close.shape == (250, 1000) and len(market.dates) == 250
+    assert (market.high >= np.maximum(market.open, market.close) * (1 - 1e-6)).all()
+    assert (market.low <= np.minimum(market.open, market.close) * (1 + 1e-6)).all()
+
+    limits = np.array([PRICE_LIMITS[board] for board in board_of(market.codes)])
+    change = np.abs(market.close / market.prev_close - 1)
+    assert (change <= limits + 1e-4).all()
+
+    spot = market.spot_snapshot()
+    price = spot["最新价"].to_numpy()
+    for ratio, per_share in (("市盈率", "每股收益"), ("市净率", "每股净资产")):
+        multiple, value = spot[ratio].to_numpy(dtype=np.float64), spot[per_share].to_numpy()
+        # 各字段保留两位小数，乘积的舍入误差随两者放大
+        assert (np.abs(multiple * value - price) <= (np.abs(multiple) + np.abs(value)) * 0.0051 + 0.006).all()
+    np.testing.assert_allclose(spot["ROE"], spot["市净率"] / spot["市盈率"] * 100, rtol=0.02)
+    assert (spot["流通市值"] <= spot["总市值"]).all() and (spot["股息率"][spot["市盈率"] < 0] == 0).all()
+
+    history = market.history(str(spot["股票代码"].iloc[0]))
+    assert abs(spot["MA5"].iloc[0] - history["收盘价"].tail(5).mean()) < 0.01
+    assert spot["最新价"].iloc[0] == history["收盘价"].iloc[-1]
+    assert spot["RSI"].between(0, 100).all() and spot["KDJ_K"].between(0, 100).all()
+    print("✅ 1000 只股票的 OHLC、涨跌停与 PE/PB/ROE 关系全部成立")
+
+def test_sector_correlation():
+    """测试同行业股票的收益相关性高于跨行业"""
+    print("🧪 测试: 行业相关性")
+    market = generate_synthetic_market(400, 500, seed=11)
+    returns = np.diff(np.log(market.close.astype(np.float64)), axis=0)
+    correlation = np.corrcoef(returns.T)
+    sectors = market.symbols["行业"].to_numpy()
+    same = sectors[:, None] == sectors[None, :]
+    off_diagonal = ~np.eye(len(sectors), dtype=bool)
+    within = correlation[same & off_diagonal].mean()
+    across = correlation[~same].mean()
+    assert within > across + 0.05 and across > 0.1
+    print(f"✅ 行业内平均相关 {within:.2f}，跨行业 {across:.2f}")
+
+def test_snapshot_schema_matches_mock():
+    """测试快照结构与 A 股模拟数据一致，并保留传入的代码表"""
+    print("🧪 测试: 快照结构")
+    fetcher = ChinaAStockFetcher()
+    random.seed(44)
+    mock = fetcher.generate_enhanced_mock_data(fetcher.a_stock_codes)
+    spot = SyntheticMarket(n_symbols=50, n_days=60, seed=1).spot_snapshot()
+    assert set(spot.columns) <= set(mock.columns)
+    assert {col: str(dtype) for col, dtype in spot.dtypes.items()} == \
+        {col: str(mock[col].dtype) for col in spot.columns}
+
+    assert mock["股票代码"].astype(str).tolist() == [c[:6] for c in fetcher.a_stock_codes]
+    assert (mock.loc[mock["股票代码"] == "600519", "行业"] == "白酒").all()
+    banks = mock.loc[mock["行业"] == "银行", "最新价"]
+    assert banks.between(3, 8).all()
+    print(f"✅ {len(spot.columns)} 列与模拟数据同名同类型")
+
+def test_generation_speed():
+    """测试 5000 只 × 2500 日在数秒内生成"""
+    print("🧪 测试: 生成速度")
+    started = time.perf_counter()
+    market = generate_synthetic_market(5000, 2500, seed=5)
+    elapsed = time.perf_counter() - started
+    assert market.close.shape == (2500, 5000) and market.close.dtype == np.float32
+    assert elapsed < 20
+    print(f"✅ 5000 只 × 2500 日生成耗时 {elapsed:.2f} 秒")
+
+if __name__ == "__main__":
+    test_deterministic_by_seed()
+    test_paths_and_fundamentals()
+    test_sector_correlation()
+    test_snapshot_schema_matches_mock()
+    test_generation_speed()
+    print("🎉 合成行情生成器测试通过")
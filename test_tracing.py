@@ -0,0 +1,130 @@
+"""
+测试阶段级耗时追踪
+验证 span 嵌套与属性、环形缓冲区、阶段 p50/p95 统计、瀑布图数据、线程隔离，
+以及数据获取链路上各阶段 span 的实际产生
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import threading
+import time
+from china_a_stock_fetcher import ChinaAStockFetcher
+from quote_server import QuoteBook, QuoteServer
+from synthetic_market import generate_synthetic_market
+from tracing import (STAGE_CLEAN, STAGE_ENRICH, STAGE_FETCH, STAGE_FILTER, STAGE_LABELS, Tracer, current_span,
+                     get_tracer, span, traced)
+
+def test_nesting_and_buffer():
+    """测试嵌套 span 归入同一追踪，最外层结束后进入环形缓冲区"""
+    print("🧪 测试: span 嵌套与缓冲区")
+    tracer = Tracer(buffer_size=3, enabled=True)
+    with tracer.span("运行", screener="value") as root:
+        with tracer.span("行情", STAGE_FETCH, provider="sina") as fetch:
+            time.sleep(0.01)
+            fetch.set(rows=30)
+            with tracer.span("解析", STAGE_CLEAN):
+                pass
+        with tracer.span("筛选", STAGE_FILTER):
+            time.sleep(0.005)
+        assert tracer.current_span() is root
+    assert len(tracer.traces()) == 1
+
+    trace = tracer.last_trace()
+    waterfall = trace.waterfall()
+    assert waterfall["名称"].tolist() == ["运行", "行情", "解析", "筛选"]
+    assert waterfall["层级"].tolist() == [0, 1, 2, 1]
+    assert waterfall["属性"].iloc[1] == "provider=sina, rows=30"
+    assert waterfall["开始(ms)"].iloc[3] >= waterfall["开始(ms)"].iloc[1] + waterfall["耗时(ms)"].iloc[1] - 0.01
+    assert waterfall["耗时(ms)"].iloc[1] >= 10 and trace.duration >= 0.015
+
+    for i in range(5):
+        with tracer.span(f"运行{i}"):
+            pass
+    assert [t.name for t in tracer.traces()] == ["运行2", "运行3", "运行4"]
+    print(f"✅ 4 个 span 归入一条追踪，缓冲区保留最近 {len(tracer.traces())} 条")
+
+def test_stage_percentiles_and_errors():
+    """测试各阶段 p50/p95（嵌套同阶段不重复计入）与异常记录"""
+    print("🧪 测试: 阶段分位数与异常")
+    tracer = Tracer(enabled=True)
+    for ms in range(1, 21):
+        with tracer.span("运行"):
+            with tracer.span("外层获取", STAGE_FETCH):
+                with tracer.span("内层获取", STAGE_FETCH):
+                    time.sleep(ms / 1000)
+    stats = tracer.stage_stats().set_index("阶段")
+    fetch = stats.loc[STAGE_LABELS[STAGE_FETCH]]
+    assert fetch["次数"] == 20 and list(stats.index) == [STAGE_LABELS[STAGE_FETCH]]
+    assert 9 <= fetch["p50(ms)"] < fetch["p95(ms)"] <= fetch["最大(ms)"]
+
+    try:
+        with tracer.span("失败运行"):
+            with tracer.span("行情", STAGE_FETCH):
+                raise ConnectionError("超时")
+    except ConnectionError:
+        pass
+    assert tracer.last_trace().waterfall()["错误"].iloc[1] == "ConnectionError: 超时"
+
+    disabled = Tracer(enabled=False)
+    with disabled.span("运行") as s:
+        s.set(rows=1)
+    assert disabled.traces() == []
+    print(f"✅ 获取阶段 p50 {fetch['p50(ms)']} ms、p95 {fetch['p95(ms)']} ms，异常写入 span")
+
+def test_thread_isolation():
+    """测试不同线程中的运行各自形成独立追踪"""
+    print("🧪 测试: 线程隔离")
+    tracer = Tracer(enabled=True)
+
+    def run(name: str):
+        with tracer.span(name):
+            with tracer.span("步骤", STAGE_FETCH):
+                time.sleep(0.01)
+
+    threads = [threading.Thread(target=run, args=(f"任务{i}",)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(t.name for t in tracer.traces()) == [f"任务{i}" for i in range(4)]
+    assert all(len(t.spans) == 2 for t in tracer.traces())
+    print("✅ 4 个线程各自产生独立追踪")
+
+def test_fetch_pipeline_spans():
+    """测试 load_codes 产生获取、清洗、派生阶段的 span 及数据源属性"""
+    print("🧪 测试: 数据获取链路")
+    market = generate_synthetic_market(30, 20, seed=4)
+    codes = [f"{code}.{'SH' if code.startswith('6') else 'SZ'}" for code in market.codes
+             if code.startswith(("0", "3", "6"))][:8]
+
+    @traced(name="测试运行")
+    def run(fetcher: ChinaAStockFetcher):
+        current_span().set(codes=len(codes))
+        return fetcher.add_derived_columns(fetcher.load_codes(codes), ["MA5", "RSI"])
+
+    with QuoteServer(QuoteBook.from_market(market)).start() as server:
+        df = run(ChinaAStockFetcher(sina_base_url=server.url, tencent_base_url=server.url))
+    assert len(df) == len(codes)
+
+    trace = get_tracer().last_trace("测试运行")
+    waterfall = trace.waterfall()
+    assert waterfall["属性"].iloc[0] == f"codes={len(codes)}, memory={trace.root.attributes['memory']}"
+    assert trace.root.attributes["memory"] == df.memory_usage(deep=True).sum()
+    sina = waterfall[waterfall["名称"] == "新浪行情"]
+    assert len(sina) == 1 and "provider=sina" in sina["属性"].iloc[0]
+    assert set(trace.stage_totals()) == {STAGE_FETCH, STAGE_CLEAN, STAGE_ENRICH}
+    with span("空运行"):
+        pass
+    assert get_tracer().last_trace().name == "空运行"
+    memory = get_tracer().stage_memory([trace]).set_index("阶段")
+    assert memory.loc[STAGE_LABELS[STAGE_ENRICH], "次数"] == 1
+    print(f"✅ {len(waterfall)} 个 span：{'、'.join(waterfall['名称'])}")
+
+if __name__ == "__main__":
+    test_nesting_and_buffer()
+    test_stage_percentiles_and_errors()
+    test_thread_isolation()
+    test_fetch_pipeline_spans()
+    print("🎉 阶段耗时追踪测试通过")
@@ -0,0 +1,288 @@
+"""
+阶段级耗时追踪
+用 span 上下文管理器或 traced 装饰器包住获取、清洗、派生、筛选、评分、渲染各阶段，
+记录耗时与数据源等属性。最外层 span 结束时整条追踪进入内存环形缓冲区，
+页面侧边栏据此显示最近一次运行的瀑布图和各阶段 p50/p95。
+
+用法:
+    with span("新浪行情", STAGE_FETCH, provider="sina") as s:
+        quotes = fetch()
+        s.set(rows=len(quotes))
+
+    @traced(STAGE_RENDER)
+    def render_results_table(results): ...
+
+traced 包住的函数返回 DataFrame 时，span 记录其深度内存占用（memory 属性，字节），
+用于按阶段查看内存峰值；STOCK_TRACE_MEMORY=0 关闭。
+
+STOCK_TRACING=0 关闭追踪；STOCK_TRACE_BUFFER 设置保留的追踪条数（默认 100）。
+"""
+
+import functools
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Callable, Deque, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+# 阶段
+STAGE_FETCH = "fetch"
+STAGE_CLEAN = "clean"
+STAGE_ENRICH = "enrich"
+STAGE_FILTER = "filter"
+STAGE_SCORE = "score"
+STAGE_RENDER = "render"
+STAGES = (STAGE_FETCH, STAGE_CLEAN, STAGE_ENRICH, STAGE_FILTER, STAGE_SCORE, STAGE_RENDER)
+
+STAGE_LABELS = {
+    STAGE_FETCH: "获取",
+    STAGE_CLEAN: "清洗",
+    STAGE_ENRICH: "派生指标",
+    STAGE_FILTER: "筛选",
+    STAGE_SCORE: "评分",
+    STAGE_RENDER: "渲染",
+}
+
+TRACE_BUFFER_SIZE = int(os.environ.get("STOCK_TRACE_BUFFER", "100"))
+
+# traced 是否记录返回 DataFrame 的深度内存占用
+TRACE_MEMORY = os.environ.get("STOCK_TRACE_MEMORY", "1") != "0"
+
+
+class Span:
+    """一个计时区间；stage 为 None 的 span 只用于分组（如一次运行、一个数据源尝试），不计入阶段统计"""
+
+    __slots__ = ("name", "stage", "attributes", "start", "end", "depth", "parent", "error")
+
+    def __init__(self, name: str, stage: Optional[str], attributes: Dict, start: float, depth: int,
+                 parent: Optional["Span"]):
+        self.name = name
+        self.stage = stage
+        self.attributes = attributes
+        self.start = start
+        self.end: Optional[float] = None
+        self.depth = depth
+        self.parent = parent
+        self.error: Optional[str] = None
+
+    def set(self, **attributes):
+        """补充属性（如返回行数）"""
+        self.attributes.update(attributes)
+
+    def add(self, name: str, amount: float):
+        """累加数值属性（如同一 span 内多次请求的响应字节数）"""
+        self.attributes[name] = self.attributes.get(name, 0) + amount
+
+    @property
+    def duration(self) -> float:
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+    def outermost_of_stage(self) -> bool:
+        """祖先中没有同阶段的 span（嵌套的同阶段 span 不重复计入统计）"""
+        parent = self.parent
+        while parent is not None:
+            if parent.stage == self.stage:
+                return False
+            parent = parent.parent
+        return True
+
+
+class _NullSpan:
+    """追踪关闭时的占位 span"""
+
+    def set(self, **attributes):
+        pass
+
+    def add(self, name: str, amount: float):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Trace:
+    """一次运行（最外层 span 及其内部的全部 span）"""
+
+    def __init__(self, root: Span):
+        self.root = root
+        self.started_at = datetime.now()
+        self.spans: List[Span] = [root]
+        self._lock = threading.Lock()
+
+    @property
+    def name(self) -> str:
+        return self.root.name
+
+    @property
+    def duration(self) -> float:
+        return self.root.duration
+
+    def add(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+
+    def waterfall(self) -> pd.DataFrame:
+        """瀑布图数据：每个 span 相对开始时间、耗时（毫秒）与层级"""
+        origin = self.root.start
+        return pd.DataFrame({
+            "名称": [s.name for s in self.spans],
+            "阶段": [STAGE_LABELS.get(s.stage, "—") for s in self.spans],
+            "开始(ms)": [round((s.start - origin) * 1000, 2) for s in self.spans],
+            "耗时(ms)": [round(s.duration * 1000, 2) for s in self.spans],
+            "层级": [s.depth for s in self.spans],
+            "属性": [", ".join(f"{k}={v}" for k, v in s.attributes.items()) for s in self.spans],
+            "错误": [s.error or "" for s in self.spans],
+        })
+
+    def stage_totals(self) -> Dict[str, float]:
+        """本次运行各阶段耗时合计（秒）"""
+        totals: Dict[str, float] = {}
+        for s in self.spans:
+            if s.stage is not None and s.end is not None and s.outermost_of_stage():
+                totals[s.stage] = totals.get(s.stage, 0.0) + s.duration
+        return totals
+
+
+class Tracer:
+    """追踪器：当前 span 按上下文（线程 / 协程）隔离，完成的追踪保存在环形缓冲区"""
+
+    def __init__(self, buffer_size: int = TRACE_BUFFER_SIZE, enabled: Optional[bool] = None):
+        self.enabled = os.environ.get("STOCK_TRACING", "1") != "0" if enabled is None else enabled
+        self._traces: Deque[Trace] = deque(maxlen=buffer_size)
+        self._current: ContextVar = ContextVar(f"tracer_{id(self)}", default=None)
+        self._listeners: List[Callable[[Span], None]] = []
+
+    def add_listener(self, listener: Callable[[Span], None]):
+        """注册 span 结束时的回调（如把获取阶段耗时汇入指标）"""
+        if listener not in self._listeners:
+            self._listeners.append(listener)
+
+    @contextmanager
+    def span(self, name: str, stage: Optional[str] = None, **attributes):
+        """计时一个区间；当前没有进行中的追踪时开始一条新追踪"""
+        if not self.enabled:
+            yield NULL_SPAN
+            return
+
+        current = self._current.get()
+        parent_trace, parent = current if current else (None, None)
+        span = Span(name, stage, attributes, time.perf_counter(), parent.depth + 1 if parent else 0, parent)
+        trace = parent_trace or Trace(span)
+        if parent_trace is not None:
+            trace.add(span)
+
+        token = self._current.set((trace, span))
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span.end = time.perf_counter()
+            self._current.reset(token)
+            for listener in self._listeners:
+                listener(span)
+            if parent_trace is None:
+                self._traces.append(trace)
+
+    def current_span(self):
+        current = self._current.get()
+        return current[1] if current else NULL_SPAN
+
+    def traces(self, prefix: Optional[str] = None) -> List[Trace]:
+        """缓冲区中的追踪（按完成顺序），可按名称前缀过滤"""
+        traces = list(self._traces)
+        return [t for t in traces if prefix is None or t.name.startswith(prefix)]
+
+    def last_trace(self, prefix: Optional[str] = None) -> Optional[Trace]:
+        traces = self.traces(prefix)
+        return traces[-1] if traces else None
+
+    def stage_stats(self, traces: Optional[List[Trace]] = None) -> pd.DataFrame:
+        """各阶段在最近追踪中的次数与 p50 / p95 / 最大耗时（毫秒）
+
+        每条追踪内同一阶段的耗时先合计，再跨追踪取分位数。
+        """
+        traces = self.traces() if traces is None else traces
+        samples: Dict[str, List[float]] = {}
+        for trace in traces:
+            for stage, seconds in trace.stage_totals().items():
+                samples.setdefault(stage, []).append(seconds * 1000)
+
+        rows = []
+        for stage in STAGES:
+            values = samples.get(stage)
+            if not values:
+                continue
+            p50, p95 = np.percentile(values, [50, 95])
+            rows.append({"阶段": STAGE_LABELS[stage], "次数": len(values), "p50(ms)": round(float(p50), 1),
+                         "p95(ms)": round(float(p95), 1), "最大(ms)": round(max(values), 1)})
+        return pd.DataFrame(rows, columns=["阶段", "次数", "p50(ms)", "p95(ms)", "最大(ms)"])
+
+    def stage_memory(self, traces: Optional[List[Trace]] = None) -> pd.DataFrame:
+        """各阶段产出 DataFrame 的内存占用（MB）：每条追踪取该阶段最大的一个，再跨追踪取中位数与最大值"""
+        traces = self.traces() if traces is None else traces
+        samples: Dict[str, List[float]] = {}
+        for trace in traces:
+            peaks: Dict[str, int] = {}
+            for s in trace.spans:
+                if s.stage is not None and "memory" in s.attributes:
+                    peaks[s.stage] = max(peaks.get(s.stage, 0), s.attributes["memory"])
+            for stage, memory in peaks.items():
+                samples.setdefault(stage, []).append(memory / 1024 / 1024)
+
+        rows = []
+        for stage in STAGES:
+            values = samples.get(stage)
+            if not values:
+                continue
+            rows.append({"阶段": STAGE_LABELS[stage], "次数": len(values),
+                         "中位(MB)": round(float(np.median(values)), 2), "最大(MB)": round(max(values), 2)})
+        return pd.DataFrame(rows, columns=["阶段", "次数", "中位(MB)", "最大(MB)"])
+
+    def clear(self):
+        self._traces.clear()
+
+
+_tracer: Optional[Tracer] = None
+
+
+def get_tracer() -> Tracer:
+    """获取全局追踪器"""
+    global _tracer
+    if _tracer is None:
+        _tracer = Tracer()
+    return _tracer
+
+
+# 主要接口函数
+def span(name: str, stage: Optional[str] = None, **attributes):
+    """在全局追踪器上计时一个区间"""
+    return get_tracer().span(name, stage, **attributes)
+
+
+def traced(stage: Optional[str] = None, name: Optional[str] = None, **attributes):
+    """把函数整体作为一个 span 的装饰器（调用时使用全局追踪器，返回 DataFrame 时记录其内存占用）"""
+    def decorator(func: Callable) -> Callable:
+        label = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with get_tracer().span(label, stage, **attributes) as s:
+                result = func(*args, **kwargs)
+                if TRACE_MEMORY and isinstance(result, pd.DataFrame) and s is not NULL_SPAN:
+                    s.set(memory=int(result.memory_usage(deep=True).sum()))
+                return result
+        return wrapper
+    return decorator
+
+
+def current_span():
+    """当前上下文中进行中的 span（没有时返回占位 span，可直接 set）"""
+    return get_tracer().current_span()